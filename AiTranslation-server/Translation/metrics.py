@@ -0,0 +1,166 @@
+"""
+按接口统计的请求延迟直方图
+
+RequestTracingMiddleware 对每个请求调用 record()，按 "方法 路由" (如 "POST /api/translate/") 聚合：
+请求数、5xx 错误数、请求/响应字节数和延迟分桶计数。统计保存在进程内存中，多进程部署时每个进程各自统计。
+
+导出接口 (settings.REQUEST_TRACE_METRICS_ENABLED 为 True 时可用，默认关闭)：
+    GET /metrics/latency/                    JSON
+    GET /metrics/latency/?format=prometheus  Prometheus 文本格式
+只有管理员 (is_staff) 或带有 "Authorization: Bearer <REQUEST_TRACE_METRICS_TOKEN>" 请求头的请求可以访问。
+"""
+import bisect
+import hmac
+import os
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+
+# 延迟分桶上界（毫秒），超过最后一个上界的请求计入 +Inf
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+class LatencyHistogram:
+    """单个接口的延迟直方图"""
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+    def observe(self, duration_ms, status, request_size, response_size):
+        self.bucket_counts[bisect.bisect_left(LATENCY_BUCKETS_MS, duration_ms)] += 1
+        self.count += 1
+        if status >= 500:
+            self.errors += 1
+        self.sum_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.request_bytes += request_size
+        self.response_bytes += response_size
+
+    def quantile(self, q):
+        """按分桶估算分位数（返回所在分桶的上界，落在 +Inf 桶时返回最大值）"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for upper, bucket_count in zip(LATENCY_BUCKETS_MS, self.bucket_counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return round(min(upper, self.max_ms), 2)
+        return round(self.max_ms, 2)
+
+    def to_dict(self):
+        buckets = {str(upper): n for upper, n in zip(LATENCY_BUCKETS_MS, self.bucket_counts)}
+        buckets['+Inf'] = self.bucket_counts[-1]
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'avg_ms': round(self.sum_ms / self.count, 2) if self.count else 0,
+            'max_ms': round(self.max_ms, 2),
+            'p50_ms': self.quantile(0.5),
+            'p90_ms': self.quantile(0.9),
+            'p99_ms': self.quantile(0.99),
+            'request_bytes': self.request_bytes,
+            'response_bytes': self.response_bytes,
+            'buckets': buckets,
+        }
+
+
+class LatencyRegistry:
+    """进程内所有接口的延迟直方图（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def record(self, method, route, status, duration_ms, request_size=0, response_size=0):
+        key = (method, route)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = LatencyHistogram()
+            histogram.observe(duration_ms, status, request_size, response_size)
+
+    def snapshot(self):
+        with self._lock:
+            return {f"{method} {route}": histogram.to_dict()
+                    for (method, route), histogram in sorted(self._histograms.items())}
+
+    def to_prometheus(self):
+        """Prometheus 文本格式（直方图单位为秒）"""
+        lines = [
+            '# HELP http_request_duration_seconds Request latency by endpoint.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        with self._lock:
+            items = sorted(self._histograms.items())
+            for (method, route), histogram in items:
+                labels = f'method="{method}",route="{_escape_label(route)}"'
+                cumulative = 0
+                for upper, bucket_count in zip(LATENCY_BUCKETS_MS, histogram.bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{upper / 1000:g}"}} {cumulative}')
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f'http_request_duration_seconds_sum{{{labels}}} {histogram.sum_ms / 1000:.6f}')
+                lines.append(f'http_request_duration_seconds_count{{{labels}}} {histogram.count}')
+            lines.append('# TYPE http_request_errors_total counter')
+            for (method, route), histogram in items:
+                labels = f'method="{method}",route="{_escape_label(route)}"'
+                lines.append(f'http_request_errors_total{{{labels}}} {histogram.errors}')
+            lines.append('# TYPE http_request_size_bytes_total counter')
+            for (method, route), histogram in items:
+                labels = f'method="{method}",route="{_escape_label(route)}"'
+                lines.append(f'http_request_size_bytes_total{{{labels}}} {histogram.request_bytes}')
+            lines.append('# TYPE http_response_size_bytes_total counter')
+            for (method, route), histogram in items:
+                labels = f'method="{method}",route="{_escape_label(route)}"'
+                lines.append(f'http_response_size_bytes_total{{{labels}}} {histogram.response_bytes}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+latency_registry = LatencyRegistry()
+
+
+def _metrics_authorized(request):
+    """管理员或持有抓取令牌的请求"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated and user.is_staff:
+        return True
+    token = getattr(settings, 'REQUEST_TRACE_METRICS_TOKEN', '')
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if token and authorization.startswith('Bearer '):
+        return hmac.compare_digest(authorization[len('Bearer '):].strip(), token)
+    return False
+
+
+def latency_metrics_view(request):
+    """导出当前进程的接口延迟直方图"""
+    if not getattr(settings, 'REQUEST_TRACE_METRICS_ENABLED', False):
+        return JsonResponse({'code': '4004', 'msg': '延迟统计接口未启用', 'data': None}, status=404)
+    if not _metrics_authorized(request):
+        return JsonResponse({'code': '4001', 'msg': '无权访问延迟统计接口', 'data': None}, status=403)
+    if request.GET.get('format') == 'prometheus':
+        return HttpResponse(latency_registry.to_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+    return JsonResponse({
+        'code': '0000',
+        'msg': '成功',
+        'data': {
+            'pid': os.getpid(),
+            'buckets_ms': list(LATENCY_BUCKETS_MS),
+            'endpoints': latency_registry.snapshot(),
+        },
+    }, json_dumps_params={'ensure_ascii': False})
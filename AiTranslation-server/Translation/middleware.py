@@ -1,45 +1,115 @@
-from django.utils.deprecation import MiddlewareMixin
-
-class PrintRequestMiddleware(MiddlewareMixin):
-    def process_request(self, request):
-        print(f"收到请求: {request.method} {request.path}")
-        # 只打印有 body 的请求
-        if request.method in ['POST', 'PUT', 'PATCH']:
-            try:
-                # 检查是否是文件上传请求
-                if hasattr(request, 'FILES') and request.FILES:
-                    print(f"文件上传请求: {len(request.FILES)} 个文件")
-                    for field_name, uploaded_file in request.FILES.items():
-                        print(f"  - {field_name}: {uploaded_file.name} ({uploaded_file.size} 字节)")
-                else:
-                    # 尝试读取请求体内容
-                    body = request.body
-                    if body:
-                        # 尝试UTF-8解码，如果失败则显示为二进制数据
-                        try:
-                            body_text = body.decode('utf-8')
-                            print(f"请求体内容: {body_text[:500]}...")
-                        except UnicodeDecodeError:
-                            print(f"请求体内容: [二进制数据，{len(body)} 字节]")
-                    else:
-                        print("请求体内容: 空")
-            except Exception as e:
-                print(f"请求体内容读取失败: {e}")
-        return None
-
-    def process_response(self, request, response):
-        # 打印响应内容（只打印前500字符，防止内容过大）
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.http import FileResponse
+
+from Translation.metrics import latency_registry
+
+logger = logging.getLogger('request.trace')
+
+
+class RequestTracingMiddleware:
+    """
+    请求追踪中间件
+
+    记录每个请求的方法、路由、状态码、请求/响应大小和耗时，不读取请求体和响应体：
+    - 请求大小取 Content-Length 头；普通响应取已生成内容的长度；
+    - StreamingHttpResponse 不会被缓冲，而是在逐块输出时累计字节数，传输结束（或客户端断开）时记录总耗时；
+    - FileResponse 保持原样（不影响 wsgi.file_wrapper），按 Content-Length 和首字节耗时记录。
+
+    所有请求都计入 Translation.metrics 中按接口统计的延迟直方图；
+    日志按 REQUEST_TRACE_SAMPLE_RATE 采样输出，慢请求 (超过 REQUEST_TRACE_SLOW_MS) 和 5xx 请求总是输出。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'REQUEST_TRACE_SAMPLE_RATE', 0.01)
+        self.slow_ms = getattr(settings, 'REQUEST_TRACE_SLOW_MS', 3000)
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        trace = {
+            'method': request.method,
+            'route': _get_route(request),
+            'path': request.path,
+            'status': response.status_code,
+            'request_size': _get_request_size(request),
+            'ttfb_ms': (time.perf_counter() - start) * 1000,
+            'sampled': random.random() < self.sample_rate,
+        }
+
+        if not response.streaming:
+            self._finish(trace, len(response.content), trace['ttfb_ms'])
+        elif isinstance(response, FileResponse):
+            self._finish(trace, _get_header_size(response), trace['ttfb_ms'])
+        elif getattr(response, 'is_async', False):
+            response.streaming_content = self._trace_async_stream(response.streaming_content, trace, start)
+        else:
+            response.streaming_content = self._trace_stream(response.streaming_content, trace, start)
+        return response
+
+    def _trace_stream(self, content, trace, start):
+        size = 0
+        completed = False
         try:
-            if hasattr(response, 'content'):
-                content = response.content
-                if content:
-                    try:
-                        content_text = content.decode('utf-8')
-                        print(f"返回内容: {content_text[:500]}...")
-                    except UnicodeDecodeError:
-                        print(f"返回内容: [二进制数据，{len(content)} 字节]")
-                else:
-                    print("返回内容: 空")
-        except Exception as e:
-            print(f"返回内容读取失败: {e}")
-        return response 
\ No newline at end of file
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+            completed = True
+        finally:
+            trace['completed'] = completed
+            self._finish(trace, size, (time.perf_counter() - start) * 1000)
+
+    async def _trace_async_stream(self, content, trace, start):
+        size = 0
+        completed = False
+        try:
+            async for chunk in content:
+                size += len(chunk)
+                yield chunk
+            completed = True
+        finally:
+            trace['completed'] = completed
+            self._finish(trace, size, (time.perf_counter() - start) * 1000)
+
+    def _finish(self, trace, response_size, duration_ms):
+        latency_registry.record(trace['method'], trace['route'], trace['status'], duration_ms,
+                                trace['request_size'], response_size)
+
+        slow = duration_ms >= self.slow_ms
+        if not (trace['sampled'] or slow or trace['status'] >= 500):
+            return
+        message = (f"{trace['method']} {trace['path']} -> {trace['status']} "
+                   f"{duration_ms:.1f}ms (首字节 {trace['ttfb_ms']:.1f}ms) "
+                   f"请求 {trace['request_size']}B 响应 {response_size}B")
+        if trace.get('completed') is False:
+            message += " [传输中断]"
+        if slow or trace['status'] >= 500:
+            logger.warning(message)
+        else:
+            logger.info(message)
+
+
+def _get_route(request):
+    """返回匹配的 URL 路由（如 "/api/translate/"），用于按接口聚合；未匹配的请求统一归为 "<unmatched>" """
+    match = getattr(request, 'resolver_match', None)
+    if match is None or not match.route:
+        return '<unmatched>'
+    return '/' + match.route
+
+
+def _get_request_size(request):
+    try:
+        return int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return 0
+
+
+def _get_header_size(response):
+    try:
+        return int(response.get('Content-Length') or 0)
+    except ValueError:
+        return 0
@@ -60,7 +60,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',  # CORS中间件必须在CommonMiddleware之前
-    "Translation.middleware.PrintRequestMiddleware",
+    "Translation.middleware.RequestTracingMiddleware",  # 请求追踪（不读取请求体/响应体）
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -193,3 +193,34 @@ DEEPSEEK_BASE_URL = "https://api.deepseek.com/v1"  # DeepSeek API基础URL
 # AI模型选择配置
 AI_MODEL_TYPE = "deepseek"  # 可选值: "openai" 或 "deepseek"
 
+
+# API访问记录缓冲写入配置（见 apps/utils/api_log_buffer.py）
+API_ACCESS_LOG_ASYNC = True            # 在后台线程中批量写入访问记录，False 时在请求线程中立即写入
+API_ACCESS_LOG_BATCH_SIZE = 200        # 每批最多写入的记录数，队列积累到该数量时提前写入
+API_ACCESS_LOG_FLUSH_INTERVAL = 2.0    # 最长写入间隔（秒）
+API_ACCESS_LOG_QUEUE_SIZE = 10000      # 队列容量，队列满时丢弃新记录
+
+# 请求追踪配置（见 Translation/middleware.py、Translation/metrics.py）
+REQUEST_TRACE_SAMPLE_RATE = 0.01       # 输出追踪日志的请求比例（0~1），所有请求都会计入延迟直方图
+REQUEST_TRACE_SLOW_MS = 3000           # 超过该耗时（毫秒）的请求和 5xx 请求总是输出日志
+REQUEST_TRACE_METRICS_ENABLED = False  # 是否开放 /metrics/latency/ 延迟统计接口（仅管理员或持有令牌的请求可访问）
+REQUEST_TRACE_METRICS_TOKEN = ''       # 抓取令牌（为空时只有管理员可访问），请求头 Authorization: Bearer <令牌>
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'request.trace': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Flask 翻译服务代理配置（见 apps/utils/upstream_proxy.py）
+SPARK_API_HOST = "127.0.0.1:5000"      # Flask 翻译服务地址
+SPARK_PROXY_MAX_CONCURRENCY = 8        # 同时转发到翻译服务的最大请求数（应小于 gunicorn 工作线程数）
+SPARK_PROXY_QUEUE_TIMEOUT = 5          # 并发已满时最长等待秒数，超时返回 503
+SPARK_PROXY_CONNECT_TIMEOUT = 5        # 连接超时（秒）
+SPARK_PROXY_FAILURE_THRESHOLD = 5      # 连续失败多少次后熔断
+SPARK_PROXY_RECOVERY_TIMEOUT = 30      # 熔断持续秒数，之后放行一个探测请求
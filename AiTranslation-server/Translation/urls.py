@@ -18,10 +18,13 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from Translation.metrics import latency_metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('auth/', include('apps.login.urls')),
     path('api/', include('apps.api.urls')),
     path('api/ai-assistant/', include('apps.ai_assistant.urls')),
     path('api/file-upload/', include('apps.file_upload.urls')),
+    path('metrics/latency/', latency_metrics_view, name='latency-metrics'),
 ]
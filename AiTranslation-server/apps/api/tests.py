@@ -1,3 +1,282 @@
-from django.test import TestCase
+import asyncio
+import base64
+import io
+import json
+import os
+import stat
+import struct
+import tempfile
+import wave
+import threading
+import time
 
-# Create your tests here.
+import websockets
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.test import SimpleTestCase, override_settings
+
+from apps.utils import audio_ingest
+from apps.utils.audio_info import HEADER_PROBE_SIZE, probe_audio_header
+from apps.utils.audio_ingest import ingest_bytes, ingest_uploaded_file
+from apps.utils.xunfei_file_recognizer import recognize_file, submit_recognition
+
+
+class MockXunfeiServer:
+    """
+    本地模拟的讯飞语音听写 WebSocket 服务
+
+    收到最后一帧后返回识别结果 "收到<字节数>字节"，可以模拟错误码、不返回结果和处理延迟。
+    """
+
+    def __init__(self, error_code=0, never_reply=False, reply_delay=0):
+        self.error_code = error_code
+        self.never_reply = never_reply
+        self.reply_delay = reply_delay
+        self.frames = []           # 每个连接收到的帧数
+        self.max_active = 0        # 同时处理的最大连接数
+        self._active = 0
+        self.loop = asyncio.new_event_loop()
+        self._server = None
+        self._thread = None
+        self.url = None
+
+    def start(self):
+        async def serve():
+            return await websockets.serve(self._handle, '127.0.0.1', 0)
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        self._server = asyncio.run_coroutine_threadsafe(serve(), self.loop).result(timeout=10)
+        port = self._server.sockets[0].getsockname()[1]
+        self.url = f"ws://127.0.0.1:{port}/v1"
+        return self
+
+    def stop(self):
+        async def close():
+            self._server.close()
+            await self._server.wait_closed()
+        asyncio.run_coroutine_threadsafe(close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+    async def _handle(self, ws, *args):
+        self._active += 1
+        self.max_active = max(self.max_active, self._active)
+        received = 0
+        frame_count = 0
+        try:
+            async for message in ws:
+                frame = json.loads(message)
+                frame_count += 1
+                if frame_count == 1:
+                    assert frame["header"]["status"] == 0 and "parameter" in frame
+                received += len(base64.b64decode(frame["payload"]["audio"]["audio"]))
+                if frame["header"]["status"] == 2:
+                    break
+            self.frames.append(frame_count)
+            if self.never_reply:
+                await ws.wait_closed()
+                return
+            await asyncio.sleep(self.reply_delay)
+            if self.error_code:
+                await ws.send(json.dumps({"header": {"code": self.error_code, "status": 2}}))
+                return
+            for status, text in ((1, "收到"), (2, f"{received}字节")):
+                result = {"ws": [{"cw": [{"w": text}]}]}
+                await ws.send(json.dumps({
+                    "header": {"code": 0, "status": status},
+                    "payload": {"result": {"text": base64.b64encode(json.dumps(result).encode('utf-8')).decode('ascii')}},
+                }))
+        finally:
+            self._active -= 1
+
+
+class XunfeiFileRecognizerTests(SimpleTestCase):
+    """文件识别模式测试（使用本地模拟服务，不访问讯飞）"""
+
+    def setUp(self):
+        # 60 秒 16k/16bit 单声道音频的大小
+        fd, self.audio_path = tempfile.mkstemp(suffix='.pcm')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(os.urandom(16000 * 2 * 60))
+
+    def tearDown(self):
+        os.unlink(self.audio_path)
+
+    def test_sends_all_frames_without_realtime_pacing(self):
+        server = MockXunfeiServer().start()
+        try:
+            start = time.time()
+            result = recognize_file(self.audio_path, url=server.url)
+            elapsed = time.time() - start
+        finally:
+            server.stop()
+        self.assertTrue(result['success'], result['error'])
+        self.assertEqual(result['text'], f"收到{16000 * 2 * 60}字节")
+        # 1280 字节一帧 + 最后一帧；按实时节奏发送需要 60 秒以上
+        self.assertEqual(server.frames, [16000 * 2 * 60 // 1280 + 1])
+        self.assertLess(elapsed, 20)
+
+    def test_concurrent_recognitions_share_loop(self):
+        server = MockXunfeiServer(reply_delay=0.5).start()
+        try:
+            futures = [submit_recognition(self.audio_path, url=server.url) for _ in range(4)]
+            results = [future.result(timeout=30) for future in futures]
+        finally:
+            server.stop()
+        self.assertTrue(all(result['success'] for result in results))
+        self.assertGreater(server.max_active, 1)
+
+    def test_error_code(self):
+        server = MockXunfeiServer(error_code=10165).start()
+        try:
+            result = recognize_file(self.audio_path, url=server.url)
+        finally:
+            server.stop()
+        self.assertFalse(result['success'])
+        self.assertEqual(result['error'], "请求错误：10165")
+
+    def test_timeout(self):
+        server = MockXunfeiServer(never_reply=True).start()
+        try:
+            result = recognize_file(self.audio_path, timeout=1, url=server.url)
+        finally:
+            server.stop()
+        self.assertFalse(result['success'])
+        self.assertEqual(result['error'], "识别超时")
+
+
+def make_wav(seconds, sample_rate=16000, channels=1, extra_chunk_size=0):
+    """生成 WAV 文件字节，extra_chunk_size > 0 时在 fmt 和 data 之间插入一个 LIST 块"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(b'\x00\x00' * channels * int(sample_rate * seconds))
+    data = buffer.getvalue()
+    if not extra_chunk_size:
+        return data
+    data_offset = data.index(b'data')
+    chunk = b'LIST' + struct.pack('<I', extra_chunk_size) + b'\x00' * extra_chunk_size
+    riff = data[:data_offset] + chunk + data[data_offset:]
+    return riff[:4] + struct.pack('<I', len(riff) - 8) + riff[8:]
+
+
+# MPEG1 Layer III、128kbps、44.1kHz、单声道的帧头 (帧长 417 字节，每帧 1152 个采样)
+MP3_FRAME_HEADER = b'\xff\xfb\x90\xc0'
+MP3_FRAME_LENGTH = 417
+
+
+def make_mp3(frame_count, vbr_tag=None, vbr_frames=None):
+    """生成 frame_count 个 CBR 帧；vbr_tag 为 'Xing' 或 'VBRI' 时在第一帧中写入总帧数 vbr_frames"""
+    first = bytearray(MP3_FRAME_HEADER + b'\x00' * (MP3_FRAME_LENGTH - 4))
+    if vbr_tag == 'Xing':
+        offset = 4 + 17  # 单声道 MPEG1 的边信息为 17 字节
+        first[offset:offset + 12] = b'Xing' + struct.pack('>II', 0x01, vbr_frames)
+    elif vbr_tag == 'VBRI':
+        offset = 4 + 32
+        first[offset:offset + 18] = b'VBRI' + b'\x00' * 10 + struct.pack('>I', vbr_frames)
+    frame = MP3_FRAME_HEADER + b'\x00' * (MP3_FRAME_LENGTH - 4)
+    return bytes(first) + frame * (frame_count - 1)
+
+
+class AudioInfoTests(SimpleTestCase):
+    """从文件头解析音频信息"""
+
+    def probe(self, data, declared_format=None):
+        return probe_audio_header(data[:HEADER_PROBE_SIZE], len(data), declared_format,
+                                  lambda offset, size: data[offset:offset + size])
+
+    def test_wav(self):
+        info = self.probe(make_wav(2.5))
+        self.assertEqual((info.format, info.sample_rate, info.channels, info.bits_per_sample),
+                         ('wav', 16000, 1, 16))
+        self.assertAlmostEqual(info.duration, 2.5)
+
+    def test_wav_large_chunk_before_data(self):
+        data = make_wav(1, sample_rate=8000, extra_chunk_size=70 * 1024)
+        self.assertGreater(data.index(b'data'), HEADER_PROBE_SIZE)
+        info = self.probe(data)
+        self.assertEqual(info.sample_rate, 8000)
+        self.assertAlmostEqual(info.duration, 1.0)
+
+    def test_wav_without_read_at_is_incomplete(self):
+        data = make_wav(1, extra_chunk_size=70 * 1024)
+        with self.assertRaises(ValueError):
+            probe_audio_header(data[:HEADER_PROBE_SIZE], len(data))
+
+    def test_cbr_mp3(self):
+        data = make_mp3(100)
+        info = self.probe(data)
+        self.assertEqual((info.format, info.sample_rate, info.channels), ('mp3', 44100, 1))
+        self.assertAlmostEqual(info.duration, len(data) * 8 / 128000)
+
+    def test_cbr_mp3_with_id3_tag(self):
+        tag = b'ID3\x03\x00\x00' + bytes([0, 0, 2, 0]) + b'\x00' * 256
+        info = self.probe(tag + make_mp3(100))
+        self.assertAlmostEqual(info.duration, 100 * MP3_FRAME_LENGTH * 8 / 128000)
+
+    def test_xing_vbr_mp3(self):
+        info = self.probe(make_mp3(10, 'Xing', vbr_frames=500))
+        self.assertAlmostEqual(info.duration, 500 * 1152 / 44100)
+
+    def test_vbri_vbr_mp3(self):
+        info = self.probe(make_mp3(10, 'VBRI', vbr_frames=250))
+        self.assertAlmostEqual(info.duration, 250 * 1152 / 44100)
+
+    def test_pcm(self):
+        info = self.probe(b'\x01\x02' * 16000 * 3, declared_format='pcm')
+        self.assertEqual((info.format, info.sample_rate, info.channels), ('pcm', 16000, 1))
+        self.assertAlmostEqual(info.duration, 3.0)
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            self.probe(b'\x00' * 1024, declared_format='ogg')
+
+
+class AudioIngestTests(SimpleTestCase):
+    """上传音频的接收和存档"""
+
+    def setUp(self):
+        self.records_dir = tempfile.mkdtemp()
+        self._original_dir = audio_ingest.VOICE_RECORDS_DIR
+        audio_ingest.VOICE_RECORDS_DIR = self.records_dir
+
+    def tearDown(self):
+        audio_ingest.VOICE_RECORDS_DIR = self._original_dir
+        for name in os.listdir(self.records_dir):
+            os.unlink(os.path.join(self.records_dir, name))
+        os.rmdir(self.records_dir)
+
+    @override_settings(FILE_UPLOAD_PERMISSIONS=0o644)
+    def test_temporary_upload_is_moved_with_upload_permissions(self):
+        data = make_wav(1, extra_chunk_size=70 * 1024)
+        upload = TemporaryUploadedFile('voice.wav', 'audio/wav', len(data), None)
+        upload.write(data)
+        upload.flush()
+        audio = ingest_uploaded_file(upload)
+        self.assertAlmostEqual(audio.duration, 1.0)
+        path = audio.save()
+        self.assertFalse(os.path.exists(upload.temporary_file_path()))
+        upload.close()  # 与请求结束时一样关闭 (临时文件已被移走)
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o644)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+    def test_in_memory_upload_is_archived(self):
+        data = make_wav(0.5)
+        audio = ingest_uploaded_file(SimpleUploadedFile('voice.wav', data))
+        self.assertEqual(audio.data, data)
+        path = audio.save()
+        audio_ingest._archive_executor.submit(lambda: None).result()  # 等待后台存档完成
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+    def test_ingest_bytes_uses_declared_format_for_pcm(self):
+        audio = ingest_bytes(b'\x00\x00' * 8000, 'pcm')
+        self.assertEqual(audio.format, 'pcm')
+        self.assertAlmostEqual(audio.duration, 0.5)
@@ -1,5 +1,4 @@
 from django.shortcuts import render
-import requests
 import base64
 import hashlib
 import hmac
@@ -19,20 +18,16 @@ from django.db.models import Q, Count, Avg, Sum
 from apps.utils.response import APIResponse
 from apps.utils.xunfei_config import XUNFEI_CONFIG, XUNFEI_ASR_URL, SUPPORTED_AUDIO_FORMATS, SUPPORTED_LANGUAGES, ENGINE_TYPES
 from apps.utils.api_logger import log_api_access
-from apps.utils.spark_mucl_cn_iat import create_xunfei_speech_recognition
+from apps.utils.xunfei_file_recognizer import recognize_file, recognize_audio
+from apps.utils.audio_ingest import ingest_uploaded_file, ingest_bytes
 from apps.api.models import APIAccessLog, APIUsageStatistics
 from apps.file_upload.models import FileUploadRecord
 from apps.utils.oss_uploader import oss_uploader
+from apps.utils.upstream_proxy import translation_proxy, UpstreamUnavailable
 import re
 import random
-import soundfile as sf
-import wave
-import contextlib
 from django.conf import settings
 
-#flask接口
-SPARK_API_HOST = "127.0.0.1:5000"
-
 LANGUAGE_DISPLAY = {
     'zh_cn': '中文',
     'en': '英语',
@@ -54,63 +49,50 @@ ACCENT_DISPLAY = {
     # 可补充
 }
 
-def parse_bubble_texts(bubble_texts):
-    """
-    将 bubble_texts 字段的每个元素从字符串解析为字典
-    输入示例:
-        [
-            '"detected": "ja",\n"translation": "xxx"',
-            '"detected": "ja",\n"translation": "yyy"'
-        ]
-    输出示例:
-        [
-            {"detected": "ja", "translation": "xxx"},
-            {"detected": "ja", "translation": "yyy"}
-        ]
-    """
-    result = []
-    for item in bubble_texts:
-        detected = None
-        translation = None
-        detected_match = re.search(r'"detected"\s*:\s*"([^"]+)"', item)
-        translation_match = re.search(r'"translation"\s*:\s*"([^"]+)"', item)
-        if detected_match:
-            detected = detected_match.group(1)
-        if translation_match:
-            translation = translation_match.group(1)
-        result.append({
-            "detected": detected,
-            "translation": translation
-        })
-    return result
-
 class TextTranslateView(APIView):
     @log_api_access(api_name="文本翻译", sensitive_fields=['password', 'token'])
     def post(self, request):
-        # 获取请求数据
-        request_data = request.data.copy()
+        # 获取请求数据（文本请求体很小，且已被访问记录装饰器解析，这里重新编码后转发）
+        body = json.dumps(request.data).encode('utf-8')
         
-        # 直接将处理后的参数转发到本地后端的 /api/spark/text-translate
-        spark_url = f"http://{SPARK_API_HOST}/api/text-translate/"
+        # 通过共享连接池转发到本地后端的 /api/text-translate/；
+        # 响应很小，读取完整响应后返回普通 Response，访问记录装饰器才能记录响应内容和大小
         try:
-            resp = requests.post(spark_url, json=request_data, timeout=100)
-            return Response(resp.json(), status=resp.status_code)
+            status_code, content = translation_proxy.fetch(
+                'POST', '/api/text-translate/', body=body,
+                headers={'Content-Type': 'application/json'}, read_timeout=100
+            )
+            return Response(json.loads(content), status=status_code)
+        except UpstreamUnavailable as e:
+            return APIResponse.fail(msg=f"Spark接口暂不可用: {str(e)}", code="4003")
         except Exception as e:
             return APIResponse.fail(msg=f"Spark接口调用异常: {str(e)}", code="4003")
 
 class ImageTranslateProxyView(APIView):
     """
     转发图片翻译请求到 Flask 服务
+    
+    JSON 请求体按块直接转发，Flask 的响应也按块返回，不在 Django 中解析图片数据；
+    bubble_texts 由 Flask 按 bubble_texts_format=parsed 解析为 {"detected", "translation"} 字典。
     """
     def post(self, request):
+        flask_path = "/api/translate_image?bubble_texts_format=parsed"
         try:
-            data = request.data if isinstance(request.data, dict) else request.data.dict()
-            flask_url = f"http://{SPARK_API_HOST}/api/translate_image"
-            resp = requests.post(flask_url, json=data, timeout=120)
-            resp_json = resp.json()
-            if "data" in resp_json and "bubble_texts" in resp_json["data"]:
-                resp_json["data"]["bubble_texts"] = parse_bubble_texts(resp_json["data"]["bubble_texts"])
-            return Response(resp_json, status=resp.status_code)
+            if request.content_type.startswith('application/json'):
+                body = request._request  # 原始请求体（未被读取），按块转发
+                headers = {'Content-Type': request.content_type}
+                if request.META.get('CONTENT_LENGTH'):
+                    headers['Content-Length'] = request.META['CONTENT_LENGTH']
+            else:
+                # 表单提交转换为 JSON
+                data = request.data.dict() if hasattr(request.data, 'dict') else request.data
+                body = json.dumps(data).encode('utf-8')
+                headers = {'Content-Type': 'application/json'}
+            return translation_proxy.forward('POST', flask_path, body=body, headers=headers, read_timeout=120)
+        except UpstreamUnavailable as e:
+            response = Response({"error": f"图片翻译服务暂不可用: {str(e)}"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = str(e.retry_after)
+            return response
         except Exception as e:
             return Response({"error": f"图片翻译转发异常: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -142,92 +124,47 @@ class SpeechRecognitionView(APIView):
         except Exception as e:
             raise ValueError(f"音频数据处理失败: {str(e)}")
     
-    def save_temp_audio_file(self, audio_data, audio_format):
-        """保存音频数据到临时文件"""
-        try:
-            # 创建临时文件
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=f'.{audio_format}')
-            temp_file.write(audio_data)
-            temp_file.close()
-            return temp_file.name
-        except Exception as e:
-            raise ValueError(f"保存临时音频文件失败: {str(e)}")
-    
-    def save_permanent_audio_file(self, audio_data, audio_format):
-        """保存音频数据到永久目录"""
-        save_dir = os.path.join('media', 'voice_records')
-        os.makedirs(save_dir, exist_ok=True)
-        filename = f"{int(time.time())}_{random.randint(1000,9999)}.{audio_format}"
-        save_path = os.path.join(save_dir, filename)
-        with open(save_path, 'wb') as f:
-            f.write(audio_data)
-        return save_path
-    
-    def check_audio_properties(self, audio_path, audio_format):
-        """检测音频文件属性，返回(是否合格, 错误信息)"""
-        try:
-            if audio_format in ['mp3', 'flac', 'ogg', 'wav']:
-                info = sf.info(audio_path)
-                if info.samplerate not in [16000, 8000]:
-                    return False, f"采样率为{info.samplerate}Hz，需为16kHz或8kHz"
-                if info.channels != 1:
-                    return False, f"声道数为{info.channels}，需为单声道"
-                # 位深判断
-                if '16' not in str(info.subtype):
-                    return False, f"采样位数为{info.subtype}，需为16bit"
-                return True, None
-            elif audio_format == 'pcm':
-                # PCM原始流，假定16k/16bit/单声道，无法直接检测
-                return True, None
-            else:
-                return False, f"暂不支持检测该格式: {audio_format}"
-        except Exception as e:
-            # wav兜底
-            if audio_format == 'wav':
-                try:
-                    with contextlib.closing(wave.open(audio_path, 'rb')) as wf:
-                        if wf.getframerate() not in [16000, 8000]:
-                            return False, f"采样率为{wf.getframerate()}Hz，需为16kHz或8kHz"
-                        if wf.getnchannels() != 1:
-                            return False, f"声道数为{wf.getnchannels()}，需为单声道"
-                        if wf.getsampwidth() * 8 != 16:
-                            return False, f"采样位数为{wf.getsampwidth() * 8}bit，需为16bit"
-                        return True, None
-                except Exception as e2:
-                    return False, f"音频属性检测失败: {e2}"
-            return False, f"音频属性检测失败: {e}"
+    def check_audio_properties(self, audio_info):
+        """检测音频属性（来自文件头），返回(是否合格, 错误信息)"""
+        if audio_info.sample_rate not in [16000, 8000]:
+            return False, f"采样率为{audio_info.sample_rate}Hz，需为16kHz或8kHz"
+        if audio_info.channels != 1:
+            return False, f"声道数为{audio_info.channels}，需为单声道"
+        # 位深判断（mp3 没有固定的采样位数，不检测）
+        if audio_info.bits_per_sample is not None and audio_info.bits_per_sample != 16:
+            return False, f"采样位数为{audio_info.bits_per_sample}bit，需为16bit"
+        return True, None
 
     @log_api_access(api_name="语音识别", sensitive_fields=['password', 'token', 'api_key', 'secret'])
     def post(self, request):
         """语音识别接口"""
-        temp_file_path = None
         try:
             # 获取音频数据
-            audio_data = None
             audio_format = request.data.get('audio_format', 'wav')  # 音频格式
             language = request.data.get('language', 'zh_cn')  # 语言
             accent = request.data.get('accent', 'mandarin')  # 口音
             
-            # 检查是否有文件上传
-            if 'audio_file' in request.FILES:
-                audio_file = request.FILES['audio_file']
-                audio_data = audio_file.read()
-                audio_format = audio_file.name.split('.')[-1].lower()
-            elif 'audio_data' in request.FILES:
-                audio_file = request.FILES['audio_data']
-                audio_data = audio_file.read()
-                audio_format = audio_file.name.split('.')[-1].lower()
-            else:
-                # 从请求数据中获取音频数据
-                audio_data_raw = request.data.get('audio_data')
-                if not audio_data_raw:
-                    return APIResponse.fail(msg="音频数据不能为空", code="4001")
-                
-                # 处理音频数据
-                audio_data = self.process_audio_data(audio_data_raw)
-            
-            if not audio_data:
-                return APIResponse.fail(msg="音频数据不能为空", code="4001")
+            # 检查是否有文件上传（只解析文件头，已落盘的上传文件不再复制）
+            audio_file = request.FILES.get('audio_file') or request.FILES.get('audio_data')
+            try:
+                if audio_file is not None:
+                    if not audio_file.size:
+                        return APIResponse.fail(msg="音频数据不能为空", code="4001")
+                    audio = ingest_uploaded_file(audio_file)
+                else:
+                    # 从请求数据中获取音频数据
+                    audio_data_raw = request.data.get('audio_data')
+                    if not audio_data_raw:
+                        return APIResponse.fail(msg="音频数据不能为空", code="4001")
+                    
+                    # 处理音频数据
+                    audio_data = self.process_audio_data(audio_data_raw)
+                    if not audio_data:
+                        return APIResponse.fail(msg="音频数据不能为空", code="4001")
+                    audio = ingest_bytes(audio_data, audio_format)
+            except ValueError as e:
+                return APIResponse.fail(msg=f"音频属性不符合要求: {str(e)}", code="4003")
+            audio_format = audio.format
             
             # 验证语言支持
             if language not in SUPPORTED_LANGUAGES:
@@ -237,34 +174,30 @@ class SpeechRecognitionView(APIView):
             if audio_format not in ['wav', 'mp3', 'pcm']:
                 return APIResponse.fail(msg=f"不支持的音频格式: {audio_format}，仅支持wav、mp3、pcm", code="4003")
             
-            # 检查音频长度（最长60秒，假设16k采样率）
-            audio_duration = len(audio_data) / (16000 * 2)  # 16k采样率，16bit = 2字节
+            # 检查音频长度（最长60秒，时长来自文件头）
+            audio_duration = audio.duration
             if audio_duration > 60:
                 return APIResponse.fail(msg=f"音频长度超过60秒限制: {audio_duration:.1f}秒", code="4004")
             
             print(f"讯飞语音识别 (官方接口):")
-            print(f"  音频大小: {len(audio_data)} 字节")
             print(f"  音频格式: {audio_format}")
             print(f"  语言: {language}")
             print(f"  口音: {accent}")
-            print(f"  预计时长: {audio_duration:.1f}秒")
-            
-            # 保存音频数据到临时文件
-            temp_file_path = self.save_temp_audio_file(audio_data, audio_format)
+            print(f"  音频时长: {audio_duration:.1f}秒")
             
             # 检查音频属性
-            ok, err = self.check_audio_properties(temp_file_path, audio_format)
+            ok, err = self.check_audio_properties(audio.info)
             if not ok:
                 return APIResponse.fail(msg=f"音频属性不符合要求: {err}", code="4003")
 
-            # 保存一份到永久目录
-            permanent_path = self.save_permanent_audio_file(audio_data, audio_format)
+            # 保存一份到永久目录（已落盘的上传文件直接移动，内存中的音频在后台写入）
+            permanent_path = audio.save()
             
-            # 创建语音识别客户端
-            asr_client = create_xunfei_speech_recognition()
-            
-            # 执行语音识别
-            result = asr_client.recognize_audio_file(temp_file_path)
+            # 执行语音识别（文件识别模式：不按实时节奏发送，在共享事件循环中等待结果）
+            if audio.data is not None:
+                result = recognize_audio(audio.data)
+            else:
+                result = recognize_file(permanent_path)
             lang_disp = LANGUAGE_DISPLAY.get(language, language)
             accent_disp = ACCENT_DISPLAY.get(accent, accent)
             if result['success']:
@@ -288,13 +221,6 @@ class SpeechRecognitionView(APIView):
                 
         except Exception as e:
             return APIResponse.fail(msg=f"语音识别异常: {str(e)}", code="4006")
-        finally:
-            # 清理临时文件
-            if temp_file_path and os.path.exists(temp_file_path):
-                try:
-                    os.unlink(temp_file_path)
-                except Exception as e:
-                    print(f"清理临时文件失败: {e}")
 
 class SpeechRecognitionFileView(APIView):
     """文件上传语音识别接口"""
@@ -329,11 +255,8 @@ class SpeechRecognitionFileView(APIView):
                     f.write(chunk)
             
             try:
-                # 创建语音识别客户端
-                asr_client = create_xunfei_speech_recognition()
-                
-                # 执行语音识别
-                result = asr_client.recognize_audio_file(temp_file_path)
+                # 执行语音识别（文件识别模式：不按实时节奏发送，在共享事件循环中等待结果）
+                result = recognize_file(temp_file_path)
                 
                 if result['success']:
                     return APIResponse.success(
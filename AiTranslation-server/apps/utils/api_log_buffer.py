@@ -0,0 +1,185 @@
+"""
+API访问记录的缓冲写入
+
+log_api_access 装饰器只把访问记录放入进程内队列，由后台线程批量写入数据库：
+- 访问记录使用 bulk_create 批量插入；
+- 使用统计先在内存中按 (用户, API名称, 日期) 聚合，再用 F() 表达式原子累加
+  (记录不存在时创建，并发创建冲突时改为累加)，多个进程同时写入也不会丢失计数；
+- 后台线程每 API_ACCESS_LOG_FLUSH_INTERVAL 秒写入一次，队列中积累到 API_ACCESS_LOG_BATCH_SIZE 条时提前写入，
+  进程退出时写入剩余记录。
+
+相关配置 (settings.py)：
+    API_ACCESS_LOG_ASYNC            是否在后台线程中写入，False 时在请求线程中立即写入 (默认 True)
+    API_ACCESS_LOG_BATCH_SIZE       每批最多写入的记录数 (默认 200)
+    API_ACCESS_LOG_FLUSH_INTERVAL   最长写入间隔，单位秒 (默认 2)
+    API_ACCESS_LOG_QUEUE_SIZE       队列容量，队列满时丢弃新记录 (默认 10000)
+"""
+import atexit
+import os
+import queue
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from apps.api.models import APIAccessLog, APIUsageStatistics
+
+# 使用统计中需要累加的字段
+STAT_FIELDS = ('total_requests', 'successful_requests', 'failed_requests',
+               'total_execution_time', 'total_request_size', 'total_response_size')
+
+
+def aggregate_usage_statistics(log_entries):
+    """
+    把访问记录按 (用户ID, API名称, 日期) 聚合为统计增量，匿名用户的记录不计入统计
+
+    Returns:
+        dict: {(user_id, api_name, date): {字段名: 增量}}
+    """
+    deltas = {}
+    for entry in log_entries:
+        if not entry.user_id:
+            continue
+        key = (entry.user_id, entry.api_name, entry.created_at.date())
+        delta = deltas.get(key)
+        if delta is None:
+            delta = deltas[key] = dict.fromkeys(STAT_FIELDS, 0)
+        delta['total_requests'] += 1
+        if entry.is_success:
+            delta['successful_requests'] += 1
+        else:
+            delta['failed_requests'] += 1
+        delta['total_execution_time'] += entry.execution_time or 0
+        delta['total_request_size'] += entry.request_size or 0
+        delta['total_response_size'] += entry.response_size or 0
+    return deltas
+
+
+def apply_usage_statistics(user_id, api_name, date, delta):
+    """把一组统计增量原子地累加到数据库中 (UPDATE ... SET 字段 = 字段 + 增量，记录不存在时创建)"""
+    lookup = {'user_id': user_id, 'api_name': api_name, 'date': date}
+    increments = {field: F(field) + value for field, value in delta.items()}
+    increments['updated_at'] = timezone.now()  # update() 不会触发 auto_now
+    stats = APIUsageStatistics.objects.filter(**lookup)
+    if stats.update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            APIUsageStatistics.objects.create(**lookup, **delta)
+    except IntegrityError:
+        # 其他进程已抢先创建了同一条统计记录，改为累加
+        stats.update(**increments)
+
+
+class APIAccessLogBuffer:
+    """进程内的访问记录缓冲队列和后台写入线程"""
+
+    def __init__(self, batch_size=200, flush_interval=2.0, queue_size=10000):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()  # 队列中凑满一批时提前唤醒写入线程
+        self._queue = None
+        self._thread = None
+        self._pid = None
+
+    def _ensure_worker(self):
+        # gunicorn 等预加载后 fork 的子进程不会继承父进程的线程，按进程号重新创建队列和线程
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._queue = queue.Queue(maxsize=self.queue_size)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='APIAccessLogWriter', daemon=True)
+            self._thread.start()
+
+    def put(self, log_entry):
+        """放入一条未保存的 APIAccessLog，不会阻塞请求线程"""
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(log_entry)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                print(f"API访问记录队列已满，已丢弃 {self.dropped} 条记录")
+            return
+        if self._queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def write(self, batch):
+        """写入一批访问记录并更新使用统计，失败时丢弃该批记录 (记录日志失败不应该影响正常API)"""
+        if not batch:
+            return
+        with self._flush_lock:
+            try:
+                # 一批记录和统计在同一个事务中提交，SQLite 每批只需获取一次写锁
+                with transaction.atomic():
+                    APIAccessLog.objects.bulk_create(batch, batch_size=self.batch_size)
+                    for (user_id, api_name, date), delta in aggregate_usage_statistics(batch).items():
+                        apply_usage_statistics(user_id, api_name, date, delta)
+            except Exception as e:
+                print(f"API访问记录批量写入失败({len(batch)} 条): {str(e)}")
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """写入队列中已有的全部记录 (后台线程定时调用，进程退出或测试时也可直接调用)"""
+        if self._queue is None or self._pid != os.getpid():
+            return
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self.write(batch)
+
+
+# --- 单例 ---
+_buffer_instance = None
+_buffer_instance_lock = threading.Lock()
+
+
+def get_api_log_buffer():
+    """获取访问记录缓冲队列的单例"""
+    global _buffer_instance
+    if _buffer_instance is None:
+        with _buffer_instance_lock:
+            if _buffer_instance is None:
+                _buffer_instance = APIAccessLogBuffer(
+                    batch_size=getattr(settings, 'API_ACCESS_LOG_BATCH_SIZE', 200),
+                    flush_interval=getattr(settings, 'API_ACCESS_LOG_FLUSH_INTERVAL', 2.0),
+                    queue_size=getattr(settings, 'API_ACCESS_LOG_QUEUE_SIZE', 10000),
+                )
+                atexit.register(_buffer_instance.flush)
+    return _buffer_instance
+
+
+def enqueue_api_access_log(log_entry):
+    """提交一条访问记录：默认放入缓冲队列，API_ACCESS_LOG_ASYNC=False 时立即写入"""
+    buffer = get_api_log_buffer()
+    if getattr(settings, 'API_ACCESS_LOG_ASYNC', True):
+        buffer.put(log_entry)
+    else:
+        buffer.write([log_entry])
+
+
+def flush_api_access_logs():
+    """立即写入当前进程中缓冲的访问记录"""
+    get_api_log_buffer().flush()
@@ -6,7 +6,10 @@ from django.utils import timezone
 from django.http import JsonResponse
 from django.core.files.uploadedfile import UploadedFile, InMemoryUploadedFile
 from django.core.serializers.json import DjangoJSONEncoder
-from apps.api.models import APIAccessLog, APIUsageStatistics
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from apps.api.models import APIAccessLog
+from apps.utils.api_log_buffer import enqueue_api_access_log, apply_usage_statistics
 
 def log_api_access(api_name=None, sensitive_fields=None):
     """
@@ -69,9 +72,9 @@ def log_api_access(api_name=None, sensitive_fields=None):
             # 计算响应大小
             response_size = calculate_response_size(response)
             
-            # 记录访问日志
+            # 记录访问日志（放入缓冲队列，由后台线程批量写入访问记录并累加使用统计）
             try:
-                log_entry = APIAccessLog.objects.create(
+                log_entry = APIAccessLog(
                     user=user,
                     ip_address=ip_address,
                     user_agent=user_agent,
@@ -89,10 +92,7 @@ def log_api_access(api_name=None, sensitive_fields=None):
                     is_success=is_success,
                     api_version='v1'
                 )
-                
-                # 更新使用统计
-                if user:
-                    update_usage_statistics(user, current_api_name, is_success, execution_time, request_size, response_size)
+                enqueue_api_access_log(log_entry)
                 
             except Exception as e:
                 # 记录日志失败不应该影响正常API响应
@@ -180,21 +180,32 @@ def get_request_params(request, sensitive_fields=None):
         print(f"获取请求参数失败: {str(e)}")
         return {}
 
+def get_response_content(response):
+    """
+    获取响应体 bytes，流式响应返回 None（不能在这里提前读取）
+
+    DRF 的 Response 在视图返回时尚未渲染（accepted_renderer 在 finalize_response 中才设置），
+    此时按 JSON 渲染其 data，与默认渲染器的输出一致。
+    """
+    if getattr(response, 'streaming', False):
+        return None
+    if isinstance(response, Response) and not response.is_rendered:
+        if getattr(response, 'accepted_renderer', None) is None:
+            return JSONRenderer().render(response.data)
+        response.render()
+    return getattr(response, 'content', None)
+
 def get_response_data(response):
     """获取响应数据"""
     try:
-        if hasattr(response, 'content'):
-            # 确保响应内容已经渲染
-            if not response.is_rendered:
-                response.render()
-            content = response.content.decode('utf-8')
-            if content:
-                try:
-                    return json.loads(content)
-                except json.JSONDecodeError:
-                    # 如果不是JSON格式，返回字符串
-                    return {'raw_content': content[:1000]}  # 限制长度
-            return None
+        content = get_response_content(response)
+        if content:
+            content = content.decode('utf-8')
+            try:
+                return json.loads(content)
+            except json.JSONDecodeError:
+                # 如果不是JSON格式，返回字符串
+                return {'raw_content': content[:1000]}  # 限制长度
         return None
     except Exception as e:
         print(f"获取响应数据失败: {str(e)}")
@@ -231,48 +242,23 @@ def calculate_request_size(request):
 def calculate_response_size(response):
     """计算响应大小"""
     try:
-        if hasattr(response, 'content'):
-            # 确保响应内容已经渲染
-            if not response.is_rendered:
-                response.render()
-            return len(response.content)
-        return 0
+        content = get_response_content(response)
+        return len(content) if content else 0
     except Exception as e:
         print(f"计算响应大小失败: {str(e)}")
         return 0
 
 def update_usage_statistics(user, api_name, is_success, execution_time, request_size, response_size):
-    """更新API使用统计"""
+    """更新API使用统计（立即写入，使用 F() 表达式原子累加）"""
     try:
-        today = timezone.now().date()
-        
-        # 获取或创建统计记录
-        stats, created = APIUsageStatistics.objects.get_or_create(
-            user=user,
-            api_name=api_name,
-            date=today,
-            defaults={
-                'total_requests': 0,
-                'successful_requests': 0,
-                'failed_requests': 0,
-                'total_execution_time': 0,
-                'total_request_size': 0,
-                'total_response_size': 0,
-            }
-        )
-        
-        # 更新统计信息
-        stats.total_requests += 1
-        if is_success:
-            stats.successful_requests += 1
-        else:
-            stats.failed_requests += 1
-        
-        stats.total_execution_time += execution_time
-        stats.total_request_size += request_size
-        stats.total_response_size += response_size
-        
-        stats.save()
+        apply_usage_statistics(user.pk, api_name, timezone.now().date(), {
+            'total_requests': 1,
+            'successful_requests': 1 if is_success else 0,
+            'failed_requests': 0 if is_success else 1,
+            'total_execution_time': execution_time,
+            'total_request_size': request_size,
+            'total_response_size': response_size,
+        })
         
     except Exception as e:
         print(f"更新使用统计失败: {str(e)}")
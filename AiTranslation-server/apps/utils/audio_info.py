@@ -1,13 +1,175 @@
 import sys
 import os
 import wave
+import struct
 import contextlib
+from collections import namedtuple
 
 try:
     import soundfile as sf
 except ImportError:
     sf = None
 
+# 从文件头解析出的音频信息（mp3 没有固定的采样位数，bits_per_sample 为 None）
+AudioInfo = namedtuple('AudioInfo', ['format', 'sample_rate', 'channels', 'bits_per_sample', 'duration'])
+
+# 解析文件头时读取的字节数（足够跳过常见的 ID3 标签；更靠后的 WAV 块头按需读取）
+HEADER_PROBE_SIZE = 64 * 1024
+
+# PCM 原始流没有文件头，按 16k 采样率、16bit、单声道计算
+PCM_SAMPLE_RATE = 16000
+PCM_CHANNELS = 1
+PCM_BITS_PER_SAMPLE = 16
+
+_MP3_BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),  # MPEG1 Layer III
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),      # MPEG2/2.5 Layer III
+}
+_MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def sniff_audio_format(header):
+    """根据文件头判断音频格式，无法识别时返回 None"""
+    if header[:4] == b'RIFF' and header[8:12] == b'WAVE':
+        return 'wav'
+    if header[:3] == b'ID3' or _find_mp3_frame(header, 0) == 0:
+        return 'mp3'
+    return None
+
+
+def parse_wav_header(header, total_size, read_at=None):
+    """
+    解析 WAV 的 fmt 块和 data 块，返回 AudioInfo；文件头不完整时抛出 ValueError
+
+    Args:
+        header: 文件开头的字节（通常为前 HEADER_PROBE_SIZE 字节）
+        total_size: 文件总大小
+        read_at: 可选的 read_at(offset, size) 函数，块头超出 header 范围时用它读取
+                 （LIST/bext 等元数据块可能把 data 块推到 64KB 之后），只读取块头，跳过块内容
+    """
+    if header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+        raise ValueError("不是有效的WAV文件")
+
+    def read(offset, size):
+        if offset + size <= len(header) or read_at is None:
+            return header[offset:offset + size]
+        return read_at(offset, size)
+
+    offset = 12
+    fmt = None
+    while offset + 8 <= total_size:
+        chunk_header = read(offset, 8)
+        if len(chunk_header) < 8:
+            break
+        chunk_id = chunk_header[:4]
+        chunk_size = struct.unpack('<I', chunk_header[4:8])[0]
+        body = offset + 8
+        if chunk_id == b'fmt ':
+            fmt_body = read(body, 16)
+            if len(fmt_body) < 16:
+                break
+            _, channels, sample_rate, byte_rate, _, bits = struct.unpack('<HHIIHH', fmt_body)
+            fmt = (channels, sample_rate, byte_rate, bits)
+        elif chunk_id == b'data':
+            if fmt is None:
+                break
+            channels, sample_rate, byte_rate, bits = fmt
+            # 流式写出的 WAV 可能没有填写 data 块大小，按文件剩余字节计算
+            available = max(0, total_size - body)
+            data_size = chunk_size if 0 < chunk_size <= available else available
+            duration = data_size / byte_rate if byte_rate else 0.0
+            return AudioInfo('wav', sample_rate, channels, bits, duration)
+        offset = body + chunk_size + (chunk_size & 1)
+    raise ValueError("WAV文件头不完整")
+
+
+def _parse_mp3_frame_header(header, offset):
+    """解析 offset 处的 MPEG Layer III 帧头，返回 (版本, 采样率, 声道数, 比特率kbps, 帧长度) 或 None"""
+    if offset + 4 > len(header):
+        return None
+    b1, b2, b3 = header[offset + 1], header[offset + 2], header[offset + 3]
+    if header[offset] != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+    version = (b1 >> 3) & 0x03
+    layer = (b1 >> 1) & 0x03
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 0x03
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    bitrate = _MP3_BITRATES[1 if version == 3 else 2][bitrate_index]
+    sample_rate = _MP3_SAMPLE_RATES[version][sample_rate_index]
+    channels = 1 if (b3 >> 6) == 3 else 2
+    padding = (b2 >> 1) & 0x01
+    frame_length = (144 if version == 3 else 72) * bitrate * 1000 // sample_rate + padding
+    return version, sample_rate, channels, bitrate, frame_length
+
+
+def _find_mp3_frame(header, start):
+    """从 start 开始查找第一个有效的帧头 (下一帧的帧头也有效，避免误判)，返回偏移或 None"""
+    offset = header.find(b'\xff', start)
+    while offset != -1 and offset + 4 <= len(header):
+        frame = _parse_mp3_frame_header(header, offset)
+        if frame is not None:
+            next_offset = offset + frame[4]
+            if next_offset + 4 > len(header) or _parse_mp3_frame_header(header, next_offset) is not None:
+                return offset
+        offset = header.find(b'\xff', offset + 1)
+    return None
+
+
+def parse_mp3_header(header, total_size):
+    """
+    解析 MP3 的首个帧头，返回 AudioInfo；文件头中找不到有效帧时抛出 ValueError。
+    VBR 文件按 Xing/Info/VBRI 头中的总帧数计算时长，CBR 文件按比特率和文件大小计算。
+    """
+    start = 0
+    if header[:3] == b'ID3' and len(header) >= 10:
+        tag_size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+        start = 10 + tag_size + (10 if header[5] & 0x10 else 0)
+    offset = _find_mp3_frame(header, start)
+    if offset is None:
+        raise ValueError("未找到有效的MP3帧")
+    version, sample_rate, channels, bitrate, _ = _parse_mp3_frame_header(header, offset)
+    samples_per_frame = 1152 if version == 3 else 576
+
+    # Xing/Info 头位于边信息之后，VBRI 头固定在帧头后 32 字节处
+    side_info = (32 if channels == 2 else 17) if version == 3 else (17 if channels == 2 else 9)
+    frame_count = None
+    xing = offset + 4 + side_info
+    if header[xing:xing + 4] in (b'Xing', b'Info') and len(header) >= xing + 12:
+        if struct.unpack('>I', header[xing + 4:xing + 8])[0] & 0x01:
+            frame_count = struct.unpack('>I', header[xing + 8:xing + 12])[0]
+    vbri = offset + 4 + 32
+    if frame_count is None and header[vbri:vbri + 4] == b'VBRI' and len(header) >= vbri + 18:
+        frame_count = struct.unpack('>I', header[vbri + 14:vbri + 18])[0]
+
+    if frame_count:
+        duration = frame_count * samples_per_frame / sample_rate
+    else:
+        duration = max(0, total_size - offset) * 8 / (bitrate * 1000)
+    return AudioInfo('mp3', sample_rate, channels, None, duration)
+
+
+def probe_audio_header(header, total_size, declared_format=None, read_at=None):
+    """
+    根据文件头 (前 HEADER_PROBE_SIZE 字节) 和文件总大小得到音频格式、采样率、声道数和时长，不解码音频。
+    无法从文件头识别的数据按 declared_format 处理 (pcm 按 16k/16bit/单声道计算时长)。
+    read_at(offset, size) 用于读取文件头之后的 WAV 块头 (见 parse_wav_header)。
+
+    Raises:
+        ValueError: 文件头无法解析或格式不受支持
+    """
+    audio_format = sniff_audio_format(header) or declared_format
+    if audio_format == 'wav':
+        return parse_wav_header(header, total_size, read_at)
+    if audio_format == 'mp3':
+        return parse_mp3_header(header, total_size)
+    if audio_format == 'pcm':
+        bytes_per_second = PCM_SAMPLE_RATE * PCM_CHANNELS * PCM_BITS_PER_SAMPLE // 8
+        return AudioInfo('pcm', PCM_SAMPLE_RATE, PCM_CHANNELS, PCM_BITS_PER_SAMPLE, total_size / bytes_per_second)
+    raise ValueError(f"暂不支持检测该格式: {audio_format}")
+
+
 def print_wav_info(filepath):
     with contextlib.closing(wave.open(filepath, 'rb')) as wf:
         channels = wf.getnchannels()
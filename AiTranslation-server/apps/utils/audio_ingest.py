@@ -0,0 +1,114 @@
+"""
+语音识别的音频接收
+
+上传的音频只写入磁盘一次：
+- 格式、采样率、声道数和时长从文件头解析 (apps.utils.audio_info.probe_audio_header)，不解码、不另存临时文件；
+- Django 已落盘的上传文件 (TemporaryUploadedFile) 直接改名移动到 media/voice_records，识别使用同一路径；
+- 内存中的上传文件和 Base64 音频直接把字节交给识别，存档到 media/voice_records 在后台线程中进行。
+"""
+import os
+import random
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from apps.utils.audio_info import HEADER_PROBE_SIZE, probe_audio_header
+
+VOICE_RECORDS_DIR = os.path.join('media', 'voice_records')
+
+# 后台存档线程
+_archive_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='AudioArchive')
+
+
+def _new_record_path(audio_format):
+    os.makedirs(VOICE_RECORDS_DIR, exist_ok=True)
+    filename = f"{int(time.time())}_{random.randint(1000, 9999)}.{audio_format}"
+    return os.path.join(VOICE_RECORDS_DIR, filename)
+
+
+def _write_record(path, audio_data):
+    """先写入临时文件再改名，存档过程中不会出现不完整的文件"""
+    tmp_path = path + '.part'
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(audio_data)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"音频存档失败 {path}: {e}")
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+class IngestedAudio:
+    """
+    接收到的一段音频
+
+    Attributes:
+        info: AudioInfo（格式、采样率、声道数、采样位数、时长）
+        data: 音频字节（内存中的音频），已落盘的上传文件为 None
+        path: 存档路径，save() 之后可用
+    """
+
+    def __init__(self, info, data=None, uploaded_path=None):
+        self.info = info
+        self.data = data
+        self.path = None
+        self._uploaded_path = uploaded_path
+
+    @property
+    def format(self):
+        return self.info.format
+
+    @property
+    def duration(self):
+        return self.info.duration
+
+    def save(self):
+        """
+        存档到 media/voice_records，返回存档路径：
+        已落盘的上传文件直接改名移动（跨文件系统时按块复制），内存中的音频提交到后台线程写入。
+        """
+        self.path = _new_record_path(self.info.format)
+        if self._uploaded_path is not None:
+            shutil.move(self._uploaded_path, self.path)
+            # Django 的上传临时文件权限为 0600，与 FileSystemStorage 一样按 FILE_UPLOAD_PERMISSIONS 修正
+            os.chmod(self.path, getattr(settings, 'FILE_UPLOAD_PERMISSIONS', None) or 0o644)
+        else:
+            _archive_executor.submit(_write_record, self.path, self.data)
+        return self.path
+
+
+def ingest_uploaded_file(uploaded_file, declared_format=None):
+    """
+    接收上传的音频文件（只读取文件头，不复制已落盘的文件）
+
+    Raises:
+        ValueError: 文件头无法解析或格式不受支持
+    """
+    declared_format = declared_format or uploaded_file.name.split('.')[-1].lower()
+    temporary_path = getattr(uploaded_file, 'temporary_file_path', None)
+    if temporary_path is not None:
+        def read_at(offset, size):
+            uploaded_file.seek(offset)
+            return uploaded_file.read(size)
+
+        uploaded_file.seek(0)
+        header = uploaded_file.read(HEADER_PROBE_SIZE)
+        info = probe_audio_header(header, uploaded_file.size, declared_format, read_at)
+        return IngestedAudio(info, uploaded_path=temporary_path())
+    uploaded_file.seek(0)
+    return ingest_bytes(uploaded_file.read(), declared_format)
+
+
+def ingest_bytes(audio_data, declared_format):
+    """
+    接收内存中的音频字节（如 Base64 解码后的数据）
+
+    Raises:
+        ValueError: 文件头无法解析或格式不受支持
+    """
+    info = probe_audio_header(audio_data[:HEADER_PROBE_SIZE], len(audio_data), declared_format,
+                              lambda offset, size: audio_data[offset:offset + size])
+    return IngestedAudio(info, data=audio_data)
@@ -95,6 +95,32 @@ class Ws_Param(object):
         return url
 
 
+def build_audio_frame(ws_param, status, buf):
+    """构造一帧音频数据（JSON字符串），第一帧携带识别参数"""
+    frame = {
+        "header": {"status": status, "app_id": ws_param.APPID},
+        "payload": {
+            "audio": {
+                "audio": str(base64.b64encode(buf), 'utf-8'), "sample_rate": 16000, "encoding": "raw"
+            }
+        }
+    }
+    if status == STATUS_FIRST_FRAME:
+        frame["parameter"] = {"iat": ws_param.iat_params}
+    return json.dumps(frame)
+
+
+def decode_result_text(payload):
+    """从响应的 payload 中解析出识别文本"""
+    text = payload["result"]["text"]
+    text = json.loads(str(base64.b64decode(text), "utf8"))
+    result = ''
+    for i in text['ws']:
+        for j in i["cw"]:
+            result += j["w"]
+    return result
+
+
 class XunfeiSpeechRecognition:
     """讯飞语音识别客户端 - 基于官方接口"""
     
@@ -120,14 +146,7 @@ class XunfeiSpeechRecognition:
             else:
                 payload = message.get("payload")
                 if payload:
-                    text = payload["result"]["text"]
-                    text = json.loads(str(base64.b64decode(text), "utf8"))
-                    text_ws = text['ws']
-                    result = ''
-                    for i in text_ws:
-                        for j in i["cw"]:
-                            w = j["w"]
-                            result += w
+                    result = decode_result_text(payload)
                     self.result_text += result
                     print(f"识别结果: {result}")
                     
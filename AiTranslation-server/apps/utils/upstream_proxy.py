@@ -0,0 +1,196 @@
+"""
+转发请求到 Flask 翻译服务的代理层
+
+- 所有转发共用一个 keep-alive 连接池 (urllib3)，不再每次请求新建连接；
+- 请求体和响应体都以数据块的形式流式转发，Django 进程不解析、也不整体缓存图片 JSON；
+- 每个上游限制并发数：并发已满时最多等待 queue_timeout 秒，超时后立即返回 503，
+  翻译服务变慢时不会占满 gunicorn 的全部工作线程；
+- 熔断：连续 failure_threshold 次连接失败、超时或 502/503/504 后熔断 recovery_timeout 秒，
+  熔断期间直接返回 503；到期后放行一个探测请求，成功则恢复。
+"""
+import threading
+import time
+
+import urllib3
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+# 透传给客户端的上游响应头
+PASS_THROUGH_RESPONSE_HEADERS = ('Content-Length', 'Content-Encoding', 'Content-Disposition', 'Cache-Control')
+# 计入熔断失败次数的上游状态码 (500 一般是单个请求的处理错误，不计入)
+FAILURE_STATUS_CODES = (502, 503, 504)
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class UpstreamUnavailable(Exception):
+    """上游暂不可用 (熔断中或并发已满)，retry_after 为建议的重试等待秒数"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """熔断器：closed (正常) -> open (熔断) -> half_open (放行一个探测请求) -> closed/open"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """请求前调用，熔断中时抛出 UpstreamUnavailable"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            remaining = self.opened_at + self.recovery_timeout - time.monotonic()
+            if remaining <= 0:
+                # 由当前请求探测上游是否恢复；探测请求迟迟没有结果时，下一个周期再放行一个
+                self.state = self.HALF_OPEN
+                self.opened_at = time.monotonic()
+                return
+            raise UpstreamUnavailable("翻译服务暂不可用（熔断中）", retry_after=max(1, int(remaining) + 1))
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"翻译服务连续失败 {self.failures} 次，熔断 {self.recovery_timeout} 秒")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class UpstreamProxy:
+    """单个上游服务的流式代理"""
+
+    def __init__(self, host, max_concurrency=8, queue_timeout=5, connect_timeout=5,
+                 failure_threshold=5, recovery_timeout=30):
+        hostname, _, port = host.partition(':')
+        self.host = host
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.connect_timeout = connect_timeout
+        # block=True：连接数不超过 maxsize；并发由 _slots 控制，这里不会真正阻塞
+        self.pool = urllib3.HTTPConnectionPool(hostname, int(port or 80), maxsize=max_concurrency, block=True)
+        self.breaker = CircuitBreaker(failure_threshold, recovery_timeout)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    def forward(self, method, path, body=None, headers=None, read_timeout=120):
+        """
+        转发请求并返回流式响应
+
+        Args:
+            body: bytes 或带 read() 的文件对象 (如 Django 的 HttpRequest，按块读取原始请求体)
+            headers: 转发的请求头，文件对象作为请求体时应带上 Content-Length，否则使用分块传输
+
+        Returns:
+            StreamingHttpResponse: 状态码、Content-Type 与上游一致，响应体边读边返回
+
+        Raises:
+            UpstreamUnavailable: 熔断中或并发已满
+            urllib3.exceptions.HTTPError: 连接失败或超时
+        """
+        self.breaker.before_request()
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise UpstreamUnavailable(f"翻译服务繁忙（并发上限 {self.max_concurrency}）")
+        try:
+            upstream = self.pool.urlopen(
+                method, path, body=body, headers=headers,
+                timeout=urllib3.Timeout(connect=self.connect_timeout, read=read_timeout),
+                retries=False, redirect=False,
+                preload_content=False, decode_content=False, release_conn=False,
+            )
+        except Exception:
+            self._slots.release()
+            self.breaker.record_failure()
+            raise
+
+        if upstream.status in FAILURE_STATUS_CODES:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+        response = StreamingHttpResponse(
+            _UpstreamBody(self, upstream),
+            status=upstream.status,
+            content_type=upstream.headers.get('Content-Type', 'application/json'),
+        )
+        for header in PASS_THROUGH_RESPONSE_HEADERS:
+            if header in upstream.headers:
+                response[header] = upstream.headers[header]
+        return response
+
+    def fetch(self, method, path, body=None, headers=None, read_timeout=120):
+        """
+        转发请求并读取完整响应体，用于文本翻译这类响应很小、调用方需要解析响应内容的接口
+        (连接池、并发限制和熔断与 forward 相同)
+
+        Returns:
+            tuple: (状态码, 响应体 bytes)
+        """
+        response = self.forward(method, path, body=body, headers=headers, read_timeout=read_timeout)
+        try:
+            content = b''.join(response.streaming_content)
+        finally:
+            response.close()
+        return response.status_code, content
+
+    def release(self):
+        self._slots.release()
+
+
+class _UpstreamBody:
+    """
+    上游响应体的可迭代包装：逐块返回数据，close() 时归还连接和并发名额。
+    StreamingHttpResponse 关闭时总会调用 close()，即使响应体一次也没有被迭代 (如 HEAD 请求、客户端提前断开)。
+    """
+
+    def __init__(self, proxy, upstream):
+        self._proxy = proxy
+        self._upstream = upstream
+        self._completed = False
+        self._closed = False
+
+    def __iter__(self):
+        try:
+            for chunk in self._upstream.stream(STREAM_CHUNK_SIZE, decode_content=False):
+                yield chunk
+            self._completed = True
+        except Exception:
+            self._proxy.breaker.record_failure()  # 读取超时或上游中途断开
+            raise
+        finally:
+            self.close()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if not self._completed:
+            self._upstream.close()  # 响应体未读完的连接不能复用
+        self._upstream.release_conn()
+        self._proxy.release()
+
+
+# 创建全局实例 (Flask 翻译服务)
+translation_proxy = UpstreamProxy(
+    host=getattr(settings, 'SPARK_API_HOST', '127.0.0.1:5000'),
+    max_concurrency=getattr(settings, 'SPARK_PROXY_MAX_CONCURRENCY', 8),
+    queue_timeout=getattr(settings, 'SPARK_PROXY_QUEUE_TIMEOUT', 5),
+    connect_timeout=getattr(settings, 'SPARK_PROXY_CONNECT_TIMEOUT', 5),
+    failure_threshold=getattr(settings, 'SPARK_PROXY_FAILURE_THRESHOLD', 5),
+    recovery_timeout=getattr(settings, 'SPARK_PROXY_RECOVERY_TIMEOUT', 30),
+)
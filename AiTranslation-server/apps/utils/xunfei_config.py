@@ -51,4 +51,12 @@ ENGINE_TYPES = {
         'rate': '16000',
         'language': 'auto'
     }
-} 
\ No newline at end of file
+} 
+# 文件识别模式配置（见 apps/utils/xunfei_file_recognizer.py）
+XUNFEI_FILE_MODE_CONFIG = {
+    'FRAME_SIZE': 1280,        # 每帧音频字节数（与实时模式相同）
+    'FRAME_INTERVAL': 0,       # 帧间隔（秒），0 表示不按实时节奏等待，只受 WebSocket 发送缓冲区限制
+    'TIMEOUT': 60,             # 单次识别超时（秒）
+    'MAX_CONCURRENCY': 10,     # 同时进行的识别数上限（不超过讯飞账号的并发路数）
+    'VERIFY_SSL': False,       # 是否校验讯飞服务端证书（与实时模式保持一致，默认不校验）
+}
@@ -0,0 +1,187 @@
+"""
+讯飞语音听写 - 文件识别模式
+
+XunfeiSpeechRecognition 按实时节奏 (每 40ms 一帧) 发送音频，并每 100ms 轮询一次识别是否完成，
+60 秒的音频会占用请求线程 60 秒以上。音频已经保存在磁盘上时改用本模块：
+- 音频帧连续发送，只受 WebSocket 发送缓冲区 (TCP 流控) 限制，不再模拟采样间隔；
+- 识别在共享的 asyncio 事件循环 (后台线程) 中进行，结果通过 Future 返回，调用方阻塞等待而不是轮询；
+- 多个识别可以在同一事件循环中并发进行，并发数由 XUNFEI_FILE_MODE_CONFIG['MAX_CONCURRENCY'] 限制。
+
+用法:
+    result = recognize_file('/path/to/audio.wav')            # 同步等待: {'success', 'text', 'error'}
+    result = recognize_audio(audio_bytes)                     # 已在内存中的音频，同上
+    future = submit_recognition('/path/to/audio.wav')         # 提交后立即返回 concurrent.futures.Future
+    result = await recognize_file_async('/path/to/audio.wav') # 在共享事件循环中使用
+"""
+import asyncio
+import concurrent.futures
+import json
+import ssl
+import threading
+import time
+
+import websockets
+
+from apps.utils.spark_mucl_cn_iat import (
+    Ws_Param, build_audio_frame, decode_result_text,
+    STATUS_FIRST_FRAME, STATUS_CONTINUE_FRAME, STATUS_LAST_FRAME,
+)
+from apps.utils.xunfei_config import XUNFEI_FILE_MODE_CONFIG
+
+
+class RecognitionLoop:
+    """在后台线程中运行的共享 asyncio 事件循环"""
+
+    def __init__(self, max_concurrency):
+        self.max_concurrency = max_concurrency
+        self.loop = asyncio.new_event_loop()
+        self._semaphore = None
+        self._thread = threading.Thread(target=self._run, name='XunfeiRecognitionLoop', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """把协程提交到事件循环，返回 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(self._limited(coro), self.loop)
+
+    async def _limited(self, coro):
+        async with self._semaphore:
+            return await coro
+
+
+async def recognize_audio_async(audio_data, ws_param=None, url=None, frame_size=None, frame_interval=None):
+    """
+    在当前事件循环中识别一段音频
+
+    Args:
+        audio_data: 音频字节（与实时模式一样按原样分帧发送）
+        ws_param: 讯飞鉴权参数，默认使用 XUNFEI_CONFIG
+        url: WebSocket 地址，默认由 ws_param 生成带鉴权的讯飞地址（测试时可指向本地模拟服务）
+
+    Returns:
+        dict: {'success': bool, 'text': str, 'error': str 或 None}
+    """
+    ws_param = ws_param or Ws_Param()
+    url = url or ws_param.create_url()
+    frame_size = frame_size or XUNFEI_FILE_MODE_CONFIG['FRAME_SIZE']
+    if frame_interval is None:
+        frame_interval = XUNFEI_FILE_MODE_CONFIG['FRAME_INTERVAL']
+
+    connect_kwargs = {'max_size': None}
+    if url.startswith('wss://') and not XUNFEI_FILE_MODE_CONFIG['VERIFY_SSL']:
+        ssl_context = ssl.create_default_context()
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+        connect_kwargs['ssl'] = ssl_context
+
+    async def send_frames(ws):
+        status = STATUS_FIRST_FRAME
+        for offset in range(0, len(audio_data), frame_size):
+            await ws.send(build_audio_frame(ws_param, status, audio_data[offset:offset + frame_size]))
+            status = STATUS_CONTINUE_FRAME
+            if frame_interval:
+                await asyncio.sleep(frame_interval)
+            else:
+                await asyncio.sleep(0)  # 让出事件循环，其他识别的收发不会被长音频阻塞
+        if status == STATUS_FIRST_FRAME:
+            # 空音频：仍需发送带识别参数的第一帧
+            await ws.send(build_audio_frame(ws_param, STATUS_FIRST_FRAME, b''))
+        await ws.send(build_audio_frame(ws_param, STATUS_LAST_FRAME, b''))
+
+    result_text = ''
+    async with websockets.connect(url, **connect_kwargs) as ws:
+        sender = asyncio.create_task(send_frames(ws))
+        try:
+            async for message in ws:
+                message = json.loads(message)
+                code = message["header"]["code"]
+                if code != 0:
+                    return {'success': False, 'text': result_text, 'error': f"请求错误：{code}"}
+                payload = message.get("payload")
+                if payload:
+                    result_text += decode_result_text(payload)
+                if message["header"]["status"] == STATUS_LAST_FRAME:
+                    return {'success': True, 'text': result_text, 'error': None}
+            if sender.done() and not sender.cancelled() and sender.exception() is not None:
+                raise sender.exception()
+            return {'success': False, 'text': result_text, 'error': "连接在识别完成前关闭"}
+        finally:
+            if not sender.done():
+                sender.cancel()
+            await asyncio.gather(sender, return_exceptions=True)
+
+
+async def recognize_file_async(audio_file_path, **kwargs):
+    """在当前事件循环中识别音频文件（参数同 recognize_audio_async）"""
+    with open(audio_file_path, 'rb') as f:
+        audio_data = f.read()
+    return await recognize_audio_async(audio_data, **kwargs)
+
+
+# --- 共享事件循环 ---
+_loop_instance = None
+_loop_instance_lock = threading.Lock()
+
+
+def get_recognition_loop():
+    """获取共享事件循环的单例"""
+    global _loop_instance
+    if _loop_instance is None:
+        with _loop_instance_lock:
+            if _loop_instance is None:
+                _loop_instance = RecognitionLoop(XUNFEI_FILE_MODE_CONFIG['MAX_CONCURRENCY'])
+    return _loop_instance
+
+
+def submit_audio(audio_data, **kwargs):
+    """
+    提交一段音频 (字节) 到共享事件循环识别，立即返回 concurrent.futures.Future，
+    其结果为 {'success', 'text', 'error'}（连接失败等异常也会作为失败结果返回）
+    """
+    async def run():
+        try:
+            return await recognize_audio_async(audio_data, **kwargs)
+        except Exception as e:
+            return {'success': False, 'text': '', 'error': f"识别失败: {str(e)}"}
+
+    return get_recognition_loop().submit(run())
+
+
+def submit_recognition(audio_file_path, **kwargs):
+    """提交一个文件识别任务到共享事件循环（同 submit_audio）"""
+    with open(audio_file_path, 'rb') as f:
+        audio_data = f.read()
+    return submit_audio(audio_data, **kwargs)
+
+
+def recognize_audio(audio_data, timeout=None, **kwargs):
+    """
+    同步识别一段音频（在共享事件循环中执行，当前线程阻塞等待结果，不轮询）
+
+    Returns:
+        dict: 与 XunfeiSpeechRecognition.recognize_audio_file 相同的 {'success', 'text', 'error'}
+    """
+    timeout = timeout or XUNFEI_FILE_MODE_CONFIG['TIMEOUT']
+    start_time = time.time()
+    future = submit_audio(audio_data, **kwargs)
+    try:
+        result = future.result(timeout=timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()  # 取消事件循环中的识别任务并关闭连接
+        return {'success': False, 'text': '', 'error': "识别超时"}
+    print(f"讯飞文件识别完成，用时 {time.time() - start_time:.2f}秒")
+    return result
+
+
+def recognize_file(audio_file_path, timeout=None, **kwargs):
+    """同步识别音频文件（同 recognize_audio）"""
+    try:
+        with open(audio_file_path, 'rb') as f:
+            audio_data = f.read()
+    except Exception as e:
+        return {'success': False, 'text': '', 'error': f"识别失败: {str(e)}"}
+    return recognize_audio(audio_data, timeout=timeout, **kwargs)
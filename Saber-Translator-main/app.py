@@ -13,7 +13,6 @@ import sys
 import colorama
 from datetime import datetime
 from src.plugins.manager import get_plugin_manager
-from src.interfaces.yolo_interface import load_yolo_model
 import mimetypes
 import copy
 
@@ -413,6 +412,10 @@ def log_response(response):
     return response
 
 if __name__ == '__main__':
+    # 打包后的程序中，工作进程池的子进程需要由此进入 (见 src/core/worker_pool.py)
+    import multiprocessing
+    multiprocessing.freeze_support()
+
     # 只在主进程打开浏览器，热重载子进程不打开
     if not os.environ.get('WERKZEUG_RUN_MAIN'):
         threading.Timer(1, open_browser).start()
@@ -461,7 +464,7 @@ if __name__ == '__main__':
     start_service_monitor()
     logger.info("服务监控线程已启动")
     
-    # 预加载MangaOCR模型
+    # 关闭 MangaOCR 的控制台日志
     try:
         # 在导入MangaOCR之前先关闭其日志输出
         for manga_log in ['manga_ocr.ocr', 'manga_ocr']:
@@ -471,12 +474,15 @@ if __name__ == '__main__':
             for handler in list(manga_logger.handlers):
                 if isinstance(handler, logging.StreamHandler) and handler.stream == sys.stdout:
                     manga_logger.removeHandler(handler)
-            
-        from src.interfaces.manga_ocr_interface import preload_manga_ocr
-        preload_manga_ocr()
-        logger.info("已启动 MangaOCR 模型预加载线程")
     except Exception as e:
-        logger.error(f"MangaOCR 预加载失败: {e}")
+        logger.error(f"设置 MangaOCR 日志级别失败: {e}")
+
+    # 在后台线程中并行预热模型 (检测、OCR、LAMA)，加载状态可通过 /api/ready 查询。
+    # 开启自动重载时只在实际处理请求的子进程中预热，监视文件变化的父进程不加载模型
+    use_reloader = True
+    if not use_reloader or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        from src.core.model_registry import get_model_registry
+        get_model_registry().warm_up()
     
     logger.info("程序正在运行，请在浏览器中访问 http://127.0.0.1:5000/")
     
@@ -487,4 +493,4 @@ if __name__ == '__main__':
     cli = sys.modules['flask.cli']
     cli.show_server_banner = lambda *x: None
     
-    app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=use_reloader)
\ No newline at end of file
@@ -176,6 +176,9 @@ datas = [
     
     # 打包 weights 文件夹
     ('weights', 'weights'),
+
+    # 打包检测后端一致性检查使用的样例页面
+    (os.path.join('data', 'detector_parity'), os.path.join('data', 'detector_parity')),
     
     # 打包 models 文件夹 (包含MI-GAN模型)
     ('models', 'models'),
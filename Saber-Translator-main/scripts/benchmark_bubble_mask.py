@@ -0,0 +1,103 @@
+"""
+气泡掩码生成的微基准测试。
+
+在合成页面上比较旧实现 (每个气泡分配整页 edge_mask 并整页高斯模糊) 与
+src.core.inpainting.create_bubble_mask 的 ROI 实现，并校验两者输出完全一致。
+
+用法 (在项目根目录运行):
+    python scripts/benchmark_bubble_mask.py
+    python scripts/benchmark_bubble_mask.py --width 4000 --height 6000 --bubbles 30 --repeat 3
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+# 把项目根目录加入 sys.path，以便导入 src 模块
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.core.inpainting import create_bubble_mask
+
+
+def legacy_create_bubble_mask(image_size, bubble_coords):
+    """旧版实现 (仅保留掩码计算部分)，作为对比基准。"""
+    mask = np.ones(image_size[:2], dtype=np.uint8) * 255
+    for x1, y1, x2, y2 in bubble_coords:
+        width = x2 - x1
+        height = y2 - y1
+        if width <= 0 or height <= 0: continue
+        padding_w = max(1, int(width * 0.02))
+        padding_h = max(1, int(height * 0.02))
+        cv2.rectangle(mask, (x1, y1), (x2, y2), 0, -1)
+        edge_mask = np.ones_like(mask) * 255
+        cv2.rectangle(edge_mask,
+                      (max(0, x1-padding_w), max(0, y1-padding_h)),
+                      (min(mask.shape[1]-1, x2+padding_w), min(mask.shape[0]-1, y2+padding_h)),
+                      0, padding_w)
+        blur_size = max(3, padding_w*2+1)
+        if blur_size % 2 == 0:
+            blur_size += 1
+        edge_mask = cv2.GaussianBlur(edge_mask, (blur_size, blur_size), 0)
+        mask = np.minimum(mask, edge_mask)
+    return mask
+
+
+def make_bubbles(width, height, count, rng):
+    """随机生成气泡坐标，部分气泡贴近页面边缘以覆盖边界情况。"""
+    coords = []
+    for i in range(count):
+        bw = int(rng.integers(width // 25, width // 10))
+        bh = int(rng.integers(height // 40, height // 15))
+        if i % 5 == 0: # 贴边气泡
+            x1 = 0 if i % 2 == 0 else width - bw - 1
+        else:
+            x1 = int(rng.integers(0, width - bw))
+        y1 = int(rng.integers(0, height - bh))
+        coords.append((x1, y1, x1 + bw, y1 + bh))
+    return coords
+
+
+def bench(func, image_size, coords, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(image_size, coords)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="create_bubble_mask 微基准测试")
+    parser.add_argument('--width', type=int, default=4000)
+    parser.add_argument('--height', type=int, default=6000)
+    parser.add_argument('--bubbles', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    image_size = (args.height, args.width, 3)
+    coords = make_bubbles(args.width, args.height, args.bubbles, rng)
+
+    legacy_time, legacy_mask = bench(legacy_create_bubble_mask, image_size, coords, args.repeat)
+    roi_time, roi_mask = bench(create_bubble_mask, image_size, coords, args.repeat)
+
+    # create_bubble_mask 在黑色区域占比超过 40% 时会额外腐蚀，合成页面的气泡数量不会触发该分支
+    identical = np.array_equal(legacy_mask, roi_mask)
+    print(f"页面: {args.width}x{args.height}, 气泡: {len(coords)}, 重复: {args.repeat} 次 (取最快)")
+    print(f"旧实现 (整页模糊): {legacy_time * 1000:.1f} ms")
+    print(f"ROI 实现:          {roi_time * 1000:.1f} ms")
+    print(f"加速比: {legacy_time / roi_time:.1f}x, 输出一致: {identical}")
+    if not identical:
+        diff = np.count_nonzero(legacy_mask != roi_mask)
+        print(f"警告: 有 {diff} 个像素不一致")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+气泡检测推理后端的基准测试。
+
+把 weights/best.pt 导出为 ONNX/OpenVINO (已缓存时直接使用缓存)，在同一组图片上比较
+PyTorch 与导出模型的单张/批量推理耗时，并检查两者的检测结果是否一致。
+
+用法 (在项目根目录运行):
+    python scripts/benchmark_detector_backend.py
+    python scripts/benchmark_detector_backend.py --format openvino --images pic/before1.png pic/before2.png
+    python scripts/benchmark_detector_backend.py --int8 --repeat 5
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+import cv2
+
+# 把项目根目录加入 sys.path，以便导入 src 模块
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.interfaces import yolov12_interface
+from src.interfaces.yolov12_export import export_weights, compare_detections
+from src.shared.path_helpers import resource_path
+
+
+def bench(model, images, conf, repeat, batch):
+    """返回 (检测结果, 单张推理最快平均耗时, 批量推理最快耗时)。"""
+    model.predict(source=images[0], conf=conf, verbose=False)  # 预热
+    single_best = batch_best = float('inf')
+    outputs = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        outputs = [yolov12_interface._merge_results(model.predict(source=img, conf=conf, verbose=False))
+                   for img in images]
+        single_best = min(single_best, (time.perf_counter() - start) / len(images))
+        start = time.perf_counter()
+        for i in range(0, len(images), batch):
+            model.predict(source=images[i:i + batch], conf=conf, verbose=False)
+        batch_best = min(batch_best, time.perf_counter() - start)
+    return outputs, single_best, batch_best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="气泡检测推理后端基准测试")
+    parser.add_argument('--format', default='onnx', choices=['onnx', 'openvino'])
+    parser.add_argument('--int8', action='store_true', help="ONNX 导出后做 INT8 动态量化")
+    parser.add_argument('--weights', default='weights/best.pt')
+    parser.add_argument('--images', nargs='*', default=[], help="测试图片，默认使用一致性检查的样例页面")
+    parser.add_argument('--conf', type=float, default=0.25)
+    parser.add_argument('--batch', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    weights_path = resource_path(args.weights)
+    images = [cv2.imread(resource_path(p)) for p in args.images] or yolov12_interface._parity_samples()
+    images = [img for img in images if img is not None]
+    if not images:
+        print("没有可用的测试图片")
+        return
+
+    model_path, cache_dir, _ = export_weights(weights_path, args.format, args.int8)
+    if model_path is None:
+        print(f"无法导出 {args.format} 模型，请查看日志")
+        return
+
+    YOLO = yolov12_interface._import_yolo()
+    reference, pt_single, pt_batch = bench(YOLO(weights_path), images, args.conf, args.repeat, args.batch)
+    candidate, ex_single, ex_batch = bench(YOLO(model_path, task='detect'), images, args.conf, args.repeat, args.batch)
+    report = compare_detections(reference, candidate, int8=args.int8)
+
+    print(f"图片: {len(images)} 张，批大小: {args.batch}，重复: {args.repeat} 次 (取最快)")
+    print(f"导出模型: {model_path}")
+    print(f"PyTorch:  单张 {pt_single * 1000:.1f} ms，批量共 {pt_batch * 1000:.1f} ms")
+    print(f"{args.format}{' INT8' if args.int8 else ''}: 单张 {ex_single * 1000:.1f} ms，批量共 {ex_batch * 1000:.1f} ms")
+    print(f"加速比: 单张 {pt_single / ex_single:.2f}x，批量 {pt_batch / ex_batch:.2f}x")
+    print(f"一致性: {'通过' if report['ok'] else '未通过'} (框数 {report['boxes']}，最小 IoU {report['min_iou']}，"
+          f"最大置信度差 {report['max_score_diff']})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+启动导入耗时的基准测试。
+
+每个模块在独立的子进程中导入 (不受其他模块已导入的影响)，统计导入耗时，
+并列出导入过程中被连带加载的重型框架 (torch、ultralytics、transformers 等)。
+模型注册表改为延迟导入后，导入 src.core.processing 或 app 不应再加载这些框架。
+
+用法 (在项目根目录运行):
+    python scripts/benchmark_import_time.py
+    python scripts/benchmark_import_time.py --modules app src.core.processing --repeat 3
+    python scripts/benchmark_import_time.py --modules src.core.ocr --top 15   # 额外列出 -X importtime 中最慢的模块
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+DEFAULT_MODULES = [
+    'src.core.detection',
+    'src.core.ocr',
+    'src.core.inpainting',
+    'src.core.processing',
+    'src.app',
+    'app',
+]
+HEAVY_MODULES = ['torch', 'ultralytics', 'transformers', 'manga_ocr', 'litelama', 'paddle', 'paddleocr', 'onnxruntime']
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module):
+    """在子进程中导入模块，返回 (耗时秒数, 被加载的重型框架列表)；导入失败时抛出 RuntimeError。"""
+    result = subprocess.run([sys.executable, '-c', _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                            cwd=PROJECT_ROOT, capture_output=True, text=True)
+    lines = [line for line in result.stdout.splitlines() if line.startswith('{')]
+    if result.returncode != 0 or not lines:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "导入失败")
+    data = json.loads(lines[-1])
+    return data['seconds'], data['heavy']
+
+
+def top_imports(module, count):
+    """使用 python -X importtime 列出累计耗时最长的模块。"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=PROJECT_ROOT, capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        # 格式: "import time: <自身微秒> | <累计微秒> | <模块名>"，首行为表头
+        fields = line[len('import time:'):].split('|') if line.startswith('import time:') else []
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        rows.append((int(fields[1]), int(fields[0]), fields[2].strip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动导入耗时基准测试")
+    parser.add_argument('--modules', nargs='*', default=DEFAULT_MODULES)
+    parser.add_argument('--repeat', type=int, default=1, help="每个模块重复测量的次数 (取最快)")
+    parser.add_argument('--top', type=int, default=0, help="列出 -X importtime 中累计耗时最长的 N 个模块")
+    args = parser.parse_args()
+
+    print(f"{'模块':<36}{'导入耗时':>10}   连带加载的重型框架")
+    for module in args.modules:
+        try:
+            runs = [measure(module) for _ in range(max(1, args.repeat))]
+        except RuntimeError as e:
+            print(f"{module:<36}{'失败':>10}   {e}")
+            continue
+        seconds = min(run[0] for run in runs)
+        heavy = runs[0][1]
+        print(f"{module:<36}{seconds * 1000:>8.0f}ms   {', '.join(heavy) if heavy else '无'}")
+        if args.top:
+            for cumulative_us, self_us, name in top_imports(module, args.top):
+                print(f"    {cumulative_us / 1000:>8.1f}ms (自身 {self_us / 1000:.1f}ms)  {name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -9,6 +9,7 @@ from .system_api import system_bp
 from .session_api import session_bp
 from .auth_api import auth_bp
 from .text_translate_api import text_translate_bp
+from .page_store_api import page_store_bp
 
 # 这个列表将在应用初始化时被导入和注册
-all_blueprints = [translate_bp, config_bp, system_bp, session_bp, auth_bp, text_translate_bp]
\ No newline at end of file
+all_blueprints = [translate_bp, config_bp, system_bp, session_bp, auth_bp, text_translate_bp, page_store_bp]
\ No newline at end of file
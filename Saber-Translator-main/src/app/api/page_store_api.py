@@ -0,0 +1,92 @@
+# src/app/api/page_store_api.py
+"""
+页面存储相关的API端点：上传一次图像，之后各编辑端点通过图像 ID 引用。
+"""
+
+from flask import Blueprint, request, jsonify, send_file
+import base64
+import binascii
+import logging
+from src.core.page_store import get_page_store, is_valid_image_id, PageNotFoundError
+
+# 获取 logger
+logger = logging.getLogger("PageStoreAPI")
+
+page_store_bp = Blueprint('page_store_api', __name__, url_prefix='/api/pages')
+
+
+def page_image_url(image_id):
+    """图像 ID 对应的访问 URL (前端可直接用作 <img> 的 src)。"""
+    return f"/api/pages/{image_id}"
+
+
+@page_store_bp.route('/upload', methods=['POST'])
+def upload_pages():
+    """
+    上传图像并返回图像 ID (原始字节的 SHA-256)，相同内容重复上传不会重复存储。
+    支持 multipart 表单 (字段名 'files'，可多个) 或 JSON {"images": ["base64 或 DataURL", ...]}。
+    """
+    store = get_page_store()
+    image_ids = []
+    try:
+        if request.files:
+            for file in request.files.getlist('files') or list(request.files.values()):
+                # 未声明类型的 Blob 以 application/octet-stream 上传，按未声明处理
+                mime = file.mimetype if file.mimetype != 'application/octet-stream' else None
+                image_ids.append(store.put_bytes(file.read(), mime))
+        else:
+            data = request.get_json(silent=True) or {}
+            images = data.get('images')
+            if not isinstance(images, list) or not images:
+                return jsonify({'error': '请通过 files 表单字段或 JSON 的 images 列表提供图像'}), 400
+            for image_data in images:
+                if isinstance(image_data, str) and image_data.startswith('data:'):
+                    image_data = image_data.split(',', 1)[-1]
+                image_ids.append(store.put_bytes(base64.b64decode(image_data)))
+    except (ValueError, binascii.Error) as e:
+        return jsonify({'error': f'无效的图像数据: {e}'}), 400
+    except Exception as e:
+        logger.error(f"上传图像到页面存储失败: {e}", exc_info=True)
+        return jsonify({'error': '保存图像失败'}), 500
+
+    logger.info(f"页面存储: 上传 {len(image_ids)} 张图像")
+    return jsonify({
+        'success': True,
+        'image_ids': image_ids,
+        'urls': [page_image_url(image_id) for image_id in image_ids]
+    })
+
+
+@page_store_bp.route('/missing', methods=['POST'])
+def missing_pages():
+    """
+    查询哪些图像 ID 不在存储中。前端可先在本地计算 SHA-256，只上传缺失的图像。
+    请求: {"image_ids": [...]}，响应: {"missing": [...]}
+    """
+    data = request.get_json(silent=True) or {}
+    image_ids = data.get('image_ids')
+    if not isinstance(image_ids, list):
+        return jsonify({'error': '缺少 image_ids 列表'}), 400
+    return jsonify({'success': True, 'missing': get_page_store().missing(image_ids)})
+
+
+@page_store_bp.route('/stats', methods=['GET'])
+def page_store_stats():
+    return jsonify({'success': True, 'stats': get_page_store().get_stats()})
+
+
+@page_store_bp.route('/<image_id>', methods=['GET'])
+def get_page(image_id):
+    """返回图像原始字节。内容由 ID 决定，永不变化，因此允许浏览器长期缓存。"""
+    if not is_valid_image_id(image_id):
+        return jsonify({'error': '无效的图像 ID'}), 400
+    try:
+        path, mime = get_page_store().get_path(image_id)
+    except PageNotFoundError as e:
+        return jsonify({'error': str(e), 'missing_image_ids': [image_id]}), 404
+    if request.if_none_match and image_id in request.if_none_match:
+        return '', 304
+    response = send_file(path, mimetype=mime, conditional=True, max_age=31536000)
+    response.set_etag(image_id)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
@@ -1,6 +1,6 @@
 # src/app/api/session_api.py
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, send_file
 import logging
 from src.core import session_manager # 导入我们创建的会话管理器模块
 
@@ -78,16 +78,20 @@ def list_sessions_api():
 # === 新增：加载指定会话 API ===
 @session_bp.route('/load', methods=['GET'])
 def load_session_api():
-    """加载指定名称的会话数据。"""
+    """
+    加载指定名称的会话数据。
+    查询参数 lazy=1 时只返回元数据和图像 URL，图像由前端通过 /image 端点按需获取。
+    """
     session_name = request.args.get('name') # 从 URL 查询参数获取会话名称
-    logger.info(f"收到加载会话请求: name='{session_name}'")
+    lazy = request.args.get('lazy', '').lower() in ('1', 'true', 'yes')
+    logger.info(f"收到加载会话请求: name='{session_name}', lazy={lazy}")
 
     if not session_name:
         logger.warning("加载请求失败：缺少 'name' 查询参数。")
         return jsonify({'success': False, 'error': "缺少会话名称参数 ('name')"}), 400
 
     try:
-        loaded_data = session_manager.load_session(session_name)
+        loaded_data = session_manager.load_session(session_name, lazy=lazy)
 
         if loaded_data is not None:
             logger.info(f"API: 会话 '{session_name}' 加载成功。")
@@ -102,6 +106,30 @@ def load_session_api():
         return jsonify({'success': False, 'error': '加载会话时发生服务器内部错误。'}), 500
 # === 结束新增 ===
 
+# --- 新增：按内容哈希获取会话图像 ---
+@session_bp.route('/image', methods=['GET'])
+def get_session_image_api():
+    """
+    返回会话中的单张图像 (原始字节)。
+    图像文件名即内容哈希，同一 URL 的内容永远不变，因此允许浏览器长期缓存。
+    """
+    session_name = request.args.get('name')
+    image_hash = request.args.get('hash', '').lower()
+    if not session_name or not image_hash:
+        return jsonify({'success': False, 'error': "缺少参数 ('name' 和 'hash')"}), 400
+
+    filepath, mime = session_manager.get_session_image_path(session_name, image_hash)
+    if not filepath:
+        return jsonify({'success': False, 'error': '图像不存在'}), 404
+
+    if request.if_none_match and image_hash in request.if_none_match:
+        return '', 304
+    response = send_file(filepath, mimetype=mime, conditional=True, max_age=31536000)
+    response.set_etag(image_hash)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+# --- 结束新增 ---
+
 # === 新增：删除指定会话 API ===
 @session_bp.route('/delete', methods=['POST'])
 def delete_session_api():
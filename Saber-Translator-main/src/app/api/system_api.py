@@ -2,12 +2,11 @@
 包含与系统功能相关的API端点
 """
 
-from flask import Blueprint, request, jsonify, send_file, session, abort # 导入 Blueprint, request, jsonify, send_file, session, abort
+from flask import Blueprint, request, jsonify, send_file, session, abort, Response, stream_with_context # 导入 Blueprint, request, jsonify, send_file, session, abort
 # 导入系统相关模块 (os, shutil, requests, pdf processor 等)
 import os
 import shutil
 import requests
-import PyPDF2 # 导入 PyPDF2
 import base64 # 需要 base64
 import io # 需要 io
 from PIL import Image, ImageDraw, ImageFont # 需要 Image, ImageDraw 和 ImageFont
@@ -15,20 +14,25 @@ import traceback # 需要traceback
 import time # 需要time
 import logging # 需要logging
 import threading # 需要threading
-import zipfile # 新增: 用于处理zip文件
 import uuid # 新增: 用于生成唯一ID
+import json
 from werkzeug.utils import secure_filename # 需要 secure_filename
 
-from src.core.pdf_processor import extract_images_from_pdf # 导入 PDF 处理函数
+from src.core.pdf_processor import get_pdf_page_count, iter_pdf_images # 导入 PDF 处理函数
+from src.core.page_store import get_page_store, is_valid_image_id
+from src.core.archive_export import ArchiveExporter, ARCHIVE_FORMATS
+from src.core.model_registry import get_model_registry, get_warmup_model_names
+from .page_store_api import page_image_url
 from src.shared.path_helpers import get_debug_dir, resource_path # 需要调试目录函数和路径助手
-from src.interfaces.lama_interface import clean_image_with_lama, LAMA_AVAILABLE # 导入LAMA接口
+from src.shared.debug_sink import get_debug_sink # 调试产物写入器
+from src.interfaces.lama_interface import clean_image_with_lama, is_lama_available # 导入LAMA接口
 from src.interfaces.baidu_ocr_interface import test_baidu_ocr_connection # 导入百度OCR接口测试方法
 from src.interfaces.vision_interface import test_ai_vision_ocr # 导入AI视觉OCR测试函数
 from src.interfaces.baidu_translate_interface import baidu_translate # 导入百度翻译接口
 from src.plugins.manager import get_plugin_manager # 需要插件管理器
 from src.plugins.base import PluginBase # 需要基类来检查类型
 from src.shared.image_helpers import base64_to_image # 需要 image_helpers
-from src.core.detection import get_bubble_coordinates # 需要 detection
+from src.core.detection import get_bubble_coordinates, get_bubble_coordinates_batch # 需要 detection
 from src.shared import constants # 导入常量
 # ... 其他需要的导入 ...
 
@@ -40,6 +44,15 @@ system_bp = Blueprint('system_api', __name__, url_prefix='/api')
 # --- API 路由函数将在此处定义 (后续步骤迁移) ---
 @system_bp.route('/upload_pdf', methods=['POST'])
 def upload_pdf_api():
+    """
+    从 PDF 中提取图像。上传的文件先保存到 data/temp 下，页面在工作进程池中分段并行提取，
+    RGB/灰度的 JPEG 和 PNG 图像原样返回 (不重新编码)，其他格式转换为 PNG。
+
+    表单字段 (也可以放在查询参数中):
+        stream: 为 true 时以 NDJSON 逐张返回图像，第一行为 {"total_pages": N}，
+                之后每张图像一行 {"index", "page", "image", "mime"}，最后一行为 {"done": true, "count": N}。
+        return_image_ids: 为 true 时图像存入页面存储，每行只返回 "image_id" 和 "image_url"。
+    """
     if 'pdfFile' not in request.files:
         return jsonify({'error': '没有上传文件'}), 400
 
@@ -47,33 +60,85 @@ def upload_pdf_api():
     if pdf_file.filename == '':
         return jsonify({'error': '文件名为空'}), 400
 
-    if pdf_file:
+    def _flag(name):
+        return str(request.form.get(name, request.args.get(name, ''))).lower() in ('1', 'true', 'yes')
+
+    stream = _flag('stream')
+    use_image_ids = _flag('return_image_ids')
+
+    # 保存到临时文件：工作进程按路径各自打开 PDF，整个文件也无需常驻内存
+    temp_dir = os.path.join(resource_path(''), 'data', 'temp', str(uuid.uuid4()))
+    os.makedirs(temp_dir, exist_ok=True)
+    pdf_path = os.path.join(temp_dir, 'upload.pdf')
+    try:
+        pdf_file.save(pdf_path)
+        page_count = get_pdf_page_count(pdf_path)
+    except Exception as e:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        logger.error(f"读取 PDF 文件失败: {e}")
+        return jsonify({'error': f"处理 PDF 文件时出错: {e}"}), 400
+
+    def _iter_image_entries():
+        """逐张产出图像条目，结束 (或客户端提前断开) 后删除临时文件。"""
         try:
-            # 使用从core模块导入的函数处理PDF
-            pdf_bytes = pdf_file.read()
-            pdf_stream = io.BytesIO(pdf_bytes)
-            
-            images = extract_images_from_pdf(pdf_stream)
-            
-            image_data_list = []
-            for i, image in enumerate(images):
-                try:
-                    buffered = io.BytesIO()
-                    # 确保图像是PNG格式
-                    if image.mode != 'RGB':
-                        image = image.convert('RGB')
-                    image.save(buffered, format="PNG")
-                    img_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
-                    image_data_list.append(img_str)
-                except Exception as save_e:
-                    print(f"保存图片失败，跳过图片{i+1}: {save_e}")
-
-            return jsonify({'images': image_data_list}), 200
-        except Exception as e:
-            print(f"处理 PDF 文件时出错: {e}")
-            return jsonify({'error': f"处理 PDF 文件时出错: {e}"}), 500
+            for index, (page_num, _, data, mime) in enumerate(iter_pdf_images(pdf_path, page_count)):
+                entry = {'index': index, 'page': page_num + 1, 'mime': mime}
+                if use_image_ids:
+                    image_id = get_page_store().put_bytes(data, mime)
+                    entry['image_id'] = image_id
+                    entry['image_url'] = page_image_url(image_id)
+                else:
+                    entry['image'] = base64.b64encode(data).decode('utf-8')
+                yield entry
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    logger.info(f"开始提取 PDF 图像: {pdf_file.filename} ({page_count} 页)")
+    if stream:
+        def _generate():
+            count = 0
+            try:
+                yield json.dumps({'total_pages': page_count}) + '\n'
+                for entry in _iter_image_entries():
+                    count += 1
+                    yield json.dumps(entry) + '\n'
+                yield json.dumps({'done': True, 'success': True, 'count': count}) + '\n'
+            except Exception as e:
+                logger.error(f"流式提取 PDF 图像时出错: {e}", exc_info=True)
+                yield json.dumps({'done': True, 'success': False, 'count': count, 'error': str(e)}, ensure_ascii=False) + '\n'
+        return Response(stream_with_context(_generate()), mimetype='application/x-ndjson',
+                        headers={'X-Accel-Buffering': 'no', 'Cache-Control': 'no-cache'})
+
+    try:
+        entries = list(_iter_image_entries())
+    except Exception as e:
+        logger.error(f"处理 PDF 文件时出错: {e}", exc_info=True)
+        return jsonify({'error': f"处理 PDF 文件时出错: {e}"}), 500
+    if use_image_ids:
+        return jsonify({
+            'image_ids': [entry['image_id'] for entry in entries],
+            'urls': [entry['image_url'] for entry in entries],
+            'mime_types': [entry['mime'] for entry in entries]
+        }), 200
+    return jsonify({
+        'images': [entry['image'] for entry in entries],
+        'mime_types': [entry['mime'] for entry in entries]
+    }), 200
 
-    return jsonify({'error': '上传失败'}), 500
+@system_bp.route('/ready', methods=['GET'])
+def ready_api():
+    """
+    就绪检查：返回各本地模型的加载状态和耗时。启动时预热的模型都已结束加载 (无论成功与否) 时返回 200，
+    否则返回 503，可用作负载均衡/容器编排的就绪探针。?wait=1 时先同步加载全部预热模型再返回。
+    """
+    registry = get_model_registry()
+    if request.args.get('wait') in ('1', 'true'):
+        registered = registry.get_status()['models']
+        for name in get_warmup_model_names():
+            if name in registered:
+                registry.ensure(name)
+    status = registry.get_status()
+    return jsonify(status), 200 if status['ready'] else 503
 
 @system_bp.route('/clean_debug_files', methods=['POST'])
 def clean_debug_files():
@@ -105,6 +170,7 @@ def clean_debug_files():
             
             # 保留目录结构但清空内容
             os.makedirs(os.path.join(debug_dir, "bubbles"), exist_ok=True)
+            get_debug_sink().reset_dir_usage()
             
             success_messages.append(f'已清理 {files_count} 个调试文件，释放了 {total_size_mb:.2f}MB 空间')
         else:
@@ -153,6 +219,27 @@ def clean_debug_files():
         print(f"清理文件失败: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@system_bp.route('/debug_artifacts', methods=['GET'])
+def get_debug_artifacts_settings():
+    """获取调试产物保存的开关、采样率和写入统计"""
+    return jsonify(get_debug_sink().get_stats())
+
+@system_bp.route('/debug_artifacts', methods=['POST'])
+def set_debug_artifacts_settings():
+    """修改调试产物保存的开关和采样率: { "enabled": true, "sample_rate": 0.5 }"""
+    data = request.get_json() or {}
+    try:
+        sample_rate = data.get('sample_rate')
+        if sample_rate is not None:
+            sample_rate = float(sample_rate)
+            if not 0 <= sample_rate <= 1:
+                return jsonify({'error': 'sample_rate 必须在 0 到 1 之间'}), 400
+        sink = get_debug_sink()
+        sink.configure(enabled=data.get('enabled'), sample_rate=sample_rate)
+        return jsonify({'success': True, **sink.get_stats()})
+    except (TypeError, ValueError):
+        return jsonify({'error': 'sample_rate 必须是数字'}), 400
+
 @system_bp.route('/test_ollama_connection', methods=['GET'])
 def test_ollama_connection():
     """测试Ollama连接状态的端点"""
@@ -252,10 +339,10 @@ def test_lama_repair():
         logger.info(f"保存掩码图像：{mask_path}")
         
         # 确认LAMA可用
-        if not LAMA_AVAILABLE:
+        if not is_lama_available():
             return jsonify({
                 'error': 'LAMA功能不可用',
-                'LAMA_AVAILABLE': LAMA_AVAILABLE
+                'LAMA_AVAILABLE': False
             })
         
         # 使用LAMA执行修复
@@ -646,6 +733,24 @@ def detect_boxes_api():
         logger.error(f"仅检测坐标时出错: {e}", exc_info=True)
         return jsonify({'success': False, 'error': f'检测坐标失败: {str(e)}'}), 500
 
+@system_bp.route('/detect_boxes_batch', methods=['POST'])
+def detect_boxes_batch_api():
+    """接收多张图片数据 (例如整个章节)，批量检测并按顺序返回每张图片的气泡坐标"""
+    data = request.get_json()
+    if not data or not isinstance(data.get('images'), list) or not data['images']:
+        return jsonify({'error': '缺少图像数据列表 (images)'}), 400
+
+    conf_threshold = float(data.get('conf_threshold', 0.6))
+    batch_size = int(data.get('batch_size', constants.DETECTION_BATCH_SIZE))
+
+    try:
+        images_pil = [base64_to_image(image_data) for image_data in data['images']]
+        coords_list = get_bubble_coordinates_batch(images_pil, conf_threshold=conf_threshold, batch_size=batch_size)
+        return jsonify({'success': True, 'all_bubble_coords': coords_list})
+    except Exception as e:
+        logger.error(f"批量检测坐标时出错: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': f'批量检测坐标失败: {str(e)}'}), 500
+
 # --- 新增：插件默认状态 API ---
 
 @system_bp.route('/plugins/default_states', methods=['GET'])
@@ -1032,10 +1137,30 @@ def upload_font():
         return jsonify({'error': f"上传字体文件失败: {str(e)}"}), 500
 
 # 新增API端点：批量下载图片
+def _iter_export_images(image_data_list):
+    """逐张解码导出请求中的图像 (base64/DataURL 或页面存储的图像 ID)，产出 (序号, 图像字节)。"""
+    for i, img_data in enumerate(image_data_list):
+        if not img_data:
+            logger.warning(f"跳过索引 {i} 的空图片数据")
+            continue
+        try:
+            if is_valid_image_id(img_data):
+                yield i, get_page_store().get_bytes(img_data)
+                continue
+            # 处理Base64数据
+            if ',' in img_data:
+                img_data = img_data.split(',', 1)[1]
+            yield i, base64.b64decode(img_data)
+        except Exception as e:
+            logger.error(f"读取图片 {i} 失败: {str(e)}")
+
 @system_bp.route('/download_all_images', methods=['POST'])
 def download_all_images_api():
     """
-    接收图像数据，将它们保存在临时目录，然后打包成ZIP、PDF或CBZ并返回下载链接
+    把图像打包成ZIP、PDF或CBZ。PNG/JPEG 图像不经解码直接写入压缩包，PDF 逐页追加，内存占用与页数无关。
+
+    请求: {"images": ["base64/DataURL 或图像 ID", ...], "format": "zip"|"cbz"|"pdf", "stream": false}
+    stream 为 true 时边打包边以分块传输直接返回文件；否则写入临时目录并返回下载用的 file_id。
     """
     logger.info("收到批量下载请求")
     
@@ -1047,97 +1172,55 @@ def download_all_images_api():
             
         format_type = data.get('format', 'zip')
         image_data_list = data.get('images', [])
+        stream = data.get('stream', False)
         
         if not image_data_list:
             return jsonify({'error': '没有提供图片数据'}), 400
+        if format_type not in ARCHIVE_FORMATS:
+            logger.error(f"不支持的格式类型: {format_type}")
+            return jsonify({'error': f'不支持的格式类型: {format_type}'}), 400
             
         logger.info(f"准备处理 {len(image_data_list)} 张图片，格式: {format_type}")
-            
-        # 创建唯一的临时目录
+
+        exporter = ArchiveExporter(format_type)
+        chunks = exporter.iter_chunks(_iter_export_images(image_data_list))
+        try:
+            # 先取出第一个数据块：没有任何有效图像时仍可以返回错误状态码
+            first_chunk = next(chunks)
+        except ValueError:
+            logger.error("没有成功处理任何图片")
+            return jsonify({'error': '所有图片处理失败'}), 500
+
+        filename = f"comic_translator_images{exporter.extension}"
+        if stream:
+            def _generate():
+                yield first_chunk
+                try:
+                    yield from chunks
+                except Exception as e:
+                    # 响应头已经发出，只能中断传输，客户端会收到不完整的文件
+                    logger.error(f"流式导出中断: {e}", exc_info=True)
+            return Response(stream_with_context(_generate()), mimetype=exporter.mimetype, headers={
+                'Content-Disposition': f'attachment; filename="{filename}"',
+                'X-Accel-Buffering': 'no',
+                'Cache-Control': 'no-cache',
+            })
+
+        # 创建唯一的临时目录，前端通过 /download_file/{unique_id} 下载
         unique_id = str(uuid.uuid4())
-        # 获取临时目录路径，这里使用data/temp/{unique_id}作为临时目录
         base_path = resource_path('')
         temp_dir = os.path.join(base_path, 'data', 'temp', unique_id)
         os.makedirs(temp_dir, exist_ok=True)
-        logger.info(f"创建临时目录: {temp_dir}")
-        
-        # 保存所有图片到临时目录
-        saved_files = []
-        for i, img_data in enumerate(image_data_list):
-            if not img_data:
-                logger.warning(f"跳过索引 {i} 的空图片数据")
-                continue
-                
-            try:
-                # 处理Base64数据
-                if ',' in img_data:
-                    img_data = img_data.split(',', 1)[1]
-                    
-                # 解码Base64数据
-                img_bytes = base64.b64decode(img_data)
-                img = Image.open(io.BytesIO(img_bytes))
-                
-                # 保存图片到临时目录
-                filename = f"image_{i:03d}.png"
-                filepath = os.path.join(temp_dir, filename)
-                img.save(filepath, format="PNG")
-                saved_files.append(filepath)
-                logger.info(f"已保存图片 {i+1}/{len(image_data_list)}: {filename}")
-            except Exception as e:
-                logger.error(f"保存图片 {i} 失败: {str(e)}")
-        
-        if not saved_files:
-            logger.error("没有成功保存任何图片")
-            return jsonify({'error': '所有图片处理失败'}), 500
-            
-        logger.info(f"成功保存 {len(saved_files)}/{len(image_data_list)} 张图片")
-        
-        # 根据请求的格式类型打包文件
-        output_path = ""
-        if format_type == 'zip' or format_type == 'cbz':
-            # ZIP和CBZ格式基本相同，只是扩展名不同
-            ext = '.cbz' if format_type == 'cbz' else '.zip'
-            output_path = os.path.join(temp_dir, f"comic_translator_images{ext}")
-            
-            with zipfile.ZipFile(output_path, 'w') as zipf:
-                for file in saved_files:
-                    # 只添加文件名，不包含路径
-                    zipf.write(file, os.path.basename(file))
-                    
-            logger.info(f"已创建{format_type.upper()}文件: {output_path}")
-            
-        elif format_type == 'pdf':
-            # 创建PDF文件
-            output_path = os.path.join(temp_dir, "comic_translator_images.pdf")
-            
-            # 使用PIL创建PDF
-            images = []
-            for file in saved_files:
-                try:
-                    img = Image.open(file).convert('RGB')
-                    images.append(img)
-                except Exception as e:
-                    logger.error(f"加载图片到PDF失败: {file} - {str(e)}")
-            
-            if images:
-                first_image = images[0]
-                if len(images) > 1:
-                    first_image.save(output_path, save_all=True, append_images=images[1:])
-                else:
-                    first_image.save(output_path)
-                logger.info(f"已创建PDF文件: {output_path}")
-            else:
-                logger.error("无法创建PDF：没有有效图像")
-                return jsonify({'error': '创建PDF失败：没有有效图像'}), 500
-        else:
-            logger.error(f"不支持的格式类型: {format_type}")
-            return jsonify({'error': f'不支持的格式类型: {format_type}'}), 400
+        output_path = os.path.join(temp_dir, filename)
+        with open(output_path, 'wb') as f:
+            f.write(first_chunk)
+            for chunk in chunks:
+                f.write(chunk)
+        logger.info(f"已创建{format_type.upper()}文件: {output_path}")
             
-        # 返回用于下载的文件路径
-        # 注意：这里返回的是相对路径，前端需要通过/download_file/{unique_id}访问
         return jsonify({
             'success': True,
-            'message': f'已成功处理 {len(saved_files)} 张图片',
+            'message': f'已成功处理 {exporter.count} 张图片',
             'file_id': unique_id,
             'format': format_type
         })
@@ -2,19 +2,26 @@
 包含与翻译相关的API端点
 """
 
-from flask import Blueprint, request, jsonify # 已有
+from flask import Blueprint, request, jsonify, Response, stream_with_context # 已有
 import base64
 import io
 from PIL import Image, ImageDraw, ImageFont # 需要 Image, ImageDraw 和 ImageFont
 import traceback # 添加traceback导入
 import logging # 需要 logging
 import json # 添加json导入
+import re
 
 # 导入核心处理函数和接口
-from src.core.processing import process_image_translation
-from src.core.rendering import re_render_text_in_bubbles, render_single_bubble # 添加渲染函数
-from src.core.translation import translate_single_text # 添加单文本翻译函数
-from src.interfaces.lama_interface import is_lama_available, clean_image_with_lama, LAMA_AVAILABLE
+from src.core.processing import process_image_translation, build_processing_params
+from src.core.job_engine import get_chapter_job_engine
+from src.core.rendering import re_render_text_in_bubbles, render_single_bubble, build_default_bubble_styles # 添加渲染函数
+from src.core.incremental_render import (render_page as render_page_incremental, get_cached_styles,
+                                         get_incremental_render_cache, hash_image_data, encode_tiles)
+from src.core.translation import translate_single_text_with_memory # 单文本翻译 (带翻译记忆)
+from src.core.translation_memory import get_translation_memory
+from src.core.page_store import get_page_store, PageNotFoundError
+from src.core.batch_render import get_batch_renderer, build_render_task, PageImageMissingError
+from src.interfaces.lama_interface import is_lama_available, clean_image_with_lama
 
 # 导入共享模块
 from src.shared import constants
@@ -29,8 +36,322 @@ translate_bp = Blueprint('translate_api', __name__, url_prefix='/api')
 
 # 从配置API模块导入所需函数
 from .config_api import save_model_info_api
+from .page_store_api import page_image_url
 # --------------------------
 
+def _parse_processing_options(data):
+    """
+    从翻译请求中解析 process_image_translation 所需的参数 (不含图像)。
+    /translate_image 与章节任务接口共用此函数。
+
+    Returns:
+        dict: process_image_translation 的关键字参数 (不含 image_pil)。
+
+    Raises:
+        ValueError: 参数缺失或无效，异常信息可直接返回给前端。
+    """
+    # 打印详细的请求数据（添加此日志）
+    logger.info("----- 翻译请求参数 -----")
+    logger.info(f"气泡填充方式: useInpainting={data.get('use_inpainting')}, useLama={data.get('use_lama')}")
+    logger.info(f"文字方向: {data.get('textDirection')}, 字体: {data.get('fontFamily')}, 字号: {data.get('fontSize')}")
+    logger.info(f"跳过翻译: {data.get('skip_translation', False)}, 跳过OCR: {data.get('skip_ocr', False)}")  # 更新日志
+    logger.info(f"仅消除模式: {data.get('remove_only', False)}")  # 添加仅消除模式日志
+    
+    # --- 获取新的 JSON 格式标记 ---
+    use_json_format_translation = data.get('use_json_format_translation', False)
+    use_json_format_ai_vision_ocr = data.get('use_json_format_ai_vision_ocr', False)
+    logger.info(f"JSON输出模式: 翻译={use_json_format_translation}, AI视觉OCR={use_json_format_ai_vision_ocr}")
+    use_batch_translation = data.get('use_batch_translation', False)
+    logger.info(f"整页批量翻译: {use_batch_translation}")
+    # ------------------------------
+    
+    # --- 新增：获取 rpm 参数 ---
+    rpm_limit_translation = data.get('rpm_limit_translation', constants.DEFAULT_rpm_TRANSLATION)
+    rpm_limit_ai_vision_ocr = data.get('rpm_limit_ai_vision_ocr', constants.DEFAULT_rpm_AI_VISION_OCR)
+    
+    # 确保rpm值是整数
+    try:
+        rpm_limit_translation = int(rpm_limit_translation)
+        if rpm_limit_translation < 0: rpm_limit_translation = 0 # 负数视为无限制
+    except (ValueError, TypeError):
+        rpm_limit_translation = constants.DEFAULT_rpm_TRANSLATION
+    
+    try:
+        rpm_limit_ai_vision_ocr = int(rpm_limit_ai_vision_ocr)
+        if rpm_limit_ai_vision_ocr < 0: rpm_limit_ai_vision_ocr = 0
+    except (ValueError, TypeError):
+        rpm_limit_ai_vision_ocr = constants.DEFAULT_rpm_AI_VISION_OCR
+    
+    logger.info(f"rpm 设置: 翻译服务 rpm={rpm_limit_translation}, AI视觉OCR rpm={rpm_limit_ai_vision_ocr}")
+    # --------------------------
+
+    # === 新增：获取描边参数 START ===
+    enable_text_stroke = data.get('enableTextStroke', constants.DEFAULT_TEXT_STROKE_ENABLED)
+    text_stroke_color = data.get('textStrokeColor', constants.DEFAULT_TEXT_STROKE_COLOR)
+    text_stroke_width = int(data.get('textStrokeWidth', constants.DEFAULT_TEXT_STROKE_WIDTH))
+    logger.info(f"描边设置: enable={enable_text_stroke}, color={text_stroke_color}, width={text_stroke_width}")
+    # === 新增：获取描边参数 END ===
+    
+    logger.info("------------------------")
+    
+    target_language = data.get('target_language', constants.DEFAULT_TARGET_LANG)
+    source_language = data.get('source_language', constants.DEFAULT_SOURCE_LANG)
+    font_size_str = data.get('fontSize')
+    autoFontSize = data.get('autoFontSize', False)
+    api_key = data.get('api_key')
+    model_name = data.get('model_name')
+    model_provider = data.get('model_provider', constants.DEFAULT_MODEL_PROVIDER)
+    font_family = data.get('fontFamily', constants.DEFAULT_FONT_RELATIVE_PATH)
+    text_direction = data.get('textDirection', constants.DEFAULT_TEXT_DIRECTION)
+    prompt_content = data.get('prompt_content')
+    use_textbox_prompt = data.get('use_textbox_prompt', False)
+    textbox_prompt_content = data.get('textbox_prompt_content')
+    use_inpainting = data.get('use_inpainting', False)  # 添加智能修复选项
+    blend_edges = data.get('blend_edges', True)
+    inpainting_strength = float(data.get('inpainting_strength', constants.DEFAULT_INPAINTING_STRENGTH))
+    use_lama = data.get('use_lama', False)  # 添加LAMA修复选项
+    skip_translation = data.get('skip_translation', False)  # 跳过翻译参数
+    skip_ocr = data.get('skip_ocr', False)  # 跳过OCR参数
+    remove_only = data.get('remove_only', False)  # 新增：仅消除文字模式参数
+    fill_color = data.get('fill_color', constants.DEFAULT_FILL_COLOR)  # 新增：气泡填充颜色参数
+    text_color = data.get('text_color', constants.DEFAULT_TEXT_COLOR)  # 新增：文字颜色参数
+    rotation_angle = data.get('rotation_angle', constants.DEFAULT_ROTATION_ANGLE)  # 新增：旋转角度参数
+    ocr_engine = data.get('ocr_engine', 'auto')  # 新增：OCR引擎选择参数
+    
+    # 百度OCR相关参数
+    baidu_api_key = data.get('baidu_api_key')
+    baidu_secret_key = data.get('baidu_secret_key')
+    baidu_version = data.get('baidu_version', 'standard')
+    
+    # 新增：获取 AI 视觉 OCR 参数
+    ai_vision_provider = data.get('ai_vision_provider')
+    ai_vision_api_key = data.get('ai_vision_api_key')
+    ai_vision_model_name = data.get('ai_vision_model_name')
+    ai_vision_ocr_prompt = data.get('ai_vision_ocr_prompt', constants.DEFAULT_AI_VISION_OCR_PROMPT)
+    custom_ai_vision_base_url = data.get('custom_ai_vision_base_url') # <<< 获取新的参数
+    
+    # --- 新增: 获取 custom_base_url ---
+    custom_base_url = data.get('custom_base_url') # 新增
+    logger.info(f"自定义 OpenAI Base URL: {custom_base_url if custom_base_url else '未提供'}")
+    # ---------------------------------
+    
+    # 对于仅消除文字模式，放宽对API和模型参数的要求
+    if remove_only:
+        logger.info("仅消除文字模式：不检查API和模型参数")
+        if not font_family:
+            raise ValueError('缺少必要的图像和字体参数')
+    else:
+        # 正常模式下的参数检查
+        if not all([target_language, text_direction, model_name, model_provider, font_family]):
+            raise ValueError('缺少必要的参数')
+            
+        # 对于非本地部署的服务商，API Key是必须的
+        if model_provider == constants.CUSTOM_OPENAI_PROVIDER_ID:
+            if not api_key:
+                raise ValueError('使用自定义OpenAI兼容服务时必须提供API Key')
+            if not model_name:
+                raise ValueError('使用自定义OpenAI兼容服务时必须提供模型名称')
+            if not custom_base_url:
+                raise ValueError('使用自定义OpenAI兼容服务时必须提供Base URL')
+        elif model_provider not in ['ollama', 'sakura'] and not api_key: # 原有逻辑
+            raise ValueError('非本地部署模式下必须提供API Key')
+    
+    # 检查百度OCR参数
+    if ocr_engine == 'baidu_ocr' and not (baidu_api_key and baidu_secret_key):
+        raise ValueError('使用百度OCR时必须提供API Key和Secret Key')
+
+    # 检查自定义AI视觉OCR参数
+    if ocr_engine == constants.AI_VISION_OCR_ENGINE_ID and \
+       ai_vision_provider == constants.CUSTOM_AI_VISION_PROVIDER_ID and \
+       not custom_ai_vision_base_url:
+        logger.error("请求错误：使用自定义AI视觉OCR服务时缺少 custom_ai_vision_base_url")
+        raise ValueError('使用自定义AI视觉OCR服务时必须提供Base URL (custom_ai_vision_base_url)')
+
+    # 处理字体大小 - 支持自动字体大小
+    if autoFontSize:
+        font_size = 'auto'
+        logger.info(f"使用自动字体大小")
+    else:
+        try:
+            # 检查是否从自动字号切换到非自动字号
+            prev_auto_font_size = data.get('prev_auto_font_size', False)
+            if prev_auto_font_size:
+                # 从自动字号切换到非自动字号，直接使用默认字号
+                font_size = constants.DEFAULT_FONT_SIZE
+                logger.info(f"从自动字号切换到非自动字号，使用默认字号: {font_size}")
+            else:
+                font_size = int(font_size_str)
+        except (ValueError, TypeError):
+            logger.warning(f"字体大小参数'{font_size_str}'无效，使用默认值: {constants.DEFAULT_FONT_SIZE}")
+            font_size = constants.DEFAULT_FONT_SIZE
+    
+    # 处理字体路径
+    corrected_font_path = get_font_path(font_family)
+    logger.info(f"原始字体路径: {font_family}, 修正后: {corrected_font_path}")
+    
+    # 确定修复方法
+    if use_lama:
+        if not is_lama_available():
+            logger.warning("LAMA模块不可用，回退到纯色填充方式")
+            inpainting_method = 'solid'
+        else:
+            inpainting_method = 'lama'
+            logger.info("使用LAMA修复方式")
+    elif use_inpainting:
+        inpainting_method = 'inpainting'
+        logger.info("使用MI-GAN修复方式")
+    else:
+        inpainting_method = 'solid'
+        logger.info("使用纯色填充方式")
+        
+    # 如果是仅消除文字模式，跳过翻译
+    skip_translation_step = remove_only or skip_translation
+    if skip_translation_step:
+        logger.info("仅消除文字模式或跳过翻译，处理将省略翻译步骤")
+
+    return dict(
+        target_language=target_language,
+        source_language=source_language,
+        font_size_setting=font_size,
+        font_family_rel=corrected_font_path,
+        text_direction=text_direction,
+        model_provider=model_provider,
+        api_key=api_key,
+        model_name=model_name,
+        prompt_content=prompt_content,
+        use_textbox_prompt=use_textbox_prompt,
+        textbox_prompt_content=textbox_prompt_content,
+        inpainting_method=inpainting_method,
+        fill_color=fill_color,
+        migan_strength=inpainting_strength,
+        migan_blend_edges=blend_edges,
+        skip_ocr=skip_ocr,
+        skip_translation=skip_translation_step,
+        text_color=text_color,  # 传递文字颜色参数
+        rotation_angle=rotation_angle,  # 传递旋转角度参数
+        ocr_engine=ocr_engine,  # 传递OCR引擎参数
+        baidu_api_key=baidu_api_key,  # 百度OCR API Key
+        baidu_secret_key=baidu_secret_key,  # 百度OCR Secret Key
+        baidu_version=baidu_version,  # 百度OCR版本
+        # AI 视觉 OCR 参数
+        ai_vision_provider=ai_vision_provider,
+        ai_vision_api_key=ai_vision_api_key,
+        ai_vision_model_name=ai_vision_model_name,
+        ai_vision_ocr_prompt=ai_vision_ocr_prompt,
+        custom_ai_vision_base_url=custom_ai_vision_base_url,
+        # 仅消除文字时不翻译，所以翻译JSON模式无效
+        use_json_format_translation=False if skip_translation_step else use_json_format_translation,
+        use_json_format_ai_vision_ocr=use_json_format_ai_vision_ocr,
+        use_batch_translation=use_batch_translation,
+        custom_base_url=custom_base_url,
+        # rpm 参数
+        rpm_limit_translation=rpm_limit_translation,
+        rpm_limit_ai_vision_ocr=rpm_limit_ai_vision_ocr,
+        # 描边参数
+        enable_text_stroke=enable_text_stroke,
+        text_stroke_color=text_stroke_color,
+        text_stroke_width=text_stroke_width
+    )
+
+# --- 新增：页面存储 (图像 ID) 支持 ---
+# 各编辑端点除了 base64 的 'image'/'clean_image' 外，也接受页面存储中的 'image_id'/'clean_image_id'；
+# 请求中带 return_image_ids=true 时，结果图像存入页面存储，只返回 '<名称>_id' 和 '<名称>_url'。
+
+def _has_request_image(data, key):
+    return bool(data.get(f'{key}_id') or data.get(key))
+
+def _open_request_image(data, key):
+    """
+    读取请求中的图像：优先使用页面存储中的 '<key>_id'，否则解码 base64 的 '<key>'。
+
+    Returns:
+        PIL.Image.Image or None: 两者都未提供时返回 None。
+
+    Raises:
+        PageNotFoundError: 引用的图像 ID 不在页面存储中。
+    """
+    image_id = data.get(f'{key}_id')
+    if image_id:
+        return get_page_store().open_image(image_id)
+    image_data = data.get(key)
+    if image_data:
+        return Image.open(io.BytesIO(base64.b64decode(image_data)))
+    return None
+
+def _put_result_image(response, name, image, use_image_ids):
+    """把结果图像写入响应：默认为 base64 PNG，use_image_ids 时为页面存储的 ID 和 URL。"""
+    if image is None:
+        response[name] = None
+        return
+    if use_image_ids:
+        image_id = get_page_store().put_image(image)
+        response[name] = None
+        response[f'{name}_id'] = image_id
+        response[f'{name}_url'] = page_image_url(image_id)
+        return
+    buffered = io.BytesIO()
+    image.save(buffered, format="PNG")
+    response[name] = base64.b64encode(buffered.getvalue()).decode('utf-8')
+
+def _page_not_found_response(e):
+    return jsonify({'error': str(e), 'missing_image_ids': [e.image_id]}), 404
+# --- 结束新增 ---
+
+def _encode_translation_result(result, use_image_ids=False):
+    """
+    将 process_image_translation 的返回值转换为前端使用的响应数据
+    (图像编码为 base64 PNG；use_image_ids 时存入页面存储并返回 ID 和 URL)。
+    """
+    translated_image, original_texts, bubble_texts, textbox_texts, bubble_coords, bubble_styles = result
+
+    # 确保仅消除/跳过翻译时返回空文本
+    if not bubble_texts and bubble_coords:
+        bubble_texts = [""] * len(bubble_coords)
+    if not textbox_texts and bubble_coords:
+        textbox_texts = [""] * len(bubble_coords)
+
+    # 保存消除文字后但未添加翻译的图片作为属性
+    clean_image = getattr(translated_image, '_clean_image', None)
+    if not clean_image:
+        logger.warning("无法从翻译后的图像获取干净背景图片")
+        # 即使在传统模式下也尝试获取干净背景
+        clean_image = getattr(translated_image, '_clean_background', None)
+        if clean_image:
+            logger.info("使用clean_background作为替代")
+        else:
+            logger.warning("无法获取任何干净的背景图片引用")
+
+    response_data = {}
+    _put_result_image(response_data, 'translated_image', translated_image, use_image_ids)
+    _put_result_image(response_data, 'clean_image', clean_image or None, use_image_ids)  # 添加消除文字后的干净图片
+    response_data.update({
+        'original_texts': original_texts,
+        'bubble_texts': bubble_texts,
+        'textbox_texts': textbox_texts,
+        'bubble_coords': bubble_coords
+    })
+    return response_data
+
+# --- 新增：bubble_texts 解析 (供 Django 代理流式转发，不在代理端解析响应) ---
+_DETECTED_PATTERN = re.compile(r'"detected"\s*:\s*"([^"]+)"')
+_TRANSLATION_PATTERN = re.compile(r'"translation"\s*:\s*"([^"]+)"')
+
+def _parse_bubble_texts(bubble_texts):
+    """
+    将 bubble_texts 的每个元素从 '"detected": "ja",\n"translation": "xxx"' 形式的字符串
+    解析为 {"detected": "ja", "translation": "xxx"}，未匹配的字段为 None。
+    """
+    result = []
+    for item in bubble_texts:
+        detected_match = _DETECTED_PATTERN.search(item or '')
+        translation_match = _TRANSLATION_PATTERN.search(item or '')
+        result.append({
+            'detected': detected_match.group(1) if detected_match else None,
+            'translation': translation_match.group(1) if translation_match else None,
+        })
+    return result
+# --- 结束新增 ---
+
 @translate_bp.route('/translate_image', methods=['POST'])
 def translate_image():
     """处理图像翻译请求"""
@@ -40,151 +361,23 @@ def translate_image():
         # 打印除图像数据外的所有参数
         params_to_log = {k: v for k, v in data.items() if k != 'image'}
         logger.info(f"请求参数（不含图片数据）: {json.dumps(params_to_log, ensure_ascii=False)}")
-        
-        # 打印详细的请求数据（添加此日志）
-        logger.info("----- 翻译请求参数 -----")
-        logger.info(f"气泡填充方式: useInpainting={data.get('use_inpainting')}, useLama={data.get('use_lama')}")
-        logger.info(f"文字方向: {data.get('textDirection')}, 字体: {data.get('fontFamily')}, 字号: {data.get('fontSize')}")
-        logger.info(f"跳过翻译: {data.get('skip_translation', False)}, 跳过OCR: {data.get('skip_ocr', False)}")  # 更新日志
-        logger.info(f"仅消除模式: {data.get('remove_only', False)}")  # 添加仅消除模式日志
-        
-        # --- 获取新的 JSON 格式标记 ---
-        use_json_format_translation = data.get('use_json_format_translation', False)
-        use_json_format_ai_vision_ocr = data.get('use_json_format_ai_vision_ocr', False)
-        logger.info(f"JSON输出模式: 翻译={use_json_format_translation}, AI视觉OCR={use_json_format_ai_vision_ocr}")
-        # ------------------------------
-        
-        # --- 新增：获取 rpm 参数 ---
-        rpm_limit_translation = data.get('rpm_limit_translation', constants.DEFAULT_rpm_TRANSLATION)
-        rpm_limit_ai_vision_ocr = data.get('rpm_limit_ai_vision_ocr', constants.DEFAULT_rpm_AI_VISION_OCR)
-        
-        # 确保rpm值是整数
-        try:
-            rpm_limit_translation = int(rpm_limit_translation)
-            if rpm_limit_translation < 0: rpm_limit_translation = 0 # 负数视为无限制
-        except (ValueError, TypeError):
-            rpm_limit_translation = constants.DEFAULT_rpm_TRANSLATION
-        
-        try:
-            rpm_limit_ai_vision_ocr = int(rpm_limit_ai_vision_ocr)
-            if rpm_limit_ai_vision_ocr < 0: rpm_limit_ai_vision_ocr = 0
-        except (ValueError, TypeError):
-            rpm_limit_ai_vision_ocr = constants.DEFAULT_rpm_AI_VISION_OCR
-        
-        logger.info(f"rpm 设置: 翻译服务 rpm={rpm_limit_translation}, AI视觉OCR rpm={rpm_limit_ai_vision_ocr}")
-        # --------------------------
 
-        # === 新增：获取描边参数 START ===
-        enable_text_stroke = data.get('enableTextStroke', constants.DEFAULT_TEXT_STROKE_ENABLED)
-        text_stroke_color = data.get('textStrokeColor', constants.DEFAULT_TEXT_STROKE_COLOR)
-        text_stroke_width = int(data.get('textStrokeWidth', constants.DEFAULT_TEXT_STROKE_WIDTH))
-        logger.info(f"描边设置: enable={enable_text_stroke}, color={text_stroke_color}, width={text_stroke_width}")
-        # === 新增：获取描边参数 END ===
-        
-        logger.info("------------------------")
-        
-        image_data = data.get('image')
-        target_language = data.get('target_language', constants.DEFAULT_TARGET_LANG)
-        source_language = data.get('source_language', constants.DEFAULT_SOURCE_LANG)
-        font_size_str = data.get('fontSize')
-        autoFontSize = data.get('autoFontSize', False)
-        api_key = data.get('api_key')
-        model_name = data.get('model_name')
-        model_provider = data.get('model_provider', constants.DEFAULT_MODEL_PROVIDER)
-        font_family = data.get('fontFamily', constants.DEFAULT_FONT_RELATIVE_PATH)
-        text_direction = data.get('textDirection', constants.DEFAULT_TEXT_DIRECTION)
-        prompt_content = data.get('prompt_content')
-        use_textbox_prompt = data.get('use_textbox_prompt', False)
-        textbox_prompt_content = data.get('textbox_prompt_content')
-        use_inpainting = data.get('use_inpainting', False)  # 添加智能修复选项
-        blend_edges = data.get('blend_edges', True)
-        inpainting_strength = float(data.get('inpainting_strength', constants.DEFAULT_INPAINTING_STRENGTH))
-        use_lama = data.get('use_lama', False)  # 添加LAMA修复选项
-        skip_translation = data.get('skip_translation', False)  # 跳过翻译参数
-        skip_ocr = data.get('skip_ocr', False)  # 跳过OCR参数
-        remove_only = data.get('remove_only', False)  # 新增：仅消除文字模式参数
-        fill_color = data.get('fill_color', constants.DEFAULT_FILL_COLOR)  # 新增：气泡填充颜色参数
-        text_color = data.get('text_color', constants.DEFAULT_TEXT_COLOR)  # 新增：文字颜色参数
-        rotation_angle = data.get('rotation_angle', constants.DEFAULT_ROTATION_ANGLE)  # 新增：旋转角度参数
-        ocr_engine = data.get('ocr_engine', 'auto')  # 新增：OCR引擎选择参数
-        
-        # 百度OCR相关参数
-        baidu_api_key = data.get('baidu_api_key')
-        baidu_secret_key = data.get('baidu_secret_key')
-        baidu_version = data.get('baidu_version', 'standard')
-        
-        # 新增：获取 AI 视觉 OCR 参数
-        ai_vision_provider = data.get('ai_vision_provider')
-        ai_vision_api_key = data.get('ai_vision_api_key')
-        ai_vision_model_name = data.get('ai_vision_model_name')
-        ai_vision_ocr_prompt = data.get('ai_vision_ocr_prompt', constants.DEFAULT_AI_VISION_OCR_PROMPT)
-        custom_ai_vision_base_url = data.get('custom_ai_vision_base_url') # <<< 获取新的参数
-        
-        # --- 新增: 获取 custom_base_url ---
-        custom_base_url = data.get('custom_base_url') # 新增
-        logger.info(f"自定义 OpenAI Base URL: {custom_base_url if custom_base_url else '未提供'}")
-        # ---------------------------------
-        
-        # 对于仅消除文字模式，放宽对API和模型参数的要求
-        if remove_only:
-            logger.info("仅消除文字模式：不检查API和模型参数")
-            if not all([image_data, font_family]):
+        if not _has_request_image(data, 'image'):
+            if data.get('remove_only', False):
                 return jsonify({'error': '缺少必要的图像和字体参数'}), 400
-        else:
-            # 正常模式下的参数检查
-            if not all([image_data, target_language, text_direction, model_name, model_provider, font_family]):
-                return jsonify({'error': '缺少必要的参数'}), 400
-                
-            # 对于非本地部署的服务商，API Key是必须的
-            if model_provider == constants.CUSTOM_OPENAI_PROVIDER_ID:
-                if not api_key:
-                    return jsonify({'error': '使用自定义OpenAI兼容服务时必须提供API Key'}), 400
-                if not model_name:
-                    return jsonify({'error': '使用自定义OpenAI兼容服务时必须提供模型名称'}), 400
-                if not custom_base_url:
-                    return jsonify({'error': '使用自定义OpenAI兼容服务时必须提供Base URL'}), 400
-            elif model_provider not in ['ollama', 'sakura'] and not api_key: # 原有逻辑
-                return jsonify({'error': '非本地部署模式下必须提供API Key'}), 400
-        
-        # 检查百度OCR参数
-        if ocr_engine == 'baidu_ocr' and not (baidu_api_key and baidu_secret_key):
-            return jsonify({'error': '使用百度OCR时必须提供API Key和Secret Key'}), 400
-
-        # 检查自定义AI视觉OCR参数
-        if ocr_engine == constants.AI_VISION_OCR_ENGINE_ID and \
-           ai_vision_provider == constants.CUSTOM_AI_VISION_PROVIDER_ID and \
-           not custom_ai_vision_base_url:
-            logger.error("请求错误：使用自定义AI视觉OCR服务时缺少 custom_ai_vision_base_url")
-            return jsonify({'error': '使用自定义AI视觉OCR服务时必须提供Base URL (custom_ai_vision_base_url)'}), 400
+            return jsonify({'error': '缺少必要的参数'}), 400
 
-        # 处理字体大小 - 支持自动字体大小
-        if autoFontSize:
-            font_size = 'auto'
-            logger.info(f"使用自动字体大小")
-        else:
-            try:
-                # 检查是否从自动字号切换到非自动字号
-                prev_auto_font_size = data.get('prev_auto_font_size', False)
-                if prev_auto_font_size:
-                    # 从自动字号切换到非自动字号，直接使用默认字号
-                    font_size = constants.DEFAULT_FONT_SIZE
-                    logger.info(f"从自动字号切换到非自动字号，使用默认字号: {font_size}")
-                else:
-                    font_size = int(font_size_str)
-            except (ValueError, TypeError):
-                logger.warning(f"字体大小参数'{font_size_str}'无效，使用默认值: {constants.DEFAULT_FONT_SIZE}")
-                font_size = constants.DEFAULT_FONT_SIZE
-        
-        # 处理字体路径
-        corrected_font_path = get_font_path(font_family)
-        logger.info(f"原始字体路径: {font_family}, 修正后: {corrected_font_path}")
+        try:
+            options = _parse_processing_options(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # 获取用户上传的图像
+        # 获取用户上传的图像 (base64 或页面存储中的图像 ID)
         try:
-            # 解码base64图像数据
-            image_bytes = base64.b64decode(image_data)
-            img = Image.open(io.BytesIO(image_bytes))
+            img = _open_request_image(data, 'image')
             logger.info(f"图像成功加载，大小: {img.size}")
+        except PageNotFoundError as e:
+            return _page_not_found_response(e)
         except Exception as e:
             logger.error(f"图像数据解码失败: {e}")
             return jsonify({'error': f'图像数据解码失败: {str(e)}'}), 400
@@ -195,161 +388,13 @@ def translate_image():
             logger.info(f"使用前端提供的手动标注气泡坐标，数量: {len(provided_coords)}")
         else:
             logger.info("未提供手动标注气泡坐标，将自动检测")
-        
-        # 确定修复方法
-        if use_lama:
-            if not LAMA_AVAILABLE:
-                logger.warning("LAMA模块不可用，回退到纯色填充方式")
-                inpainting_method = 'solid'
-            else:
-                inpainting_method = 'lama'
-                logger.info("使用LAMA修复方式")
-        elif use_inpainting:
-            inpainting_method = 'inpainting'
-            logger.info("使用MI-GAN修复方式")
-        else:
-            inpainting_method = 'solid'
-            logger.info("使用纯色填充方式")
-            
-        # 如果是仅消除文字模式，跳过翻译
-        if remove_only or skip_translation:
-            logger.info("仅消除文字模式或跳过翻译，处理将省略翻译步骤")
-            translated_image, original_texts, bubble_texts, textbox_texts, bubble_coords, bubble_styles = process_image_translation(
-                image_pil=img,
-                target_language=target_language,
-                source_language=source_language,
-                font_size_setting=font_size,
-                font_family_rel=corrected_font_path,
-                text_direction=text_direction,
-                model_provider=model_provider,
-                api_key=api_key,
-                model_name=model_name,
-                prompt_content=prompt_content,
-                use_textbox_prompt=use_textbox_prompt,
-                textbox_prompt_content=textbox_prompt_content,
-                inpainting_method=inpainting_method,
-                fill_color=fill_color,
-                migan_strength=inpainting_strength,
-                migan_blend_edges=blend_edges,
-                skip_ocr=skip_ocr,
-                skip_translation=True,  # 设置跳过翻译
-                provided_coords=provided_coords,
-                text_color=text_color,  # 传递文字颜色参数
-                rotation_angle=rotation_angle,  # 传递旋转角度参数
-                ocr_engine=ocr_engine,  # 传递OCR引擎参数
-                baidu_api_key=baidu_api_key,  # 百度OCR API Key
-                baidu_secret_key=baidu_secret_key,  # 百度OCR Secret Key
-                baidu_version=baidu_version,  # 百度OCR版本
-                # 新增传递 AI 视觉 OCR 参数
-                ai_vision_provider=ai_vision_provider,
-                ai_vision_api_key=ai_vision_api_key,
-                ai_vision_model_name=ai_vision_model_name,
-                ai_vision_ocr_prompt=ai_vision_ocr_prompt,
-                custom_ai_vision_base_url=custom_ai_vision_base_url, # <<< 新增传递
-                # --- 传递新参数 ---
-                use_json_format_translation=False, # 仅消除文字，不翻译，所以翻译JSON模式无效
-                use_json_format_ai_vision_ocr=use_json_format_ai_vision_ocr,
-                custom_base_url=custom_base_url, # --- 传递 custom_base_url ---
-                # --- 传递 rpm 参数给核心处理函数 ---
-                rpm_limit_translation=rpm_limit_translation,
-                rpm_limit_ai_vision_ocr=rpm_limit_ai_vision_ocr,
-                # === 新增：传递描边参数给 processing START ===
-                enable_text_stroke=enable_text_stroke,
-                text_stroke_color=text_stroke_color,
-                text_stroke_width=text_stroke_width
-                # === 新增：传递描边参数给 processing END ===
-                # ------------------------------------
-            )
-            
-            # 确保返回空文本
-            if not bubble_texts and bubble_coords:
-                bubble_texts = [""] * len(bubble_coords)
-            if not textbox_texts and bubble_coords:
-                textbox_texts = [""] * len(bubble_coords)
-        else:
-            # 正常翻译流程
-            translated_image, original_texts, bubble_texts, textbox_texts, bubble_coords, bubble_styles = process_image_translation(
-                image_pil=img,
-                target_language=target_language,
-                source_language=source_language,
-                font_size_setting=font_size,
-                font_family_rel=corrected_font_path,
-                text_direction=text_direction,
-                model_provider=model_provider,
-                api_key=api_key,
-                model_name=model_name,
-                prompt_content=prompt_content,
-                use_textbox_prompt=use_textbox_prompt,
-                textbox_prompt_content=textbox_prompt_content,
-                inpainting_method=inpainting_method,
-                fill_color=fill_color,
-                migan_strength=inpainting_strength,
-                migan_blend_edges=blend_edges,
-                skip_ocr=skip_ocr,
-                provided_coords=provided_coords,
-                text_color=text_color,  # 传递文字颜色参数
-                rotation_angle=rotation_angle,  # 传递旋转角度参数
-                ocr_engine=ocr_engine,  # 传递OCR引擎参数
-                baidu_api_key=baidu_api_key,  # 百度OCR API Key
-                baidu_secret_key=baidu_secret_key,  # 百度OCR Secret Key
-                baidu_version=baidu_version,  # 百度OCR版本
-                # 新增传递 AI 视觉 OCR 参数
-                ai_vision_provider=ai_vision_provider,
-                ai_vision_api_key=ai_vision_api_key,
-                ai_vision_model_name=ai_vision_model_name,
-                ai_vision_ocr_prompt=ai_vision_ocr_prompt,
-                custom_ai_vision_base_url=custom_ai_vision_base_url, # <<< 新增传递
-                # --- 传递新参数 ---
-                use_json_format_translation=use_json_format_translation,
-                use_json_format_ai_vision_ocr=use_json_format_ai_vision_ocr,
-                custom_base_url=custom_base_url, # --- 传递 custom_base_url ---
-                # --- 传递 rpm 参数给核心处理函数 ---
-                rpm_limit_translation=rpm_limit_translation,
-                rpm_limit_ai_vision_ocr=rpm_limit_ai_vision_ocr,
-                # === 新增：传递描边参数给 processing START ===
-                enable_text_stroke=enable_text_stroke,
-                text_stroke_color=text_stroke_color,
-                text_stroke_width=text_stroke_width
-                # === 新增：传递描边参数给 processing END ===
-                # ------------------------------------
-            )
-            
-            # textbox_texts已从detect_text_in_bubbles函数中获取，无需在这里处理
-        
-        # 保存消除文字后但未添加翻译的图片作为属性
-        clean_image = getattr(translated_image, '_clean_image', None)
-        if clean_image:
-            # 确保我们返回的是真正的干净图片
-            buffered_clean = io.BytesIO()
-            clean_image.save(buffered_clean, format="PNG")
-            clean_img_str = base64.b64encode(buffered_clean.getvalue()).decode('utf-8')
-            print(f"成功获取到干净图片数据，大小: {len(clean_img_str)}")
-        else:
-            print("警告：无法从翻译后的图像获取干净背景图片")
-            # 即使在传统模式下也尝试获取干净背景
-            clean_background = getattr(translated_image, '_clean_background', None)
-            if clean_background:
-                buffered_clean = io.BytesIO()
-                clean_background.save(buffered_clean, format="PNG")
-                clean_img_str = base64.b64encode(buffered_clean.getvalue()).decode('utf-8')
-                print(f"使用clean_background作为替代，大小: {len(clean_img_str)}")
-            else:
-                print("严重警告：无法获取任何干净的背景图片引用")
-                clean_img_str = None
 
-        buffered = io.BytesIO()
-        translated_image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
+        result = process_image_translation(image_pil=img, provided_coords=provided_coords, **options)
+        response_data = _encode_translation_result(result, use_image_ids=data.get('return_image_ids', False))
+        if request.args.get('bubble_texts_format') == 'parsed':
+            response_data['bubble_texts'] = _parse_bubble_texts(response_data['bubble_texts'])
 
         # 打印返回参数 key（不打印内容）
-        response_data = {
-            'translated_image': img_str,
-            'clean_image': clean_img_str,  # 添加消除文字后的干净图片
-            'original_texts': original_texts,
-            'bubble_texts': bubble_texts,
-            'textbox_texts': textbox_texts,
-            'bubble_coords': bubble_coords
-        }
         logger.info(f"返回参数 keys: {list(response_data.keys())}")
         return jsonify({
             'code': '0000',
@@ -358,9 +403,181 @@ def translate_image():
         })
 
     except Exception as e:
-        print(e)
+        logger.error(f"处理图像翻译请求时出错: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+@translate_bp.route('/submit_chapter_job', methods=['POST'])
+def submit_chapter_job():
+    """
+    提交多页章节翻译任务，各页在检测/OCR/翻译/修复/渲染阶段间流水线并行处理。
+    请求参数与 /translate_image 相同，但使用 'images' (base64 列表) 或 'image_ids' (页面存储中的图像 ID 列表)
+    代替 'image'，可选的 'all_bubble_coords' 为每页的手动标注坐标列表。
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': '请求体不能为空'}), 400
+
+        image_ids = data.get('image_ids') or []
+        images_data = data.get('images') or image_ids
+        if not isinstance(images_data, list) or len(images_data) == 0:
+            return jsonify({'error': '缺少图片数据'}), 400
+
+        all_bubble_coords = data.get('all_bubble_coords')
+        if all_bubble_coords is not None and len(all_bubble_coords) != len(images_data):
+            return jsonify({'error': '图片与气泡坐标数量不匹配'}), 400
+
+        try:
+            options = _parse_processing_options(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        images = []
+        for i, image_data in enumerate(images_data):
+            try:
+                if image_ids and not data.get('images'):
+                    img = get_page_store().open_image(image_data)
+                else:
+                    img = Image.open(io.BytesIO(base64.b64decode(image_data)))
+                    img.load()
+                images.append(img)
+            except PageNotFoundError as e:
+                return _page_not_found_response(e)
+            except Exception as e:
+                logger.error(f"第 {i+1} 张图像数据解码失败: {e}")
+                return jsonify({'error': f'第 {i+1} 张图像数据解码失败: {str(e)}'}), 400
+
+        page_params = None
+        if all_bubble_coords is not None:
+            page_params = [{'provided_coords': coords} if coords else None for coords in all_bubble_coords]
+
+        engine = get_chapter_job_engine()
+        job_id = engine.submit(images, build_processing_params(**options), page_params=page_params)
+        return jsonify({'success': True, 'job_id': job_id, 'total': len(images)})
+
+    except Exception as e:
+        logger.error(f"提交章节任务时出错: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@translate_bp.route('/chapter_job_progress/<job_id>', methods=['GET'])
+def chapter_job_progress(job_id):
+    """查询章节任务进度"""
+    progress = get_chapter_job_engine().get_progress(job_id)
+    if progress is None:
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify({'success': True, 'progress': progress})
+
+@translate_bp.route('/chapter_job_result/<job_id>', methods=['GET'])
+def chapter_job_result(job_id):
+    """
+    获取章节任务结果。任务未完成时返回 202 和当前进度；
+    可通过 ?wait=秒数 等待任务完成 (最多 constants.CHAPTER_JOB_MAX_WAIT 秒)，
+    ?return_image_ids=1 时图像以页面存储 ID 返回。
+    """
+    engine = get_chapter_job_engine()
+    if engine.get_job(job_id) is None:
+        return jsonify({'error': '任务不存在'}), 404
+
+    try:
+        wait = min(float(request.args.get('wait', 0)), constants.CHAPTER_JOB_MAX_WAIT)
+    except ValueError:
+        wait = 0
+    if not wait > 0: # 同时排除 nan
+        wait = 0
+    use_image_ids = request.args.get('return_image_ids', '').lower() in ('1', 'true', 'yes')
+    results = engine.get_result(job_id, timeout=wait if wait > 0 else None)
+    if results is None:
+        return jsonify({'success': False, 'progress': engine.get_progress(job_id)}), 202
+
+    pages = []
+    for i, result in enumerate(results):
+        if result is None:
+            pages.append(None) # 任务被取消或此页无法加入流水线，此页未处理
+            continue
+        try:
+            pages.append(_encode_translation_result(result, use_image_ids=use_image_ids))
+        except Exception as e:
+            logger.error(f"编码章节任务 {job_id} 第 {i+1} 页结果时出错: {e}", exc_info=True)
+            pages.append(None)
+
+    return jsonify({
+        'success': True,
+        'progress': engine.get_progress(job_id),
+        'pages': pages
+    })
+
+@translate_bp.route('/cancel_chapter_job/<job_id>', methods=['POST'])
+def cancel_chapter_job(job_id):
+    """取消章节任务"""
+    if not get_chapter_job_engine().cancel(job_id):
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify({'success': True})
+
+def _convert_bubble_styles(all_bubble_styles, default_text_color, default_rotation_angle,
+                           enable_text_stroke, text_stroke_color, text_stroke_width):
+    """把前端的 all_bubble_styles 列表转换为渲染函数使用的样式字典 (键为气泡索引字符串)。"""
+    bubble_styles = {}
+    for i, style in enumerate(all_bubble_styles):
+        bubble_styles[str(i)] = {
+            'fontSize': style.get('fontSize', constants.DEFAULT_FONT_SIZE),
+            'autoFontSize': style.get('autoFontSize', False),
+            'fontFamily': get_font_path(style.get('fontFamily', constants.DEFAULT_FONT_RELATIVE_PATH)),
+            'text_direction': style.get('textDirection', constants.DEFAULT_TEXT_DIRECTION),
+            'position_offset': style.get('position', {'x': 0, 'y': 0}),
+            'text_color': style.get('textColor', default_text_color),
+            'rotation_angle': style.get('rotationAngle', default_rotation_angle),
+            'enableStroke': style.get('enableStroke', enable_text_stroke),
+            'strokeColor': style.get('strokeColor', text_stroke_color),
+            'strokeWidth': style.get('strokeWidth', text_stroke_width)
+        }
+    return bubble_styles
+
+def _incremental_render_response(data, texts, coords, styles):
+    """
+    增量重渲染 (请求中带 incremental=true 和 page_id 时使用)。
+
+    服务端缓存了该页时 clean_image 可以省略；只返回变化区域的图块 (tiles) 及其偏移和本次的 revision。
+    图块只能贴到上一次返回的图像上，因此前端需要把当时的 revision 作为 base_revision 传回；
+    base_revision 不匹配、首次渲染、气泡数量变化或请求了 return_full_image 时返回整页图像 (rendered_image)。
+    """
+    page_id = str(data.get('page_id'))
+    clean_image = None
+    clean_hash = None
+    if _has_request_image(data, 'clean_image'):
+        # 页面存储的图像 ID 本身就是内容哈希
+        clean_hash = data.get('clean_image_id') or hash_image_data(data.get('clean_image'))
+        state = get_incremental_render_cache().get(page_id)
+        # 干净背景没有变化时不再解码
+        if state is None or state.clean_hash != clean_hash:
+            try:
+                clean_image = _open_request_image(data, 'clean_image')
+                clean_image.load()
+            except PageNotFoundError as e:
+                return _page_not_found_response(e)
+            except Exception as e:
+                logger.error(f"加载干净图片失败: {str(e)}")
+                return jsonify({'error': '无法加载干净背景图像'}), 400
+
+    result = render_page_incremental(page_id, texts, coords, styles, clean_image=clean_image, clean_hash=clean_hash)
+    if result is None:
+        return jsonify({'error': '服务端没有该页的渲染缓存，请附带 clean_image 重新请求', 'needs_clean_image': True}), 409
+
+    page = result['page']
+    base_matches = result['previous_revision'] is not None and str(data.get('base_revision')) == str(result['previous_revision'])
+    incremental = result['incremental'] and base_matches and not data.get('return_full_image')
+    response = {
+        'success': True,
+        'page_id': page_id,
+        'revision': result['revision'],
+        'incremental': incremental,
+        'width': page.width,
+        'height': page.height,
+        'tiles': encode_tiles(page, result['tiles']) if incremental else []
+    }
+    if not incremental:
+        _put_result_image(response, 'rendered_image', page, data.get('return_image_ids', False))
+    return jsonify(response)
+
 @translate_bp.route('/re_render_image', methods=['POST'])
 def re_render_image():
     try:
@@ -405,7 +622,7 @@ def re_render_image():
         # 打印调试信息，帮助排查问题
         logger_text_data = "null" if bubble_texts is None else f"长度: {len(bubble_texts)}"
         logger_bubble_data = "null" if bubble_coords is None else f"长度: {len(bubble_coords)}"
-        logger_clean_data = "null" if clean_image_data is None else f"长度: {len(clean_image_data)}"
+        logger_clean_data = f"ID: {data.get('clean_image_id')}" if data.get('clean_image_id') else ("null" if clean_image_data is None else f"长度: {len(clean_image_data)}")
         logger_styles_data = "null" if all_bubble_styles is None else f"长度: {len(all_bubble_styles)}"
         logger.info(f"重新渲染参数: fontSize_str={fontSize_str}, autoFontSize={data.get('autoFontSize')}, textDirection={text_direction}, translated_text={logger_text_data}, bubble_coords={logger_bubble_data}, is_font_style_change={is_font_style_change}")
         logger.info(f"传入的干净图片数据: {logger_clean_data}, 使用智能修复: {use_inpainting}, 使用LAMA修复: {use_lama}")
@@ -458,13 +675,28 @@ def re_render_image():
         corrected_font_path = get_font_path(fontFamily)
         logger.info(f"原始字体路径: {fontFamily}, 修正后: {corrected_font_path}")
 
+        # --- 新增：增量重渲染模式，只重绘文本或样式变化的气泡 ---
+        if data.get('incremental') and data.get('page_id'):
+            textColor = data.get('textColor', constants.DEFAULT_TEXT_COLOR)
+            rotationAngle = data.get('rotationAngle', constants.DEFAULT_ROTATION_ANGLE)
+            if all_bubble_styles and len(all_bubble_styles) == len(bubble_coords):
+                bubble_styles = _convert_bubble_styles(all_bubble_styles, textColor, rotationAngle,
+                                                       enable_text_stroke, text_stroke_color, text_stroke_width)
+            else:
+                bubble_styles = build_default_bubble_styles(
+                    len(bubble_coords), fontSize, corrected_font_path, text_direction, textColor, rotationAngle,
+                    enable_text_stroke, text_stroke_color, text_stroke_width
+                )
+            return _incremental_render_response(data, bubble_texts, bubble_coords, bubble_styles)
+        # --- 结束新增 ---
+
         # === 修改：优先使用干净的图片，并重构图像处理逻辑 ===
         # 默认使用当前图片为基础，如果提供了image_data
         img = None
-        if clean_image_data:
+        if _has_request_image(data, 'clean_image'):
             logger.info("使用消除文字后的干净图片进行重新渲染")
             try:
-                img = Image.open(io.BytesIO(base64.b64decode(clean_image_data)))
+                img = _open_request_image(data, 'clean_image')
                 logger.info(f"成功加载干净图片，尺寸: {img.width}x{img.height}")
                 
                 # 标记这是干净图片，避免修复步骤
@@ -473,16 +705,18 @@ def re_render_image():
                 setattr(img, '_clean_background', img.copy())
                 setattr(img, '_migan_inpainted', True)  # 标记为已修复
                 logger.info("已标记干净图片属性，将跳过修复步骤")
+            except PageNotFoundError as e:
+                return _page_not_found_response(e)
             except Exception as e:
                 logger.error(f"加载干净图片失败: {str(e)}")
                 img = None  # 重置，后续会尝试使用当前图片
         
         # 如果没有干净图片或加载失败，则回退到当前图片
         if img is None:
-            if image_data:
+            if _has_request_image(data, 'image'):
                 logger.warning("没有有效的干净图片，回退使用当前图片")
                 try:
-                    img = Image.open(io.BytesIO(base64.b64decode(image_data)))
+                    img = _open_request_image(data, 'image')
                     logger.info(f"成功加载当前图片，尺寸: {img.width}x{img.height}")
                     
                     # 如果是字体样式变更，设置标记以避免不必要的修复
@@ -508,6 +742,8 @@ def re_render_image():
                             logger.info("成功创建临时干净背景")
                         except Exception as e:
                             logger.error(f"创建临时干净背景失败: {str(e)}")
+                except PageNotFoundError as e:
+                    return _page_not_found_response(e)
                 except Exception as e:
                     logger.error(f"加载当前图片失败: {str(e)}")
                     return jsonify({'error': '无法加载图像数据'}), 400
@@ -523,25 +759,10 @@ def re_render_image():
         # 处理所有气泡的样式
         if all_bubble_styles and len(all_bubble_styles) == len(bubble_coords):
             logger.info(f"收到前端传递的所有气泡样式，共 {len(all_bubble_styles)} 个")
-            bubble_styles = {}
-            for i, style in enumerate(all_bubble_styles):
-                # 转换为后端需要的格式
-                font_path = get_font_path(style.get('fontFamily', constants.DEFAULT_FONT_RELATIVE_PATH))
-                converted_style = {
-                    'fontSize': style.get('fontSize', constants.DEFAULT_FONT_SIZE),
-                    'autoFontSize': style.get('autoFontSize', False),  # 添加自动字体大小设置
-                    'fontFamily': font_path,
-                    'text_direction': style.get('textDirection', constants.DEFAULT_TEXT_DIRECTION),
-                    'position_offset': style.get('position', {'x': 0, 'y': 0}),
-                    'text_color': style.get('textColor', textColor),  # 使用単个气泡设置或全局颜色
-                    'rotation_angle': style.get('rotationAngle', rotationAngle),   # 使用単个气泡设置或全局旋转角度
-                    # 如果前端的 all_bubble_styles 包含描边，则使用它们，否则使用全局的
-                    'enableStroke': style.get('enableStroke', enable_text_stroke),
-                    'strokeColor': style.get('strokeColor', text_stroke_color),
-                    'strokeWidth': style.get('strokeWidth', text_stroke_width)
-                }
-                bubble_styles[str(i)] = converted_style
-                logger.info(f"保存气泡 {i} 的样式: 字号={converted_style['fontSize']}, 自动字号={converted_style['autoFontSize']}, 字体={converted_style['fontFamily']}, 方向={converted_style['text_direction']}, 颜色={converted_style['text_color']}, 旋转={converted_style['rotation_angle']}")
+            bubble_styles = _convert_bubble_styles(all_bubble_styles, textColor, rotationAngle,
+                                                   enable_text_stroke, text_stroke_color, text_stroke_width)
+            for i_str, converted_style in bubble_styles.items():
+                logger.info(f"保存气泡 {i_str} 的样式: 字号={converted_style['fontSize']}, 自动字号={converted_style['autoFontSize']}, 字体={converted_style['fontFamily']}, 方向={converted_style['text_direction']}, 颜色={converted_style['text_color']}, 旋转={converted_style['rotation_angle']}")
             
             # 将所有气泡样式保存到图像对象上
             setattr(img, '_bubble_styles', bubble_styles)
@@ -576,12 +797,10 @@ def re_render_image():
             # === 新增：传递全局描边参数给 re_render_text_in_bubbles END ===
         )
 
-        # 转换结果图像为Base64字符串
-        buffered = io.BytesIO()
-        rendered_image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
-
-        return jsonify({'rendered_image': img_str})
+        # 转换结果图像为Base64字符串 (或存入页面存储)
+        response_data = {}
+        _put_result_image(response_data, 'rendered_image', rendered_image, data.get('return_image_ids', False))
+        return jsonify(response_data)
 
     except Exception as e:
         logger.error(f"重新渲染图像时出错: {e}")
@@ -646,8 +865,11 @@ def re_render_single_bubble():
             truncated_texts = [txt[:20] + "..." if len(txt) > 20 else txt for txt in all_texts]
             logger.info(f"文本内容示例：{truncated_texts}")
         
+        # 增量模式下服务端已缓存该页时，可以不传图像数据
+        incremental = bool(data.get('incremental') and data.get('page_id'))
+
         # 验证必要的参数
-        if not image_data:
+        if not image_data and not data.get('image_id') and not incremental:
             logger.error("缺少图像数据")
             return jsonify({'error': '缺少图像数据'}), 400
         
@@ -672,16 +894,51 @@ def re_render_single_bubble():
         # 处理字体路径
         corrected_font_path = get_font_path(fontFamily)
         logger.info(f"原始字体路径: {fontFamily}, 修正后: {corrected_font_path}")
+
+        # --- 新增：增量重渲染模式，只重绘该气泡 (以及与其重叠的气泡) ---
+        if incremental:
+            cached = get_cached_styles(str(data.get('page_id')))
+            if all_bubble_styles and len(all_bubble_styles) == len(bubble_coords):
+                bubble_styles = _convert_bubble_styles(all_bubble_styles, constants.DEFAULT_TEXT_COLOR,
+                                                       constants.DEFAULT_ROTATION_ANGLE, enable_text_stroke,
+                                                       text_stroke_color, text_stroke_width)
+            elif cached is not None and len(cached[0]) == len(bubble_coords):
+                bubble_styles = cached[0]
+            else:
+                bubble_styles = build_default_bubble_styles(
+                    len(bubble_coords), constants.DEFAULT_FONT_SIZE, constants.DEFAULT_FONT_RELATIVE_PATH,
+                    constants.DEFAULT_TEXT_DIRECTION, constants.DEFAULT_TEXT_COLOR, constants.DEFAULT_ROTATION_ANGLE,
+                    enable_text_stroke, text_stroke_color, text_stroke_width
+                )
+            # 与 render_single_bubble 一致：目标气泡使用请求中的样式
+            target_style = dict(bubble_styles.get(str(bubble_index), {}))
+            target_style.update({
+                'fontSize': fontSize,
+                'autoFontSize': isinstance(fontSize, str) and fontSize.lower() == 'auto',
+                'fontFamily': corrected_font_path,
+                'text_direction': text_direction,
+                'position_offset': position_offset,
+                'text_color': text_color,
+                'rotation_angle': rotation_angle,
+                'enableStroke': enable_text_stroke,
+                'strokeColor': text_stroke_color,
+                'strokeWidth': text_stroke_width
+            })
+            bubble_styles[str(bubble_index)] = target_style
+            return _incremental_render_response(data, all_texts, bubble_coords, bubble_styles)
+        # --- 结束新增 ---
         
         # 打开原始图像
         try:
             # 优先使用干净的背景图像
-            if clean_image_data:
+            if _has_request_image(data, 'clean_image'):
                 logger.info("使用传入的干净背景图像")
-                image = Image.open(io.BytesIO(base64.b64decode(clean_image_data)))
+                image = _open_request_image(data, 'clean_image')
             else:
                 logger.info("使用传入的普通图像")
-                image = Image.open(io.BytesIO(base64.b64decode(image_data)))
+                image = _open_request_image(data, 'image')
+        except PageNotFoundError as e:
+            return _page_not_found_response(e)
         except Exception as e:
             logger.error(f"无法解码或打开图像: {e}")
             return jsonify({'error': f'无法解码或打开图像: {str(e)}'}), 500
@@ -716,11 +973,10 @@ def re_render_single_bubble():
         
         # 尝试使用干净背景图片
         clean_image = None
-        if clean_image_data:
+        if _has_request_image(data, 'clean_image'):
             logger.info(f"使用传入的干净背景图像")
             try:
-                clean_image_bytes = base64.b64decode(clean_image_data)
-                clean_image = Image.open(io.BytesIO(clean_image_bytes))
+                clean_image = _open_request_image(data, 'clean_image')
                 
                 # 设置为干净背景图像的属性，以便后续处理
                 setattr(image, '_clean_image', clean_image)
@@ -821,12 +1077,10 @@ def re_render_single_bubble():
             traceback.print_exc()
             return jsonify({'error': f'渲染气泡时出错: {str(e)}'}), 500
         
-        # 将图像转换为base64字符串
+        # 将图像转换为base64字符串 (或存入页面存储)
         logger.info("将渲染后的图像转换为base64格式...")
-        buffered = io.BytesIO()
-        rendered_image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
-        logger.info(f"图像转换完成，base64字符串长度: {len(img_str)}")
+        image_result = {}
+        _put_result_image(image_result, 'rendered_image', rendered_image, data.get('return_image_ids', False))
         
         # 如果使用智能修复但没有干净背景，提供警告
         if use_inpainting and not clean_image:
@@ -836,7 +1090,7 @@ def re_render_single_bubble():
         logger.info(f"返回渲染结果: 气泡索引={bubble_index}")
         return jsonify({
             'success': True,
-            'rendered_image': img_str,
+            **image_result,
             'bubble_index': bubble_index,
             'message': f'气泡 {bubble_index} 的文本已成功渲染'
         })
@@ -873,8 +1127,19 @@ def apply_settings_to_all_images():
         # 获取其他必要参数
         all_images = data.get('all_images', [])
         all_clean_images = data.get('all_clean_images', [])
+        # 页面存储中的图像 ID (与 all_images/all_clean_images 二选一，按页对应)
+        all_image_ids = data.get('all_image_ids', [])
+        all_clean_image_ids = data.get('all_clean_image_ids', [])
+        use_image_ids = data.get('return_image_ids', False)
+        if not all_images and all_image_ids:
+            all_images = [None] * len(all_image_ids)
+        elif not all_images and (all_clean_images or all_clean_image_ids):
+            # 只提供了干净背景时直接用它渲染，不必重复上传同一张图
+            all_images = [None] * max(len(all_clean_images), len(all_clean_image_ids))
         all_texts = data.get('all_texts', [])
         all_bubble_coords = data.get('all_bubble_coords', [])
+        # 每页每个气泡的位置偏移 [[{x, y}, ...], ...]，保留用户在编辑模式中移动过的文字位置
+        all_bubble_positions = data.get('all_bubble_positions', [])
         use_inpainting = data.get('use_inpainting', False)
         use_lama = data.get('use_lama', False)  # 添加LAMA修复选项
         
@@ -898,117 +1163,133 @@ def apply_settings_to_all_images():
         corrected_font_path = get_font_path(fontFamily)
         logger.info(f"原始字体路径: {fontFamily}, 修正后: {corrected_font_path}")
         
-        rendered_images = []
-        
-        # 为每张图片应用设置并重新渲染
-        for i, (image_data, texts, bubble_coords) in enumerate(zip(all_images, all_texts, all_bubble_coords)):
-            logger.info(f"处理图片 {i+1}/{len(all_images)}")
-            
-            # 获取干净背景图片（如果有）
-            clean_image_data = all_clean_images[i] if i < len(all_clean_images) else None
-            
-            try:
-                # 打开图像
-                if clean_image_data:
-                    logger.info(f"使用干净背景图像渲染图片 {i+1}")
-                    img = Image.open(io.BytesIO(base64.b64decode(clean_image_data)))
-                else:
-                    logger.info(f"使用普通图像渲染图片 {i+1}")
-                    img = Image.open(io.BytesIO(base64.b64decode(image_data)))
-                
-                # 创建所有气泡的统一样式
-                all_bubble_styles = []
-                for j in range(len(bubble_coords)):
-                    bubble_style = {
-                        'fontSize': fontSize,
-                        'autoFontSize': autoFontSize,  # 添加自动字体大小设置
-                        'fontFamily': fontFamily,
-                        'textDirection': textDirection,
-                        'position': {'x': 0, 'y': 0},  # 保持默认位置
-                        'textColor': textColor,
-                        'rotationAngle': rotationAngle,
-                        # === 新增：描边参数 START ===
-                        'enableStroke': enable_text_stroke,
-                        'strokeColor': text_stroke_color,
-                        'strokeWidth': text_stroke_width
-                        # === 新增：描边参数 END ===
-                    }
-                    all_bubble_styles.append(bubble_style)
-                
-                # 设置气泡样式到图像属性
-                bubble_styles = {}
-                for j, style in enumerate(all_bubble_styles):
-                    font_path = get_font_path(style.get('fontFamily', constants.DEFAULT_FONT_RELATIVE_PATH))
-                    converted_style = {
-                        'fontSize': style.get('fontSize', constants.DEFAULT_FONT_SIZE),
-                        'autoFontSize': style.get('autoFontSize', False),  # 添加自动字体大小设置
-                        'fontFamily': font_path,
-                        'text_direction': style.get('textDirection', constants.DEFAULT_TEXT_DIRECTION),
-                        'position_offset': style.get('position', {'x': 0, 'y': 0}),
-                        'text_color': style.get('textColor', constants.DEFAULT_TEXT_COLOR),
-                        'rotation_angle': style.get('rotationAngle', constants.DEFAULT_ROTATION_ANGLE),
-                        # === 新增：描边参数 START ===
-                        'enableStroke': style.get('enableStroke', enable_text_stroke),
-                        'strokeColor': style.get('strokeColor', text_stroke_color),
-                        'strokeWidth': style.get('strokeWidth', text_stroke_width)
-                        # === 新增：描边参数 END ===
-                    }
-                    bubble_styles[str(j)] = converted_style
-                
-                setattr(img, '_bubble_styles', bubble_styles)
-                
-                # 如果有干净图片，设置相关属性
-                if clean_image_data:
-                    clean_img = img.copy()
-                    setattr(img, '_clean_image', clean_img)
-                    setattr(img, '_clean_background', clean_img)
-                
-                # 重新渲染图片
-                rendered_image = re_render_text_in_bubbles(
-                    img,
-                    texts,
-                    bubble_coords,
-                    fontSize,
-                    fontFamily=corrected_font_path,
-                    text_direction=textDirection,
-                    use_inpainting=use_inpainting,
-                    blend_edges=True,
-                    inpainting_strength=constants.DEFAULT_INPAINTING_STRENGTH,
-                    use_lama=use_lama,  # 传递LAMA修复选项
-                    fill_color=data.get('fill_color', constants.DEFAULT_FILL_COLOR),  # 使用文字颜色作为填充颜色
-                    text_color=textColor,  # 传递文字颜色
-                    rotation_angle=rotationAngle,  # 传递旋转角度
-                    # === 新增：传递全局描边参数给 re_render_text_in_bubbles START ===
-                    # 注意：如果上面已经将描边信息整合到 img._bubble_styles，这里可能不需要再传全局的
-                    # 但为了兼容性或明确性，可以传递。re_render_text_in_bubbles 内部会决定如何使用。
-                    enable_stroke_param=enable_text_stroke,
-                    stroke_color_param=text_stroke_color,
-                    stroke_width_param=text_stroke_width
-                    # === 新增：传递全局描边参数给 re_render_text_in_bubbles END ===
+        # 所有页面使用相同的样式和渲染参数
+        render_args = {
+            'fontSize': fontSize,
+            'fontFamily': corrected_font_path,
+            'text_direction': textDirection,
+            'use_inpainting': use_inpainting,
+            'blend_edges': True,
+            'inpainting_strength': constants.DEFAULT_INPAINTING_STRENGTH,
+            'use_lama': use_lama,
+            'fill_color': data.get('fill_color', constants.DEFAULT_FILL_COLOR),
+            'text_color': textColor,
+            'rotation_angle': rotationAngle,
+            'enable_stroke_param': enable_text_stroke,
+            'stroke_color_param': text_stroke_color,
+            'stroke_width_param': text_stroke_width,
+        }
+        total = len(all_images)
+        stream = data.get('stream', False)
+        rendered_images = [None] * total # 流式响应时不保留已发送的页面，内存占用只取决于在途页面数
+        success_indices = set()
+        missing_image_ids = [] # 页面存储中已不存在的图像 ID，前端需要重新上传
+        failed_pages = [] # (页面序号, 错误信息)：任务构建阶段就失败的页面
+
+        def _iter_tasks():
+            # 惰性构建任务：渲染器只在有空闲槽位时才取下一页
+            for i, (image_data, texts, bubble_coords) in enumerate(zip(all_images, all_texts, all_bubble_coords)):
+                page_images = {
+                    'image': image_data,
+                    'image_id': all_image_ids[i] if i < len(all_image_ids) else None,
+                    'clean_image': all_clean_images[i] if i < len(all_clean_images) else None,
+                    'clean_image_id': all_clean_image_ids[i] if i < len(all_clean_image_ids) else None,
+                }
+                key = 'clean_image' if _has_request_image(page_images, 'clean_image') else 'image'
+                bubble_styles = build_default_bubble_styles(
+                    len(bubble_coords), fontSize, corrected_font_path, textDirection, textColor, rotationAngle,
+                    enable_text_stroke, text_stroke_color, text_stroke_width
                 )
-                
-                # 转换为base64字符串
-                buffered = io.BytesIO()
-                rendered_image.save(buffered, format="PNG")
-                img_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
-                
-                rendered_images.append(img_str)
-                logger.info(f"图片 {i+1} 渲染完成")
-                
-            except Exception as e:
-                logger.error(f"渲染图片 {i+1} 时出错: {e}")
-                traceback.print_exc()
-                # 继续处理下一张图片，而不是立即返回错误
-                rendered_images.append(None)
-        
-        # 统计成功渲染的图片数量
-        success_count = sum(1 for img in rendered_images if img is not None)
-        
-        return jsonify({
-            'success': True,
-            'rendered_images': rendered_images,
-            'message': f'已成功将设置应用到 {success_count}/{len(all_images)} 张图片'
-        })
+                page_positions = all_bubble_positions[i] if i < len(all_bubble_positions) else None
+                for j, position in enumerate(page_positions or []):
+                    if position and str(j) in bubble_styles:
+                        bubble_styles[str(j)]['position_offset'] = {'x': position.get('x', 0), 'y': position.get('y', 0)}
+                page_render_args = dict(render_args, bubble_styles=bubble_styles)
+                try:
+                    image_id = page_images.get(f'{key}_id')
+                    if image_id:
+                        image_path, _ = get_page_store().get_path(image_id)
+                        task = build_render_task(i, texts, bubble_coords, page_render_args, image_path=image_path,
+                                                 image_id=image_id, is_clean=(key == 'clean_image'))
+                    elif page_images.get(key):
+                        task = build_render_task(i, texts, bubble_coords, page_render_args,
+                                                 image_b64=page_images[key], is_clean=(key == 'clean_image'))
+                    else:
+                        raise ValueError("缺少图像数据")
+                except PageNotFoundError as e:
+                    logger.error(f"渲染图片 {i+1} 时出错: {e}")
+                    missing_image_ids.append(e.image_id)
+                    failed_pages.append((i, str(e)))
+                    continue
+                except Exception as e:
+                    logger.error(f"渲染图片 {i+1} 时出错: {e}")
+                    failed_pages.append((i, str(e)))
+                    continue
+                yield task
+
+        def _iter_page_results():
+            """逐页产出结果 (按完成顺序)，每项可直接序列化为 JSON。"""
+            for i, png_bytes, error in get_batch_renderer().iter_render(_iter_tasks()):
+                # 构建任务时失败的页面先报告
+                while failed_pages:
+                    failed_index, failed_error = failed_pages.pop(0)
+                    yield {'index': failed_index, 'rendered_image': None, 'error': failed_error}
+                page_result = {'index': i}
+                if error is not None:
+                    logger.error(f"渲染图片 {i+1} 时出错: {error}")
+                    if isinstance(error, PageImageMissingError):
+                        missing_image_ids.append(error.image_id)
+                    page_result.update({'rendered_image': None, 'error': str(error)})
+                elif use_image_ids:
+                    image_id = get_page_store().put_bytes(png_bytes, 'image/png') # 子进程已编码为 PNG，直接存入
+                    page_result.update({'rendered_image': None, 'rendered_image_id': image_id,
+                                        'rendered_image_url': page_image_url(image_id)})
+                else:
+                    page_result['rendered_image'] = base64.b64encode(png_bytes).decode('utf-8')
+                if error is None:
+                    success_indices.add(i)
+                    if not stream:
+                        rendered_images[i] = page_result.get('rendered_image_id') or page_result['rendered_image']
+                logger.info(f"图片 {i+1}/{total} 渲染完成" if error is None else f"图片 {i+1}/{total} 渲染失败")
+                yield page_result
+            for failed_index, failed_error in failed_pages:
+                yield {'index': failed_index, 'rendered_image': None, 'error': failed_error}
+
+        def _summary():
+            success_count = len(success_indices)
+            summary = {
+                'success': True,
+                'message': f'已成功将设置应用到 {success_count}/{total} 张图片',
+                'success_count': success_count,
+                'total': total,
+            }
+            if missing_image_ids:
+                summary['missing_image_ids'] = missing_image_ids
+            return summary
+
+        if stream:
+            # 流式响应 (NDJSON)：每渲染完一页输出一行，最后一行为 {"done": true, ...} 汇总
+            def _generate():
+                try:
+                    for page_result in _iter_page_results():
+                        yield json.dumps(page_result, ensure_ascii=False) + '\n'
+                    yield json.dumps(dict(_summary(), done=True), ensure_ascii=False) + '\n'
+                except Exception as e:
+                    logger.error(f"流式应用设置到所有图片时出错: {e}")
+                    traceback.print_exc()
+                    yield json.dumps({'done': True, 'success': False, 'error': str(e)}, ensure_ascii=False) + '\n'
+            return Response(stream_with_context(_generate()), mimetype='application/x-ndjson',
+                            headers={'X-Accel-Buffering': 'no', 'Cache-Control': 'no-cache'})
+
+        # 非流式：保持原有的响应格式 (页面仍并行渲染，全部完成后一次性返回)
+        for _ in _iter_page_results():
+            pass
+        response_data = dict(_summary(), rendered_images=rendered_images)
+        if use_image_ids:
+            response_data['rendered_images'] = [None] * len(rendered_images)
+            response_data['rendered_image_ids'] = rendered_images
+            response_data['rendered_image_urls'] = [page_image_url(image_id) if image_id else None for image_id in rendered_images]
+        return jsonify(response_data)
         
     except Exception as e:
         logger.error(f"处理应用设置到所有图片的请求时发生错误: {e}")
@@ -1058,7 +1339,7 @@ def route_translate_single_text():
 
         try:
             logger.info(f"开始调用translate_single_text函数进行翻译... JSON模式: {use_json_format}, 自定义BaseURL: {custom_base_url if custom_base_url else '无'}, rpm: {rpm_limit_translation}")
-            translated = translate_single_text( # 调用 src.core.translation 中的函数
+            translated = translate_single_text_with_memory( # 先查询翻译记忆，未命中时调用 translate_single_text
                 original_text, 
                 target_language, 
                 model_provider, 
@@ -1086,4 +1367,33 @@ def route_translate_single_text():
 
     except Exception as e:
         logger.error(f"处理单条文本翻译请求时出错: {e}")
-        return jsonify({'error': f'请求处理失败: {str(e)}'}), 500
\ No newline at end of file
+        return jsonify({'error': f'请求处理失败: {str(e)}'}), 500
+
+
+@translate_bp.route('/translation_memory_stats', methods=['GET'])
+def translation_memory_stats():
+    """返回翻译记忆的条目数和命中统计"""
+    memory = get_translation_memory()
+    if memory is None:
+        return jsonify({'enabled': False})
+    try:
+        stats = memory.get_stats()
+        stats['enabled'] = True
+        return jsonify(stats)
+    except Exception as e:
+        logger.error(f"获取翻译记忆统计时出错: {e}", exc_info=True)
+        return jsonify({'error': f'获取翻译记忆统计失败: {str(e)}'}), 500
+
+
+@translate_bp.route('/clear_translation_memory', methods=['POST'])
+def clear_translation_memory():
+    """清空翻译记忆"""
+    memory = get_translation_memory()
+    if memory is None:
+        return jsonify({'error': '翻译记忆未启用'}), 400
+    try:
+        memory.clear()
+        return jsonify({'success': True, 'message': '翻译记忆已清空'})
+    except Exception as e:
+        logger.error(f"清空翻译记忆时出错: {e}", exc_info=True)
+        return jsonify({'error': f'清空翻译记忆失败: {str(e)}'}), 500
\ No newline at end of file
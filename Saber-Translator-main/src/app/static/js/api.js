@@ -119,6 +119,71 @@ export function applySettingsToAllApi(params) {
     return makeApiRequest('/api/apply_settings_to_all_images', 'POST', params);
 }
 
+/**
+ * 逐行读取 NDJSON 流式响应：非 {done: true} 的行交给 onItem，返回最后一行 {done: true, ...}
+ * @param {Response} response - fetch 的响应对象
+ * @param {function(object): void} onItem - 每行数据的回调
+ * @param {string} failMessage - 服务器报告失败但没有给出错误信息时使用的提示
+ * @returns {Promise<object>} - 最后一行的汇总结果
+ */
+async function readNdjsonStream(response, onItem, failMessage) {
+    if (!response.ok) {
+        let errorMsg = `请求失败: ${response.status}`;
+        try {
+            const errData = await response.json();
+            if (errData.error) errorMsg = errData.error;
+        } catch (e) {
+            // 非 JSON 错误响应，使用状态码
+        }
+        throw new Error(errorMsg);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let summary = null;
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let newlineIndex;
+        while ((newlineIndex = buffer.indexOf('\n')) >= 0) {
+            const line = buffer.slice(0, newlineIndex).trim();
+            buffer = buffer.slice(newlineIndex + 1);
+            if (!line) continue;
+            const item = JSON.parse(line);
+            if (item.done) {
+                summary = item;
+            } else {
+                onItem(item);
+            }
+        }
+    }
+    if (!summary) {
+        throw new Error('结果未完整返回，连接可能已中断');
+    }
+    if (summary.success === false) {
+        throw new Error(summary.error || failMessage);
+    }
+    return summary;
+}
+
+/**
+ * 以流式 (NDJSON) 方式请求将设置应用到所有图片，后端每渲染完一页就返回一行
+ * @param {object} params - 与 applySettingsToAllApi 相同的参数
+ * @param {function(object): void} onPage - 每页结果的回调 ({index, rendered_image, error})
+ * @returns {Promise<object>} - 最后一行的汇总结果 ({done, success_count, total, message})
+ */
+export async function applySettingsToAllStreamApi(params, onPage) {
+    console.log('发起 API 请求: POST /api/apply_settings_to_all_images (流式)');
+    const response = await fetch('/api/apply_settings_to_all_images', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ ...params, stream: true })
+    });
+    return readNdjsonStream(response, onPage, '应用设置失败');
+}
+
 /**
  * 请求翻译单段文本
  * @param {object} params - 包含 original_text, target_language, 等参数的对象
@@ -136,6 +201,54 @@ export function translateSingleTextApi(params) {
 }
 
 
+// --- 页面存储 API ---
+
+function base64ToBytes(base64) {
+    const binary = atob(base64);
+    const bytes = new Uint8Array(binary.length);
+    for (let i = 0; i < binary.length; i++) bytes[i] = binary.charCodeAt(i);
+    return bytes;
+}
+
+/**
+ * 把图像逐张上传到页面存储，返回与输入顺序对应的图像 ID。
+ * 图像 ID 是原始字节的 SHA-256：浏览器支持 crypto.subtle 时先在本地计算哈希，只上传存储中缺失的图像。
+ * 每个请求只携带一张图像，后端的内存占用与图像总数无关。
+ * @param {string[]} base64Images - 不带 DataURL 前缀的 base64 图像
+ * @returns {Promise<string[]>} - 图像 ID 列表
+ */
+export async function uploadPagesApi(base64Images) {
+    const uploadOne = async (base64) => {
+        const formData = new FormData();
+        formData.append('files', new Blob([base64ToBytes(base64)]));
+        const response = await makeApiRequest('/api/pages/upload', 'POST', formData);
+        return response.image_ids[0];
+    };
+
+    if (!(window.crypto && window.crypto.subtle)) {
+        // 非安全上下文 (如通过局域网 IP 访问) 无法计算哈希，全部上传 (后端按内容去重)
+        const imageIds = [];
+        for (const base64 of base64Images) imageIds.push(await uploadOne(base64));
+        return imageIds;
+    }
+
+    const imageIds = [];
+    for (const base64 of base64Images) {
+        const digest = await window.crypto.subtle.digest('SHA-256', base64ToBytes(base64));
+        imageIds.push(Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, '0')).join(''));
+    }
+    const { missing } = await makeApiRequest('/api/pages/missing', 'POST', { image_ids: imageIds });
+    const missingSet = new Set(missing);
+    for (let i = 0; i < base64Images.length; i++) {
+        if (missingSet.has(imageIds[i])) {
+            imageIds[i] = await uploadOne(base64Images[i]);
+            missingSet.delete(imageIds[i]); // 同一张图像出现多次时只上传一次
+        }
+    }
+    return imageIds;
+}
+
+
 // --- 配置管理 API ---
 
 /**
@@ -266,6 +379,56 @@ export function uploadPdfApi(formData) {
     return makeApiRequest('/api/upload_pdf', 'POST', formData, 'json', false);
 }
 
+/**
+ * 以流式 (NDJSON) 方式上传 PDF，后端每提取出一张图像就返回一行
+ * @param {FormData} formData - 包含 PDF 文件的 FormData 对象
+ * @param {function(object): void} onItem - 每行的回调：首行为 {total_pages}，之后每张图像为 {index, page, image, mime}
+ * @returns {Promise<object>} - 最后一行的汇总结果 ({done, count})
+ */
+export async function uploadPdfStreamApi(formData, onItem) {
+    console.log('发起 API 请求: POST /api/upload_pdf (流式)');
+    formData.set('stream', 'true');
+    const response = await fetch('/api/upload_pdf', { method: 'POST', body: formData });
+    return readNdjsonStream(response, onItem, '处理 PDF 文件失败');
+}
+
+/**
+ * 以流式方式请求批量导出 (ZIP/CBZ/PDF)，后端边打包边返回文件数据
+ * @param {object} params - 包含 images 和 format 的对象
+ * @param {function(number): void} [onProgress] - 已接收字节数的回调
+ * @returns {Promise<Blob>} - 导出的文件
+ */
+export async function downloadAllImagesStreamApi(params, onProgress) {
+    console.log('发起 API 请求: POST /api/download_all_images (流式)');
+    const response = await fetch('/api/download_all_images', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ ...params, stream: true })
+    });
+    if (!response.ok) {
+        let errorMsg = `请求失败: ${response.status}`;
+        try {
+            const errData = await response.json();
+            if (errData.error) errorMsg = errData.error;
+        } catch (e) {
+            // 非 JSON 错误响应，使用状态码
+        }
+        throw new Error(errorMsg);
+    }
+
+    const reader = response.body.getReader();
+    const chunks = [];
+    let received = 0;
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        chunks.push(value);
+        received += value.length;
+        if (onProgress) onProgress(received);
+    }
+    return new Blob(chunks, { type: response.headers.get('Content-Type') || 'application/octet-stream' });
+}
+
 /**
  * 请求清理调试文件
  * @returns {Promise<object>}
@@ -6,6 +6,175 @@ import * as session from './session.js'; // <--- 添加导入，用于自动存
 import * as main from './main.js'; // 导入main模块以使用loadImage函数
 // import $ from 'jquery'; // 假设 jQuery 已全局加载
 
+// --- 新增：增量重渲染状态 ---
+// 服务端按 page_id 缓存每页的干净背景和渲染结果，只重绘变化的气泡并返回变化区域的图块。
+// 使用 WeakMap 记录，不写入图片状态 (避免被保存到会话中)。
+const renderPageIds = new WeakMap();      // 图片对象 -> page_id
+const lastSentCleanImage = new WeakMap(); // 图片对象 -> 上次发送给服务端的干净背景
+const lastRenderResult = new WeakMap();   // 图片对象 -> { revision, dataURL } 上次整页渲染得到的图像
+// 编辑模式下每页常驻一个画布：增量结果的图块直接画在上面并叠加显示在图片上，
+// 不必每次都解码整页、再编码为 PNG；只在需要 DataURL 时 (保存、下载、切换图片、退出编辑模式) 才编码。
+const liveRenderCanvases = new WeakMap(); // 图片对象 -> { canvas, revision, baseDataURL, dirty }
+// 预填充的背景只在填充色或气泡坐标变化时重新生成
+const preFilledBackgrounds = new WeakMap(); // 图片对象 -> { source, fillKey, base64 }
+const LIVE_CANVAS = 'live-canvas'; // applyRenderResponse 的返回值：结果已画在常驻画布上
+
+function getRenderPageId(image) {
+    let pageId = renderPageIds.get(image);
+    if (!pageId) {
+        pageId = `page-${Date.now()}-${Math.random().toString(36).slice(2, 10)}`;
+        renderPageIds.set(image, pageId);
+    }
+    return pageId;
+}
+
+/**
+ * 获取该页的常驻画布。translatedDataURL 已被其他操作替换 (例如重新翻译) 时画布作废。
+ */
+function getLiveCanvas(image) {
+    const live = liveRenderCanvases.get(image);
+    if (live && live.baseDataURL !== image.translatedDataURL) {
+        discardLiveCanvas(image);
+        return null;
+    }
+    return live || null;
+}
+
+function discardLiveCanvas(image) {
+    const live = liveRenderCanvases.get(image);
+    if (live) {
+        $(live.canvas).remove();
+        liveRenderCanvases.delete(image);
+    }
+}
+
+/**
+ * 把常驻画布上尚未编码的渲染结果写回 translatedDataURL。
+ * 读取 translatedDataURL 之前 (保存会话、下载、切换显示原图等) 调用。
+ * @param {object} [image] - 图片对象，默认当前图片
+ */
+export function flushLiveRender(image = state.getCurrentImage()) {
+    const live = image && getLiveCanvas(image);
+    if (!live || !live.dirty) return;
+    const dataURL = live.canvas.toDataURL('image/png');
+    image.translatedDataURL = dataURL;
+    live.baseDataURL = dataURL;
+    live.dirty = false;
+    if (image === state.getCurrentImage() && !image.showOriginal) {
+        ui.updateTranslatedImage(dataURL); // 同时移除叠加的画布
+    }
+}
+
+/**
+ * 编码常驻画布上的结果并释放画布 (退出编辑模式时)，下次增量渲染仍以当前结果为基准。
+ */
+function releaseLiveCanvas(image) {
+    const live = getLiveCanvas(image);
+    if (!live) return;
+    flushLiveRender(image);
+    if (live.revision !== null) {
+        lastRenderResult.set(image, { revision: live.revision, dataURL: image.translatedDataURL });
+    }
+    discardLiveCanvas(image);
+}
+
+/**
+ * 把常驻画布叠加显示在当前图片上 (位置与尺寸由 ui.syncLiveRenderCanvas 按图片的显示比例设置)。
+ */
+function showLiveCanvas(image) {
+    const live = liveRenderCanvases.get(image);
+    if (!live || image !== state.getCurrentImage() || image.showOriginal) return;
+    const imageElement = $('#translatedImageDisplay');
+    if (live.canvas.parentNode !== imageElement.parent()[0]) {
+        $(live.canvas).addClass('live-render-canvas').insertAfter(imageElement);
+    }
+    ui.syncLiveRenderCanvas();
+}
+
+/**
+ * 以增量模式请求重渲染。服务端没有该页缓存 (409) 时附带干净背景重试一次。
+ */
+function requestIncrementalRender(image, data, cleanImageBase64) {
+    data.incremental = true;
+    data.page_id = getRenderPageId(image);
+    const live = getLiveCanvas(image);
+    const last = lastRenderResult.get(image);
+    // 只有当前显示的图像就是上次渲染的结果时，服务端返回的图块才能直接贴上去
+    if (live) {
+        data.base_revision = live.revision;
+    } else if (last && last.dataURL === image.translatedDataURL) {
+        data.base_revision = last.revision;
+    }
+    if (cleanImageBase64 && lastSentCleanImage.get(image) === cleanImageBase64) {
+        delete data.clean_image; // 背景未变化，服务端已缓存
+    }
+    return api.reRenderImageApi(data)
+        .catch(error => {
+            if (error.status === 409 && !data.clean_image && cleanImageBase64) {
+                data.clean_image = cleanImageBase64;
+                return api.reRenderImageApi(data);
+            }
+            throw error;
+        })
+        .then(response => {
+            if (data.clean_image) lastSentCleanImage.set(image, data.clean_image);
+            return response;
+        });
+}
+
+/**
+ * 处理渲染响应。整页结果返回新的 DataURL；增量结果把图块画到该页的常驻画布上
+ * (第一次增量时才解码一次整页)，在编辑模式中返回 LIVE_CANVAS，不编码整页。
+ * 没有变化时返回当前的 translatedDataURL。
+ */
+async function applyRenderResponse(image, response) {
+    if (response.rendered_image) {
+        discardLiveCanvas(image);
+        const dataURL = 'data:image/png;base64,' + response.rendered_image;
+        if (response.revision !== undefined) {
+            lastRenderResult.set(image, { revision: response.revision, dataURL: dataURL });
+        }
+        return dataURL;
+    }
+    if (!response.incremental) return null;
+
+    const tiles = response.tiles || [];
+    let live = getLiveCanvas(image);
+    if (!live && tiles.length > 0) {
+        const baseImage = await main.loadImage(image.translatedDataURL);
+        const canvas = document.createElement('canvas');
+        canvas.width = response.width;
+        canvas.height = response.height;
+        canvas.getContext('2d').drawImage(baseImage, 0, 0);
+        live = { canvas: canvas, revision: null, baseDataURL: image.translatedDataURL, dirty: false };
+        liveRenderCanvases.set(image, live);
+    }
+    if (!live) {
+        // 没有变化，也还没有常驻画布
+        if (response.revision !== undefined) {
+            lastRenderResult.set(image, { revision: response.revision, dataURL: image.translatedDataURL });
+        }
+        return image.translatedDataURL;
+    }
+
+    if (tiles.length > 0) {
+        const tileImages = await Promise.all(
+            tiles.map(tile => main.loadImage('data:image/png;base64,' + tile.image))
+        );
+        const ctx = live.canvas.getContext('2d');
+        tiles.forEach((tile, i) => ctx.drawImage(tileImages[i], tile.x, tile.y));
+        live.dirty = true;
+    }
+    if (response.revision !== undefined) live.revision = response.revision;
+
+    if (state.editModeActive && image === state.getCurrentImage()) {
+        return live.dirty ? LIVE_CANVAS : image.translatedDataURL;
+    }
+    releaseLiveCanvas(image); // 不在编辑中 (如退出编辑模式时的最后一次渲染)，直接编码
+    return image.translatedDataURL;
+}
+// --- 结束新增 ---
+
 /**
  * 切换编辑模式
  */
@@ -40,6 +209,7 @@ export function toggleEditMode() {
     } else {
         // --- 退出编辑模式 ---
         ui.toggleEditModeUI(false); // 更新 UI (这会清除所有高亮框)
+        releaseLiveCanvas(state.getCurrentImage()); // 编码编辑期间的渲染结果并移除叠加的画布
         
         // 确保清除任何可能存在的"重新渲染中..."消息
         ui.clearGeneralMessageById("rendering_loading_message");
@@ -242,6 +412,21 @@ export function renderBubblePreview(bubbleIndex) {
     reRenderFullImage();
 }
 
+/**
+ * 每个气泡的填充色：编辑模式下使用当前的气泡设置，否则使用图片保存的气泡设置，
+ * 没有独立填充色的气泡使用图片的全局填充色。
+ */
+function getBubbleFillColors(image) {
+    const imageFillColor = image.fillColor || state.defaultFillColor;
+    let settings = null;
+    if (state.editModeActive && state.bubbleSettings && state.bubbleSettings.length === image.bubbleCoords.length) {
+        settings = state.bubbleSettings;
+    } else if (Array.isArray(image.bubbleSettings) && image.bubbleSettings.length > 0) {
+        settings = image.bubbleSettings;
+    }
+    return image.bubbleCoords.map((_, i) => (settings && settings[i] && settings[i].fillColor) || imageFillColor);
+}
+
 /**
  * 重新渲染整个图像
  * @param {boolean} [fromAutoToManual=false] - (保留) 是否是从自动字号切换到手动字号,用于后端特殊处理
@@ -283,17 +468,6 @@ export function reRenderFullImage(fromAutoToManual = false) {
                 throw new Error("无法找到原始干净背景用于填充。");
             }
 
-            const pristineBgImage = await main.loadImage(pristineBackgroundSrc); // main.js 需要导出 loadImage
-            const canvas = document.createElement('canvas');
-            canvas.width = pristineBgImage.naturalWidth;
-            canvas.height = pristineBgImage.naturalHeight;
-            const ctx = canvas.getContext('2d');
-            ctx.drawImage(pristineBgImage, 0, 0);
-
-            // 2. 根据 state.bubbleSettings 中的独立 fillColor 填充气泡区域
-            // 只有在编辑模式下，并且有有效的 bubbleSettings 时才应用独立填充色
-            let appliedIndividualFills = false;
-            
             // 检查是否使用了LAMA修复，如果是则不进行填充
             const usesLamaInpainting = (
                 (currentImage.hasOwnProperty('_lama_inpainted') && currentImage._lama_inpainted === true) || 
@@ -305,59 +479,30 @@ export function reRenderFullImage(fromAutoToManual = false) {
                 // 直接使用LAMA修复的干净背景
                 preFilledBackgroundBase64 = currentImage.cleanImageData;
             } else {
-                // 普通填充逻辑
-                if (state.editModeActive && state.bubbleSettings && state.bubbleSettings.length === currentImage.bubbleCoords.length) {
-                    currentImage.bubbleCoords.forEach((coords, i) => {
-                        const bubbleSetting = state.bubbleSettings[i];
-                        if (bubbleSetting && bubbleSetting.fillColor) {
-                            const [x1, y1, x2, y2] = coords;
-                            ctx.fillStyle = bubbleSetting.fillColor;
-                            ctx.fillRect(x1, y1, x2 - x1 + 1, y2 - y1 + 1);
-                            appliedIndividualFills = true;
-                        } else {
-                            // 如果某个气泡没有独立填充色，则使用图片的全局填充色
-                            const imageFillColor = currentImage.fillColor || state.defaultFillColor;
-                            const [x1, y1, x2, y2] = coords;
-                            ctx.fillStyle = imageFillColor;
-                            ctx.fillRect(x1, y1, x2 - x1 + 1, y2 - y1 + 1);
-                        }
-                    });
-                    if(appliedIndividualFills) {
-                        console.log("reRenderFullImage: 已在前端应用独立的或全局的气泡填充色。");
-                    }
-                } else if (currentImage.bubbleSettings && Array.isArray(currentImage.bubbleSettings) && 
-                    currentImage.bubbleSettings.length > 0) {
-                    // 非编辑模式，但有保存的bubbleSettings，检查是否有独立fillColor
-                    currentImage.bubbleCoords.forEach((coords, i) => {
-                        const bubbleSetting = currentImage.bubbleSettings[i];
-                        if (bubbleSetting && bubbleSetting.fillColor) {
-                            const [x1, y1, x2, y2] = coords;
-                            ctx.fillStyle = bubbleSetting.fillColor;
-                            ctx.fillRect(x1, y1, x2 - x1 + 1, y2 - y1 + 1);
-                            appliedIndividualFills = true;
-                        } else {
-                            // 如果某个气泡没有独立填充色，则使用图片的全局填充色
-                            const imageFillColor = currentImage.fillColor || state.defaultFillColor;
-                            const [x1, y1, x2, y2] = coords;
-                            ctx.fillStyle = imageFillColor;
-                            ctx.fillRect(x1, y1, x2 - x1 + 1, y2 - y1 + 1);
-                        }
-                    });
-                    if(appliedIndividualFills) {
-                        console.log("reRenderFullImage (非编辑模式): 应用了保存的独立气泡填充色。");
-                    }
+                // 2. 按每个气泡的填充色填充气泡区域；填充色和坐标都没变时直接复用上次的结果，不再解码和编码整页
+                const fillColors = getBubbleFillColors(currentImage);
+                const fillKey = JSON.stringify([currentImage.bubbleCoords, fillColors]);
+                const source = currentImage.cleanImageData || currentImage.originalDataURL;
+                const cached = preFilledBackgrounds.get(currentImage);
+                if (cached && cached.fillKey === fillKey &&
+                    (currentImage.cleanImageData === cached.base64 || source === cached.source)) {
+                    preFilledBackgroundBase64 = cached.base64;
                 } else {
-                    // 没有可用的bubbleSettings，使用图片的全局填充色填充所有气泡
-                    const imageFillColor = currentImage.fillColor || state.defaultFillColor;
-                    currentImage.bubbleCoords.forEach(coords => {
+                    const pristineBgImage = await main.loadImage(pristineBackgroundSrc); // main.js 需要导出 loadImage
+                    const canvas = document.createElement('canvas');
+                    canvas.width = pristineBgImage.naturalWidth;
+                    canvas.height = pristineBgImage.naturalHeight;
+                    const ctx = canvas.getContext('2d');
+                    ctx.drawImage(pristineBgImage, 0, 0);
+                    currentImage.bubbleCoords.forEach((coords, i) => {
                         const [x1, y1, x2, y2] = coords;
-                        ctx.fillStyle = imageFillColor;
+                        ctx.fillStyle = fillColors[i];
                         ctx.fillRect(x1, y1, x2 - x1 + 1, y2 - y1 + 1);
                     });
-                    console.log("reRenderFullImage: 已在前端应用图片的全局填充色。");
+                    console.log("reRenderFullImage: 已在前端应用气泡填充色。");
+                    preFilledBackgroundBase64 = canvas.toDataURL('image/png').split(',')[1];
+                    preFilledBackgrounds.set(currentImage, { source: source, fillKey: fillKey, base64: preFilledBackgroundBase64 });
                 }
-                
-                preFilledBackgroundBase64 = canvas.toDataURL('image/png').split(',')[1];
             }
 
             backendShouldInpaint = false;
@@ -501,20 +646,28 @@ export function reRenderFullImage(fromAutoToManual = false) {
         // 添加日志显示描边参数
         console.log(`reRenderFullImage: 发送描边参数 - 启用=${data.enableTextStroke}, 颜色=${data.textStrokeColor}, 宽度=${data.textStrokeWidth}`);
 
-        api.reRenderImageApi(data)
-            .then(response => {
+        requestIncrementalRender(currentImage, data, preFilledBackgroundBase64)
+            .then(response => applyRenderResponse(currentImage, response))
+            .then(renderedDataURL => {
                 ui.clearGeneralMessageById(loadingMessageId);
-                if (response.rendered_image) {
-                    state.updateCurrentImageProperty('translatedDataURL', 'data:image/png;base64,' + response.rendered_image);
+                if (renderedDataURL) {
                     // **重要**：如果前端成功预填充了背景，那么这个预填充的背景应该成为新的 cleanImageData
                     // 这样，如果用户接下来修改其他文本样式（不改变填充色），可以基于这个最新的背景重绘
-                    if (preFilledBackgroundBase64) {
+                    if (preFilledBackgroundBase64 && currentImage.cleanImageData !== preFilledBackgroundBase64) {
                         state.updateCurrentImageProperty('cleanImageData', preFilledBackgroundBase64);
                         console.log("reRenderFullImage: 更新 cleanImageData 为前端预填充的背景。");
                     }
                     // 如果之前是 _tempCleanImageForFill，它已经被用掉了，不再需要。
-
                     state.updateCurrentImageProperty('bubbleTexts', currentTexts);
+
+                    if (renderedDataURL === LIVE_CANVAS) {
+                        // 图块已画在常驻画布上，直接叠加显示
+                        showLiveCanvas(currentImage);
+                        ui.updateBubbleHighlight(state.selectedBubbleIndex);
+                        resolve();
+                        return;
+                    }
+                    state.updateCurrentImageProperty('translatedDataURL', renderedDataURL);
                     ui.updateTranslatedImage(state.getCurrentImage().translatedDataURL);
                     $('#translatedImageDisplay').one('load', () => {
                         ui.updateBubbleHighlight(state.selectedBubbleIndex);
@@ -624,6 +624,7 @@ function handleNextImage() {
 }
 
 function handleToggleImageDisplay() {
+    editMode.flushLiveRender(); // 编辑模式中尚未编码的渲染结果
     const currentImage = state.getCurrentImage();
     if (!currentImage || !currentImage.translatedDataURL) return;
     state.updateCurrentImageProperty('showOriginal', !currentImage.showOriginal);
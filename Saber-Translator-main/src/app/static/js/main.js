@@ -632,7 +632,8 @@ function processImageFile(file) { // 私有
 }
 
 /**
- * 处理 PDF 文件列表
+ * 处理 PDF 文件列表。以流式方式上传，后端每提取出一张图像就立即加入图片列表，
+ * 不必等整个 PDF 处理完；JPEG 图像按原格式返回，因此按返回的 mime 构造 DataURL。
  * @param {Array<File>} pdfFiles - PDF 文件数组
  * @returns {Promise<void>}
  */
@@ -642,24 +643,35 @@ function processPDFFiles(pdfFiles) { // 私有
             ui.showLoading(`处理 PDF: ${file.name}...`);
             const formData = new FormData();
             formData.append('pdfFile', file);
-            return api.uploadPdfApi(formData)
-                .then(response => {
-                    if (response.images && response.images.length > 0) {
-                        response.images.forEach((imageData, idx) => {
-                            const originalDataURL = "data:image/png;base64," + imageData;
-                            const pdfFileName = `${file.name}_页面${idx+1}`;
-                            state.addImage({
-                                originalDataURL: originalDataURL,
-                                translatedDataURL: null, cleanImageData: null,
-                                bubbleTexts: [], bubbleCoords: [], originalTexts: [], textboxTexts: [],
-                                bubbleSettings: null, fileName: pdfFileName,
-                                fontSize: state.defaultFontSize, autoFontSize: $('#autoFontSize').is(':checked'),
-                                fontFamily: state.defaultFontFamily, layoutDirection: state.defaultLayoutDirection,
-                                showOriginal: false, translationFailed: false,
-                                originalUseInpainting: undefined, originalUseLama: undefined,
-                            });
-                        });
-                    } else {
+            let totalPages = 0;
+            return api.uploadPdfStreamApi(formData, item => {
+                    if (item.total_pages !== undefined) {
+                        totalPages = item.total_pages;
+                        return;
+                    }
+                    const originalDataURL = `data:${item.mime || 'image/png'};base64,${item.image}`;
+                    const pdfFileName = `${file.name}_页面${item.index + 1}`;
+                    state.addImage({
+                        originalDataURL: originalDataURL,
+                        translatedDataURL: null, cleanImageData: null,
+                        bubbleTexts: [], bubbleCoords: [], originalTexts: [], textboxTexts: [],
+                        bubbleSettings: null, fileName: pdfFileName,
+                        fontSize: state.defaultFontSize, autoFontSize: $('#autoFontSize').is(':checked'),
+                        fontFamily: state.defaultFontFamily, layoutDirection: state.defaultLayoutDirection,
+                        showOriginal: false, translationFailed: false,
+                        originalUseInpainting: undefined, originalUseLama: undefined,
+                    });
+                    ui.showLoading(`处理 PDF: ${file.name} (第 ${item.page}/${totalPages} 页)...`);
+                    // 第一张图像到达后立即显示，之后每 10 张刷新一次缩略图 (全部完成后会统一排序刷新)
+                    if (state.images.length === 1) {
+                        ui.renderThumbnails();
+                        switchImage(0);
+                    } else if (state.images.length % 10 === 0) {
+                        ui.renderThumbnails();
+                    }
+                })
+                .then(summary => {
+                    if (!summary.count) {
                         ui.showGeneralMessage(`PDF文件 ${file.name} 中没有检测到图片`, "warning");
                     }
                 })
@@ -1279,6 +1291,7 @@ export function translateAllImages() {
  * 下载当前图片（翻译后或原始图片）
  */
 export function downloadCurrentImage() {
+    editMode.flushLiveRender(); // 编辑模式中尚未编码的渲染结果
     const currentImage = state.getCurrentImage();
     if (!currentImage) {
         ui.showGeneralMessage("没有可下载的图片", "warning");
@@ -1329,6 +1342,7 @@ export function downloadCurrentImage() {
  */
 export function downloadAllImages() {
     const selectedFormat = $('#downloadFormat').val();
+    editMode.flushLiveRender(); // 编辑模式中尚未编码的渲染结果
 
     // 立即显示进度条
     $("#translationProgressBar").show();
@@ -1381,78 +1395,52 @@ export function downloadAllImages() {
             }
             
             // 更新进度条状态
-            ui.updateProgressBar(30, "保存图片到临时文件夹...");
+            ui.updateProgressBar(30, "打包中...");
             
-            // 调用后端API
-            $.ajax({
-                url: '/api/download_all_images',
-                type: 'POST',
-                contentType: 'application/json',
-                data: JSON.stringify({
-                    images: imageDataList,
-                    format: selectedFormat
-                }),
-                success: function(response) {
+            // 调用后端API：后端边打包边返回文件，不再经过临时目录
+            const extension = selectedFormat === 'pdf' ? 'pdf' : selectedFormat === 'cbz' ? 'cbz' : 'zip';
+            api.downloadAllImagesStreamApi({ images: imageDataList, format: selectedFormat }, received => {
+                    ui.updateProgressBar(30, `打包中... 已接收 ${(received / (1024 * 1024)).toFixed(1)} MB`);
+                })
+                .then(blob => {
                     ui.updateProgressBar(80, "处理完成，准备下载...");
-                    
-                    if (response.success && response.file_id) {
-                        // 创建下载链接
-                        const downloadUrl = `/api/download_file/${response.file_id}?format=${response.format}`;
-                        
-                        // 通过创建临时链接触发下载
-                        const link = document.createElement('a');
-                        link.href = downloadUrl;
-                        document.body.appendChild(link);
-                        link.click();
-                        document.body.removeChild(link);
-                        
-                        ui.updateProgressBar(100, "下载已开始");
-                        
-                        // 更新下载成功信息，包括翻译和原始图片数量
-                        let successMessage = `已成功处理 ${imageDataList.length} 张图片`;
-                        if (translatedCount > 0 && originalCount > 0) {
-                            successMessage += `（${translatedCount} 张翻译图片和 ${originalCount} 张原始图片）`;
-                        } else if (translatedCount > 0) {
-                            successMessage += `（全部为翻译后图片）`;
-                        } else if (originalCount > 0) {
-                            successMessage += `（全部为原始图片）`;
-                        }
-                        successMessage += "，下载即将开始";
-                        
-                        ui.showGeneralMessage(successMessage, "success");
-                        
-                        // 启动后台清理过期文件的请求
-                        setTimeout(() => {
-                            $.ajax({
-                                url: '/api/clean_temp_files',
-                                type: 'POST',
-                                contentType: 'application/json',
-                                data: JSON.stringify({}),
-                                success: function(cleanResponse) {
-                                    console.log("临时文件清理结果:", cleanResponse);
-                                },
-                                error: function(xhr, status, error) {
-                                    console.error("清理临时文件失败:", error);
-                                }
-                            });
-                        }, 60000); // 1分钟后清理
-                    } else {
-                        ui.showGeneralMessage(`处理失败: ${response.error || '未知错误'}`, "error");
-                        $("#translationProgressBar").hide();
+
+                    // 通过创建临时链接触发下载
+                    const downloadUrl = URL.createObjectURL(blob);
+                    const link = document.createElement('a');
+                    link.href = downloadUrl;
+                    link.download = `comic_translator_images.${extension}`;
+                    document.body.appendChild(link);
+                    link.click();
+                    document.body.removeChild(link);
+                    setTimeout(() => URL.revokeObjectURL(downloadUrl), 60000);
+
+                    ui.updateProgressBar(100, "下载已开始");
+
+                    // 更新下载成功信息，包括翻译和原始图片数量
+                    let successMessage = `已成功处理 ${imageDataList.length} 张图片`;
+                    if (translatedCount > 0 && originalCount > 0) {
+                        successMessage += `（${translatedCount} 张翻译图片和 ${originalCount} 张原始图片）`;
+                    } else if (translatedCount > 0) {
+                        successMessage += `（全部为翻译后图片）`;
+                    } else if (originalCount > 0) {
+                        successMessage += `（全部为原始图片）`;
                     }
-                },
-                error: function(xhr, status, error) {
-                    ui.showGeneralMessage(`下载请求失败: ${xhr.responseJSON?.error || error}`, "error");
+                    successMessage += "，下载即将开始";
+
+                    ui.showGeneralMessage(successMessage, "success");
+                })
+                .catch(error => {
+                    ui.showGeneralMessage(`下载请求失败: ${error.message || error}`, "error");
                     $("#translationProgressBar").hide();
-                },
-                complete: function() {
+                })
+                .finally(() => {
                     setTimeout(() => {
                     $("#translationProgressBar").hide();
                     $(".message.info").fadeOut(300, function() { $(this).remove(); });
                     }, 2000); // 延迟2秒再隐藏，让用户能看到完成进度
                     ui.showDownloadingMessage(false);
-                }
-            });
+                });
         } catch (e) {
             console.error("下载所有图片时出错:", e);
             ui.showGeneralMessage("下载失败", "error");
@@ -1495,15 +1483,119 @@ export async function applySettingsToAll() { // 导出
     
     // 保存当前图片索引，以便处理完后恢复
     const originalImageIndex = state.currentImageIndex;
+
+    // 把设置写入图片状态
+    const applySettingsToImageState = (img) => {
+        img.fontSize = settingsToApply.fontSize;
+        img.autoFontSize = settingsToApply.autoFontSize;
+        img.fontFamily = settingsToApply.fontFamily;
+        img.layoutDirection = settingsToApply.textDirection;
+        
+        // 更新 bubbleSettings (如果存在)
+        if (img.bubbleSettings) {
+            img.bubbleSettings = img.bubbleSettings.map(setting => ({
+                ...setting,
+                fontSize: settingsToApply.fontSize,
+                autoFontSize: settingsToApply.autoFontSize,
+                fontFamily: settingsToApply.fontFamily,
+                textDirection: settingsToApply.textDirection,
+                textColor: settingsToApply.textColor,
+                rotationAngle: settingsToApply.rotationAngle,
+                // === 新增：描边参数 START ===
+                enableStroke: settingsToApply.enableStroke,
+                strokeColor: settingsToApply.strokeColor, 
+                strokeWidth: settingsToApply.strokeWidth
+                // === 新增：描边参数 END ===
+            }));
+        }
+    };
+
+    // --- 新增：有干净背景且没有独立填充色的图片交给后端批量并行渲染，结果逐页流式返回 ---
+    // 其余图片 (需要在前端预填充独立填充色) 仍逐页走 reRenderFullImage
+    const hasIndividualFill = (img) => !img.originalUseLama && !img._lama_inpainted &&
+        Array.isArray(img.bubbleSettings) && img.bubbleSettings.some(setting => setting && setting.fillColor);
+    const batchIndices = [];
+    const singleIndices = [];
+    state.images.forEach((img, imageIndex) => {
+        if (!img.translatedDataURL) return; // 跳过未翻译的图片
+        if (img.cleanImageData && img.bubbleCoords && img.bubbleCoords.length > 0 && !hasIndividualFill(img)) {
+            batchIndices.push(imageIndex);
+        } else {
+            singleIndices.push(imageIndex);
+        }
+    });
     
     try {
-        // 遍历所有图片
-        for (let imageIndex = 0; imageIndex < state.images.length; imageIndex++) {
+        if (batchIndices.length > 0) {
+            let finishedCount = 0;
+            const batchTexts = batchIndices.map(imageIndex => {
+                const img = state.images[imageIndex];
+                const texts = (img.bubbleTexts || []).slice(0, img.bubbleCoords.length);
+                while (texts.length < img.bubbleCoords.length) texts.push("");
+                return texts;
+            });
+            // 干净背景先逐张上传到页面存储 (已存在的不再上传)，渲染请求只携带图像 ID，
+            // 后端不必一次解析整章的 base64，内存占用只取决于并行渲染的页数
+            ui.updateLoadingMessage("上传图片背景...");
+            const batchCleanImageIds = await api.uploadPagesApi(
+                batchIndices.map(imageIndex => state.images[imageIndex].cleanImageData)
+            );
+            const summary = await api.applySettingsToAllStreamApi({
+                fontSize: settingsToApply.fontSize,
+                autoFontSize: settingsToApply.autoFontSize,
+                fontFamily: settingsToApply.fontFamily,
+                textDirection: settingsToApply.textDirection,
+                textColor: settingsToApply.textColor,
+                rotationAngle: settingsToApply.rotationAngle,
+                enableTextStroke: settingsToApply.enableStroke,
+                textStrokeColor: settingsToApply.strokeColor,
+                textStrokeWidth: settingsToApply.strokeWidth,
+                all_clean_image_ids: batchCleanImageIds, // 只发送干净背景，后端直接在其上渲染
+                all_texts: batchTexts,
+                all_bubble_coords: batchIndices.map(imageIndex => state.images[imageIndex].bubbleCoords),
+                // 保留每个气泡的位置偏移 (与逐页 reRenderFullImage 发送的 position 一致)
+                all_bubble_positions: batchIndices.map(imageIndex => {
+                    const img = state.images[imageIndex];
+                    return img.bubbleCoords.map((_, i) => {
+                        const setting = Array.isArray(img.bubbleSettings) ? img.bubbleSettings[i] : null;
+                        return (setting && setting.position) || { x: 0, y: 0 };
+                    });
+                }),
+                use_inpainting: false,
+                use_lama: false
+            }, (pageResult) => {
+                finishedCount++;
+                ui.updateLoadingMessage(`应用设置到图片 ${finishedCount}/${batchIndices.length + singleIndices.length}...`);
+                const imageIndex = batchIndices[pageResult.index];
+                if (!pageResult.rendered_image) {
+                    console.error(`应用设置到图片 ${imageIndex + 1} 失败:`, pageResult.error);
+                    return;
+                }
+                const img = state.images[imageIndex];
+                applySettingsToImageState(img);
+                img.translatedDataURL = 'data:image/png;base64,' + pageResult.rendered_image;
+                // 渲染完一页就立即显示
+                if (imageIndex === state.currentImageIndex) {
+                    ui.updateTranslatedImage(img.translatedDataURL);
+                }
+            });
+            console.log("批量应用设置完成:", summary.message);
+            // 渲染前已被页面存储淘汰的背景：这些页面改为逐页渲染
+            if (summary.missing_image_ids && summary.missing_image_ids.length > 0) {
+                const missingIds = new Set(summary.missing_image_ids);
+                batchIndices.forEach((imageIndex, i) => {
+                    if (missingIds.has(batchCleanImageIds[i])) singleIndices.push(imageIndex);
+                });
+            }
+        }
+
+        // 逐页处理需要前端预填充背景的图片
+        for (let i = 0; i < singleIndices.length; i++) {
+            const imageIndex = singleIndices[i];
             const img = state.images[imageIndex];
-            if (!img.translatedDataURL) continue; // 跳过未翻译的图片
             
             // 更新进度显示
-            ui.updateLoadingMessage(`应用设置到图片 ${imageIndex + 1}/${state.images.length}...`);
+            ui.updateLoadingMessage(`应用设置到图片 ${batchIndices.length + i + 1}/${batchIndices.length + singleIndices.length}...`);
             
             // 切换到当前图片
             await new Promise(resolve => {
@@ -1512,28 +1604,7 @@ export async function applySettingsToAll() { // 导出
             });
             
             // 应用设置
-            img.fontSize = settingsToApply.fontSize;
-            img.autoFontSize = settingsToApply.autoFontSize;
-            img.fontFamily = settingsToApply.fontFamily;
-            img.layoutDirection = settingsToApply.textDirection;
-            
-            // 更新 bubbleSettings (如果存在)
-            if (img.bubbleSettings) {
-                img.bubbleSettings = img.bubbleSettings.map(setting => ({
-                    ...setting,
-                    fontSize: settingsToApply.fontSize,
-                    autoFontSize: settingsToApply.autoFontSize,
-                    fontFamily: settingsToApply.fontFamily,
-                    textDirection: settingsToApply.textDirection,
-                    textColor: settingsToApply.textColor,
-                    rotationAngle: settingsToApply.rotationAngle,
-                    // === 新增：描边参数 START ===
-                    enableStroke: settingsToApply.enableStroke,
-                    strokeColor: settingsToApply.strokeColor, 
-                    strokeWidth: settingsToApply.strokeWidth
-                    // === 新增：描边参数 END ===
-                }));
-            }
+            applySettingsToImageState(img);
             
             // 对当前图片进行重渲染
             await new Promise(resolve => {
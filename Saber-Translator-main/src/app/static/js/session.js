@@ -67,6 +67,7 @@ function collectCurrentSessionData() {
 
     // 2. 收集图片状态 (深拷贝以避免修改原始状态)
     // 注意：这里包含了 Base64 数据，会比较大
+    editMode.flushLiveRender(); // 编辑模式中尚未编码的渲染结果
     const imagesData = JSON.parse(JSON.stringify(state.images));
     console.log(`收集到 ${imagesData.length} 张图片的状态数据。`);
 
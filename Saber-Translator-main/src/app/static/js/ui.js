@@ -84,6 +84,8 @@ export function updateTranslatedImage(dataURL) {
     const translatedImageDisplay = $("#translatedImageDisplay");
     const toggleImageButton = $('#toggleImageButton');
 
+    $('.live-render-canvas').remove(); // 显示新的图像时移除编辑模式叠加的渲染画布
+
     if (dataURL) {
         translatedImageDisplay.attr('src', dataURL).show();
         toggleImageButton.show();
@@ -646,6 +648,25 @@ function testBaiduTranslateConnection() {
 export function updateImageSizeDisplay(value) {
     $("#imageSizeValue").text(value + "%");
     $("#translatedImageDisplay").css("width", value + "%");
+    syncLiveRenderCanvas();
+}
+
+/**
+ * 让编辑模式叠加的渲染画布与图片的显示位置和尺寸保持一致 (与高亮框使用相同的坐标换算)。
+ */
+export function syncLiveRenderCanvas() {
+    const canvas = $('.live-render-canvas');
+    if (canvas.length === 0) return;
+    const metrics = calculateImageDisplayMetrics($('#translatedImageDisplay'));
+    if (!metrics) return;
+    canvas.css({
+        'position': 'absolute',
+        'left': `${metrics.visualContentOffsetX}px`,
+        'top': `${metrics.visualContentOffsetY}px`,
+        'width': `${metrics.visualContentWidth}px`,
+        'height': `${metrics.visualContentHeight}px`,
+        'pointer-events': 'none'
+    });
 }
 
 /**
@@ -892,6 +913,8 @@ export function updateBubbleHighlight(selectedBubbleIndex) {
         return;
     }
 
+    syncLiveRenderCanvas();
+
     // 遍历所有气泡坐标并创建高亮框
     currentImage.bubbleCoords.forEach((coords, index) => {
         const [x1, y1, x2, y2] = coords;
@@ -0,0 +1,206 @@
+"""
+批量导出：把多页图像打包为 ZIP/CBZ 或 PDF，以数据块的形式逐页产出。
+
+- ZIP/CBZ：PNG/JPEG 图像的原始字节直接写入压缩包 (不解码、不重新编码)，其他格式转换为 PNG；
+- PDF：逐页追加，RGB/灰度 JPEG 直接以 DCTDecode 嵌入，其他图像转换为 RGB 后编码为 JPEG
+  (与之前使用 Pillow 保存 PDF 的结果一致)，页面对象写出后即释放，内存占用与页数无关。
+
+调用方可以把产出的数据块直接作为分块传输的 HTTP 响应返回，也可以写入文件。
+"""
+
+import io
+import logging
+import time
+import zipfile
+
+from PIL import Image
+
+from src.core.page_store import sniff_mime
+from src.shared import constants
+
+logger = logging.getLogger("CoreArchiveExport")
+
+# 格式 -> (扩展名, MIME)
+ARCHIVE_FORMATS = {
+    'zip': ('.zip', 'application/zip'),
+    'cbz': ('.cbz', 'application/x-cbz'),
+    'pdf': ('.pdf', 'application/pdf'),
+}
+
+_ENTRY_EXTENSIONS = {'image/png': '.png', 'image/jpeg': '.jpg'}
+
+
+class _ChunkSink:
+    """只支持 write 的输出对象 (zipfile 对不可 seek 的输出会改用数据描述符)，写入的数据由 drain 取走。"""
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class _PdfStreamWriter:
+    """
+    逐页写出的最小 PDF 写入器。每页由图像、内容流和页面三个对象组成，
+    目录和页面树在最后写出，交叉引用表按已写出的字节数记录偏移。
+    """
+    _CATALOG_ID = 1
+    _PAGES_ID = 2
+
+    def __init__(self):
+        self._position = 0
+        self._offsets = {}
+        self._page_ids = []
+        self._next_id = 3
+
+    def _object(self, obj_id, body, stream=None):
+        self._offsets[obj_id] = self._position
+        data = f"{obj_id} 0 obj\n".encode('ascii') + body
+        if stream is not None:
+            data += b"\nstream\n" + stream + b"\nendstream"
+        data += b"\nendobj\n"
+        self._position += len(data)
+        return data
+
+    def header(self):
+        data = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+        self._position += len(data)
+        return data
+
+    def page(self, jpeg_bytes, width, height, color_space):
+        """写出一页 (整页显示一张 JPEG 图像，按 72 DPI 换算页面尺寸，与 Pillow 的默认值一致)。"""
+        image_id, content_id, page_id = self._next_id, self._next_id + 1, self._next_id + 2
+        self._next_id += 3
+        self._page_ids.append(page_id)
+        content = f"q {width} 0 0 {height} 0 0 cm /Im0 Do Q".encode('ascii')
+        return b''.join((
+            self._object(image_id, (
+                f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                f"/ColorSpace /{color_space} /BitsPerComponent 8 /Filter /DCTDecode /Length {len(jpeg_bytes)} >>"
+            ).encode('ascii'), jpeg_bytes),
+            self._object(content_id, f"<< /Length {len(content)} >>".encode('ascii'), content),
+            self._object(page_id, (
+                f"<< /Type /Page /Parent {self._PAGES_ID} 0 R /MediaBox [0 0 {width} {height}] "
+                f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>"
+            ).encode('ascii')),
+        ))
+
+    def trailer(self):
+        kids = ' '.join(f"{page_id} 0 R" for page_id in self._page_ids)
+        data = self._object(self._CATALOG_ID, f"<< /Type /Catalog /Pages {self._PAGES_ID} 0 R >>".encode('ascii'))
+        data += self._object(self._PAGES_ID,
+                             f"<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>".encode('ascii'))
+        xref_position = self._position
+        size = self._next_id
+        xref = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+        xref.extend(f"{self._offsets[obj_id]:010d} 00000 n \n" for obj_id in range(1, size))
+        xref.append(f"trailer\n<< /Size {size} /Root {self._CATALOG_ID} 0 R >>\nstartxref\n{xref_position}\n%%EOF\n")
+        return data + ''.join(xref).encode('ascii')
+
+
+def _zip_entry(data):
+    """返回 (扩展名, 字节)：PNG/JPEG 原样返回，其他格式解码后转换为 PNG。"""
+    mime = sniff_mime(data)
+    if mime in _ENTRY_EXTENSIONS:
+        return _ENTRY_EXTENSIONS[mime], data
+    buffered = io.BytesIO()
+    Image.open(io.BytesIO(data)).save(buffered, format="PNG")
+    return '.png', buffered.getvalue()
+
+
+def _pdf_page_image(data):
+    """返回 (JPEG 字节, 宽, 高, 颜色空间)：RGB/灰度 JPEG 原样返回，其他图像转换为 RGB 后编码为 JPEG。"""
+    img = Image.open(io.BytesIO(data))
+    if sniff_mime(data) == 'image/jpeg' and img.mode in ('RGB', 'L'):
+        return data, img.width, img.height, 'DeviceRGB' if img.mode == 'RGB' else 'DeviceGray'
+    img = img.convert('RGB')
+    buffered = io.BytesIO()
+    img.save(buffered, format="JPEG", quality=constants.EXPORT_PDF_JPEG_QUALITY)
+    return buffered.getvalue(), img.width, img.height, 'DeviceRGB'
+
+
+class ArchiveExporter:
+    """
+    把图像逐页打包为指定格式。
+
+    用法:
+        exporter = ArchiveExporter('cbz')
+        for chunk in exporter.iter_chunks(image_bytes_iter):
+            output.write(chunk)
+    """
+    def __init__(self, format_type):
+        if format_type not in ARCHIVE_FORMATS:
+            raise ValueError(f"不支持的格式类型: {format_type}")
+        self.format_type = format_type
+        self.extension, self.mimetype = ARCHIVE_FORMATS[format_type]
+        self.count = 0   # 成功写入的页数
+        self.failed = 0  # 无法识别而跳过的页数
+
+    def iter_chunks(self, images):
+        """
+        Args:
+            images: 可迭代对象，逐个给出 (页面序号, 图像字节)；按需产生即可，不必预先全部加载。
+
+        Yields:
+            bytes: 导出文件的数据块 (每页一个)。
+
+        Raises:
+            ValueError: 没有任何一页可以导出 (此时尚未产出任何数据)。
+        """
+        if self.format_type == 'pdf':
+            chunks = self._iter_pdf(images)
+        else:
+            chunks = self._iter_zip(images)
+        for chunk in chunks:
+            if chunk:
+                yield chunk
+        logger.info(f"已导出 {self.format_type.upper()}: {self.count} 页" + (f"，跳过 {self.failed} 页" if self.failed else ""))
+
+    def _iter_zip(self, images):
+        sink = _ChunkSink()
+        zipf = None
+        date_time = time.localtime(time.time())[:6]
+        for index, data in images:
+            try:
+                extension, entry_bytes = _zip_entry(data)
+            except Exception as e:
+                logger.error(f"导出第 {index + 1} 张图片失败: {e}")
+                self.failed += 1
+                continue
+            if zipf is None:
+                zipf = zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED)
+            # PNG/JPEG 本身已经压缩，直接存储
+            zipf.writestr(zipfile.ZipInfo(f"image_{index:03d}{extension}", date_time), entry_bytes)
+            self.count += 1
+            yield sink.drain()
+        if zipf is None:
+            raise ValueError("没有可导出的有效图像")
+        zipf.close()
+        yield sink.drain()
+
+    def _iter_pdf(self, images):
+        writer = None
+        for index, data in images:
+            try:
+                page = _pdf_page_image(data)
+            except Exception as e:
+                logger.error(f"加载图片到PDF失败: 第 {index + 1} 张 - {e}")
+                self.failed += 1
+                continue
+            if writer is None:
+                writer = _PdfStreamWriter()
+                yield writer.header()
+            self.count += 1
+            yield writer.page(*page)
+        if writer is None:
+            raise ValueError("没有可导出的有效图像")
+        yield writer.trailer()
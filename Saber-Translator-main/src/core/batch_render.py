@@ -0,0 +1,181 @@
+"""
+多页批量重渲染：把"应用设置到所有图片"的每一页分发到进程池中渲染。
+
+重渲染是纯 CPU 的 Pillow 工作 (排版、逐字绘制、PNG 编码)，在线程中只能部分释放 GIL，
+因此使用进程池并行。结果按完成顺序逐页产出，同时在途的页面数不超过进程数的两倍，
+内存占用由进程池大小而不是章节页数决定。
+
+- 任务和结果都只包含可序列化的基本类型 (图像以 base64 字符串/文件路径传入，以 PNG 字节返回)；
+- 需要 LAMA 修复的页面 (没有干净背景且启用了 LAMA) 在主进程中渲染，复用已常驻的模型；
+- 工作进程池无法启动或运行中崩溃时，自动退回到主进程的线程中渲染。
+"""
+
+import atexit
+import base64
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image
+
+from src.core.worker_pool import get_worker_pool, discard_worker_pool, get_worker_count
+
+logger = logging.getLogger("CoreBatchRender")
+
+
+class PageImageMissingError(Exception):
+    """任务引用的页面存储文件在渲染前已被淘汰。"""
+    def __init__(self, image_id):
+        super().__init__(image_id)
+        self.image_id = image_id
+
+
+def build_render_task(index, texts, bubble_coords, render_args, image_b64=None, image_path=None,
+                      image_id=None, is_clean=False):
+    """
+    构建单页渲染任务。
+
+    Args:
+        index (int): 页面序号 (随结果一起返回)。
+        render_args (dict): re_render_text_in_bubbles 的关键字参数，另含 'bubble_styles'。
+        image_b64 (str): base64 图像数据；与 image_path 二选一。
+        image_path (str): 页面存储中的图像文件路径 (子进程直接读取，不经过管道传输整页数据)。
+        image_id (str): image_path 对应的图像 ID，文件已被淘汰时用于报告。
+        is_clean (bool): 图像是否为干净背景 (无需修复)。
+    """
+    return {
+        'index': index,
+        'image_b64': image_b64,
+        'image_path': image_path,
+        'image_id': image_id,
+        'is_clean': is_clean,
+        'texts': texts,
+        'bubble_coords': bubble_coords,
+        'render_args': render_args,
+    }
+
+
+def needs_main_process(task):
+    """没有干净背景且启用 LAMA 的页面需要修复，LAMA 模型只在主进程中常驻。"""
+    return not task['is_clean'] and task['render_args'].get('use_lama', False)
+
+
+def render_page_task(task):
+    """
+    渲染单页 (在子进程或主进程中执行)。
+
+    Returns:
+        tuple: (页面序号, PNG 字节)。
+
+    Raises:
+        PageImageMissingError: 引用的页面存储文件已不存在。
+    """
+    from src.core.rendering import re_render_text_in_bubbles
+
+    if task['image_path']:
+        try:
+            with open(task['image_path'], 'rb') as f:
+                image_bytes = f.read()
+        except FileNotFoundError:
+            raise PageImageMissingError(task['image_id'])
+    else:
+        image_bytes = base64.b64decode(task['image_b64'])
+    img = Image.open(io.BytesIO(image_bytes))
+    img.load()
+
+    render_args = dict(task['render_args'])
+    setattr(img, '_bubble_styles', render_args.pop('bubble_styles', {}))
+    if task['is_clean']:
+        clean_img = img.copy()
+        setattr(img, '_clean_image', clean_img)
+        setattr(img, '_clean_background', clean_img)
+
+    rendered_image = re_render_text_in_bubbles(img, task['texts'], task['bubble_coords'], **render_args)
+    buffered = io.BytesIO()
+    rendered_image.save(buffered, format="PNG")
+    return task['index'], buffered.getvalue()
+
+
+class BatchRenderer:
+    """
+    批量渲染器。页面提交到常驻的工作进程池 (src/core/worker_pool.py)，需要在主进程中渲染的页面
+    和进程池不可用时的页面使用本地线程池。
+    """
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or get_worker_count()
+        # 主进程中的渲染线程：LAMA 页面，以及进程池不可用时的退回路径
+        self._thread_pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="BatchRender")
+
+    def _submit(self, task):
+        if not needs_main_process(task):
+            pool = get_worker_pool()
+            if pool is not None:
+                try:
+                    return pool.submit(render_page_task, task), pool
+                except (BrokenProcessPool, RuntimeError) as e:
+                    logger.warning(f"工作进程池不可用，改为在主进程中渲染: {e}")
+                    discard_worker_pool(pool)
+        return self._thread_pool.submit(render_page_task, task), None
+
+    def iter_render(self, tasks):
+        """
+        渲染所有任务，按完成顺序逐页产出结果。
+
+        Yields:
+            tuple: (页面序号, PNG 字节 或 None, 异常 或 None)。
+        """
+        tasks = iter(tasks)
+        max_in_flight = self.max_workers * 2
+        in_flight = {} # future -> (任务, 所属进程池)
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(in_flight) < max_in_flight:
+                    task = next(tasks, None)
+                    if task is None:
+                        exhausted = True
+                        break
+                    future, pool = self._submit(task)
+                    in_flight[future] = (task, pool)
+                if not in_flight:
+                    return
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task, pool = in_flight.pop(future)
+                    try:
+                        index, png_bytes = future.result()
+                        yield index, png_bytes, None
+                    except BrokenProcessPool as e:
+                        # 子进程崩溃 (如内存不足被系统终止)：该页及之后的页面都在主进程中渲染
+                        logger.error(f"批量渲染子进程异常退出，第 {task['index'] + 1} 页改为在主进程中重试: {e}")
+                        if pool is not None:
+                            discard_worker_pool(pool)
+                        retry_future = self._thread_pool.submit(render_page_task, task)
+                        in_flight[retry_future] = (task, None)
+                    except Exception as e:
+                        yield task['index'], None, e
+        finally:
+            # 调用方提前停止迭代 (如客户端断开了流式响应) 时，取消尚未开始的页面
+            for future in in_flight:
+                future.cancel()
+
+    def shutdown(self):
+        self._thread_pool.shutdown(wait=False)
+
+
+# --- 单例 ---
+batch_renderer_instance = None
+_renderer_instance_lock = threading.Lock()
+
+def get_batch_renderer():
+    """获取批量渲染器的单例。"""
+    global batch_renderer_instance
+    if batch_renderer_instance is None:
+        with _renderer_instance_lock:
+            if batch_renderer_instance is None:
+                batch_renderer_instance = BatchRenderer()
+                atexit.register(batch_renderer_instance.shutdown)
+    return batch_renderer_instance
@@ -3,22 +3,170 @@ import cv2
 import numpy as np
 import os
 import sys
-from src.interfaces.yolov12_interface import detect_bubbles_v12
- 
-try:
-    from src.interfaces.yolo_interface import detect_bubbles # 正常导入方式
-    # 确保得到config_loader模块
-except ModuleNotFoundError:
-    # 在直接运行脚本时找不到src模块，添加项目根目录到sys.path
-    script_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    if script_dir not in sys.path:
-        sys.path.insert(0, script_dir)
-    #from src.interfaces.yolo_interface import detect_bubbles # 再次尝试导入
-    from src.interfaces.yolov12_interface import detect_bubbles_v12
+from src.interfaces.yolov12_interface import detect_bubbles_v12, detect_bubbles_batch
+from src.shared import constants
 
 logger = logging.getLogger("CoreDetection")
 # logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
+def _pil_to_bgr(image_pil):
+    """
+    将 PIL 图像转换为 OpenCV BGR 数组。
+    已经是 RGB 模式的图像不再调用 convert('RGB')，整个转换只产生一次数组拷贝。
+    """
+    if image_pil.mode != 'RGB':
+        image_pil = image_pil.convert('RGB')
+    return cv2.cvtColor(np.asarray(image_pil), cv2.COLOR_RGB2BGR)
+
+def _boxes_to_sorted_coords(boxes):
+    """把检测框数组转换为整数坐标元组列表，过滤无效框并按宽度降序排序。"""
+    if boxes is None or len(boxes) == 0:
+        logger.info("未检测到气泡。")
+        return []
+
+    bubble_coords = []
+    logger.info(f"检测到 {len(boxes)} 个气泡候选框。")
+    for i in range(len(boxes)):
+        # 确保坐标是整数
+        x1, y1, x2, y2 = map(int, boxes[i])
+        # 基本的坐标有效性检查 (可选，但推荐)
+        if x1 < x2 and y1 < y2:
+            bubble_coords.append((x1, y1, x2, y2))
+        else:
+            logger.warning(f"检测到无效坐标框，已跳过: [{x1}, {y1}, {x2}, {y2}]")
+
+    # 按宽度降序排序 (YOLO 输出可能无序，排序有助于后续处理)
+    # 宽度 = x2 - x1
+    bubble_coords.sort(key=lambda coord: coord[2] - coord[0], reverse=True)
+
+    logger.info(f"最终获取并排序了 {len(bubble_coords)} 个有效气泡坐标。")
+    return bubble_coords
+
+# --- 新增：条漫长图/超大图的分块检测 ---
+def needs_tiled_detection(width, height):
+    """长宽比或尺寸超过阈值的图像 (如条漫长图) 使用分块检测；普通页面仍整页检测，结果不变。"""
+    long_side, short_side = max(width, height), min(width, height)
+    if short_side <= 0:
+        return False
+    return (long_side / short_side > constants.DETECTION_TILE_ASPECT_RATIO
+            or long_side > constants.DETECTION_TILE_MAX_SIDE)
+
+def _axis_starts(length, tile, overlap):
+    """单个方向上各图块的起点：步长为 tile - overlap，最后一块与图像末端对齐。"""
+    if length <= tile:
+        return [0]
+    stride = max(1, tile - overlap)
+    starts = list(range(0, length - tile, stride))
+    starts.append(length - tile)
+    return starts
+
+def _tile_windows(width, height):
+    """返回覆盖整张图像、相互重叠的图块窗口列表 [(x1, y1, x2, y2), ...]。"""
+    tile = min(width, height, constants.DETECTION_TILE_SIZE)
+    overlap = int(tile * constants.DETECTION_TILE_OVERLAP)
+    return [(x, y, min(x + tile, width), min(y + tile, height))
+            for y in _axis_starts(height, tile, overlap)
+            for x in _axis_starts(width, tile, overlap)]
+
+def _clipped_by_seam(box, window, width, height):
+    """检测框是否贴着图块的内部边缘 (即气泡被图块切开，只检测到了一部分)。"""
+    margin = constants.DETECTION_TILE_EDGE_MARGIN
+    x1, y1, x2, y2 = box
+    wx1, wy1, wx2, wy2 = window
+    return ((wx1 > 0 and x1 - wx1 <= margin) or (wy1 > 0 and y1 - wy1 <= margin)
+            or (wx2 < width and wx2 - x2 <= margin) or (wy2 < height and wy2 - y2 <= margin))
+
+def _box_area(box):
+    return max(0.0, box[2] - box[0]) * max(0.0, box[3] - box[1])
+
+def _intersection(a, b):
+    return max(0.0, min(a[2], b[2]) - max(a[0], b[0])) * max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+
+def _merge_tile_detections(boxes, scores, class_ids, clipped):
+    """
+    合并各图块的检测结果 (坐标已换算到整图)。
+
+    1. 被接缝切开的框：同类别、相交且在另一方向上基本对齐 (重叠超过一半) 的拼接为它们的外接框，
+       跨越多个图块的大气泡也能拼回完整的框；
+    2. 拼接后的框与完整的框一起做 NMS：IoU 超过阈值，或被切开的框大部分落在已保留的框内时去掉
+       (重叠区中的气泡会在相邻两个图块中各检测一次，其中一次可能只检测到一部分)。
+    """
+    n = len(boxes)
+    parent = list(range(n))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    partial = [i for i in range(n) if clipped[i]]
+    for a_pos, i in enumerate(partial):
+        for j in partial[a_pos + 1:]:
+            if class_ids[i] != class_ids[j] or _intersection(boxes[i], boxes[j]) <= 0:
+                continue
+            a, b = boxes[i], boxes[j]
+            x_align = (min(a[2], b[2]) - max(a[0], b[0])) / (max(a[2], b[2]) - min(a[0], b[0]))
+            y_align = (min(a[3], b[3]) - max(a[1], b[1])) / (max(a[3], b[3]) - min(a[1], b[1]))
+            if max(x_align, y_align) >= 0.5:
+                parent[find(j)] = find(i)
+
+    groups = {}
+    for i in range(n):
+        groups.setdefault(find(i), []).append(i)
+    candidates = []
+    for members in groups.values():
+        group_boxes = boxes[members]
+        merged_box = np.array([group_boxes[:, 0].min(), group_boxes[:, 1].min(),
+                               group_boxes[:, 2].max(), group_boxes[:, 3].max()])
+        best = max(members, key=lambda k: scores[k])
+        candidates.append((merged_box, scores[best], class_ids[best], all(clipped[k] for k in members)))
+
+    # 完整的框优先，其次按置信度
+    candidates.sort(key=lambda c: (c[3], -c[1]))
+    kept = []
+    for box, score, class_id, is_partial in candidates:
+        area = _box_area(box)
+        suppressed = False
+        for kept_box, _, _, _ in kept:
+            inter = _intersection(box, kept_box)
+            union = area + _box_area(kept_box) - inter
+            if (union > 0 and inter / union >= constants.DETECTION_TILE_NMS_IOU) or \
+                    (is_partial and area > 0 and inter / area >= 0.7):
+                suppressed = True
+                break
+        if not suppressed:
+            kept.append((box, score, class_id, is_partial))
+
+    if not kept:
+        return np.array([]), np.array([]), np.array([])
+    return (np.array([k[0] for k in kept]), np.array([k[1] for k in kept]), np.array([k[2] for k in kept]))
+
+def _detect_tiled(img_cv, conf_threshold, batch_size):
+    """把图像切成重叠的图块，分批送入检测器，再把各图块的结果合并为整图的 (boxes, scores, class_ids)。"""
+    height, width = img_cv.shape[:2]
+    windows = _tile_windows(width, height)
+    tiles = [np.ascontiguousarray(img_cv[y1:y2, x1:x2]) for x1, y1, x2, y2 in windows]
+    detections = detect_bubbles_batch(tiles, conf_threshold=conf_threshold, batch_size=batch_size)
+
+    all_boxes, all_scores, all_classes, clipped = [], [], [], []
+    for window, (boxes, scores, class_ids) in zip(windows, detections):
+        for box, score, class_id in zip(boxes, scores, class_ids):
+            box = np.asarray(box, dtype=np.float64) + [window[0], window[1], window[0], window[1]]
+            all_boxes.append(box)
+            all_scores.append(float(score))
+            all_classes.append(class_id)
+            clipped.append(_clipped_by_seam(box, window, width, height))
+    if not all_boxes:
+        return np.array([]), np.array([]), np.array([])
+
+    boxes, scores, class_ids = _merge_tile_detections(np.array(all_boxes), np.array(all_scores),
+                                                      np.array(all_classes), clipped)
+    logger.info(f"分块检测: {width}x{height} 切为 {len(windows)} 个图块，"
+                f"{len(all_boxes)} 个候选框合并为 {len(boxes)} 个")
+    return boxes, scores, class_ids
+# --- 结束新增 ---
+
 def get_bubble_coordinates(image_pil, conf_threshold=0.6):
     """
     检测 PIL 图像中的气泡并返回排序后的坐标列表。
@@ -33,39 +181,47 @@ def get_bubble_coordinates(image_pil, conf_threshold=0.6):
     """
     try:
         # 1. 将 PIL Image 转换为 OpenCV BGR 格式
-        img_np = np.array(image_pil.convert('RGB')) # 确保是 RGB
-        img_cv = cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)
-
-        # 2. 调用 YOLO 接口进行检测
-        boxes, scores, class_ids = detect_bubbles_v12(img_cv, conf_threshold=conf_threshold)
+        img_cv = _pil_to_bgr(image_pil)
 
-        if boxes is None or len(boxes) == 0:
-            logger.info("未检测到气泡。")
-            return []
+        # 2. 调用 YOLO 接口进行检测 (条漫长图/超大图分块检测)
+        if needs_tiled_detection(*image_pil.size):
+            boxes, scores, class_ids = _detect_tiled(img_cv, conf_threshold, constants.DETECTION_BATCH_SIZE)
+        else:
+            boxes, scores, class_ids = detect_bubbles_v12(img_cv, conf_threshold=conf_threshold)
 
-        # 3. 提取并格式化坐标
-        bubble_coords = []
-        logger.info(f"检测到 {len(boxes)} 个气泡候选框。")
-        for i in range(len(boxes)):
-            # 确保坐标是整数
-            x1, y1, x2, y2 = map(int, boxes[i])
-            # 基本的坐标有效性检查 (可选，但推荐)
-            if x1 < x2 and y1 < y2:
-                bubble_coords.append((x1, y1, x2, y2))
-            else:
-                logger.warning(f"检测到无效坐标框，已跳过: [{x1}, {y1}, {x2}, {y2}]")
+        # 3. 提取、过滤并排序坐标
+        return _boxes_to_sorted_coords(boxes)
 
+    except Exception as e:
+        logger.error(f"获取气泡坐标时出错: {e}", exc_info=True)
+        return []
 
-        # 4. 按宽度降序排序 (YOLO 输出可能无序，排序有助于后续处理)
-        # 宽度 = x2 - x1
-        bubble_coords.sort(key=lambda coord: coord[2] - coord[0], reverse=True)
+def get_bubble_coordinates_batch(images_pil, conf_threshold=0.6, batch_size=constants.DETECTION_BATCH_SIZE):
+    """
+    批量检测多张 PIL 图像中的气泡 (用于章节/多页处理)，每 batch_size 页只做一次前向推理。
 
-        logger.info(f"最终获取并排序了 {len(bubble_coords)} 个有效气泡坐标。")
-        return bubble_coords
+    Args:
+        images_pil (list): PIL 图像列表。
+        conf_threshold (float): 检测的置信度阈值。
+        batch_size (int): 每次推理的页数。
 
-    except Exception as e:
-        logger.error(f"获取气泡坐标时出错: {e}", exc_info=True)
+    Returns:
+        list: 与 images_pil 等长的列表，每项为该页的坐标列表 (格式同 get_bubble_coordinates)。
+    """
+    if not images_pil:
         return []
+    try:
+        images_cv = [_pil_to_bgr(img) for img in images_pil]
+        # 普通页面合并批量推理；需要分块的页面单独分块检测 (其图块同样按 batch_size 批量推理)
+        tiled = [needs_tiled_detection(*img.size) for img in images_pil]
+        regular = [img for img, is_tiled in zip(images_cv, tiled) if not is_tiled]
+        regular_detections = iter(detect_bubbles_batch(regular, conf_threshold=conf_threshold, batch_size=batch_size))
+        detections = [_detect_tiled(img, conf_threshold, batch_size) if is_tiled else next(regular_detections)
+                      for img, is_tiled in zip(images_cv, tiled)]
+        return [_boxes_to_sorted_coords(boxes) for boxes, _, _ in detections]
+    except Exception as e:
+        logger.error(f"批量获取气泡坐标时出错: {e}", exc_info=True)
+        return [[] for _ in images_pil]
 
 # --- 测试代码 ---
 if __name__ == '__main__':
@@ -0,0 +1,374 @@
+"""
+编辑器的增量重渲染 (脏区域重绘)。
+
+服务端按 page_id 缓存每页的干净背景、当前渲染结果，以及每个气泡的 "签名" (文本 + 坐标 + 样式)
+和文字实际覆盖的矩形。再次渲染时只处理签名变化的气泡：
+1. 脏区域 = 变化气泡旧文字区域 ∪ 新文字区域；
+2. 在脏区域内用干净背景还原，再按原有顺序重绘与该区域相交的所有气泡 (包括重叠的邻居)；
+3. 只返回脏区域的图块和偏移，前端把图块贴回当前页面即可。
+
+气泡的绘制逻辑仍然是 render_all_bubbles，只是绘制在裁剪出来的小图上 (坐标做相应平移)。
+字形紧贴画布边缘绘制时，边缘像素与整页渲染不同，因此画布在脏区域外留有
+INCREMENTAL_RENDER_CANVAS_PADDING 像素的余量，绘制后再裁剪回脏区域，结果与整页重渲染逐像素一致。
+"""
+
+import base64
+import hashlib
+import io
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from src.shared import constants
+from src.core.rendering import render_all_bubbles
+
+logger = logging.getLogger("CoreIncrementalRender")
+
+# 每次渲染后页面的版本号 (全局递增)，前端据此判断自己持有的图像是否就是服务端缓存的页面
+_revision_counter = itertools.count(1)
+
+# 不影响绘制结果的样式字段 (render_all_bubbles 会把自动字号的计算结果写回样式)
+# 渲染时写回样式的派生字段 (自动字号、排版结果)，不参与签名
+_SIGNATURE_IGNORED_KEYS = ('calculated_font_size', 'layout')
+
+
+def bubble_signature(text, coords, style):
+    """生成气泡的签名，文本、坐标或任一样式字段变化时签名都会变化。"""
+    style_items = {k: v for k, v in (style or {}).items() if k not in _SIGNATURE_IGNORED_KEYS}
+    payload = json.dumps([text or "", [int(c) for c in coords], style_items], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def hash_image_data(image_data):
+    """对前端传来的 Base64 图像字符串做哈希，用于判断干净背景是否变化 (无需解码)。"""
+    if not image_data:
+        return None
+    return hashlib.sha1(image_data.encode('ascii', errors='ignore')).hexdigest()
+
+
+def _rects_intersect(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def _union_rect(a, b):
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def _pad_rect(rect, padding, size):
+    """向四周扩展矩形，限制在页面范围内。"""
+    width, height = size
+    return (max(0, rect[0] - padding), max(0, rect[1] - padding),
+            min(width, rect[2] + padding), min(height, rect[3] + padding))
+
+
+def merge_rects(rects):
+    """把相交的矩形合并，直到互不相交。"""
+    merged = [r for r in rects if r is not None]
+    changed = True
+    while changed:
+        changed = False
+        result = []
+        while merged:
+            current = merged.pop()
+            i = 0
+            while i < len(merged):
+                if _rects_intersect(current, merged[i]):
+                    current = _union_rect(current, merged.pop(i))
+                    changed = True
+                else:
+                    i += 1
+            result.append(current)
+        merged = result
+    return sorted(merged, key=lambda r: (r[1], r[0]))
+
+
+def _draw_bubble_on_patch(patch, rect, text, coords, style):
+    """在 patch (对应页面上的 rect 区域) 上绘制一个气泡，坐标平移到 patch 内。"""
+    ox, oy = rect[0], rect[1]
+    x1, y1, x2, y2 = coords
+    render_all_bubbles(patch, [text], [(x1 - ox, y1 - oy, x2 - ox, y2 - oy)], {'0': style})
+
+
+def _initial_margin(coords, style):
+    """估计气泡文字可能超出气泡框的距离 (位置偏移、描边、竖排居中等)。"""
+    x1, y1, x2, y2 = coords
+    offset = (style or {}).get('position_offset') or {}
+    stroke = (style or {}).get('strokeWidth', 0) or 0
+    try:
+        extra = abs(int(offset.get('x', 0))) + abs(int(offset.get('y', 0))) + int(stroke)
+    except (TypeError, ValueError):
+        extra = 0
+    return max(x2 - x1, y2 - y1) // 2 + extra + 16
+
+
+def _measure_changed_rect(clean, text, coords, style, margin):
+    """在逐步扩大的区域内单独绘制气泡，返回与干净背景不同的像素范围 (页面坐标)。"""
+    width, height = clean.size
+    x1, y1, x2, y2 = coords
+    for _ in range(constants.INCREMENTAL_RENDER_MAX_BBOX_RETRIES + 1):
+        rect = (max(0, x1 - margin), max(0, y1 - margin), min(width, x2 + margin), min(height, y2 + margin))
+        if rect[0] >= rect[2] or rect[1] >= rect[3]:
+            return None
+        base = clean.crop(rect)
+        patch = base.copy()
+        _draw_bubble_on_patch(patch, rect, text, coords, style) # 排版结果写回 style，重试和之后的重绘直接复用
+        diff = np.asarray(patch) != np.asarray(base)
+        if diff.ndim == 3:
+            diff = diff.any(axis=2)
+        ys, xs = np.nonzero(diff)
+        if len(xs) == 0:
+            return None
+        ink = (rect[0] + int(xs.min()), rect[1] + int(ys.min()), rect[0] + int(xs.max()) + 1, rect[1] + int(ys.max()) + 1)
+        # 文字贴到了测量区域边缘 (且不是页面边缘)，说明可能还有部分在区域外，扩大后重新测量
+        touches_edge = ((ink[0] == rect[0] and rect[0] > 0) or (ink[1] == rect[1] and rect[1] > 0) or
+                        (ink[2] == rect[2] and rect[2] < width) or (ink[3] == rect[3] and rect[3] < height))
+        if not touches_edge:
+            return ink
+        margin *= 2
+    logger.warning(f"气泡 {coords} 的文字范围超出测量区域，按整页处理")
+    return (0, 0, width, height)
+
+
+def measure_bubble_rects(clean, text, coords, style):
+    """
+    测量气泡在页面上占用的范围。
+
+    Returns:
+        tuple: (ink_rect, layout_rect)。ink_rect 是绘制后实际改变的像素范围，用于计算脏区域；
+               layout_rect 是重绘该气泡时画布必须包含的范围 (旋转文字同时包含未旋转时的文字范围)。
+               气泡没有绘制任何内容时两者都为 None。
+    """
+    if not text:
+        return None, None
+    style = style or {}
+    coords = tuple(int(c) for c in coords)
+    margin = _initial_margin(coords, style)
+    if not style.get('rotation_angle'):
+        ink = _measure_changed_rect(clean, text, coords, style, margin)
+        return ink, ink
+
+    unrotated_style = dict(style)
+    unrotated_style['rotation_angle'] = 0
+    source = _measure_changed_rect(clean, text, coords, unrotated_style, margin)
+    # 排版与旋转角度无关，未旋转时的排版结果可以直接用于旋转绘制
+    for key in _SIGNATURE_IGNORED_KEYS:
+        if key in unrotated_style:
+            style[key] = unrotated_style[key]
+    if source is not None:
+        # 旋转后的文字可能落在未旋转范围之外，测量区域按未旋转范围的对角线长度扩展
+        diagonal = int(((source[2] - source[0]) ** 2 + (source[3] - source[1]) ** 2) ** 0.5)
+        margin = max(margin, diagonal)
+    ink = _measure_changed_rect(clean, text, coords, style, margin)
+    if ink is None:
+        return None, source
+    layout = _union_rect(ink, source) if source is not None else ink
+    return ink, layout
+
+
+class PageRenderState:
+    """一页的增量渲染状态。"""
+    def __init__(self, clean, clean_hash):
+        self.clean = clean
+        self.clean_hash = clean_hash
+        self.page = None
+        self.texts = []
+        self.coords = []
+        self.styles = {}
+        self.signatures = []
+        self.ink_rects = []
+        self.layout_rects = []
+        self.revision = None
+        self.last_used = time.time()
+
+
+class IncrementalRenderCache:
+    """按 page_id 缓存 PageRenderState 的 LRU 缓存 (线程安全)。"""
+    def __init__(self, max_pages=constants.INCREMENTAL_RENDER_MAX_PAGES):
+        self.max_pages = max(1, int(max_pages))
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+        self._page_locks = {}
+
+    def get(self, page_id):
+        with self._lock:
+            state = self._states.get(page_id)
+            if state is not None:
+                self._states.move_to_end(page_id)
+                state.last_used = time.time()
+            return state
+
+    def put(self, page_id, state):
+        with self._lock:
+            self._states[page_id] = state
+            self._states.move_to_end(page_id)
+            while len(self._states) > self.max_pages:
+                evicted_id, _ = self._states.popitem(last=False)
+                self._page_locks.pop(evicted_id, None)
+                logger.info(f"增量渲染缓存已满，淘汰页面 {evicted_id}")
+
+    def drop(self, page_id):
+        with self._lock:
+            self._states.pop(page_id, None)
+            self._page_locks.pop(page_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._states.clear()
+            self._page_locks.clear()
+
+    def page_lock(self, page_id):
+        """同一页的渲染请求需要串行执行 (拖动滑块时请求可能并发到达)。"""
+        with self._lock:
+            lock = self._page_locks.get(page_id)
+            if lock is None:
+                lock = threading.Lock()
+                self._page_locks[page_id] = lock
+            return lock
+
+    def get_stats(self):
+        with self._lock:
+            return {'pages': len(self._states), 'max_pages': self.max_pages}
+
+
+def _full_render(state, texts, coords, styles, signatures):
+    page = state.clean.copy()
+    render_all_bubbles(page, texts, coords, styles)
+    state.page = page
+    state.texts = list(texts)
+    state.coords = [tuple(int(c) for c in b) for b in coords]
+    state.styles = styles
+    state.signatures = signatures
+    rects = [measure_bubble_rects(state.clean, texts[i], state.coords[i], styles.get(str(i), {}))
+             for i in range(len(coords))]
+    state.ink_rects = [r[0] for r in rects]
+    state.layout_rects = [r[1] for r in rects]
+
+
+def render_page(page_id, texts, coords, styles, clean_image=None, clean_hash=None):
+    """
+    渲染一页，能增量时只重绘变化的气泡。
+
+    Args:
+        page_id (str): 前端为页面生成的标识 (同一页的多次编辑使用同一个值)。
+        texts (list): 所有气泡的文本。
+        coords (list): 所有气泡的坐标 [(x1, y1, x2, y2), ...]。
+        styles (dict): 每个气泡的样式 (键为气泡索引字符串，格式同 render_all_bubbles)。
+        clean_image (PIL.Image.Image, optional): 干净背景。服务端已缓存该页时可以省略。
+        clean_hash (str, optional): 干净背景的哈希，变化时丢弃缓存并整页渲染。
+
+    Returns:
+        dict or None: {'page': 当前整页图像, 'tiles': [(x1, y1, x2, y2), ...] 变化的区域,
+                       'incremental': 是否为增量渲染, 'revision': 本次渲染后的版本号,
+                       'previous_revision': 图块所基于的页面版本号}；
+                      服务端没有缓存且未提供干净背景时返回 None (前端需要重新发送干净背景)。
+    """
+    cache = get_incremental_render_cache()
+    with cache.page_lock(page_id):
+        state = cache.get(page_id)
+        if clean_image is not None and (state is None or state.clean_hash != clean_hash
+                                        or state.clean.size != clean_image.size):
+            state = None
+        if state is None:
+            if clean_image is None:
+                return None
+            state = PageRenderState(clean_image, clean_hash)
+
+        texts = [t if t is not None else "" for t in texts]
+        signatures = [bubble_signature(texts[i], coords[i], styles.get(str(i), {})) for i in range(len(coords))]
+
+        # 首次渲染或气泡数量变化 (增删气泡) 时整页渲染
+        if state.page is None or len(state.coords) != len(coords):
+            start_time = time.time()
+            _full_render(state, texts, coords, styles, signatures)
+            previous_revision, state.revision = state.revision, next(_revision_counter)
+            cache.put(page_id, state)
+            logger.info(f"页面 {page_id}: 整页渲染 {len(coords)} 个气泡，耗时 {time.time() - start_time:.3f} 秒")
+            return {'page': state.page, 'tiles': [(0, 0, state.page.width, state.page.height)], 'incremental': False,
+                    'revision': state.revision, 'previous_revision': previous_revision}
+
+        start_time = time.time()
+        new_coords = [tuple(int(c) for c in b) for b in coords]
+        dirty = [i for i in range(len(coords)) if signatures[i] != state.signatures[i]]
+        for i in range(len(coords)):
+            # 未变化的气泡沿用上次的排版结果，重绘时跳过排版
+            previous_layout = state.styles.get(str(i), {}).get('layout')
+            if signatures[i] == state.signatures[i] and previous_layout and str(i) in styles:
+                styles[str(i)].setdefault('layout', previous_layout)
+        ink_rects = list(state.ink_rects)
+        layout_rects = list(state.layout_rects)
+        dirty_rects = []
+        for i in dirty:
+            ink_rects[i], layout_rects[i] = measure_bubble_rects(state.clean, texts[i], new_coords[i], styles.get(str(i), {}))
+            dirty_rects.extend([state.ink_rects[i], ink_rects[i]])
+        regions = merge_rects(dirty_rects)
+
+        for region in regions:
+            # 按原有顺序重绘与该区域相交的所有气泡，保证重叠部分的覆盖顺序与整页渲染一致
+            to_draw = [j for j in range(len(new_coords))
+                       if ink_rects[j] is not None and _rects_intersect(ink_rects[j], region)]
+            # 画布需要包含这些气泡的完整排版范围 (旋转文字)，绘制后只把脏区域贴回页面
+            canvas_rect = region
+            for j in to_draw:
+                canvas_rect = _union_rect(canvas_rect, layout_rects[j])
+            canvas_rect = _pad_rect(canvas_rect, constants.INCREMENTAL_RENDER_CANVAS_PADDING, state.clean.size)
+            canvas = state.clean.crop(canvas_rect)
+            for j in to_draw:
+                _draw_bubble_on_patch(canvas, canvas_rect, texts[j], new_coords[j], styles.get(str(j), {}))
+            if canvas_rect != region:
+                canvas = canvas.crop((region[0] - canvas_rect[0], region[1] - canvas_rect[1],
+                                      region[2] - canvas_rect[0], region[3] - canvas_rect[1]))
+            state.page.paste(canvas, region[:2])
+
+        state.texts = texts
+        state.coords = new_coords
+        state.styles = styles
+        state.signatures = signatures
+        state.ink_rects = ink_rects
+        state.layout_rects = layout_rects
+        previous_revision, state.revision = state.revision, next(_revision_counter)
+        logger.info(f"页面 {page_id}: 增量渲染 {len(dirty)} 个变化的气泡，重绘 {len(regions)} 个区域，"
+                    f"耗时 {time.time() - start_time:.3f} 秒")
+        return {'page': state.page, 'tiles': regions, 'incremental': True,
+                'revision': state.revision, 'previous_revision': previous_revision}
+
+
+def get_cached_styles(page_id):
+    """返回服务端缓存的该页气泡样式和文本 (单气泡编辑时用来补全其他气泡)，没有缓存时返回 None。"""
+    state = get_incremental_render_cache().get(page_id)
+    if state is None or state.page is None:
+        return None
+    styles = {k: {sk: sv for sk, sv in v.items() if sk != 'calculated_font_size'}
+              for k, v in state.styles.items()}
+    return styles, list(state.texts)
+
+
+def encode_tiles(page, tiles):
+    """把变化区域编码为 PNG 图块列表 [{'x', 'y', 'width', 'height', 'image'}, ...]。"""
+    encoded = []
+    for x1, y1, x2, y2 in tiles:
+        buffered = io.BytesIO()
+        page.crop((x1, y1, x2, y2)).save(buffered, format="PNG")
+        encoded.append({
+            'x': x1, 'y': y1, 'width': x2 - x1, 'height': y2 - y1,
+            'image': base64.b64encode(buffered.getvalue()).decode('utf-8')
+        })
+    return encoded
+
+
+# --- 单例 ---
+incremental_render_cache_instance = None
+_cache_instance_lock = threading.Lock()
+
+def get_incremental_render_cache():
+    """获取增量渲染缓存的单例。"""
+    global incremental_render_cache_instance
+    if incremental_render_cache_instance is None:
+        with _cache_instance_lock:
+            if incremental_render_cache_instance is None:
+                incremental_render_cache_instance = IncrementalRenderCache()
+    return incremental_render_cache_instance
@@ -14,10 +14,26 @@ except ImportError:
 
 from src.shared import constants
 from src.shared.path_helpers import get_debug_dir, resource_path # 导入 resource_path 用于测试
+from src.shared.debug_sink import save_debug_artifact # 调试图像由后台线程异步写入
 
 logger = logging.getLogger("CoreInpainting")
 # logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
+def _bubble_edge_params(width, height):
+    """计算气泡边缘渐变带的线宽和高斯模糊核大小。"""
+    # 使用比例缩放的填充，更灵活地适应不同大小的气泡
+    padding_ratio = 0.02  # 2%的填充比例
+    min_padding = 1
+
+    padding_w = max(min_padding, int(width * padding_ratio))
+    padding_h = max(min_padding, int(height * padding_ratio))
+
+    # 使用高斯模糊创建边缘渐变效果，使修复效果更自然
+    blur_size = max(3, padding_w*2+1)
+    if blur_size % 2 == 0:  # 确保大小是奇数
+        blur_size += 1
+    return padding_w, padding_h, blur_size
+
 def create_bubble_mask(image_size, bubble_coords):
     """
     为气泡创建掩码图像 (黑色区域为修复区)。
@@ -25,13 +41,18 @@ def create_bubble_mask(image_size, bubble_coords):
     参考MI-GAN项目的掩码处理方法，更精细地创建文字区域掩码
     黑色区域（0）表示需要修复的区域
     白色区域（255）表示保留的区域
+
+    每个气泡的边缘渐变带只在其外扩后的包围框 (ROI) 内绘制和模糊，再合并到整页掩码，
+    不再为每个气泡分配整页大小的数组并对整页做高斯模糊。ROI 向外预留了模糊核半径，
+    ROI 之外的边缘掩码恒为 255，因此结果与逐气泡整页计算完全一致。
     """
     logger.info(f"创建气泡掩码，图像大小：{image_size}, 气泡数量：{len(bubble_coords)}")
     if not bubble_coords:
-        return np.ones(image_size[:2], dtype=np.uint8) * 255
+        return np.full(image_size[:2], 255, dtype=np.uint8)
 
     # 创建全白掩码（全部保留）
-    mask = np.ones(image_size[:2], dtype=np.uint8) * 255
+    mask = np.full(image_size[:2], 255, dtype=np.uint8)
+    img_h, img_w = mask.shape
     
     for x1, y1, x2, y2 in bubble_coords:
         # 计算气泡大小
@@ -40,12 +61,7 @@ def create_bubble_mask(image_size, bubble_coords):
         
         if width <= 0 or height <= 0: continue
         
-        # 使用比例缩放的填充，更灵活地适应不同大小的气泡
-        padding_ratio = 0.02  # 2%的填充比例
-        min_padding = 1
-        
-        padding_w = max(min_padding, int(width * padding_ratio))
-        padding_h = max(min_padding, int(height * padding_ratio))
+        padding_w, padding_h, blur_size = _bubble_edge_params(width, height)
         
         # 创建精确的文字区域掩码
         # 首先创建实心填充区域
@@ -53,24 +69,26 @@ def create_bubble_mask(image_size, bubble_coords):
         
         # 更精确的边缘处理，确保气泡边缘平滑
         # 外围添加一圈渐变区域，改善与背景的融合
-        edge_mask = np.ones_like(mask) * 255
-        cv2.rectangle(edge_mask, 
-                     (max(0, x1-padding_w), max(0, y1-padding_h)), 
-                     (min(mask.shape[1]-1, x2+padding_w), min(mask.shape[0]-1, y2+padding_h)), 
-                     0, padding_w)
-        
-        # 使用高斯模糊创建边缘渐变效果，使修复效果更自然
-        blur_size = max(3, padding_w*2+1)
-        if blur_size % 2 == 0:  # 确保大小是奇数
-            blur_size += 1
+        ex1, ey1 = max(0, x1-padding_w), max(0, y1-padding_h)
+        ex2, ey2 = min(img_w-1, x2+padding_w), min(img_h-1, y2+padding_h)
+
+        # ROI = 边框线 (线宽 padding_w，向两侧各扩展约一半) + 模糊核半径
+        margin = padding_w + blur_size // 2 + 1
+        rx1, ry1 = max(0, min(ex1, ex2) - margin), max(0, min(ey1, ey2) - margin)
+        rx2, ry2 = min(img_w, max(ex1, ex2) + margin + 1), min(img_h, max(ey1, ey2) + margin + 1)
+        if rx1 >= rx2 or ry1 >= ry2: continue
+
+        edge_mask = np.full((ry2 - ry1, rx2 - rx1), 255, dtype=np.uint8)
+        cv2.rectangle(edge_mask, (ex1 - rx1, ey1 - ry1), (ex2 - rx1, ey2 - ry1), 0, padding_w)
         edge_mask = cv2.GaussianBlur(edge_mask, (blur_size, blur_size), 0)
         
         # 合并主体掩码和边缘掩码，确保中心区域为0
-        mask = np.minimum(mask, edge_mask)
+        roi = mask[ry1:ry2, rx1:rx2]
+        np.minimum(roi, edge_mask, out=roi)
 
     # 检查掩码是否覆盖了图像的大部分
     total_pixels = mask.size
-    zeros = np.sum(mask == 0)
+    zeros = total_pixels - cv2.countNonZero(mask)
     black_ratio = zeros / total_pixels
     
     # 调整阈值为25%，更保守但还是可以允许适度的修复区域
@@ -82,11 +100,7 @@ def create_bubble_mask(image_size, bubble_coords):
             kernel = np.ones((3, 3), np.uint8)
             mask = cv2.erode(mask, kernel, iterations=1)
 
-    try:
-        debug_dir = get_debug_dir("inpainting_masks")
-        cv2.imwrite(os.path.join(debug_dir, "bubble_mask_core.png"), mask)
-    except Exception as save_e:
-        logger.warning(f"保存修复掩码调试图像失败: {save_e}")
+    save_debug_artifact("inpainting_masks", "bubble_mask_core.png", mask)
 
     return mask
 
@@ -162,18 +176,15 @@ def inpaint_bubbles(image_pil, bubble_coords, method='solid', fill_color=constan
              clean_background = None
 
 
-    # 保存调试图像
-    try:
-        debug_dir = get_debug_dir("inpainting_results")
-        final_method = method if inpainting_successful else 'solid_fallback'
-        result_img.save(os.path.join(debug_dir, f"inpainted_result_{final_method}.png"))
-        if clean_background:
-            # 将干净背景标记附加到主结果图像对象上
-            setattr(result_img, '_clean_background', clean_background)
-            setattr(result_img, '_clean_image', clean_background)
-            clean_background.save(os.path.join(debug_dir, f"clean_background_{final_method}.png"))
-    except Exception as save_e:
-        logger.warning(f"保存修复结果调试图像失败: {save_e}")
+    if clean_background:
+        # 将干净背景标记附加到主结果图像对象上
+        setattr(result_img, '_clean_background', clean_background)
+        setattr(result_img, '_clean_image', clean_background)
+
+    # 保存调试图像 (后台异步写入)
+    final_method = method if inpainting_successful else 'solid_fallback'
+    save_debug_artifact("inpainting_results", f"inpainted_result_{final_method}.png", result_img)
+    save_debug_artifact("inpainting_results", f"clean_background_{final_method}.png", clean_background)
 
     return result_img, clean_background
 
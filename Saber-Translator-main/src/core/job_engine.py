@@ -0,0 +1,318 @@
+"""
+章节任务引擎：以流水线方式批量处理多页图像。
+
+单页流程 (检测 -> OCR -> 翻译 -> 修复 -> 渲染) 的每个阶段都有独立的有界队列和工作线程池，
+因此第 N+1 页在检测时，第 N 页可以同时在等待翻译服务，第 N-1 页在进行 LAMA 修复。
+各阶段直接复用 src/core/processing.py 中的阶段函数，插件钩子的触发时机与单页处理完全一致。
+提供了批量函数的阶段 (如气泡检测) 会把队列中已就绪的多页合并为一次模型推理。
+"""
+
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from src.core.processing import PIPELINE_STAGES, PIPELINE_BATCH_STAGES, create_page_context, get_page_result
+from src.plugins.manager import get_plugin_manager
+from src.shared import constants
+
+logger = logging.getLogger("CoreJobEngine")
+
+# 页面状态
+PAGE_QUEUED = 'queued'
+PAGE_DONE = 'done'
+PAGE_FAILED = 'failed'
+PAGE_CANCELLED = 'cancelled'
+
+# 任务状态
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_CANCELLED = 'cancelled'
+
+
+class ChapterJob:
+    """
+    一个章节任务，记录每一页的处理状态和结果。
+    """
+    def __init__(self, job_id, page_count, params):
+        self.job_id = job_id
+        self.params = params
+        self.total = page_count
+        self.page_status = [PAGE_QUEUED] * page_count
+        self.page_errors = {}
+        self.results = [None] * page_count
+        self.cancelled = False
+        self.created_at = time.time()
+        self.finished_at = None
+        self.lock = threading.Lock()
+        self.done_event = threading.Event()
+
+    def set_page_status(self, page_index, status):
+        with self.lock:
+            self.page_status[page_index] = status
+
+    def finish_page(self, page_index, result, status=PAGE_DONE, error=None):
+        """记录单页的最终结果，所有页面结束后标记任务完成。"""
+        with self.lock:
+            self.results[page_index] = result
+            self.page_status[page_index] = status
+            if error:
+                self.page_errors[page_index] = error
+            if all(s in (PAGE_DONE, PAGE_FAILED, PAGE_CANCELLED) for s in self.page_status):
+                self.finished_at = time.time()
+                self.done_event.set()
+
+    def is_finished(self):
+        return self.done_event.is_set()
+
+    def get_progress(self):
+        """返回任务进度的快照 (可直接序列化为 JSON)。"""
+        with self.lock:
+            statuses = list(self.page_status)
+            errors = dict(self.page_errors)
+        stage_counts = {name: statuses.count(name) for name, _ in PIPELINE_STAGES}
+        if self.cancelled:
+            status = JOB_CANCELLED
+        elif self.is_finished():
+            status = JOB_COMPLETED
+        else:
+            status = JOB_RUNNING
+        end_time = self.finished_at or time.time()
+        return {
+            'job_id': self.job_id,
+            'status': status,
+            'total': self.total,
+            'completed': statuses.count(PAGE_DONE),
+            'failed': statuses.count(PAGE_FAILED),
+            'cancelled': statuses.count(PAGE_CANCELLED),
+            'queued': statuses.count(PAGE_QUEUED),
+            'stages': stage_counts,
+            'pages': statuses,
+            'errors': {str(k): v for k, v in errors.items()},
+            'elapsed': round(end_time - self.created_at, 2),
+        }
+
+
+class ChapterJobEngine:
+    """
+    多页流水线处理引擎。
+
+    每个阶段拥有一个有界输入队列和若干工作线程；工作线程处理完一页后将其放入下一阶段的队列。
+    队列满时上游线程会阻塞，从而限制同时驻留内存的页面数量。
+    """
+    def __init__(self, stage_workers=None, queue_size=constants.CHAPTER_JOB_QUEUE_SIZE,
+                 max_finished_jobs=constants.CHAPTER_JOB_MAX_FINISHED,
+                 batch_size=constants.DETECTION_BATCH_SIZE):
+        """
+        Args:
+            stage_workers (dict, optional): 各阶段的工作线程数 {阶段名: 数量}，
+                                            默认使用 constants.CHAPTER_JOB_STAGE_WORKERS。
+            queue_size (int): 每个阶段输入队列的最大长度。
+            max_finished_jobs (int): 保留的已结束任务数量上限，超出后丢弃最早的任务。
+            batch_size (int): 支持批量执行的阶段每次最多合并的页数。
+        """
+        self.stage_workers = dict(constants.CHAPTER_JOB_STAGE_WORKERS)
+        if stage_workers:
+            self.stage_workers.update(stage_workers)
+        self.queues = [queue.Queue(maxsize=max(1, queue_size)) for _ in PIPELINE_STAGES]
+        self.max_finished_jobs = max_finished_jobs
+        self.batch_size = max(1, int(batch_size))
+        self.jobs = OrderedDict() # {job_id: ChapterJob}
+        self._jobs_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        """启动所有阶段的工作线程 (只会启动一次)。"""
+        with self._start_lock:
+            if self._threads:
+                return
+            for stage_index, (stage_name, _) in enumerate(PIPELINE_STAGES):
+                worker_count = max(1, int(self.stage_workers.get(stage_name, 1)))
+                for n in range(worker_count):
+                    t = threading.Thread(
+                        target=self._stage_worker,
+                        args=(stage_index,),
+                        name=f"ChapterJob-{stage_name}-{n}",
+                        daemon=True
+                    )
+                    t.start()
+                    self._threads.append(t)
+            logger.info(f"章节任务引擎已启动，阶段线程数: {self.stage_workers}")
+
+    def submit(self, images, params, page_params=None):
+        """
+        提交一个章节任务。
+
+        Args:
+            images (list): PIL 图像列表，按页码顺序排列。
+            params (dict): 所有页面共享的处理参数 (键名与 process_image_translation 一致)。
+            page_params (list, optional): 与 images 等长的列表，每项为该页需要覆盖的参数字典
+                                          (例如 {'provided_coords': [...]})，可为 None。
+
+        Returns:
+            str: 任务 ID。
+        """
+        if page_params is not None and len(page_params) != len(images):
+            raise ValueError("page_params 的长度必须与 images 一致")
+
+        self.start()
+        job = ChapterJob(uuid.uuid4().hex, len(images), params)
+        with self._jobs_lock:
+            self.jobs[job.job_id] = job
+            self._evict_finished_jobs()
+
+        if not images:
+            job.finished_at = time.time()
+            job.done_event.set()
+            return job.job_id
+
+        # 由单独的线程把页面送入第一个阶段，避免队列已满时阻塞调用方
+        feeder = threading.Thread(
+            target=self._feed_pages,
+            args=(job, images, page_params),
+            name=f"ChapterJob-feeder-{job.job_id[:8]}",
+            daemon=True
+        )
+        feeder.start()
+        logger.info(f"已提交章节任务 {job.job_id}，共 {len(images)} 页")
+        return job.job_id
+
+    def get_job(self, job_id):
+        with self._jobs_lock:
+            return self.jobs.get(job_id)
+
+    def get_progress(self, job_id):
+        """返回任务进度字典，任务不存在时返回 None。"""
+        job = self.get_job(job_id)
+        return job.get_progress() if job else None
+
+    def get_result(self, job_id, timeout=None):
+        """
+        获取任务结果。
+
+        Args:
+            job_id (str): 任务 ID。
+            timeout (float, optional): 等待任务完成的最长秒数；为 None 时不等待。
+
+        Returns:
+            list or None: 每页一个与 process_image_translation 返回值格式相同的元组
+                          (被取消或无法加入流水线的页面为 None)；任务不存在或尚未完成时返回 None。
+        """
+        job = self.get_job(job_id)
+        if job is None:
+            return None
+        if timeout is not None:
+            job.done_event.wait(timeout)
+        if not job.is_finished():
+            return None
+        with job.lock:
+            return list(job.results)
+
+    def cancel(self, job_id):
+        """取消任务：尚未开始的页面不再处理，正在处理的阶段会在完成后停止。"""
+        job = self.get_job(job_id)
+        if job is None:
+            return False
+        job.cancelled = True
+        logger.info(f"章节任务 {job_id} 已请求取消")
+        return True
+
+    def remove_job(self, job_id):
+        """删除任务记录及其结果。"""
+        with self._jobs_lock:
+            return self.jobs.pop(job_id, None) is not None
+
+    def _evict_finished_jobs(self):
+        finished = [jid for jid, j in self.jobs.items() if j.is_finished()]
+        while len(finished) > self.max_finished_jobs:
+            old_id = finished.pop(0)
+            self.jobs.pop(old_id, None)
+            logger.debug(f"丢弃较早的已结束章节任务: {old_id}")
+
+    def _feed_pages(self, job, images, page_params):
+        for page_index, image in enumerate(images):
+            if job.cancelled:
+                job.finish_page(page_index, None, status=PAGE_CANCELLED)
+                continue
+            try:
+                params = dict(job.params) # 每页使用独立的参数副本，插件修改参数不会影响其他页面
+                if page_params and page_params[page_index]:
+                    params.update(page_params[page_index])
+                ctx = create_page_context(image, params)
+            except Exception as e:
+                # 单页无法创建上下文 (如图像无效) 时只让该页失败，其余页面照常送入流水线
+                logger.error(f"任务 {job.job_id[:8]} 第 {page_index + 1} 页无法加入流水线: {e}", exc_info=True)
+                job.finish_page(page_index, None, status=PAGE_FAILED, error=str(e))
+                continue
+            self.queues[0].put((job, page_index, ctx))
+
+    def _forward_page(self, stage_index, job, page_index, ctx):
+        """阶段完成后：页面已结束则记录结果，否则放入下一阶段的队列。"""
+        if ctx['finished'] or stage_index == len(PIPELINE_STAGES) - 1:
+            job.finish_page(page_index, get_page_result(ctx))
+        else:
+            job.set_page_status(page_index, PAGE_QUEUED)
+            self.queues[stage_index + 1].put((job, page_index, ctx))
+
+    def _stage_worker(self, stage_index):
+        stage_name, stage_func = PIPELINE_STAGES[stage_index]
+        batch_func = PIPELINE_BATCH_STAGES.get(stage_name)
+        stage_queue = self.queues[stage_index]
+        plugin_mgr = get_plugin_manager()
+
+        while True:
+            items = [stage_queue.get()]
+            # 批量阶段：不等待，只合并队列中已经就绪的页面
+            while batch_func and len(items) < self.batch_size:
+                try:
+                    items.append(stage_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                active = []
+                for job, page_index, ctx in items:
+                    if job.cancelled:
+                        job.finish_page(page_index, None, status=PAGE_CANCELLED)
+                    else:
+                        job.set_page_status(page_index, stage_name)
+                        active.append((job, page_index, ctx))
+                if not active:
+                    continue
+
+                start_time = time.time()
+                try:
+                    if batch_func and len(active) > 1:
+                        batch_func([ctx for _, _, ctx in active], plugin_mgr)
+                    else:
+                        stage_func(active[0][2], plugin_mgr)
+                except Exception as e:
+                    for job, page_index, ctx in active:
+                        logger.error(f"任务 {job.job_id[:8]} 第 {page_index + 1} 页在阶段 '{stage_name}' 出错: {e}", exc_info=True)
+                        # 与单页处理一致：失败的页面返回原始图像副本和空数据
+                        job.finish_page(page_index, get_page_result(ctx), status=PAGE_FAILED, error=str(e))
+                    continue
+
+                elapsed = time.time() - start_time
+                for job, page_index, ctx in active:
+                    logger.info(f"任务 {job.job_id[:8]} 第 {page_index + 1} 页阶段 '{stage_name}' 完成 (耗时: {elapsed:.2f}s, 同批 {len(active)} 页)")
+                    self._forward_page(stage_index, job, page_index, ctx)
+            finally:
+                for _ in items:
+                    stage_queue.task_done()
+
+
+# --- 单例 ---
+chapter_job_engine_instance = None
+_engine_instance_lock = threading.Lock()
+
+def get_chapter_job_engine():
+    """获取章节任务引擎的单例实例。"""
+    global chapter_job_engine_instance
+    with _engine_instance_lock:
+        if chapter_job_engine_instance is None:
+            logger.info("创建章节任务引擎实例...")
+            chapter_job_engine_instance = ChapterJobEngine()
+        return chapter_job_engine_instance
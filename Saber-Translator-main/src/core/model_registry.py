@@ -0,0 +1,156 @@
+"""
+模型注册表：统一管理各本地模型的加载状态，并在应用启动后于后台线程中并行预热。
+
+各模型的加载函数本身已是带缓存的单例 (load_yolov12_model、get_manga_ocr_instance、get_lama_model)，
+注册表只负责：
+- 延迟导入：加载函数在被调用时才导入对应接口模块，torch/ultralytics/transformers 等框架不会在启动时导入；
+- 并行预热：constants.MODEL_WARMUP 中的模型各用一个后台线程同时加载，首个请求不必再等待模型加载；
+- 状态查询：/api/ready 返回每个模型的状态 (pending/loading/ready/unavailable/failed) 和加载耗时。
+"""
+
+import logging
+import os
+import threading
+import time
+
+from src.shared import constants
+
+logger = logging.getLogger("CoreModelRegistry")
+
+STATE_PENDING = 'pending'          # 尚未加载
+STATE_LOADING = 'loading'          # 正在加载
+STATE_READY = 'ready'              # 已加载
+STATE_UNAVAILABLE = 'unavailable'  # 依赖未安装或模型文件缺失 (加载函数返回 None)
+STATE_FAILED = 'failed'            # 加载时抛出异常
+
+
+def _load_detector():
+    from src.interfaces.yolov12_interface import load_yolov12_model
+    return load_yolov12_model()
+
+def _detector_info():
+    from src.interfaces.yolov12_interface import get_detector_backend
+    return {'backend': get_detector_backend()}
+
+def _load_manga_ocr():
+    from src.interfaces.manga_ocr_interface import get_manga_ocr_instance
+    return get_manga_ocr_instance()
+
+def _load_lama():
+    from src.interfaces.lama_interface import get_lama_model
+    return get_lama_model()
+
+
+class _ModelEntry:
+    def __init__(self, name, loader, info=None):
+        self.name = name
+        self.loader = loader
+        self.info = info  # 可选：加载完成后补充到状态中的信息 (如检测后端)
+        self.state = STATE_PENDING
+        self.model = None
+        self.error = None
+        self.load_seconds = None
+        self.started_at = None
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    """线程安全的模型注册表。"""
+    def __init__(self):
+        self._entries = {}
+        self._warmup_targets = []
+        self._warmup_started_at = None
+
+    def register(self, name, loader, info=None):
+        """注册模型。loader 无参数，返回模型对象，返回 None 表示不可用。"""
+        self._entries[name] = _ModelEntry(name, loader, info)
+
+    def ensure(self, name):
+        """
+        确保模型已加载 (同一模型的并发调用只加载一次)，返回模型对象或 None。
+        不可用或加载失败的模型再次调用时会重新尝试。
+        """
+        entry = self._entries[name]
+        with entry.lock:
+            if entry.state == STATE_READY:
+                return entry.model
+            entry.state = STATE_LOADING
+            entry.error = None
+            entry.started_at = time.time()
+            start = time.perf_counter()
+            try:
+                model = entry.loader()
+            except Exception as e:
+                entry.state = STATE_FAILED
+                entry.error = str(e)
+                logger.error(f"模型 {name} 加载失败: {e}", exc_info=True)
+                return None
+            finally:
+                entry.load_seconds = round(time.perf_counter() - start, 2)
+            entry.model = model
+            entry.state = STATE_READY if model is not None else STATE_UNAVAILABLE
+            logger.info(f"模型 {name} {'已就绪' if model is not None else '不可用'}，用时 {entry.load_seconds}s")
+            return model
+
+    def warm_up(self, names=None):
+        """在后台线程中并行加载指定模型 (默认 constants.MODEL_WARMUP，可用环境变量 SABER_WARMUP_MODELS 覆盖)。"""
+        if names is None:
+            names = get_warmup_model_names()
+        names = [name for name in names if name in self._entries]
+        self._warmup_targets = names
+        self._warmup_started_at = time.time()
+        for name in names:
+            threading.Thread(target=self.ensure, args=(name,), name=f"Warmup-{name}", daemon=True).start()
+        if names:
+            logger.info(f"已在后台并行预热模型: {', '.join(names)}")
+        return names
+
+    def get_status(self):
+        """
+        Returns:
+            dict: {'ready': 预热目标是否都已结束加载, 'warmup': 预热目标, 'warmup_elapsed_seconds', 'models': {名称: 状态}}。
+        """
+        models = {}
+        for name, entry in self._entries.items():
+            status = {'state': entry.state, 'load_seconds': entry.load_seconds}
+            if entry.error:
+                status['error'] = entry.error
+            if entry.info is not None and entry.state == STATE_READY:
+                try:
+                    status.update(entry.info())
+                except Exception:
+                    pass
+            models[name] = status
+        pending = [name for name in self._warmup_targets
+                   if self._entries[name].state in (STATE_PENDING, STATE_LOADING)]
+        return {
+            'ready': not pending,
+            'warmup': list(self._warmup_targets),
+            'warmup_elapsed_seconds': round(time.time() - self._warmup_started_at, 1) if self._warmup_started_at else None,
+            'models': models,
+        }
+
+
+def get_warmup_model_names():
+    env_value = os.environ.get('SABER_WARMUP_MODELS')
+    if env_value is not None:
+        return [name.strip() for name in env_value.split(',') if name.strip()]
+    return list(constants.MODEL_WARMUP)
+
+
+# --- 单例 ---
+model_registry_instance = None
+_registry_instance_lock = threading.Lock()
+
+def get_model_registry():
+    """获取模型注册表的单例 (已注册 detector、manga_ocr、lama)。"""
+    global model_registry_instance
+    if model_registry_instance is None:
+        with _registry_instance_lock:
+            if model_registry_instance is None:
+                registry = ModelRegistry()
+                registry.register('detector', _load_detector, info=_detector_info)
+                registry.register('manga_ocr', _load_manga_ocr)
+                registry.register('lama', _load_lama)
+                model_registry_instance = registry
+    return model_registry_instance
@@ -9,25 +9,20 @@ import json # 确保导入 json
 import re
 
 # 导入接口和常量
-from src.interfaces.manga_ocr_interface import recognize_japanese_text, get_manga_ocr_instance
+from src.interfaces.manga_ocr_interface import recognize_japanese_text_batch, get_manga_ocr_instance
 from src.interfaces.paddle_ocr_interface import get_paddle_ocr_handler, PaddleOCRHandler
 from src.interfaces.baidu_ocr_interface import recognize_text_with_baidu_ocr, test_baidu_ocr_connection
 from src.shared import constants
-from src.shared.path_helpers import get_debug_dir # 用于保存调试图片
+from src.shared.debug_sink import save_debug_artifact # 用于保存调试图片
 from src.shared.image_helpers import image_to_base64 # 导入图像转Base64助手
 # 导入新的AI视觉OCR服务调用函数(将在下一步创建)
 from src.interfaces.vision_interface import call_ai_vision_ocr_service
-# 导入rpm限制辅助函数
-from src.core.translation import _enforce_rpm_limit
+# 导入rpm限制 (与翻译共用的令牌桶实现)
+from src.shared.rate_limiter import acquire_rate_limit
 
 logger = logging.getLogger("CoreOCR")
 # logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
-# --- rpm Limiting Globals for AI Vision OCR ---
-_ai_vision_ocr_rpm_last_reset_time_container = [0]
-_ai_vision_ocr_rpm_request_count_container = [0]
-# --------------------------------------------
-
 # 在解析JSON响应时增加安全提取方法
 def _safely_extract_from_json(json_str, field_name):
     """
@@ -154,12 +149,8 @@ def recognize_text_in_bubbles(image_pil, bubble_coords, source_language='japan',
                     # 转换为 PIL Image
                     bubble_img_pil = Image.fromarray(bubble_img_np)
                     
-                    # 保存调试图像 (可选)
-                    try:
-                        debug_dir = get_debug_dir("ocr_bubbles")
-                        bubble_img_pil.save(os.path.join(debug_dir, f"bubble_{i}_{source_language}_baidu.png"))
-                    except Exception as save_e:
-                        logger.warning(f"保存 OCR 调试气泡图像失败: {save_e}")
+                    # 保存调试图像 (可选，后台异步写入)
+                    save_debug_artifact("ocr_bubbles", f"bubble_{i}_{source_language}_baidu.png", bubble_img_pil)
                     
                     # 将PIL图像转换为字节
                     buffer = io.BytesIO()
@@ -228,34 +219,30 @@ def recognize_text_in_bubbles(image_pil, bubble_coords, source_language='japan',
     elif ocr_engine_type == 'MangaOCR':
         ocr_instance = get_manga_ocr_instance()
         if ocr_instance:
-            logger.info(f"开始使用 MangaOCR 逐个识别 {len(bubble_coords)} 个气泡...")
-            # MangaOCR 需要逐个处理气泡
+            logger.info(f"开始使用 MangaOCR 批量识别 {len(bubble_coords)} 个气泡...")
+            # 先裁剪所有气泡，再一次性批量推理
+            bubble_images = []
             for i, (x1, y1, x2, y2) in enumerate(bubble_coords):
                 try:
-                    # 裁剪气泡图像 (使用 NumPy 数组)
-                    bubble_img_np = img_np[y1:y2, x1:x2]
-                    # 转换为 PIL Image
-                    bubble_img_pil = Image.fromarray(bubble_img_np)
-
-                    # 保存调试图像 (可选)
-                    try:
-                        debug_dir = get_debug_dir("ocr_bubbles")
-                        bubble_img_pil.save(os.path.join(debug_dir, f"bubble_{i}_{source_language}.png"))
-                    except Exception as save_e:
-                        logger.warning(f"保存 OCR 调试气泡图像失败: {save_e}")
-
-                    # 调用 MangaOCR 接口识别
-                    text = recognize_japanese_text(bubble_img_pil)
-                    recognized_texts[i] = text
-                    # 输出识别文本到日志
-                    if text:
-                        logger.info(f"气泡 {i} 识别文本: '{text}'")
-                    else:
-                        logger.info(f"气泡 {i} 未识别出文本")
+                    # 裁剪气泡图像 (使用 NumPy 数组) 并转换为 PIL Image
+                    bubble_img_pil = Image.fromarray(img_np[y1:y2, x1:x2])
 
+                    # 保存调试图像 (可选，后台异步写入)
+                    save_debug_artifact("ocr_bubbles", f"bubble_{i}_{source_language}.png", bubble_img_pil)
+                    bubble_images.append(bubble_img_pil)
                 except Exception as e:
                     logger.error(f"处理气泡 {i} (MangaOCR) 时出错: {e}", exc_info=True)
-                    recognized_texts[i] = "" # 出错时设置为空字符串
+                    bubble_images.append(None) # 对应位置识别结果为空字符串
+
+            start_time = time.time()
+            recognized_texts = recognize_japanese_text_batch(bubble_images)
+            logger.info(f"MangaOCR 批量推理耗时: {time.time() - start_time:.2f}s")
+            for i, text in enumerate(recognized_texts):
+                # 输出识别文本到日志
+                if text:
+                    logger.info(f"气泡 {i} 识别文本: '{text}'")
+                else:
+                    logger.info(f"气泡 {i} 未识别出文本")
             logger.info("MangaOCR 识别完成。")
         else:
             logger.error("无法初始化 MangaOCR，OCR 步骤跳过。")
@@ -283,19 +270,15 @@ def recognize_text_in_bubbles(image_pil, bubble_coords, source_language='japan',
                         bubble_img_np = img_np[y1:y2, x1:x2]
                         bubble_img_pil = Image.fromarray(bubble_img_np)
                         
-                        # 保存调试图像
-                        try:
-                            debug_dir = get_debug_dir("ocr_bubbles")
-                            bubble_img_pil.save(os.path.join(debug_dir, f"bubble_{i}_{source_language}_ai_vision.png"))
-                        except Exception as save_e:
-                            logger.warning(f"保存 AI视觉OCR 调试气泡图像失败: {save_e}")
+                        # 保存调试图像 (后台异步写入)
+                        save_debug_artifact("ocr_bubbles", f"bubble_{i}_{source_language}_ai_vision.png", bubble_img_pil)
                         
                         # --- rpm Enforcement for AI Vision OCR ---
-                        _enforce_rpm_limit(
+                        # 同一服务商/地址/密钥的所有请求共享一个令牌桶
+                        acquire_rate_limit(
+                            ('ai_vision_ocr', ai_vision_provider, custom_ai_vision_base_url, ai_vision_api_key),
                             rpm_limit_ai_vision,
-                            f"AI Vision OCR ({ai_vision_provider})",
-                            _ai_vision_ocr_rpm_last_reset_time_container,
-                            _ai_vision_ocr_rpm_request_count_container
+                            f"AI Vision OCR ({ai_vision_provider})"
                         )
                         # -----------------------------------------
                         
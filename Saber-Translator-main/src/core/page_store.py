@@ -0,0 +1,264 @@
+"""
+内容寻址的页面图像存储。
+
+前端把原图/干净背景上传一次，之后各编辑端点只传图像 ID (原始字节的 SHA-256)，
+渲染结果也可以存入这里并只返回 ID 和 URL，避免每次请求都在 JSON 中往返整页 base64。
+
+- 图像以原始字节存放在 data/page_store/<id>.<ext>，总大小超过上限时按最近使用时间淘汰；
+- 存入 PIL 图像时按像素内容做指纹，内容没有变化的图像直接复用上次的编码结果，不再重新编码 PNG。
+"""
+
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image
+
+from src.shared import constants
+from src.shared.path_helpers import resource_path
+
+logger = logging.getLogger("CorePageStore")
+
+_IMAGE_ID_RE = re.compile(r'^[0-9a-f]{64}$')
+_MIME_EXTENSIONS = {
+    'image/png': '.png',
+    'image/jpeg': '.jpg',
+    'image/webp': '.webp',
+    'image/gif': '.gif',
+    'image/bmp': '.bmp',
+}
+_EXTENSION_MIMES = {ext: mime for mime, ext in _MIME_EXTENSIONS.items()}
+
+
+class PageNotFoundError(KeyError):
+    """请求引用的图像 ID 不在存储中 (从未上传或已被淘汰)，前端需要重新上传。"""
+    def __init__(self, image_id):
+        super().__init__(image_id)
+        self.image_id = image_id
+
+    def __str__(self):
+        return f"图像 {self.image_id} 不存在或已被清理，请重新上传"
+
+
+def is_valid_image_id(image_id):
+    return isinstance(image_id, str) and bool(_IMAGE_ID_RE.match(image_id))
+
+
+def sniff_mime(data):
+    """根据文件头判断图像的 MIME 类型，无法识别时返回 None。"""
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if data.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if data[:2] == b'BM':
+        return 'image/bmp'
+    return None
+
+
+def _pixel_fingerprint(image):
+    """像素内容的指纹 (比 PNG 编码快一个数量级以上)。"""
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"{image.mode}:{image.size}".encode('ascii'))
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class PageStore:
+    """
+    线程安全的磁盘图像存储，按最近使用时间 (LRU) 淘汰。
+    """
+    def __init__(self, store_dir, max_bytes=constants.PAGE_STORE_MAX_MB * 1024 * 1024):
+        self.store_dir = store_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index = OrderedDict() # image_id -> (文件名, 字节数)，按最近使用排序
+        self._total_bytes = 0
+        self._encode_cache = OrderedDict() # 像素指纹 -> image_id
+        self.encode_reused = 0
+        os.makedirs(store_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """启动时扫描存储目录，按修改时间 (即最近使用时间) 重建索引。"""
+        entries = []
+        for filename in os.listdir(self.store_dir):
+            image_id, ext = os.path.splitext(filename)
+            if not is_valid_image_id(image_id) or ext not in _EXTENSION_MIMES:
+                continue
+            try:
+                st = os.stat(os.path.join(self.store_dir, filename))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, image_id, filename, st.st_size))
+        for _, image_id, filename, size in sorted(entries):
+            self._index[image_id] = (filename, size)
+            self._total_bytes += size
+        logger.info(f"页面存储已加载: {self.store_dir} ({len(self._index)} 个图像, "
+                    f"{self._total_bytes / (1024 * 1024):.1f}MB / {self.max_bytes / (1024 * 1024):.0f}MB)")
+
+    def put_bytes(self, data, mime=None):
+        """
+        存入图像的原始字节 (PNG/JPEG/WebP...)。内容相同的图像只存一份。
+
+        格式和扩展名总是按文件头判断，调用方 (客户端上传表单) 给出的 mime 只用于记录不一致的情况，
+        不能把任意数据以图像类型存入。
+
+        Returns:
+            str: 图像 ID。
+
+        Raises:
+            ValueError: 数据为空或不是可识别的图像格式。
+        """
+        if not data:
+            raise ValueError("图像数据为空")
+        sniffed = sniff_mime(data)
+        if sniffed is None:
+            raise ValueError("无法识别的图像格式")
+        if mime and mime != sniffed:
+            logger.warning(f"声明的图像类型 {mime} 与文件内容 {sniffed} 不一致，按文件内容存储")
+        mime = sniffed
+        image_id = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if image_id in self._index:
+                self._touch_locked(image_id)
+                return image_id
+        filename = image_id + _MIME_EXTENSIONS[mime]
+        path = os.path.join(self.store_dir, filename)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if image_id not in self._index:
+                self._index[image_id] = (filename, len(data))
+                self._total_bytes += len(data)
+            self._evict_locked(keep=image_id)
+        return image_id
+
+    def put_image(self, image, format="PNG"):
+        """
+        存入 PIL 图像。像素内容与之前存入的某张图像相同时直接返回其 ID，不再重新编码。
+
+        Returns:
+            str: 图像 ID。
+        """
+        fingerprint = _pixel_fingerprint(image)
+        with self._lock:
+            image_id = self._encode_cache.get(fingerprint)
+            if image_id is not None and image_id in self._index:
+                self._encode_cache.move_to_end(fingerprint)
+                self._touch_locked(image_id)
+                self.encode_reused += 1
+                return image_id
+        buffered = io.BytesIO()
+        image.save(buffered, format=format)
+        image_id = self.put_bytes(buffered.getvalue(), Image.MIME.get(format.upper()))
+        with self._lock:
+            self._encode_cache[fingerprint] = image_id
+            self._encode_cache.move_to_end(fingerprint)
+            while len(self._encode_cache) > constants.PAGE_STORE_ENCODE_CACHE_SIZE:
+                self._encode_cache.popitem(last=False)
+        return image_id
+
+    def get_path(self, image_id):
+        """
+        Returns:
+            tuple: (文件路径, MIME)。
+
+        Raises:
+            PageNotFoundError: ID 不存在。
+        """
+        with self._lock:
+            entry = self._index.get(image_id) if is_valid_image_id(image_id) else None
+            if entry is None:
+                raise PageNotFoundError(image_id)
+            self._touch_locked(image_id)
+        filename = entry[0]
+        return os.path.join(self.store_dir, filename), _EXTENSION_MIMES[os.path.splitext(filename)[1]]
+
+    def get_bytes(self, image_id):
+        path, _ = self.get_path(image_id)
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            self._forget(image_id)
+            raise PageNotFoundError(image_id)
+
+    def open_image(self, image_id):
+        """按 ID 打开图像 (已完成解码，可在文件被淘汰后继续使用)。"""
+        image = Image.open(io.BytesIO(self.get_bytes(image_id)))
+        image.load()
+        return image
+
+    def contains(self, image_id):
+        with self._lock:
+            return image_id in self._index
+
+    def missing(self, image_ids):
+        """返回 image_ids 中不在存储里的 ID (前端据此只上传缺失的图像)。"""
+        with self._lock:
+            return [image_id for image_id in image_ids if image_id not in self._index]
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'images': len(self._index),
+                'total_bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'encode_reused': self.encode_reused,
+            }
+
+    def _touch_locked(self, image_id):
+        self._index.move_to_end(image_id)
+        # 更新修改时间，重启后仍能按最近使用时间淘汰
+        try:
+            os.utime(os.path.join(self.store_dir, self._index[image_id][0]))
+        except OSError:
+            pass
+
+    def _forget(self, image_id):
+        with self._lock:
+            entry = self._index.pop(image_id, None)
+            if entry is not None:
+                self._total_bytes -= entry[1]
+
+    def _evict_locked(self, keep=None):
+        removed = 0
+        while self._total_bytes > self.max_bytes and len(self._index) > 1:
+            image_id, (filename, size) = next(iter(self._index.items()))
+            if image_id == keep:
+                self._index.move_to_end(image_id)
+                continue
+            del self._index[image_id]
+            self._total_bytes -= size
+            try:
+                os.remove(os.path.join(self.store_dir, filename))
+            except OSError:
+                pass
+            removed += 1
+        if removed:
+            logger.info(f"页面存储超出 {self.max_bytes / (1024 * 1024):.0f}MB 上限，已淘汰 {removed} 个最久未使用的图像")
+
+
+# --- 单例 ---
+page_store_instance = None
+_store_instance_lock = threading.Lock()
+
+def get_page_store():
+    """获取页面存储的单例 (data/page_store/)。"""
+    global page_store_instance
+    if page_store_instance is None:
+        with _store_instance_lock:
+            if page_store_instance is None:
+                page_store_instance = PageStore(resource_path(os.path.join('data', constants.PAGE_STORE_DIR_NAME)))
+    return page_store_instance
@@ -1,71 +1,140 @@
 import io
 import logging
+from collections import deque
+from concurrent.futures.process import BrokenProcessPool
 from PIL import Image
 import PyPDF2 
 
+from src.core.page_store import sniff_mime
+from src.core.worker_pool import get_worker_pool, discard_worker_pool, get_worker_count
+from src.shared import constants
+
 logger = logging.getLogger("PDFProcessor")
 
-def extract_images_from_pdf(pdf_file_stream):
+# --- 新增：流式 PDF 导入 ---
+# 浏览器可以直接显示、且无需转换颜色的格式，这些图像的原始字节直接透传，不解码也不重新编码
+_PASSTHROUGH_MODES = {
+    'image/jpeg': ('RGB', 'L'),
+    'image/png': ('RGB', 'L', '1'),
+}
+
+def to_browser_image(data):
+    """
+    把从 PDF 中取出的图像字节转换为浏览器可显示的格式。
+    RGB/灰度的 JPEG 和 PNG 原样返回 (Image.open 只读取文件头，不解码像素)；
+    其他格式 (JPEG 2000、CMYK JPEG、调色板图像等) 解码后转换为 RGB PNG。
+
+    Returns:
+        tuple: (图像字节, MIME)。
+    """
+    mime = sniff_mime(data)
+    img = Image.open(io.BytesIO(data))
+    if mime in _PASSTHROUGH_MODES and img.mode in _PASSTHROUGH_MODES[mime]:
+        return data, mime
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    buffered = io.BytesIO()
+    img.save(buffered, format="PNG")
+    return buffered.getvalue(), 'image/png'
+
+def _extract_page_images(page, page_num):
+    """提取单页中的所有图像，返回 [(图像字节, MIME), ...]。"""
+    results = []
+    # PyPDF2 >= 3.0.0 使用 page.images (DCTDecode 图像的 data 就是原始 JPEG 数据流)
+    if hasattr(page, 'images') and page.images:
+        raw_images = [(getattr(img_obj, 'name', f"img{i+1}"), img_obj.data) for i, img_obj in enumerate(page.images)]
+    # 兼容旧版 PyPDF2 或不同结构的 PDF
+    elif '/Resources' in page and '/XObject' in page['/Resources']:
+        xObject = page['/Resources']['/XObject'].get_object()
+        raw_images = [(obj, xObject[obj].get_data()) for obj in xObject if xObject[obj]['/Subtype'] == '/Image']
+    else:
+        raw_images = []
+    for name, data in raw_images:
+        try:
+            results.append(to_browser_image(data))
+        except Exception as img_e:
+            logger.warning(f"  提取页面 {page_num + 1} 的图像 {name} 失败: {img_e}")
+    return results
+
+def get_pdf_page_count(pdf_path):
+    """
+    Raises:
+        PyPDF2.errors.PdfReadError: 文件损坏或有密码保护。
     """
-    从 PDF 文件流中提取图像。
+    return len(PyPDF2.PdfReader(pdf_path).pages)
 
-    Args:
-        pdf_file_stream: PDF 文件的文件流对象 (例如通过 request.files 获取)。
+def extract_pdf_page_range(pdf_path, start, end):
+    """
+    提取 [start, end) 页的图像 (在工作进程中执行，每个进程独立打开 PDF)。
 
     Returns:
-        list: 包含提取出的 PIL Image 对象的列表。
+        list: [(页码, [(图像字节, MIME), ...]), ...]。
+    """
+    pdf_reader = PyPDF2.PdfReader(pdf_path)
+    results = []
+    for page_num in range(start, end):
+        try:
+            results.append((page_num, _extract_page_images(pdf_reader.pages[page_num], page_num)))
+        except Exception as page_e:
+            logger.error(f"处理 PDF 页面 {page_num + 1} 时出错: {page_e}", exc_info=True)
+            results.append((page_num, []))
+    return results
+
+def iter_pdf_images(pdf_path, page_count=None):
+    """
+    按页码顺序逐个产出 PDF 中的图像。页面按 constants.PDF_EXTRACT_CHUNK_PAGES 分段，
+    各段在工作进程池中并行提取，同时在途的段数不超过进程数的两倍，内存占用与 PDF 总页数无关。
+
+    Yields:
+        tuple: (页码, 页内序号, 图像字节, MIME)。
     """
-    images = []
+    if page_count is None:
+        page_count = get_pdf_page_count(pdf_path)
+    chunk = max(1, constants.PDF_EXTRACT_CHUNK_PAGES)
+    ranges = iter([(start, min(start + chunk, page_count)) for start in range(0, page_count, chunk)])
+    pool = get_worker_pool() if page_count > chunk else None
+    max_in_flight = get_worker_count() * 2
+    pending = deque() # (页码范围, future 或 None, 所属进程池)，按页码顺序排列
+
     try:
-        pdf_reader = PyPDF2.PdfReader(pdf_file_stream)
-        num_pages = len(pdf_reader.pages)
-        logger.info(f"开始处理 PDF 文件，共 {num_pages} 页。")
-
-        for page_num in range(num_pages):
-            try:
-                page = pdf_reader.pages[page_num]
-                # PyPDF2 >= 3.0.0 使用 page.images
-                if hasattr(page, 'images') and page.images:
-                    logger.debug(f"页面 {page_num + 1}: 发现 {len(page.images)} 个图像对象 (新方法)。")
-                    for i, img_obj in enumerate(page.images):
-                        try:
-                            # img_obj.data 是图像的字节数据
-                            img = Image.open(io.BytesIO(img_obj.data))
-                            # 尝试获取原始文件名（可能没有）
-                            img_name = img_obj.name if hasattr(img_obj, 'name') else f"page{page_num+1}_img{i+1}"
-                            logger.info(f"  成功提取图像: {img_name} (模式: {img.mode}, 尺寸: {img.size})")
-                            images.append(img)
-                        except Exception as img_e:
-                            logger.warning(f"  提取页面 {page_num + 1} 的图像 {i+1} 失败: {img_e}")
-                # 兼容旧版 PyPDF2 或不同结构的 PDF
-                elif '/Resources' in page and '/XObject' in page['/Resources']:
-                    xObject = page['/Resources']['/XObject'].get_object()
-                    img_count = 0
-                    for obj in xObject:
-                        if xObject[obj]['/Subtype'] == '/Image':
-                            img_count += 1
-                            try:
-                                img_data = xObject[obj].get_data() # 使用 get_data()
-                                img = Image.open(io.BytesIO(img_data))
-                                logger.info(f"  成功提取图像 (XObject): {obj} (模式: {img.mode}, 尺寸: {img.size})")
-                                images.append(img)
-                            except Exception as img_e:
-                                logger.warning(f"  提取页面 {page_num + 1} 的 XObject 图像 {obj} 失败: {img_e}")
-                    if img_count > 0:
-                         logger.debug(f"页面 {page_num + 1}: 发现 {img_count} 个 XObject 图像对象 (旧方法)。")
-
-            except Exception as page_e:
-                logger.error(f"处理 PDF 页面 {page_num + 1} 时出错: {page_e}", exc_info=True)
-
-        logger.info(f"PDF 处理完成，共提取 {len(images)} 张图片。")
-        return images
-
-    except PyPDF2.errors.PdfReadError as pdf_err:
-         logger.error(f"无法读取 PDF 文件，可能是文件损坏或密码保护: {pdf_err}")
-         return []
-    except Exception as e:
-        logger.error(f"处理 PDF 文件时发生未知错误: {e}", exc_info=True)
-        return []
+        while True:
+            while len(pending) < max_in_flight:
+                page_range = next(ranges, None)
+                if page_range is None:
+                    break
+                future = None
+                if pool is not None:
+                    try:
+                        future = pool.submit(extract_pdf_page_range, pdf_path, *page_range)
+                    except (BrokenProcessPool, RuntimeError) as e:
+                        logger.warning(f"工作进程池不可用，改为在主进程中提取 PDF: {e}")
+                        discard_worker_pool(pool)
+                        pool = None
+                pending.append((page_range, future, pool))
+            if not pending:
+                return
+
+            page_range, future, owner_pool = pending.popleft()
+            page_results = None
+            if future is not None:
+                try:
+                    page_results = future.result()
+                except BrokenProcessPool as e:
+                    logger.error(f"PDF 提取子进程异常退出，改为在主进程中提取: {e}")
+                    discard_worker_pool(owner_pool)
+                    pool = None
+            if page_results is None:
+                page_results = extract_pdf_page_range(pdf_path, *page_range)
+
+            for page_num, page_images in page_results:
+                for image_index, (data, mime) in enumerate(page_images):
+                    yield page_num, image_index, data, mime
+    finally:
+        # 调用方提前停止迭代 (如客户端断开了流式响应) 时，取消尚未开始的提取任务
+        for _, future, _ in pending:
+            if future is not None:
+                future.cancel()
+# --- 结束新增 ---
 
 # --- 测试代码 ---
 if __name__ == '__main__':
@@ -79,20 +148,18 @@ if __name__ == '__main__':
     if os.path.exists(test_pdf_path):
         print(f"加载测试 PDF: {test_pdf_path}")
         try:
-            with open(test_pdf_path, 'rb') as f:
-                extracted_images = extract_images_from_pdf(f)
-            print(f"提取完成，共找到 {len(extracted_images)} 张图片。")
-
-            # 保存提取的图片用于检查 (可选)
-            if extracted_images:
-                save_dir = get_debug_dir("pdf_extracted_images")
-                print(f"将提取的图片保存到: {save_dir}")
-                for i, img in enumerate(extracted_images):
-                    try:
-                        img.save(os.path.join(save_dir, f"extracted_image_{i+1}.png"))
-                    except Exception as save_e:
-                        print(f"  保存图片 {i+1} 失败: {save_e}")
+            # 保存提取的图片用于检查
+            save_dir = resource_path(os.path.join('data', 'debug', 'pdf_extracted_images'))
+            os.makedirs(save_dir, exist_ok=True)
+            print(f"将提取的图片保存到: {save_dir}")
+            count = 0
+            for page_num, image_index, data, mime in iter_pdf_images(test_pdf_path):
+                extension = '.jpg' if mime == 'image/jpeg' else '.png'
+                with open(os.path.join(save_dir, f"page{page_num + 1}_img{image_index + 1}{extension}"), 'wb') as f:
+                    f.write(data)
+                count += 1
+            print(f"提取完成，共找到 {count} 张图片。")
         except Exception as e:
             print(f"测试过程中发生错误: {e}")
     else:
-        print(f"错误：测试 PDF 文件未找到 {test_pdf_path}")
\ No newline at end of file
+        print(f"错误：测试 PDF 文件未找到 {test_pdf_path}")
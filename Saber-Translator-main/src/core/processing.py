@@ -5,14 +5,15 @@ import cv2 # 需要 cv2
 import time
 import os
 import sys
+import inspect
 from src.plugins.manager import get_plugin_manager
-from src.plugins.hooks import * 
+from src.plugins.hooks import *
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
-from src.core.detection import get_bubble_coordinates
+from src.core.detection import get_bubble_coordinates, get_bubble_coordinates_batch
 from src.core.ocr import recognize_text_in_bubbles
-from src.core.translation import translate_text_list
+from src.core.translation import translate_text_list, translate_text_list_batch
 from src.core.inpainting import inpaint_bubbles
 from src.core.rendering import render_all_bubbles, calculate_auto_font_size, get_font # 需要渲染和计算函数
 
@@ -23,6 +24,470 @@ from src.shared.path_helpers import get_debug_dir, resource_path # 需要路径
 logger = logging.getLogger("CoreProcessing")
 # logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
+# --- 页面处理上下文 ---
+# 单页翻译流程被拆分为若干阶段函数，各阶段通过一个上下文字典传递中间结果。
+# process_image_translation 按顺序同步执行全部阶段；
+# 章节任务引擎 (src/core/job_engine.py) 则把各阶段分配到独立的工作线程池中流水线执行。
+
+def create_page_context(image_pil, params):
+    """
+    创建单页处理上下文。
+
+    Args:
+        image_pil (PIL.Image.Image): 输入的原始 PIL 图像。
+        params (dict): 处理参数，键名与 process_image_translation 的参数一致 (不含 image_pil)。
+
+    Returns:
+        dict: 页面上下文，各阶段函数读取并更新其中的字段。
+    """
+    return {
+        'image': image_pil,
+        'original_image': image_pil.copy(), # 保留原始副本以备失败时返回
+        'params': params,
+        'bubble_coords': [],
+        'original_texts': [],
+        'bubble_texts': [],
+        'textbox_texts': [],
+        'inpainted_image': None,
+        'clean_background': None,
+        'bubble_styles': {},
+        'processed_image': None,
+        'finished': False, # 为 True 时表示无需执行后续阶段 (例如未检测到气泡)
+    }
+
+def _trigger_before_processing(ctx, plugin_mgr):
+    """触发 BEFORE_PROCESSING 钩子 (插件可以替换图像和参数)。"""
+    try:
+        hook_result = plugin_mgr.trigger_hook(BEFORE_PROCESSING, ctx['image'], ctx['params'])
+        if hook_result: # 如果插件返回了修改后的数据
+            ctx['image'], ctx['params'] = hook_result # 解包
+            logger.info("BEFORE_PROCESSING 钩子修改了参数/图像。")
+    except Exception as hook_e:
+         logger.error(f"执行 {BEFORE_PROCESSING} 钩子时出错: {hook_e}", exc_info=True)
+
+def _get_provided_coords(ctx):
+    """返回前端提供的手动标注坐标，没有时返回 None。"""
+    provided_coords = ctx['params'].get('provided_coords')
+    if provided_coords and isinstance(provided_coords, list) and len(provided_coords) > 0:
+        return provided_coords
+    return None
+
+def _finish_detection(ctx, plugin_mgr, bubble_coords):
+    """触发 AFTER_DETECTION 钩子并把坐标写入上下文。"""
+    try:
+        hook_result = plugin_mgr.trigger_hook(AFTER_DETECTION, ctx['image'], bubble_coords, ctx['params'])
+        if hook_result and isinstance(hook_result[0], list): # 钩子应返回包含列表的元组
+            bubble_coords = hook_result[0] # 更新坐标
+            logger.info("AFTER_DETECTION 钩子修改了气泡坐标。")
+    except Exception as hook_e:
+        logger.error(f"执行 {AFTER_DETECTION} 钩子时出错: {hook_e}", exc_info=True)
+
+    ctx['bubble_coords'] = bubble_coords
+    if not bubble_coords:
+        logger.info("未检测到气泡，处理结束。")
+        ctx['finished'] = True
+    return ctx
+
+def run_detection_stage(ctx, plugin_mgr):
+    """阶段 1: 触发 BEFORE_PROCESSING 钩子并检测气泡坐标。"""
+    _trigger_before_processing(ctx, plugin_mgr)
+
+    # --- 优先使用前端提供的坐标 ---
+    bubble_coords = _get_provided_coords(ctx)
+    if bubble_coords is not None:
+        logger.info(f"使用前端提供的手动标注框，共 {len(bubble_coords)} 个")
+    else:
+        # 原有的自动检测逻辑
+        logger.info("步骤 1: 检测气泡坐标...")
+        start_time = time.time()
+        bubble_coords = get_bubble_coordinates(ctx['image'], conf_threshold=ctx['params'].get('yolo_conf_threshold', 0.6))
+        logger.info(f"气泡检测完成，找到 {len(bubble_coords)} 个气泡 (耗时: {time.time() - start_time:.2f}s)")
+    # ------------------------------------
+
+    return _finish_detection(ctx, plugin_mgr, bubble_coords)
+
+def run_detection_stage_batch(ctxs, plugin_mgr):
+    """
+    阶段 1 的批量版本：多页一起做气泡检测，每批只做一次模型前向推理。
+    钩子仍按页触发，结果与逐页调用 run_detection_stage 相同。
+
+    Args:
+        ctxs (list): 页面上下文列表。
+    """
+    for ctx in ctxs:
+        _trigger_before_processing(ctx, plugin_mgr)
+
+    # 需要自动检测的页面按置信度阈值分组 (通常所有页面的阈值相同)
+    detected = {}
+    groups = {}
+    for i, ctx in enumerate(ctxs):
+        if _get_provided_coords(ctx) is None:
+            groups.setdefault(ctx['params'].get('yolo_conf_threshold', 0.6), []).append(i)
+    for conf_threshold, indices in groups.items():
+        start_time = time.time()
+        coords_list = get_bubble_coordinates_batch([ctxs[i]['image'] for i in indices], conf_threshold=conf_threshold)
+        detected.update(zip(indices, coords_list))
+        logger.info(f"批量气泡检测完成: {len(indices)} 页 (耗时: {time.time() - start_time:.2f}s)")
+
+    for i, ctx in enumerate(ctxs):
+        bubble_coords = detected[i] if i in detected else _get_provided_coords(ctx)
+        _finish_detection(ctx, plugin_mgr, bubble_coords)
+    return ctxs
+
+def run_ocr_stage(ctx, plugin_mgr):
+    """阶段 2: OCR 识别气泡内文本。"""
+    params = ctx['params']
+    image_pil = ctx['image']
+    bubble_coords = ctx['bubble_coords']
+
+    if params.get('skip_ocr', False):
+        logger.info("步骤 2: 跳过 OCR。")
+        ctx['original_texts'] = [""] * len(bubble_coords) # 创建占位符
+        return ctx
+
+    # --- 触发 BEFORE_OCR 钩子 ---
+    try:
+         plugin_mgr.trigger_hook(BEFORE_OCR, image_pil, bubble_coords, params)
+    except Exception as hook_e:
+         logger.error(f"执行 {BEFORE_OCR} 钩子时出错: {hook_e}", exc_info=True)
+    # ---------------------------
+    logger.info("步骤 2: OCR 识别文本...")
+    start_time = time.time()
+
+    source_language = params.get('source_language', constants.DEFAULT_SOURCE_LANG)
+    ocr_engine = params.get('ocr_engine', 'auto')
+
+    # 如果使用百度OCR，传递相关参数
+    if ocr_engine == 'baidu_ocr':
+        logger.info(f"使用百度OCR ({params.get('baidu_version', 'standard')}) 识别文本...")
+        original_texts = recognize_text_in_bubbles(
+            image_pil,
+            bubble_coords,
+            source_language,
+            ocr_engine,
+            baidu_api_key=params.get('baidu_api_key'),
+            baidu_secret_key=params.get('baidu_secret_key'),
+            baidu_version=params.get('baidu_version', 'standard')
+        )
+    elif ocr_engine == constants.AI_VISION_OCR_ENGINE_ID:
+        logger.info(f"使用AI视觉OCR ({params.get('ai_vision_provider')}/{params.get('ai_vision_model_name')}) 识别文本...")
+        original_texts = recognize_text_in_bubbles(
+            image_pil,
+            bubble_coords,
+            source_language,
+            ocr_engine,
+            ai_vision_provider=params.get('ai_vision_provider'),
+            ai_vision_api_key=params.get('ai_vision_api_key'),
+            ai_vision_model_name=params.get('ai_vision_model_name'),
+            ai_vision_ocr_prompt=params.get('ai_vision_ocr_prompt'),
+            custom_ai_vision_base_url=params.get('custom_ai_vision_base_url'),
+            use_json_format_for_ai_vision=params.get('use_json_format_ai_vision_ocr', False),
+            rpm_limit_ai_vision=params.get('rpm_limit_ai_vision_ocr', constants.DEFAULT_rpm_AI_VISION_OCR)
+        )
+    else:
+        # 使用其他OCR引擎
+        original_texts = recognize_text_in_bubbles(image_pil, bubble_coords, source_language, ocr_engine)
+
+    logger.info(f"OCR 完成 (耗时: {time.time() - start_time:.2f}s)")
+    # --- 触发 AFTER_OCR 钩子 ---
+    try:
+        hook_result = plugin_mgr.trigger_hook(AFTER_OCR, image_pil, original_texts, bubble_coords, params)
+        if hook_result and isinstance(hook_result[0], list):
+            original_texts = hook_result[0] # 更新识别文本
+            logger.info("AFTER_OCR 钩子修改了识别文本。")
+    except Exception as hook_e:
+        logger.error(f"执行 {AFTER_OCR} 钩子时出错: {hook_e}", exc_info=True)
+    # -------------------------
+
+    ctx['original_texts'] = original_texts
+    return ctx
+
+def run_translation_stage(ctx, plugin_mgr):
+    """阶段 3: 翻译识别出的文本 (气泡译文与可选的文本框译文)。"""
+    params = ctx['params']
+    bubble_coords = ctx['bubble_coords']
+    original_texts = ctx['original_texts']
+
+    translated_bubble_texts = [""] * len(bubble_coords)
+    translated_textbox_texts = [""] * len(bubble_coords)
+    if params.get('skip_translation', False):
+        logger.info("步骤 3: 跳过翻译。")
+        # 如果跳过翻译，两个列表都为空字符串
+        ctx['bubble_texts'] = translated_bubble_texts
+        ctx['textbox_texts'] = translated_textbox_texts
+        return ctx
+
+    # --- 触发 BEFORE_TRANSLATION 钩子 ---
+    try:
+        hook_result = plugin_mgr.trigger_hook(BEFORE_TRANSLATION, original_texts, params)
+        if hook_result:
+             original_texts, params = hook_result # 更新待翻译文本和参数
+             ctx['original_texts'] = original_texts
+             ctx['params'] = params
+             logger.info("BEFORE_TRANSLATION 钩子修改了文本或参数。")
+    except Exception as hook_e:
+         logger.error(f"执行 {BEFORE_TRANSLATION} 钩子时出错: {hook_e}", exc_info=True)
+    # ------------------------------------
+
+    target_language = params.get('target_language', constants.DEFAULT_TARGET_LANG)
+    model_provider = params.get('model_provider', constants.DEFAULT_MODEL_PROVIDER)
+    api_key = params.get('api_key')
+    model_name = params.get('model_name')
+    prompt_content = params.get('prompt_content')
+    textbox_prompt_content = params.get('textbox_prompt_content')
+    custom_base_url = params.get('custom_base_url')
+    rpm_limit_translation = params.get('rpm_limit_translation', constants.DEFAULT_rpm_TRANSLATION)
+
+    logger.info("步骤 3: 翻译文本...")
+    logger.info(f"翻译模型: {model_provider}, 模型名称: {model_name}")
+    logger.info(f"待翻译文本数量: {len(original_texts)}")
+    for i, text in enumerate(original_texts):
+        if text:
+            logger.info(f"待翻译文本 {i}: '{text}'")
+
+    start_time = time.time()
+    # 漫画气泡翻译
+    try:
+        logger.info(f"调用 translate_text_list 开始 - 模型: {model_provider}, 模型名: {model_name}, API密钥长度: {len(api_key) if api_key else 0}, 自定义BaseURL: {custom_base_url if custom_base_url else '无'}")
+        # 整页批量模式：一次请求翻译整页气泡，不支持的服务商会自动回退到逐条翻译
+        translate_func = translate_text_list_batch if params.get('use_batch_translation', False) else translate_text_list
+        translated_bubble_texts = translate_func(
+            original_texts, target_language, model_provider, api_key, model_name, prompt_content,
+            use_json_format=params.get('use_json_format_translation', False),
+            custom_base_url=custom_base_url,
+            rpm_limit_translation=rpm_limit_translation # <--- 传递rpm参数
+        )
+        logger.info(f"translate_text_list 调用完成，返回结果数量: {len(translated_bubble_texts)}")
+
+        # 输出翻译结果
+        logger.info("翻译结果:")
+        for i, text in enumerate(translated_bubble_texts):
+            if text:
+                logger.info(f"文本 {i} 翻译结果: '{text}'")
+
+        # 文本框翻译 (如果启用)
+        if params.get('use_textbox_prompt', False) and textbox_prompt_content:
+            translated_textbox_texts = translate_text_list(
+                original_texts, target_language, model_provider, api_key, model_name, textbox_prompt_content,
+                use_json_format=False,
+                custom_base_url=custom_base_url,
+                rpm_limit_translation=rpm_limit_translation # <--- 传递rpm参数
+            )
+        else:
+            translated_textbox_texts = translated_bubble_texts
+        logger.info(f"翻译完成 (耗时: {time.time() - start_time:.2f}s)")
+        # --- 触发 AFTER_TRANSLATION 钩子 ---
+        try:
+            hook_result = plugin_mgr.trigger_hook(AFTER_TRANSLATION, translated_bubble_texts, translated_textbox_texts, original_texts, params)
+            if hook_result and len(hook_result) >= 2 and isinstance(hook_result[0], list) and isinstance(hook_result[1], list):
+                 translated_bubble_texts, translated_textbox_texts = hook_result[:2] # 只取前两个元素，更新翻译结果
+                 logger.info("AFTER_TRANSLATION 钩子修改了翻译结果。")
+        except Exception as hook_e:
+             logger.error(f"执行 {AFTER_TRANSLATION} 钩子时出错: {hook_e}", exc_info=True)
+        # ----------------------------------
+    except Exception as e:
+        logger.error(f"翻译过程发生错误: {e}", exc_info=True)
+        if params.get('ignore_connection_errors', True):
+            logger.warning(f"翻译服务出错，使用空翻译结果: {e}")
+            # 使用原文复制代替翻译结果，或者在需要时保持空字符串
+            translated_bubble_texts = original_texts.copy() if original_texts else [""] * len(bubble_coords)
+            translated_textbox_texts = translated_bubble_texts
+        else:
+            # 如果不忽略错误，重新抛出异常
+            raise
+
+    ctx['bubble_texts'] = translated_bubble_texts
+    ctx['textbox_texts'] = translated_textbox_texts
+    return ctx
+
+def run_inpainting_stage(ctx, plugin_mgr):
+    """阶段 4: 修复/填充气泡背景。"""
+    params = ctx['params']
+    image_pil = ctx['image']
+    bubble_coords = ctx['bubble_coords']
+    inpainting_method = params.get('inpainting_method', 'solid')
+    fill_color = params.get('fill_color', constants.DEFAULT_FILL_COLOR)
+
+    # --- 触发 BEFORE_INPAINTING 钩子 ---
+    try:
+        plugin_mgr.trigger_hook(BEFORE_INPAINTING, image_pil, bubble_coords, params)
+    except Exception as hook_e:
+        logger.error(f"执行 {BEFORE_INPAINTING} 钩子时出错: {hook_e}", exc_info=True)
+    # ---------------------------------
+    logger.info(f"步骤 4: 修复/填充背景 (方法: {inpainting_method})...")
+    start_time = time.time()
+    clean_background_img = None
+    try:
+        inpainted_image, clean_background_img = inpaint_bubbles( # 现在我们保存 clean_bg
+            image_pil, bubble_coords, method=inpainting_method, fill_color=fill_color
+        )
+        logger.info(f"背景处理完成 (耗时: {time.time() - start_time:.2f}s)")
+        # --- 触发 AFTER_INPAINTING 钩子 ---
+        try:
+            hook_result = plugin_mgr.trigger_hook(AFTER_INPAINTING, inpainted_image, clean_background_img, bubble_coords, params)
+            if hook_result and len(hook_result) >= 2 and isinstance(hook_result[0], Image.Image):
+                 inpainted_image, clean_background_img = hook_result[:2] # 只取前两个元素，更新图像
+                 # 如果 clean_background_img 被更新，需要重新附加到 inpainted_image
+                 if clean_background_img:
+                     setattr(inpainted_image, '_clean_background', clean_background_img)
+                     setattr(inpainted_image, '_clean_image', clean_background_img)
+                 logger.info("AFTER_INPAINTING 钩子修改了图像。")
+        except Exception as hook_e:
+            logger.error(f"执行 {AFTER_INPAINTING} 钩子时出错: {hook_e}", exc_info=True)
+        # --------------------------------
+    except Exception as e:
+        if params.get('ignore_connection_errors', True) and "lama" in inpainting_method.lower():
+            # 如果 LAMA 出错，回退到纯色填充
+            logger.warning(f"LAMA 修复出错，回退到纯色填充: {e}")
+            inpainted_image, _ = inpaint_bubbles(
+                image_pil, bubble_coords, method='solid', fill_color=fill_color
+            )
+            logger.info("使用纯色填充完成背景处理")
+        else:
+            # 如果不是高级修复方法出错或者不忽略错误，重新抛出异常
+            raise
+
+    ctx['inpainted_image'] = inpainted_image
+    ctx['clean_background'] = clean_background_img
+    return ctx
+
+def run_rendering_stage(ctx, plugin_mgr):
+    """阶段 5: 渲染译文并触发 AFTER_PROCESSING 钩子。"""
+    params = ctx['params']
+    inpainted_image = ctx['inpainted_image']
+    translated_bubble_texts = ctx['bubble_texts']
+    bubble_coords = ctx['bubble_coords']
+
+    font_size_setting = params.get('font_size_setting', constants.DEFAULT_FONT_SIZE)
+
+    # 准备初始样式字典
+    initial_bubble_styles = {}
+    is_auto_font_size = isinstance(font_size_setting, str) and font_size_setting.lower() == 'auto'
+    for i in range(len(bubble_coords)):
+        initial_bubble_styles[str(i)] = {
+            'fontSize': font_size_setting, # 传递 'auto' 或数字
+            'autoFontSize': is_auto_font_size,
+            'fontFamily': params.get('font_family_rel', constants.DEFAULT_FONT_RELATIVE_PATH),
+            'text_direction': params.get('text_direction', constants.DEFAULT_TEXT_DIRECTION),
+            'position_offset': {'x': 0, 'y': 0},
+            'text_color': params.get('text_color', constants.DEFAULT_TEXT_COLOR),
+            'rotation_angle': params.get('rotation_angle', constants.DEFAULT_ROTATION_ANGLE),
+            # === 新增描边参数 START ===
+            'enableStroke': params.get('enable_text_stroke', constants.DEFAULT_TEXT_STROKE_ENABLED),
+            'strokeColor': params.get('text_stroke_color', constants.DEFAULT_TEXT_STROKE_COLOR),
+            'strokeWidth': params.get('text_stroke_width', constants.DEFAULT_TEXT_STROKE_WIDTH)
+            # === 新增描边参数 END ===
+        }
+
+    # --- 触发 BEFORE_RENDERING 钩子 ---
+    try:
+        hook_result = plugin_mgr.trigger_hook(BEFORE_RENDERING, inpainted_image, translated_bubble_texts, bubble_coords, initial_bubble_styles, params)
+        if hook_result and len(hook_result) >= 4:
+             # 只解包前4个元素，忽略其余元素
+             inpainted_image, translated_bubble_texts, bubble_coords, initial_bubble_styles = hook_result[:4]
+             logger.info("BEFORE_RENDERING 钩子修改了渲染参数。")
+    except Exception as hook_e:
+        logger.error(f"执行 {BEFORE_RENDERING} 钩子时出错: {hook_e}", exc_info=True)
+    # ----------------------------------
+    logger.info("步骤 5: 渲染翻译文本...")
+    start_time = time.time()
+
+    # 在修复/填充后的图像上渲染
+    render_all_bubbles(
+        inpainted_image, # 直接修改 inpainted_image
+        translated_bubble_texts, # 使用气泡翻译结果渲染
+        bubble_coords,
+        initial_bubble_styles
+    )
+    # 将样式附加到最终图像
+    setattr(inpainted_image, '_bubble_styles', initial_bubble_styles)
+    logger.info(f"文本渲染完成 (耗时: {time.time() - start_time:.2f}s)")
+
+    # 6. 准备最终结果
+    processed_image = inpainted_image
+    original_texts = ctx['original_texts']
+    translated_textbox_texts = ctx['textbox_texts']
+
+    # --- 触发 AFTER_PROCESSING 钩子 ---
+    try:
+        # 准备传递给钩子的结果字典
+        final_results = {
+            'original_texts': original_texts,
+            'bubble_texts': translated_bubble_texts,
+            'textbox_texts': translated_textbox_texts,
+            'bubble_coords': bubble_coords,
+            'bubble_styles': initial_bubble_styles
+        }
+        hook_result = plugin_mgr.trigger_hook(AFTER_PROCESSING, processed_image, final_results, params)
+        if hook_result and len(hook_result) >= 2 and isinstance(hook_result[0], Image.Image):
+             processed_image, final_results = hook_result[:2] # 只取前两个元素，更新最终图像和结果
+             # 可能需要从 final_results 更新局部变量以便返回
+             original_texts = final_results.get('original_texts', original_texts)
+             translated_bubble_texts = final_results.get('bubble_texts', translated_bubble_texts)
+             translated_textbox_texts = final_results.get('textbox_texts', translated_textbox_texts)
+             bubble_coords = final_results.get('bubble_coords', bubble_coords)
+             initial_bubble_styles = final_results.get('bubble_styles', initial_bubble_styles)
+             logger.info("AFTER_PROCESSING 钩子修改了最终结果。")
+    except Exception as hook_e:
+         logger.error(f"执行 {AFTER_PROCESSING} 钩子时出错: {hook_e}", exc_info=True)
+    # ---------------------------------
+
+    # 附加必要的标记 (修复标记已在 inpaint_bubbles 中处理)
+    # 附加干净背景引用 (已在 inpaint_bubbles 中处理)
+    ctx['processed_image'] = processed_image
+    ctx['original_texts'] = original_texts
+    ctx['bubble_texts'] = translated_bubble_texts
+    ctx['textbox_texts'] = translated_textbox_texts
+    ctx['bubble_coords'] = bubble_coords
+    ctx['bubble_styles'] = initial_bubble_styles
+    return ctx
+
+# 按执行顺序排列的阶段 (名称, 阶段函数)
+PIPELINE_STAGES = [
+    ('detection', run_detection_stage),
+    ('ocr', run_ocr_stage),
+    ('translation', run_translation_stage),
+    ('inpainting', run_inpainting_stage),
+    ('rendering', run_rendering_stage),
+]
+
+# 支持多页合并执行的阶段 {阶段名: 批量函数}，章节任务引擎会把队列中已就绪的页面合并处理
+PIPELINE_BATCH_STAGES = {
+    'detection': run_detection_stage_batch,
+}
+
+def get_page_result(ctx):
+    """
+    从页面上下文中提取与 process_image_translation 相同格式的返回值。
+    未完成渲染 (未检测到气泡或处理失败) 的页面返回原始图像副本和空数据。
+    """
+    if ctx.get('processed_image') is None:
+        return ctx['original_image'], [], [], [], [], {}
+    return (
+        ctx['processed_image'],
+        ctx['original_texts'],
+        ctx['bubble_texts'],
+        ctx['textbox_texts'],
+        ctx['bubble_coords'],
+        ctx['bubble_styles'] # 返回初始样式
+    )
+
+def build_processing_params(**overrides):
+    """
+    以 process_image_translation 的参数默认值为基础构建处理参数字典 (不含 image_pil)。
+    用于章节任务等不直接调用 process_image_translation 的场景。
+
+    Raises:
+        ValueError: 传入了未知的参数名。
+    """
+    signature = inspect.signature(process_image_translation)
+    params = {name: p.default for name, p in signature.parameters.items() if name != 'image_pil'}
+    unknown = set(overrides) - set(params)
+    if unknown:
+        raise ValueError(f"未知的处理参数: {sorted(unknown)}")
+    params.update(overrides)
+    return params
+
 def process_image_translation(
     image_pil, # 原始 PIL Image
     target_language=constants.DEFAULT_TARGET_LANG,
@@ -59,6 +524,7 @@ def process_image_translation(
     # --- 新增 JSON 格式标记参数 ---
     use_json_format_translation=False,
     use_json_format_ai_vision_ocr=False,
+    use_batch_translation=False, # 整页批量翻译 (一次请求翻译整页所有气泡)
     custom_base_url=None, # --- 新增参数 ---
     # --- 新增 rpm 参数 ---
     rpm_limit_translation: int = constants.DEFAULT_rpm_TRANSLATION,
@@ -98,340 +564,31 @@ def process_image_translation(
         )
         如果处理失败，processed_image 将是原始图像的副本。
     """
+    # 将所有参数打包成字典传递给各阶段和钩子 (image_pil 单独传递)
+    initial_params = locals().copy()
+    initial_params.pop('image_pil', None)
+
     logger.info(f"开始处理图像翻译流程: 源={source_language}, 目标={target_language}, 修复={inpainting_method}")
     start_time_total = time.time() # 记录总时间
 
-    original_image_copy = image_pil.copy() # 保留原始副本以备失败时返回
-
     # 获取插件管理器实例
     plugin_mgr = get_plugin_manager()
+    ctx = create_page_context(image_pil, initial_params)
 
-    # --- 触发 BEFORE_PROCESSING 钩子 ---
     try:
-        # 将所有参数打包成字典传递给钩子
-        initial_params = locals().copy() # 获取当前函数所有局部变量
-        # 移除不应传递给插件的变量 (例如 image_pil 单独传递)
-        initial_params.pop('image_pil', None)
-        initial_params.pop('original_image_copy', None)
-        initial_params.pop('start_time_total', None)
-        initial_params.pop('plugin_mgr', None) # 移除管理器自身
-
-        hook_result = plugin_mgr.trigger_hook(BEFORE_PROCESSING, image_pil, initial_params)
-        if hook_result: # 如果插件返回了修改后的数据
-            image_pil, initial_params = hook_result # 解包
-            # 将修改后的参数更新回函数局部变量 (需要小心处理)
-            # 例如: target_language = initial_params.get('target_language', target_language)
-            # 这里简化处理，假设插件主要修改 params 字典本身
-            logger.info("BEFORE_PROCESSING 钩子修改了参数/图像。")
-            # 更新局部变量 (根据需要选择性更新)
-            target_language = initial_params.get('target_language', target_language)
-            source_language = initial_params.get('source_language', source_language)
-            # ... 其他需要更新的参数 ...
-    except Exception as hook_e:
-         logger.error(f"执行 {BEFORE_PROCESSING} 钩子时出错: {hook_e}", exc_info=True)
-    # ------------------------------------
-
-    try:
-        # 1. 检测气泡坐标
-        # --- 新增：优先使用前端提供的坐标 ---
-        if provided_coords and isinstance(provided_coords, list) and len(provided_coords) > 0:
-            bubble_coords = provided_coords
-            logger.info(f"使用前端提供的手动标注框，共 {len(bubble_coords)} 个")
-        else:
-            # 原有的自动检测逻辑
-            logger.info("步骤 1: 检测气泡坐标...")
-            start_time = time.time()
-            bubble_coords = get_bubble_coordinates(image_pil, conf_threshold=yolo_conf_threshold)
-            logger.info(f"气泡检测完成，找到 {len(bubble_coords)} 个气泡 (耗时: {time.time() - start_time:.2f}s)")
-        # ------------------------------------
-        
-        # --- 触发 AFTER_DETECTION 钩子 ---
-        try:
-            hook_result = plugin_mgr.trigger_hook(AFTER_DETECTION, image_pil, bubble_coords, initial_params)
-            if hook_result and isinstance(hook_result[0], list): # 钩子应返回包含列表的元组
-                bubble_coords = hook_result[0] # 更新坐标
-                logger.info("AFTER_DETECTION 钩子修改了气泡坐标。")
-        except Exception as hook_e:
-            logger.error(f"执行 {AFTER_DETECTION} 钩子时出错: {hook_e}", exc_info=True)
-        # ---------------------------------
-
-        if not bubble_coords:
-             logger.info("未检测到气泡，处理结束。")
-             # 返回原图和空列表/字典
-             return original_image_copy, [], [], [], [], {}
-
-        # 2. OCR 识别文本
-        original_texts = []
-        if not skip_ocr:
-            # --- 触发 BEFORE_OCR 钩子 ---
-            try:
-                 plugin_mgr.trigger_hook(BEFORE_OCR, image_pil, bubble_coords, initial_params)
-            except Exception as hook_e:
-                 logger.error(f"执行 {BEFORE_OCR} 钩子时出错: {hook_e}", exc_info=True)
-            # ---------------------------
-            logger.info("步骤 2: OCR 识别文本...")
-            start_time = time.time()
-            
-            # 如果使用百度OCR，传递相关参数
-            if ocr_engine == 'baidu_ocr':
-                logger.info(f"使用百度OCR ({baidu_version}) 识别文本...")
-                original_texts = recognize_text_in_bubbles(
-                    image_pil, 
-                    bubble_coords, 
-                    source_language, 
-                    ocr_engine,
-                    baidu_api_key=baidu_api_key,
-                    baidu_secret_key=baidu_secret_key,
-                    baidu_version=baidu_version
-                )
-            elif ocr_engine == constants.AI_VISION_OCR_ENGINE_ID:
-                logger.info(f"使用AI视觉OCR ({ai_vision_provider}/{ai_vision_model_name}) 识别文本...")
-                original_texts = recognize_text_in_bubbles(
-                    image_pil,
-                    bubble_coords,
-                    source_language,
-                    ocr_engine,
-                    ai_vision_provider=ai_vision_provider,
-                    ai_vision_api_key=ai_vision_api_key,
-                    ai_vision_model_name=ai_vision_model_name,
-                    ai_vision_ocr_prompt=ai_vision_ocr_prompt,
-                    custom_ai_vision_base_url=custom_ai_vision_base_url,
-                    use_json_format_for_ai_vision=use_json_format_ai_vision_ocr,
-                    rpm_limit_ai_vision=rpm_limit_ai_vision_ocr
-                )
-            else:
-                # 使用其他OCR引擎
-                original_texts = recognize_text_in_bubbles(image_pil, bubble_coords, source_language, ocr_engine)
-                
-            logger.info(f"OCR 完成 (耗时: {time.time() - start_time:.2f}s)")
-            # --- 触发 AFTER_OCR 钩子 ---
-            try:
-                hook_result = plugin_mgr.trigger_hook(AFTER_OCR, image_pil, original_texts, bubble_coords, initial_params)
-                if hook_result and isinstance(hook_result[0], list):
-                    original_texts = hook_result[0] # 更新识别文本
-                    logger.info("AFTER_OCR 钩子修改了识别文本。")
-            except Exception as hook_e:
-                logger.error(f"执行 {AFTER_OCR} 钩子时出错: {hook_e}", exc_info=True)
-            # -------------------------
-        else:
-            logger.info("步骤 2: 跳过 OCR。")
-            original_texts = [""] * len(bubble_coords) # 创建占位符
-
-        # 3. 翻译文本
-        translated_bubble_texts = [""] * len(bubble_coords)
-        translated_textbox_texts = [""] * len(bubble_coords)
-        if not skip_translation:
-            # --- 触发 BEFORE_TRANSLATION 钩子 ---
-            try:
-                hook_result = plugin_mgr.trigger_hook(BEFORE_TRANSLATION, original_texts, initial_params)
-                if hook_result:
-                     original_texts, initial_params = hook_result # 更新待翻译文本和参数
-                     logger.info("BEFORE_TRANSLATION 钩子修改了文本或参数。")
-                     # 可能需要更新函数局部变量，如 model_provider, api_key 等
-                     model_provider = initial_params.get('model_provider', model_provider)
-                     api_key = initial_params.get('api_key', api_key)
-                     model_name = initial_params.get('model_name', model_name)
-                     prompt_content = initial_params.get('prompt_content', prompt_content)
-                     textbox_prompt_content = initial_params.get('textbox_prompt_content', textbox_prompt_content)
-                     custom_base_url = initial_params.get('custom_base_url', custom_base_url)
-            except Exception as hook_e:
-                 logger.error(f"执行 {BEFORE_TRANSLATION} 钩子时出错: {hook_e}", exc_info=True)
-            # ------------------------------------
-            logger.info("步骤 3: 翻译文本...")
-            logger.info(f"翻译模型: {model_provider}, 模型名称: {model_name}")
-            logger.info(f"待翻译文本数量: {len(original_texts)}")
-            for i, text in enumerate(original_texts):
-                if text:
-                    logger.info(f"待翻译文本 {i}: '{text}'")
-                
-            start_time = time.time()
-            # 漫画气泡翻译
-            try:
-                logger.info(f"调用 translate_text_list 开始 - 模型: {model_provider}, 模型名: {model_name}, API密钥长度: {len(api_key) if api_key else 0}, 自定义BaseURL: {custom_base_url if custom_base_url else '无'}")
-                translated_bubble_texts = translate_text_list(
-                    original_texts, target_language, model_provider, api_key, model_name, prompt_content,
-                    use_json_format=use_json_format_translation,
-                    custom_base_url=custom_base_url,
-                    rpm_limit_translation=rpm_limit_translation # <--- 传递rpm参数
-                )
-                logger.info(f"translate_text_list 调用完成，返回结果数量: {len(translated_bubble_texts)}")
-                
-                # 输出翻译结果
-                logger.info("翻译结果:")
-                for i, text in enumerate(translated_bubble_texts):
-                    if text:
-                        logger.info(f"文本 {i} 翻译结果: '{text}'")
-                
-                # 文本框翻译 (如果启用)
-                if use_textbox_prompt and textbox_prompt_content:
-                    translated_textbox_texts = translate_text_list(
-                        original_texts, target_language, model_provider, api_key, model_name, textbox_prompt_content,
-                        use_json_format=False,
-                        custom_base_url=custom_base_url,
-                        rpm_limit_translation=rpm_limit_translation # <--- 传递rpm参数
-                    )
-                else:
-                    translated_textbox_texts = translated_bubble_texts
-                logger.info(f"翻译完成 (耗时: {time.time() - start_time:.2f}s)")
-                # --- 触发 AFTER_TRANSLATION 钩子 ---
-                try:
-                    hook_result = plugin_mgr.trigger_hook(AFTER_TRANSLATION, translated_bubble_texts, translated_textbox_texts, original_texts, initial_params)
-                    if hook_result and len(hook_result) >= 2 and isinstance(hook_result[0], list) and isinstance(hook_result[1], list):
-                         translated_bubble_texts, translated_textbox_texts = hook_result[:2] # 只取前两个元素，更新翻译结果
-                         logger.info("AFTER_TRANSLATION 钩子修改了翻译结果。")
-                except Exception as hook_e:
-                     logger.error(f"执行 {AFTER_TRANSLATION} 钩子时出错: {hook_e}", exc_info=True)
-                # ----------------------------------
-            except Exception as e:
-                logger.error(f"翻译过程发生错误: {e}", exc_info=True)
-                if ignore_connection_errors:
-                    logger.warning(f"翻译服务出错，使用空翻译结果: {e}")
-                    # 使用原文复制代替翻译结果，或者在需要时保持空字符串
-                    translated_bubble_texts = original_texts.copy() if original_texts else [""] * len(bubble_coords)
-                    translated_textbox_texts = translated_bubble_texts
-                else:
-                    # 如果不忽略错误，重新抛出异常
-                    raise
-        else:
-            logger.info("步骤 3: 跳过翻译。")
-            # 如果跳过翻译，两个列表都为空字符串
-
-        # 4. 修复/填充背景
-        # --- 触发 BEFORE_INPAINTING 钩子 ---
-        try:
-            plugin_mgr.trigger_hook(BEFORE_INPAINTING, image_pil, bubble_coords, initial_params)
-        except Exception as hook_e:
-            logger.error(f"执行 {BEFORE_INPAINTING} 钩子时出错: {hook_e}", exc_info=True)
-        # ---------------------------------
-        logger.info(f"步骤 4: 修复/填充背景 (方法: {inpainting_method})...")
-        start_time = time.time()
-        try:
-            inpainted_image, clean_background_img = inpaint_bubbles( # 现在我们保存 clean_bg
-                image_pil, bubble_coords, method=inpainting_method, fill_color=fill_color
-            )
-            logger.info(f"背景处理完成 (耗时: {time.time() - start_time:.2f}s)")
-            # --- 触发 AFTER_INPAINTING 钩子 ---
-            try:
-                hook_result = plugin_mgr.trigger_hook(AFTER_INPAINTING, inpainted_image, clean_background_img, bubble_coords, initial_params)
-                if hook_result and len(hook_result) >= 2 and isinstance(hook_result[0], Image.Image):
-                     inpainted_image, clean_background_img = hook_result[:2] # 只取前两个元素，更新图像
-                     # 如果 clean_background_img 被更新，需要重新附加到 inpainted_image
-                     if clean_background_img:
-                         setattr(inpainted_image, '_clean_background', clean_background_img)
-                         setattr(inpainted_image, '_clean_image', clean_background_img)
-                     logger.info("AFTER_INPAINTING 钩子修改了图像。")
-            except Exception as hook_e:
-                logger.error(f"执行 {AFTER_INPAINTING} 钩子时出错: {hook_e}", exc_info=True)
-            # --------------------------------
-        except Exception as e:
-            if ignore_connection_errors and "lama" in inpainting_method.lower():
-                # 如果 LAMA 出错，回退到纯色填充
-                logger.warning(f"LAMA 修复出错，回退到纯色填充: {e}")
-                inpainted_image, _ = inpaint_bubbles(
-                    image_pil, bubble_coords, method='solid', fill_color=fill_color
-                )
-                logger.info("使用纯色填充完成背景处理")
-            else:
-                # 如果不是高级修复方法出错或者不忽略错误，重新抛出异常
-                raise
-
-        # 5. 渲染文本
-        # 准备初始样式字典
-        initial_bubble_styles = {}
-        is_auto_font_size = isinstance(font_size_setting, str) and font_size_setting.lower() == 'auto'
-        for i in range(len(bubble_coords)):
-            initial_bubble_styles[str(i)] = {
-                'fontSize': font_size_setting, # 传递 'auto' 或数字
-                'autoFontSize': is_auto_font_size,
-                'fontFamily': font_family_rel,
-                'text_direction': text_direction,
-                'position_offset': {'x': 0, 'y': 0},
-                'text_color': text_color,
-                'rotation_angle': rotation_angle,
-                # === 新增描边参数 START ===
-                'enableStroke': enable_text_stroke,
-                'strokeColor': text_stroke_color,
-                'strokeWidth': text_stroke_width
-                # === 新增描边参数 END ===
-            }
-        
-        # --- 触发 BEFORE_RENDERING 钩子 ---
-        try:
-            hook_result = plugin_mgr.trigger_hook(BEFORE_RENDERING, inpainted_image, translated_bubble_texts, bubble_coords, initial_bubble_styles, initial_params)
-            if hook_result and len(hook_result) >= 4:
-                 # 只解包前4个元素，忽略其余元素
-                 inpainted_image, translated_bubble_texts, bubble_coords, initial_bubble_styles = hook_result[:4]
-                 logger.info("BEFORE_RENDERING 钩子修改了渲染参数。")
-        except Exception as hook_e:
-            logger.error(f"执行 {BEFORE_RENDERING} 钩子时出错: {hook_e}", exc_info=True)
-        # ----------------------------------
-        logger.info("步骤 5: 渲染翻译文本...")
-        start_time = time.time()
-            # 如果是自动字号，预计算一次（可选，也可以在渲染时计算）
-            # if is_auto_font_size:
-            #     x1, y1, x2, y2 = bubble_coords[i]
-            #     text = translated_bubble_texts[i] if i < len(translated_bubble_texts) else ""
-            #     calculated_size = calculate_auto_font_size(text, x2-x1, y2-y1, text_direction, font_family_rel)
-            #     initial_bubble_styles[str(i)]['calculated_font_size'] = calculated_size
-            #     initial_bubble_styles[str(i)]['fontSize'] = calculated_size # 更新 fontSize
-
-        # 在修复/填充后的图像上渲染
-        render_all_bubbles(
-            inpainted_image, # 直接修改 inpainted_image
-            translated_bubble_texts, # 使用气泡翻译结果渲染
-            bubble_coords,
-            initial_bubble_styles
-        )
-        # 将样式附加到最终图像
-        setattr(inpainted_image, '_bubble_styles', initial_bubble_styles)
-        logger.info(f"文本渲染完成 (耗时: {time.time() - start_time:.2f}s)")
-
-        # 6. 准备最终结果
-        processed_image = inpainted_image
-
-        # --- 触发 AFTER_PROCESSING 钩子 ---
-        try:
-            # 准备传递给钩子的结果字典
-            final_results = {
-                'original_texts': original_texts,
-                'bubble_texts': translated_bubble_texts,
-                'textbox_texts': translated_textbox_texts,
-                'bubble_coords': bubble_coords,
-                'bubble_styles': initial_bubble_styles
-            }
-            hook_result = plugin_mgr.trigger_hook(AFTER_PROCESSING, processed_image, final_results, initial_params)
-            if hook_result and len(hook_result) >= 2 and isinstance(hook_result[0], Image.Image):
-                 processed_image, final_results = hook_result[:2] # 只取前两个元素，更新最终图像和结果
-                 # 可能需要从 final_results 更新局部变量以便返回
-                 original_texts = final_results.get('original_texts', original_texts)
-                 translated_bubble_texts = final_results.get('bubble_texts', translated_bubble_texts)
-                 translated_textbox_texts = final_results.get('textbox_texts', translated_textbox_texts)
-                 bubble_coords = final_results.get('bubble_coords', bubble_coords)
-                 initial_bubble_styles = final_results.get('bubble_styles', initial_bubble_styles)
-                 logger.info("AFTER_PROCESSING 钩子修改了最终结果。")
-        except Exception as hook_e:
-             logger.error(f"执行 {AFTER_PROCESSING} 钩子时出错: {hook_e}", exc_info=True)
-        # ---------------------------------
-
-        # 附加必要的标记 (修复标记已在 inpaint_bubbles 中处理)
-        # 附加干净背景引用 (已在 inpaint_bubbles 中处理)
+        for stage_name, stage_func in PIPELINE_STAGES:
+            stage_func(ctx, plugin_mgr)
+            if ctx['finished']:
+                break
 
         total_duration = time.time() - start_time_total
         logger.info(f"图像翻译流程完成，总耗时: {total_duration:.2f}s")
-
-        return (
-            processed_image,
-            original_texts,
-            translated_bubble_texts,
-            translated_textbox_texts,
-            bubble_coords,
-            initial_bubble_styles # 返回初始样式
-        )
+        return get_page_result(ctx)
 
     except Exception as e:
         logger.error(f"图像翻译处理流程中发生严重错误: {e}", exc_info=True)
         # 返回原始图像副本和空数据
-        return original_image_copy, [], [], [], [], {}
+        return ctx['original_image'], [], [], [], [], {}
 
 # --- 测试代码 ---
 if __name__ == '__main__':
@@ -1,3 +1,4 @@
+import hashlib
 import logging
 import math
 import os
@@ -13,6 +14,8 @@ logger = logging.getLogger("CoreRendering")
 
 # --- 字体加载缓存 ---
 _font_cache = {}
+# --- 字形宽度缓存：字体对象 -> {字符: 宽度} (字体对象本身由 _font_cache 常驻) ---
+_glyph_width_cache = {}
 
 # --- 特殊字符的字体路径 ---
 NOTOSANS_FONT_PATH = os.path.join('src', 'app', 'static', 'fonts', 'NotoSans-Medium.ttf')
@@ -130,23 +133,93 @@ def get_font(font_family_relative_path=constants.DEFAULT_FONT_RELATIVE_PATH, fon
     _font_cache[cache_key] = font
     return font
 
+# --- 排版引擎 ---
+# 行高/列宽规则与 draw_multiline_text_* 的绘制规则一致，自动字号和换行都按真实字形宽度计算
+VERTICAL_CHAR_STEP = 1    # 竖排字间距 (字高 = 字号 + 1)
+VERTICAL_COLUMN_GAP = 3   # 竖排列间距 (列宽 = 字号 + 3)
+HORIZONTAL_LINE_GAP = 5   # 横排行间距 (行高 = 字号 + 5)
+
+def get_glyph_widths(font, text):
+    """
+    返回字体的字形宽度表 {字符: 宽度}，text 中尚未测量的字符会一次性补齐。
+    每个 (字体, 字号) 的每个字符只测量一次，之后的排版和绘制都直接查表。
+    """
+    widths = _glyph_width_cache.get(font)
+    if widths is None:
+        widths = _glyph_width_cache.setdefault(font, {})
+    missing = set(text).difference(widths)
+    if missing:
+        for char in missing:
+            bbox = font.getbbox(char)
+            widths[char] = bbox[2] - bbox[0]
+    return widths
+
+def layout_vertical_lines(text, font_size, max_height):
+    """竖排断列 (标点已转换为竖排样式)，返回每一列的文本。"""
+    text = map_to_vertical_punctuation(text)
+    char_step = font_size + VERTICAL_CHAR_STEP
+    lines = []
+    current_line = ""
+    current_column_height = 0
+    for char in text:
+        if current_column_height + char_step <= max_height:
+            current_line += char
+            current_column_height += char_step
+        else:
+            lines.append(current_line)
+            current_line = char
+            current_column_height = char_step
+    lines.append(current_line)
+    return lines
+
+def layout_horizontal_lines(text, font, max_width):
+    """横排按字形宽度断行，返回每一行的文本。"""
+    widths = get_glyph_widths(font, text)
+    lines = []
+    current_line = ""
+    current_line_width = 0
+    for char in text:
+        char_width = widths[char]
+        if current_line_width + char_width <= max_width:
+            current_line += char
+            current_line_width += char_width
+        else:
+            lines.append(current_line)
+            current_line = char
+            current_line_width = char_width
+    lines.append(current_line)
+    return lines
+
+def _layout_fits(text, font, font_size, text_direction, width, height):
+    """按实际绘制规则排版后，文字是否能完整放入 width x height 的区域。"""
+    if text_direction == 'horizontal':
+        lines = layout_horizontal_lines(text, font, width)
+        widths = get_glyph_widths(font, text)
+        if any(sum(widths[c] for c in line) > width for line in lines):
+            return False # 单个字符就比区域宽
+        return len(lines) * (font_size + HORIZONTAL_LINE_GAP) <= height
+    if font_size + VERTICAL_CHAR_STEP > height:
+        return False
+    lines = layout_vertical_lines(text, font_size, height)
+    return len(lines) * (font_size + VERTICAL_COLUMN_GAP) <= width
+
+def layout_signature(text, font_family_rel, font_size_token, text_direction, bubble_width, bubble_height):
+    """排版结果的签名：文字、字体、字号设置、方向或气泡尺寸任一变化时都会变化 (与气泡位置无关)。"""
+    payload = f"{font_family_rel}\x00{font_size_token}\x00{text_direction}\x00{bubble_width}x{bubble_height}\x00{text}"
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
 def calculate_auto_font_size(text, bubble_width, bubble_height, text_direction='vertical',
                              font_family_relative_path=constants.DEFAULT_FONT_RELATIVE_PATH,
                              min_size=12, max_size=60, padding_ratio=1.0):
     """
-    使用二分法计算最佳字体大小。
+    使用二分法计算最佳字体大小。每个候选字号都按真实字形宽度和绘制时的行高/列宽实际排版，
+    比例字体 (英文、半角标点) 不会再被按全角宽度估算而缩得过小或溢出。
     """
     if not text or not text.strip() or bubble_width <= 0 or bubble_height <= 0:
         return constants.DEFAULT_FONT_SIZE
 
-    W = bubble_width * padding_ratio
-    H = bubble_height * padding_ratio
-    N = len(text)
-    c_w = 1.0
-    l_h = 1.05
-
-    if text_direction == 'vertical':
-        W, H = H, W
+    W = max(10, bubble_width) * padding_ratio
+    H = max(10, bubble_height) * padding_ratio
 
     low = min_size
     high = max_size
@@ -162,21 +235,7 @@ def calculate_auto_font_size(text, bubble_width, bubble_height, text_direction='
                 high = mid - 1
                 continue
 
-            avg_char_width = mid * c_w
-            avg_char_height = mid
-
-            if text_direction == 'horizontal':
-                chars_per_line = max(1, int(W / avg_char_width)) if avg_char_width > 0 else N # 避免除零
-                lines_needed = math.ceil(N / chars_per_line) if chars_per_line > 0 else N
-                total_height_needed = lines_needed * mid * l_h
-                fits = total_height_needed <= H
-            else: # vertical
-                chars_per_column = max(1, int(H / avg_char_height)) if avg_char_height > 0 else N
-                columns_needed = math.ceil(N / chars_per_column) if chars_per_column > 0 else N
-                total_width_needed = columns_needed * mid * l_h
-                fits = total_width_needed <= W
-
-            if fits:
+            if _layout_fits(text, font, mid, text_direction, W, H):
                 best_size = mid
                 low = mid + 1
             else:
@@ -190,6 +249,51 @@ def calculate_auto_font_size(text, bubble_width, bubble_height, text_direction='
     logger.info(f"自动计算的最佳字体大小: {result}px (范围: {min_size}-{max_size})")
     return result
 
+def _draw_rotated_glyphs(image, glyphs, rotation_angle, center):
+    """
+    把整个气泡的字符绘制到一张紧贴文字范围的透明图层上，整体旋转一次后合成到图像。
+
+    Args:
+        image (PIL.Image.Image): 目标图像 (会被直接修改)。
+        glyphs (list): [((x, y), 字符, draw.text 参数), ...]，坐标为未旋转时在 image 上的位置。
+        rotation_angle (float): 旋转角度 (逆时针，与 Image.rotate 一致)。
+        center (tuple): 旋转中心 (image 坐标)。
+    """
+    if not glyphs:
+        return
+    # 图层范围：所有字符 (含描边) 的包围盒
+    left = top = float('inf')
+    right = bottom = float('-inf')
+    for (gx, gy), char, params in glyphs:
+        bbox = params["font"].getbbox(char, stroke_width=params.get("stroke_width", 0))
+        left, top = min(left, gx + bbox[0]), min(top, gy + bbox[1])
+        right, bottom = max(right, gx + bbox[2]), max(bottom, gy + bbox[3])
+    # 旋转后的范围可能超出未旋转的包围盒，按到旋转中心的最远距离扩展成正方形
+    cx, cy = center
+    radius = max(math.hypot(px - cx, py - cy) for px in (left, right) for py in (top, bottom))
+    origin_x = math.floor(min(left, cx - radius)) - 2
+    origin_y = math.floor(min(top, cy - radius)) - 2
+    layer_w = math.ceil(max(right, cx + radius)) + 2 - origin_x
+    layer_h = math.ceil(max(bottom, cy + radius)) + 2 - origin_y
+
+    # 图层原点取整数，字符坐标的小数部分与直接绘制时一致
+    layer = Image.new('RGBA', (layer_w, layer_h), (0, 0, 0, 0))
+    layer_draw = ImageDraw.Draw(layer)
+    for (gx, gy), char, params in glyphs:
+        layer_draw.text((gx - origin_x, gy - origin_y), char, **params)
+    rotated = layer.rotate(
+        rotation_angle,
+        resample=Image.Resampling.BICUBIC,
+        center=(cx - origin_x, cy - origin_y),
+        expand=False
+    )
+    # 只把有内容的部分合成到目标图像 (超出图像边界的部分由 paste 裁剪)
+    content_box = rotated.getbbox()
+    if content_box is None:
+        return
+    rotated = rotated.crop(content_box)
+    image.paste(rotated, (origin_x + content_box[0], origin_y + content_box[1]), rotated)
+
 # --- 占位符，后续步骤会添加 ---
 def draw_multiline_text_vertical(draw, text, font, x, y, max_height,
                                  fill=constants.DEFAULT_TEXT_COLOR,
@@ -198,36 +302,18 @@ def draw_multiline_text_vertical(draw, text, font, x, y, max_height,
                                  enable_stroke=False,
                                  stroke_color="#FFFFFF",
                                  stroke_width=0,
-                                 bubble_width=None): # bubble_width 用于居中
+                                 bubble_width=None, # bubble_width 用于居中
+                                 lines=None): # 预先计算好的分列结果 (标点已转换)，提供时跳过排版
     if not text:
         return
     
-    # 将标点符号转换为竖排样式
-    text = map_to_vertical_punctuation(text)
+    # 按字高断列 (标点转换为竖排样式)
+    if lines is None:
+        lines = layout_vertical_lines(text, font.size, max_height)
+    line_height_approx = font.size + VERTICAL_CHAR_STEP # 字间距为1像素
 
-    lines = []
-    current_line = ""
-    current_column_height = 0
-    # Pillow的行高通常由字体大小决定，可微调 line_spacing
-    # font.getsize("A")[1] 或 font.getbbox("A")[3] - font.getbbox("A")[1] 可以估算单行高度
-    # 简单的处理方式：
-    line_height_approx = font.size + 1 # 字间距为1像素
-
-    for char in text:
-        # 简单按字符高度估算，更精确的需要 font.getmask(char).size[1]
-        # 但 Pillow 的 ImageFont 没有直接的 get_character_height
-        # 这里我们简化，认为每个字符占用的垂直空间主要是字体大小
-        if current_column_height + line_height_approx <= max_height:
-            current_line += char
-            current_column_height += line_height_approx
-        else:
-            lines.append(current_line)
-            current_line = char
-            current_column_height = line_height_approx
-    lines.append(current_line)
-
-    # 列宽也基于字体大小估算
-    column_width_approx = font.size + 3 # 假设列间距
+    # 列宽基于字体大小
+    column_width_approx = font.size + VERTICAL_COLUMN_GAP # 列间距
 
     # 计算文本段落的总宽度
     total_text_width_for_centering = len(lines) * column_width_approx
@@ -268,6 +354,8 @@ def draw_multiline_text_vertical(draw, text, font, x, y, max_height,
     # 预加载NotoSans字体，用于特殊字符
     special_font = None
     font_size = font.size  # 获取当前字体大小
+    glyph_widths = get_glyph_widths(font, "".join(lines))
+    rotated_glyphs = [] # 旋转时先收集所有字符，最后整体旋转绘制
 
     current_x_col = current_x_base # 当前列的右边界x坐标
     for line_idx, line in enumerate(lines):
@@ -287,9 +375,11 @@ def draw_multiline_text_vertical(draw, text, font, x, y, max_height,
                 if special_font is not None:
                     current_font = special_font
             
-            # 使用当前选定的字体计算字符尺寸
-            bbox = current_font.getbbox(char)
-            char_width = bbox[2] - bbox[0]
+            # 使用当前选定的字体的字形宽度 (查缓存)
+            if current_font is font:
+                char_width = glyph_widths[char]
+            else:
+                char_width = get_glyph_widths(current_font, char)[char]
             
             # 对于竖排，我们通常需要将字符的右上角或中心对齐到 (current_x_col - char_width, current_y_char)
             # Pillow的 text 方法的 xy 参数是文本的左上角。
@@ -308,27 +398,7 @@ def draw_multiline_text_vertical(draw, text, font, x, y, max_height,
                 # logger.debug(f"V-Stroke: char='{char}', width={stroke_width}, color={stroke_color}")
             
             if rotation_angle != 0 and original_image is not None:
-                try:
-                    # 创建一个透明的临时图像用于绘制和旋转单个字符
-                    temp_char_img = Image.new('RGBA', original_image.size, (0, 0, 0, 0))
-                    temp_char_draw = ImageDraw.Draw(temp_char_img)
-                    
-                    # 在临时图像上绘制当前字符
-                    temp_char_draw.text((text_x_char, text_y_char), char, **text_draw_params)
-                    
-                    # 旋转临时图像
-                    rotated_char_img = temp_char_img.rotate(
-                        rotation_angle, 
-                        resample=Image.Resampling.BICUBIC,
-                        center=(center_x_rot, center_y_rot),
-                        expand=False
-                    )
-                    
-                    # 将旋转后的图像合成到原始图像
-                    original_image.paste(rotated_char_img, (0,0), rotated_char_img)
-                except Exception as e_rot:
-                    logger.error(f"旋转渲染竖排字符 '{char}' 失败: {e_rot}, 回退到直接渲染")
-                    draw.text((text_x_char, text_y_char), char, **text_draw_params)
+                rotated_glyphs.append(((text_x_char, text_y_char), char, text_draw_params))
             else:
                 # 直接绘制，应用描边（如果启用）
                 draw.text((text_x_char, text_y_char), char, **text_draw_params)
@@ -336,41 +406,37 @@ def draw_multiline_text_vertical(draw, text, font, x, y, max_height,
             current_y_char += line_height_approx
         current_x_col -= column_width_approx
 
+    if rotated_glyphs:
+        try:
+            _draw_rotated_glyphs(original_image, rotated_glyphs, rotation_angle, (center_x_rot, center_y_rot))
+        except Exception as e_rot:
+            logger.error(f"旋转渲染竖排文本失败: {e_rot}, 回退到直接渲染")
+            for xy, char, text_draw_params in rotated_glyphs:
+                draw.text(xy, char, **text_draw_params)
+
 def draw_multiline_text_horizontal(draw, text, font, x, y, max_width,
                                   fill=constants.DEFAULT_TEXT_COLOR, # 保持默认文本填充色
                                   rotation_angle=constants.DEFAULT_ROTATION_ANGLE,
                                   # 新增描边参数，这些将从 bubble_styles 中提取
                                   enable_stroke=False,
                                   stroke_color="#FFFFFF",
-                                  stroke_width=0):
+                                  stroke_width=0,
+                                  lines=None): # 预先计算好的分行结果，提供时跳过排版
     if not text:
         return
 
-    lines = []
-    current_line = ""
-    current_line_width = 0
-
-    for char in text:
-        bbox = font.getbbox(char)
-        char_width = bbox[2] - bbox[0]
-        space_width = font.getbbox(' ')[2] - font.getbbox(' ')[0]
-
-        if current_line_width + char_width <= max_width:
-            current_line += char
-            current_line_width += char_width
-        else:
-            lines.append(current_line)
-            current_line = char
-            current_line_width = char_width
-
-    lines.append(current_line)
+    # 按字形宽度断行
+    if lines is None:
+        lines = layout_horizontal_lines(text, font, max_width)
 
     current_y = y
-    line_height = font.size + 5
+    line_height = font.size + HORIZONTAL_LINE_GAP
     
     # 预加载NotoSans字体，用于特殊字符
     special_font = None
     font_size = font.size  # 获取当前字体大小
+    glyph_widths = get_glyph_widths(font, "".join(lines))
+    rotated_glyphs = [] # 旋转时先收集所有字符，最后整体旋转绘制
     
     # 如果需要旋转，先获取原始图像
     original_image = None
@@ -401,10 +467,11 @@ def draw_multiline_text_horizontal(draw, text, font, x, y, max_width,
                 if special_font is not None:
                     current_font = special_font
 
-            # 使用当前选定的字体计算字符尺寸
-            bbox = current_font.getbbox(char)
-            char_width = bbox[2] - bbox[0]
-            char_height = bbox[3] - bbox[1]
+            # 使用当前选定的字体的字形宽度 (查缓存)
+            if current_font is font:
+                char_width = glyph_widths[char]
+            else:
+                char_width = get_glyph_widths(current_font, char)[char]
             
             # 准备传递给 draw.text 的参数字典
             text_draw_params = {
@@ -417,30 +484,7 @@ def draw_multiline_text_horizontal(draw, text, font, x, y, max_width,
                 # logger.debug(f"H-Stroke: char='{char}', width={stroke_width}, color={stroke_color}")
             
             if rotation_angle != 0 and original_image is not None:
-                try:
-                    # 创建一个透明的临时图像用于绘制和旋转单个字符
-                    # 尺寸可以根据字符和旋转角度估算，或者用一个足够大的固定尺寸再裁剪
-                    # 为简化，这里使用原始图像尺寸的临时画布，后续可以优化
-                    temp_char_img = Image.new('RGBA', original_image.size, (0, 0, 0, 0))
-                    temp_char_draw = ImageDraw.Draw(temp_char_img)
-                    
-                    # 在临时图像的 (current_x, current_y) 位置绘制字符
-                    temp_char_draw.text((current_x, current_y), char, **text_draw_params)
-                    
-                    # 旋转这个包含单个字符的临时图像
-                    rotated_char_img = temp_char_img.rotate(
-                        rotation_angle,
-                        resample=Image.Resampling.BICUBIC, # 或者 NEAREST 如果要求锐利
-                        center=(center_x_rot, center_y_rot), # 使用计算好的旋转中心
-                        expand=False # 不扩展图像边界
-                    )
-                    
-                    # 将旋转后的字符图像粘贴回原始图像 (带透明度蒙版)
-                    # 注意：Image.paste 的第三个参数是蒙版。如果 rotated_char_img 是 RGBA，它自身可以作为蒙版。
-                    original_image.paste(rotated_char_img, (0,0), rotated_char_img)
-                except Exception as e_rot:
-                    logger.error(f"旋转渲染字符 '{char}' 失败: {e_rot}, 回退到直接渲染")
-                    draw.text((current_x, current_y), char, **text_draw_params)
+                rotated_glyphs.append(((current_x, current_y), char, text_draw_params))
             else:
                 # 直接绘制，应用描边（如果启用）
                 draw.text((current_x, current_y), char, **text_draw_params)
@@ -448,6 +492,14 @@ def draw_multiline_text_horizontal(draw, text, font, x, y, max_width,
             current_x += char_width
         current_y += line_height
 
+    if rotated_glyphs:
+        try:
+            _draw_rotated_glyphs(original_image, rotated_glyphs, rotation_angle, (center_x_rot, center_y_rot))
+        except Exception as e_rot:
+            logger.error(f"旋转渲染横排文本失败: {e_rot}, 回退到直接渲染")
+            for xy, char, text_draw_params in rotated_glyphs:
+                draw.text(xy, char, **text_draw_params)
+
 def render_all_bubbles(draw_image, all_texts, bubble_coords, bubble_styles):
     """
     在图像上渲染所有气泡的文本，使用各自的样式。
@@ -459,6 +511,7 @@ def render_all_bubbles(draw_image, all_texts, bubble_coords, bubble_styles):
         bubble_styles (dict): 包含每个气泡样式的字典，键为气泡索引(字符串),
                               值为样式字典 {'fontSize':, 'autoFontSize':, 'fontFamily':,
                               'textDirection':, 'position_offset':, 'textColor':, 'rotationAngle':}。
+                              渲染后会写回 'calculated_font_size' (自动字号) 和 'layout' (排版结果)。
     """
     if not all_texts or not bubble_coords or len(all_texts) != len(bubble_coords):
         logger.warning(f"文本({len(all_texts) if all_texts else 0})、坐标({len(bubble_coords) if bubble_coords else 0})数量不匹配，无法渲染。")
@@ -495,20 +548,34 @@ def render_all_bubbles(draw_image, all_texts, bubble_coords, bubble_styles):
 
         # --- 处理字体大小 ---
         current_font_size = constants.DEFAULT_FONT_SIZE
-        if auto_font_size:
-            bubble_width = x2 - x1
-            bubble_height = y2 - y1
+        if not auto_font_size: # 自动字号在下方排版时确定
+            if isinstance(font_size_setting, (int, float)) and font_size_setting > 0:
+                current_font_size = int(font_size_setting)
+            elif isinstance(font_size_setting, str) and font_size_setting.isdigit(): # 处理字符串形式的数字
+                current_font_size = int(font_size_setting)
+
+        # --- 排版 (自动字号 + 断行)：样式中保存的排版结果仍然有效时直接复用 ---
+        bubble_width = x2 - x1
+        bubble_height = y2 - y1
+        max_text_width = max(10, bubble_width)
+        max_text_height = max(10, bubble_height)
+        signature = layout_signature(text, font_family_rel, 'auto' if auto_font_size else current_font_size,
+                                     text_direction, bubble_width, bubble_height)
+        cached_layout = style.get('layout')
+        lines = None
+        if (isinstance(cached_layout, dict) and cached_layout.get('signature') == signature and
+                (not auto_font_size or style.get('calculated_font_size') in (None, cached_layout.get('font_size')))):
+            current_font_size = cached_layout['font_size']
+            lines = cached_layout['lines']
+        elif auto_font_size:
             if 'calculated_font_size' in style and style['calculated_font_size']:
                  current_font_size = style['calculated_font_size']
             else:
                  current_font_size = calculate_auto_font_size(
                      text, bubble_width, bubble_height, text_direction, font_family_rel
                  )
-                 style['calculated_font_size'] = current_font_size # 保存计算结果
-        elif isinstance(font_size_setting, (int, float)) and font_size_setting > 0:
-            current_font_size = int(font_size_setting)
-        elif isinstance(font_size_setting, str) and font_size_setting.isdigit(): # 处理字符串形式的数字
-             current_font_size = int(font_size_setting)
+        if auto_font_size:
+            style['calculated_font_size'] = current_font_size # 保存计算结果
 
         # --- 加载字体 ---
         font = get_font(font_family_rel, current_font_size)
@@ -516,14 +583,20 @@ def render_all_bubbles(draw_image, all_texts, bubble_coords, bubble_styles):
             logger.error(f"气泡 {i}: 无法加载字体 {font_family_rel} (大小: {current_font_size})，跳过渲染。")
             continue
 
+        if lines is None and text_direction in ('vertical', 'horizontal'):
+            if text_direction == 'vertical':
+                lines = layout_vertical_lines(text, font.size, max_text_height)
+            else:
+                lines = layout_horizontal_lines(text, font, max_text_width)
+            # 保存排版结果，重渲染时 (文字、字体、字号和气泡尺寸都未变) 跳过排版
+            style['layout'] = {'signature': signature, 'font_size': current_font_size, 'lines': lines}
+
         # --- 计算绘制参数 ---
         offset_x = position_offset.get('x', 0)
         offset_y = position_offset.get('y', 0)
         draw_x = x1 + offset_x
         draw_y = y1 + offset_y
         vertical_draw_x = x2 + offset_x # 竖排时，x是右边界
-        max_text_width = max(10, x2 - x1)
-        max_text_height = max(10, y2 - y1)
 
         # --- 调用绘制函数 ---
         try:
@@ -535,14 +608,16 @@ def render_all_bubbles(draw_image, all_texts, bubble_coords, bubble_styles):
                                            enable_stroke=enable_stroke_to_use,
                                            stroke_color=stroke_color_to_use,
                                            stroke_width=stroke_width_to_use,
-                                           bubble_width=bubble_width_for_centering)
+                                           bubble_width=bubble_width_for_centering,
+                                           lines=lines)
             elif text_direction == 'horizontal':
                 draw_multiline_text_horizontal(draw, text, font, draw_x, draw_y, max_text_width,
                                              fill=text_color, rotation_angle=rotation_angle,
                                              # 传递描边参数
                                              enable_stroke=enable_stroke_to_use,
                                              stroke_color=stroke_color_to_use,
-                                             stroke_width=stroke_width_to_use)
+                                             stroke_width=stroke_width_to_use,
+                                             lines=lines)
             else:
                 logger.warning(f"气泡 {i}: 未知的文本方向 '{text_direction}'，跳过渲染。")
         except Exception as render_e:
@@ -550,6 +625,28 @@ def render_all_bubbles(draw_image, all_texts, bubble_coords, bubble_styles):
 
     logger.info("所有气泡文本渲染完成。")
 
+def build_default_bubble_styles(bubble_count, fontSize, fontFamily, text_direction, text_color,
+                                rotation_angle, enable_stroke=False, stroke_color="#FFFFFF", stroke_width=0):
+    """
+    用全局设置为每个气泡生成样式字典 (格式与 render_all_bubbles 的 bubble_styles 一致)。
+    """
+    is_auto_font_size_global = isinstance(fontSize, str) and fontSize.lower() == 'auto'
+    return {
+        str(i): {
+            'fontSize': fontSize,
+            'autoFontSize': is_auto_font_size_global,
+            'fontFamily': fontFamily,
+            'text_direction': text_direction,  # 全局文字方向
+            'position_offset': {'x': 0, 'y': 0},  # 保持默认位置
+            'text_color': text_color,
+            'rotation_angle': rotation_angle,
+            'enableStroke': enable_stroke,
+            'strokeColor': stroke_color,
+            'strokeWidth': stroke_width
+        }
+        for i in range(bubble_count)
+    }
+
 def render_single_bubble(
     image,
     bubble_index,
@@ -753,8 +850,7 @@ def re_render_text_in_bubbles(
 
         logger.info(f"重渲染时选择修复/填充方法: {inpainting_method}")
         img_pil, generated_clean_bg = inpaint_bubbles(
-            image, bubble_coords, method=inpainting_method, fill_color=fill_color,
-            migan_strength=inpainting_strength, migan_blend_edges=blend_edges
+            image, bubble_coords, method=inpainting_method, fill_color=fill_color
         )
         if generated_clean_bg: clean_image_base = generated_clean_bg.copy()
 
@@ -779,27 +875,11 @@ def re_render_text_in_bubbles(
         # 没有预定义样式，使用全局设置创建新样式
         logger.info("没有找到预定义气泡样式，使用全局设置创建样式")
         
-        # 获取全局设置参数
-        is_auto_font_size_global = isinstance(fontSize, str) and fontSize.lower() == 'auto'
-        font_family_rel = fontFamily
-        
         logger.info(f"使用传入的全局颜色设置: {text_color}, 旋转角度: {rotation_angle}")
-        
-        # 为所有气泡创建新的样式字典，使用全局设置
-        for i in range(len(bubble_coords)):
-            bubble_styles_to_use[str(i)] = {
-                'fontSize': fontSize,
-                'autoFontSize': is_auto_font_size_global,
-                'fontFamily': font_family_rel,
-                'text_direction': text_direction,  # 全局文字方向
-                'position_offset': {'x': 0, 'y': 0},  # 保持默认位置
-                'text_color': text_color,  # 使用从请求获取的颜色
-                'rotation_angle': rotation_angle,  # 使用从请求获取的旋转角度
-                # 添加全局描边设置
-                'enableStroke': enable_stroke_param,
-                'strokeColor': stroke_color_param,
-                'strokeWidth': stroke_width_param
-            }
+        bubble_styles_to_use = build_default_bubble_styles(
+            len(bubble_coords), fontSize, fontFamily, text_direction, text_color, rotation_angle,
+            enable_stroke_param, stroke_color_param, stroke_width_param
+        )
 
     # --- 调用核心渲染函数 ---
     render_all_bubbles(
@@ -5,6 +5,9 @@ import json
 import logging
 import time
 import shutil # 用于后续的删除操作
+import base64
+import binascii
+import hashlib
 from src.shared.path_helpers import resource_path # 需要路径助手
 
 logger = logging.getLogger("SessionManager")
@@ -12,7 +15,21 @@ logger = logging.getLogger("SessionManager")
 # --- 基础配置 ---
 SESSION_BASE_DIR_NAME = "sessions" # 会话保存的基础目录名
 METADATA_FILENAME = "session_meta.json" # 会话元数据文件名
-IMAGE_DATA_EXTENSION = ".b64" # 存储 Base64 图像数据的文件扩展名
+IMAGE_DATA_EXTENSION = ".b64" # v1 格式：存储 Base64 图像数据的文件扩展名 (仅用于读取和迁移旧会话)
+
+# --- v2 格式 ---
+# 图像以原始字节 (PNG/JPEG/WebP) 存放在会话目录的 images/ 子目录中，文件名为内容的 SHA-256，
+# 元数据只记录每张图像的哈希和 MIME 类型。内容未变化的图像在再次保存时不会重写。
+SESSION_FORMAT_VERSION = 2
+IMAGE_DIR_NAME = "images"
+IMAGE_TYPES = ('original', 'translated', 'clean')
+_MIME_EXTENSIONS = {
+    'image/png': '.png',
+    'image/jpeg': '.jpg',
+    'image/webp': '.webp',
+    'image/gif': '.gif',
+    'image/bmp': '.bmp',
+}
 
 # --- 辅助函数 ---
 
@@ -43,37 +60,100 @@ def _get_session_path(session_name):
         return None
     return os.path.join(_get_session_base_dir(), safe_session_name)
 
-def _save_image_data(session_folder, image_index, image_type, base64_data):
+def _sniff_mime(data):
+    """根据文件头判断图像的 MIME 类型，无法识别时按 PNG 处理。"""
+    if data.startswith(b'\x89PNG'):
+        return 'image/png'
+    if data.startswith(b'\xff\xd8'):
+        return 'image/jpeg'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    if data[:3] == b'GIF':
+        return 'image/gif'
+    if data[:2] == b'BM':
+        return 'image/bmp'
+    return 'image/png'
+
+def _decode_image_field(value):
     """
-    将单个图像的 Base64 数据保存到单独的文件。
+    把前端传来的图像字段解码为原始字节。
 
     Args:
-        session_folder (str): 此会话的文件夹路径。
-        image_index (int): 图像在其列表中的索引。
-        image_type (str): 图像类型 ('original', 'translated', 'clean')。
-        base64_data (str): Base64 编码的图像数据 (不含 'data:image/...' 前缀)。
+        value (str): 'data:image/...;base64,...' 形式的 DataURL 或纯 Base64 字符串。
 
     Returns:
-        bool: 保存是否成功。
+        tuple: (bytes, mime)；值为空或格式无效时返回 (None, None)。
     """
-    if not base64_data:
-        # logger.debug(f"图像 {image_index} 的 {image_type} 数据为空，跳过保存。")
-        return True # 认为是"成功"跳过
+    if not value or not isinstance(value, str):
+        return None, None
+    payload = value
+    if value.startswith('data:'):
+        try:
+            payload = value.split(',', 1)[1]
+        except IndexError:
+            return None, None
+    try:
+        data = base64.b64decode(payload, validate=False)
+    except (binascii.Error, ValueError):
+        return None, None
+    if not data:
+        return None, None
+    return data, _sniff_mime(data)
 
-    filename = f"image_{image_index}_{image_type}{IMAGE_DATA_EXTENSION}"
-    filepath = os.path.join(session_folder, filename)
+def _get_image_dir(session_folder):
+    return os.path.join(session_folder, IMAGE_DIR_NAME)
+
+def _image_filename(image_hash, mime):
+    return image_hash + _MIME_EXTENSIONS.get(mime, '.png')
+
+def _store_image_bytes(session_folder, data, mime):
+    """
+    以内容哈希为文件名保存图像字节；相同内容的文件已存在时跳过写入。
+
+    Returns:
+        tuple: (引用字典 {"hash", "mime"}, 是否实际写入了文件)
+    """
+    image_hash = hashlib.sha256(data).hexdigest()
+    image_dir = _get_image_dir(session_folder)
+    os.makedirs(image_dir, exist_ok=True)
+    filepath = os.path.join(image_dir, _image_filename(image_hash, mime))
+    if os.path.exists(filepath) and os.path.getsize(filepath) == len(data):
+        return {"hash": image_hash, "mime": mime}, False
+    # 先写临时文件再替换，避免中途失败留下损坏的图像
+    tmp_path = filepath + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, filepath)
+    return {"hash": image_hash, "mime": mime}, True
+
+def get_session_image_path(session_name, image_hash):
+    """
+    获取会话中指定哈希图像的文件路径和 MIME 类型 (供图像端点按需读取)。
+
+    Returns:
+        tuple: (文件路径, MIME)；会话或图像不存在、哈希格式无效时返回 (None, None)。
+    """
+    if not image_hash or len(image_hash) != 64 or any(c not in '0123456789abcdef' for c in image_hash):
+        return None, None
+    session_folder = _get_session_path(session_name)
+    if not session_folder:
+        return None, None
+    image_dir = _get_image_dir(session_folder)
+    for mime, ext in _MIME_EXTENSIONS.items():
+        filepath = os.path.join(image_dir, image_hash + ext)
+        if os.path.isfile(filepath):
+            return filepath, mime
+    return None, None
+
+def _read_image_ref(session_folder, ref):
+    """读取 v2 图像引用对应的原始字节，失败时返回 None。"""
+    filepath = os.path.join(_get_image_dir(session_folder), _image_filename(ref["hash"], ref.get("mime")))
     try:
-        # 直接写入 Base64 字符串
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(base64_data)
-        # logger.debug(f"成功保存图像数据: {filepath}")
-        return True
+        with open(filepath, 'rb') as f:
+            return f.read()
     except IOError as e:
-        logger.error(f"保存图像数据文件失败: {filepath} - {e}", exc_info=True)
-        return False
-    except Exception as e:
-        logger.error(f"保存图像数据时发生未知错误: {filepath} - {e}", exc_info=True)
-        return False
+        logger.error(f"读取会话图像文件失败: {filepath} - {e}")
+        return None
 
 def _load_image_data(session_folder, image_index, image_type):
     """
@@ -107,7 +187,7 @@ def _load_image_data(session_folder, image_index, image_type):
 
 def save_session(session_name, session_data):
     """
-    保存完整的会话状态到磁盘。
+    保存完整的会话状态到磁盘 (v2 格式)。
 
     Args:
         session_name (str): 要保存的会话名称。
@@ -120,6 +200,8 @@ def save_session(session_name, session_data):
                         "originalDataURL": "data:image/...;base64,...", # 原始图 Base64
                         "translatedDataURL": "data:image/...;base64,...", # 翻译图 Base64 (可能为 null)
                         "cleanImageData": "...", # 干净背景 Base64 (可能为 null)
+                        "imageRefs": {"original": {"hash": "...", "mime": "..."}, ...}, # 可选：延迟加载时
+                                     # 前端未取回图像数据，可直接回传引用，表示图像未变化
                         "bubbleCoords": [[...], ...],
                         "originalTexts": ["...", ...],
                         "bubbleTexts": ["...", ...],
@@ -143,11 +225,9 @@ def save_session(session_name, session_data):
         return False
 
     try:
-        # 1. 创建会话文件夹 (如果已存在，先删除旧内容还是覆盖？这里选择覆盖)
+        # 1. 创建会话文件夹 (已存在时覆盖元数据，图像按内容哈希增量写入)
         if os.path.exists(session_folder):
             logger.warning(f"会话 '{session_name}' 已存在，将覆盖。")
-            # 可以选择删除旧文件夹或只覆盖文件，这里简单覆盖
-            # shutil.rmtree(session_folder) # 如果需要完全清空
         os.makedirs(session_folder, exist_ok=True)
 
         # 2. 准备元数据 (排除大的 Base64 字符串)
@@ -155,66 +235,70 @@ def save_session(session_name, session_data):
             "metadata": {
                 "name": session_name,
                 "saved_at": time.strftime("%Y-%m-%d %H:%M:%S"),
-                "translator_version": "2.1.3+" # 或者从某处获取版本号
+                "translator_version": "2.1.3+", # 或者从某处获取版本号
+                "format_version": SESSION_FORMAT_VERSION
             },
             "ui_settings": session_data.get("ui_settings", {}),
-            "images_meta": [], # 存储图片元数据，不含 Base64
+            "images_meta": [], # 存储图片元数据，不含图像数据
             "currentImageIndex": session_data.get("currentImageIndex", -1)
         }
 
         images_data = session_data.get("images", [])
         all_image_data_saved = True
+        written_count = 0
+        skipped_count = 0
 
-        # 3. 遍历图片，保存 Base64 数据到文件，并准备图片元数据
+        # 3. 遍历图片，把图像字节按内容哈希保存，并准备图片元数据
         for idx, img_state in enumerate(images_data):
             image_meta = img_state.copy() # 复制一份元数据
+            fields = {
+                'original': image_meta.pop('originalDataURL', None),
+                'translated': image_meta.pop('translatedDataURL', None),
+                'clean': image_meta.pop('cleanImageData', None),
+            }
+            incoming_refs = image_meta.pop('imageRefs', None) or {}
+            # 延迟加载时前端传回的图像 URL 不需要保存
+            for image_type in IMAGE_TYPES:
+                image_meta.pop(f'{image_type}ImageUrl', None)
+
+            image_refs = {}
+            for image_type in IMAGE_TYPES:
+                data, mime = _decode_image_field(fields[image_type])
+                if data is not None:
+                    try:
+                        ref, written = _store_image_bytes(session_folder, data, mime)
+                        image_refs[image_type] = ref
+                        if written:
+                            written_count += 1
+                        else:
+                            skipped_count += 1
+                    except IOError as e:
+                        logger.error(f"保存会话 '{session_name}' 图像 {idx} ({image_type}) 失败: {e}", exc_info=True)
+                        all_image_data_saved = False
+                elif fields[image_type]:
+                    logger.warning(f"图像 {idx} 的 {image_type} 数据格式无效，跳过保存。")
+                elif isinstance(incoming_refs.get(image_type), dict):
+                    # 前端没有图像数据但带有引用：图像未变化，沿用已有文件
+                    ref = incoming_refs[image_type]
+                    if get_session_image_path(session_name, ref.get('hash'))[0]:
+                        image_refs[image_type] = {"hash": ref['hash'], "mime": ref.get('mime', 'image/png')}
+                    else:
+                        logger.warning(f"图像 {idx} 的 {image_type} 引用在会话中不存在，已忽略。")
+                        all_image_data_saved = False
 
-            # 提取并保存 Original Image Data
-            original_b64 = None
-            if img_state.get('originalDataURL'):
-                try:
-                    original_b64 = img_state['originalDataURL'].split(',', 1)[1]
-                except IndexError:
-                    logger.warning(f"图像 {idx} 的 originalDataURL 格式无效，跳过保存。")
-                if not _save_image_data(session_folder, idx, 'original', original_b64):
-                    all_image_data_saved = False
-            del image_meta['originalDataURL'] # 从元数据中移除
-
-            # 提取并保存 Translated Image Data
-            translated_b64 = None
-            if img_state.get('translatedDataURL'):
-                try:
-                    translated_b64 = img_state['translatedDataURL'].split(',', 1)[1]
-                except IndexError:
-                    logger.warning(f"图像 {idx} 的 translatedDataURL 格式无效，跳过保存。")
-                if not _save_image_data(session_folder, idx, 'translated', translated_b64):
-                    all_image_data_saved = False
-            del image_meta['translatedDataURL'] # 从元数据中移除
-
-            # 提取并保存 Clean Image Data
-            clean_b64 = img_state.get('cleanImageData') # 假设这个已经是纯 Base64
-            if not _save_image_data(session_folder, idx, 'clean', clean_b64):
-                all_image_data_saved = False
-            if 'cleanImageData' in image_meta:
-                 del image_meta['cleanImageData'] # 从元数据中移除
-
-            # (可选) 可以在 image_meta 中添加标记，指示哪些文件被保存了
-            image_meta['hasOriginalData'] = bool(original_b64)
-            image_meta['hasTranslatedData'] = bool(translated_b64)
-            image_meta['hasCleanData'] = bool(clean_b64)
-
+            image_meta['imageRefs'] = image_refs
             metadata_to_save["images_meta"].append(image_meta)
 
         if not all_image_data_saved:
             logger.warning(f"会话 '{session_name}': 部分图像数据保存失败。元数据仍会保存。")
-            # 这里可以选择是否继续保存元数据，或者直接返回 False
-            # return False # 如果希望任何图像保存失败都导致整个会话保存失败
 
-        # 4. 保存元数据 JSON 文件
+        # 4. 保存元数据 JSON 文件 (先写临时文件再替换)
         metadata_filepath = os.path.join(session_folder, METADATA_FILENAME)
         try:
-            with open(metadata_filepath, 'w', encoding='utf-8') as f:
+            tmp_path = metadata_filepath + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
                 json.dump(metadata_to_save, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, metadata_filepath)
             logger.info(f"成功保存会话元数据: {metadata_filepath}")
         except IOError as e:
             logger.error(f"保存会话元数据文件失败: {metadata_filepath} - {e}", exc_info=True)
@@ -223,31 +307,136 @@ def save_session(session_name, session_data):
              logger.error(f"写入会话元数据时发生未知错误: {metadata_filepath} - {e}", exc_info=True)
              return False
 
-        logger.info(f"会话 '{session_name}' 已成功保存到: {session_folder}")
+        # 5. 清理不再被引用的图像文件和 v1 格式遗留的 .b64 文件
+        _remove_unreferenced_files(session_folder, metadata_to_save["images_meta"])
+
+        logger.info(f"会话 '{session_name}' 已成功保存到: {session_folder} (写入 {written_count} 张图像，{skipped_count} 张未变化已跳过)")
         return True
 
     except Exception as e:
         logger.error(f"保存会话 '{session_name}' 时发生未知错误: {e}", exc_info=True)
-        # 尝试清理可能已创建的文件夹/文件
-        try:
-            if os.path.exists(session_folder):
-                shutil.rmtree(session_folder)
-        except Exception as cleanup_e:
-            logger.error(f"清理失败的会话文件夹时出错: {session_folder} - {cleanup_e}")
         return False
 
-def load_session(session_name):
+def _remove_unreferenced_files(session_folder, images_meta):
+    """删除 images/ 中不再被元数据引用的图像，以及 v1 格式的 .b64 文件。"""
+    referenced = set()
+    for image_meta in images_meta:
+        for ref in (image_meta.get('imageRefs') or {}).values():
+            referenced.add(_image_filename(ref['hash'], ref.get('mime')))
+    image_dir = _get_image_dir(session_folder)
+    try:
+        if os.path.isdir(image_dir):
+            for filename in os.listdir(image_dir):
+                if filename not in referenced:
+                    os.remove(os.path.join(image_dir, filename))
+        for filename in os.listdir(session_folder):
+            if filename.endswith(IMAGE_DATA_EXTENSION):
+                os.remove(os.path.join(session_folder, filename))
+    except OSError as e:
+        logger.warning(f"清理会话目录中的旧图像文件失败: {session_folder} - {e}")
+
+def _read_session_meta(session_folder):
+    metadata_filepath = os.path.join(session_folder, METADATA_FILENAME)
+    with open(metadata_filepath, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _get_format_version(session_meta_data):
+    return session_meta_data.get("metadata", {}).get("format_version", 1)
+
+def migrate_session_to_v2(session_name):
+    """
+    把 v1 格式 (每张图像一个 Base64 文本文件) 的会话原地转换为 v2 格式。
+    转换失败时保留原有文件不变。
+
+    Returns:
+        bool: 转换成功或会话已经是 v2 格式时返回 True。
+    """
+    session_folder = _get_session_path(session_name)
+    if not session_folder or not os.path.isdir(session_folder):
+        return False
+    try:
+        session_meta_data = _read_session_meta(session_folder)
+        if _get_format_version(session_meta_data) >= SESSION_FORMAT_VERSION:
+            return True
+
+        logger.info(f"开始把会话 '{session_name}' 迁移到 v{SESSION_FORMAT_VERSION} 格式...")
+        flag_names = {'original': 'hasOriginalData', 'translated': 'hasTranslatedData', 'clean': 'hasCleanData'}
+        new_images_meta = []
+        for idx, img_meta in enumerate(session_meta_data.get("images_meta", [])):
+            image_meta = img_meta.copy()
+            image_refs = {}
+            for image_type in IMAGE_TYPES:
+                has_data = image_meta.pop(flag_names[image_type], False)
+                if not has_data:
+                    continue
+                data, mime = _decode_image_field(_load_image_data(session_folder, idx, image_type))
+                if data is None:
+                    logger.warning(f"会话 '{session_name}', 图像 {idx}: v1 的 {image_type} 数据缺失或无效，迁移时跳过。")
+                    continue
+                image_refs[image_type], _ = _store_image_bytes(session_folder, data, mime)
+            image_meta['imageRefs'] = image_refs
+            new_images_meta.append(image_meta)
+
+        session_meta_data["images_meta"] = new_images_meta
+        session_meta_data.setdefault("metadata", {})["format_version"] = SESSION_FORMAT_VERSION
+        metadata_filepath = os.path.join(session_folder, METADATA_FILENAME)
+        tmp_path = metadata_filepath + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(session_meta_data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, metadata_filepath)
+        _remove_unreferenced_files(session_folder, new_images_meta)
+        logger.info(f"会话 '{session_name}' 已迁移到 v{SESSION_FORMAT_VERSION} 格式")
+        return True
+    except Exception as e:
+        logger.error(f"迁移会话 '{session_name}' 失败，将继续以 v1 格式读取: {e}", exc_info=True)
+        return False
+
+def _load_session_v1(session_name, session_folder, session_meta_data):
+    """按 v1 格式 (Base64 文本文件) 加载会话，仅在迁移失败时使用。"""
+    session_data_to_return = {
+        "ui_settings": session_meta_data.get("ui_settings", {}),
+        "images": [],
+        "currentImageIndex": session_meta_data.get("currentImageIndex", -1)
+    }
+    fields = (('original', 'hasOriginalData', 'originalDataURL', True),
+              ('translated', 'hasTranslatedData', 'translatedDataURL', True),
+              ('clean', 'hasCleanData', 'cleanImageData', False))
+    for idx, img_meta in enumerate(session_meta_data.get("images_meta", [])):
+        loaded_img_state = img_meta.copy()
+        for image_type, flag_name, field_name, as_data_url in fields:
+            loaded_img_state[field_name] = None
+            if img_meta.get(flag_name):
+                b64 = _load_image_data(session_folder, idx, image_type)
+                if b64 is None:
+                    logger.warning(f"会话 '{session_name}', 图像 {idx}: 标记有 {image_type} 数据但文件加载失败。")
+                elif as_data_url:
+                    loaded_img_state[field_name] = f"data:image/png;base64,{b64}"
+                else:
+                    loaded_img_state[field_name] = b64
+            loaded_img_state.pop(flag_name, None)
+        session_data_to_return["images"].append(loaded_img_state)
+    return session_data_to_return
+
+def build_session_image_url(session_name, image_hash):
+    """生成会话图像端点的 URL (前端可直接用作 <img> 的 src)。"""
+    from urllib.parse import quote
+    return f"/api/sessions/image?name={quote(str(session_name))}&hash={image_hash}"
+
+def load_session(session_name, lazy=False):
     """
-    从磁盘加载指定的会话状态。
+    从磁盘加载指定的会话状态。v1 格式的会话会先自动迁移到 v2。
 
     Args:
         session_name (str): 要加载的会话名称。
+        lazy (bool): 为 True 时只加载元数据，不读取图像：每张图像返回
+                     originalImageUrl/translatedImageUrl/cleanImageUrl (图像端点地址) 和 imageRefs，
+                     DataURL 字段为 None，前端按需通过图像端点获取。
 
     Returns:
         dict or None: 包含完整会话状态的字典 (结构与 save_session 接收的 session_data 类似)，
                       如果会话不存在或加载失败则返回 None。
     """
-    logger.info(f"开始加载会话: {session_name}")
+    logger.info(f"开始加载会话: {session_name} (延迟加载图像: {lazy})")
     session_folder = _get_session_path(session_name)
     if not session_folder or not os.path.isdir(session_folder):
         logger.error(f"会话文件夹未找到或不是有效目录: {session_folder}")
@@ -259,9 +448,13 @@ def load_session(session_name):
         return None
 
     try:
-        # 1. 加载元数据 JSON 文件
-        with open(metadata_filepath, 'r', encoding='utf-8') as f:
-            session_meta_data = json.load(f)
+        # 1. 加载元数据 JSON 文件 (v1 会话先迁移)
+        session_meta_data = _read_session_meta(session_folder)
+        if _get_format_version(session_meta_data) < SESSION_FORMAT_VERSION:
+            if migrate_session_to_v2(session_name):
+                session_meta_data = _read_session_meta(session_folder)
+            else:
+                return _load_session_v1(session_name, session_folder, session_meta_data)
         logger.info(f"成功加载会话元数据: {metadata_filepath}")
 
         # 2. 准备要返回的完整会话数据结构
@@ -269,58 +462,34 @@ def load_session(session_name):
             "ui_settings": session_meta_data.get("ui_settings", {}),
             "images": [], # 稍后填充
             "currentImageIndex": session_meta_data.get("currentImageIndex", -1)
-            # 可以考虑把 metadata 也包含进去，供前端显示
-            # "metadata": session_meta_data.get("metadata", {})
         }
 
-        images_meta = session_meta_data.get("images_meta", [])
         all_images_loaded = True
-
-        # 3. 遍历图片元数据，加载对应的 Base64 数据
-        for idx, img_meta in enumerate(images_meta):
+        # 3. 遍历图片元数据，按引用加载图像 (或只返回图像 URL)
+        for idx, img_meta in enumerate(session_meta_data.get("images_meta", [])):
             loaded_img_state = img_meta.copy() # 复制元数据
-
-            # 加载 Original Image Data (如果元数据标记存在)
-            if img_meta.get('hasOriginalData'):
-                original_b64 = _load_image_data(session_folder, idx, 'original')
-                if original_b64 is not None:
-                    loaded_img_state['originalDataURL'] = f"data:image/png;base64,{original_b64}" # 加上前缀
-                else:
-                    logger.warning(f"会话 '{session_name}', 图像 {idx}: 标记有原始数据但文件加载失败。")
-                    loaded_img_state['originalDataURL'] = None # 明确设为 None
+            image_refs = img_meta.get('imageRefs') or {}
+            loaded_img_state['originalDataURL'] = None
+            loaded_img_state['translatedDataURL'] = None
+            loaded_img_state['cleanImageData'] = None
+
+            for image_type, ref in image_refs.items():
+                if lazy:
+                    loaded_img_state[f'{image_type}ImageUrl'] = build_session_image_url(session_name, ref['hash'])
+                    continue
+                data = _read_image_ref(session_folder, ref)
+                if data is None:
+                    logger.warning(f"会话 '{session_name}', 图像 {idx}: {image_type} 图像文件加载失败。")
                     all_images_loaded = False
-            else:
-                loaded_img_state['originalDataURL'] = None
-
-            # 加载 Translated Image Data
-            if img_meta.get('hasTranslatedData'):
-                translated_b64 = _load_image_data(session_folder, idx, 'translated')
-                if translated_b64 is not None:
-                    loaded_img_state['translatedDataURL'] = f"data:image/png;base64,{translated_b64}"
-                else:
-                    logger.warning(f"会话 '{session_name}', 图像 {idx}: 标记有翻译数据但文件加载失败。")
-                    loaded_img_state['translatedDataURL'] = None
-                    all_images_loaded = False
-            else:
-                 loaded_img_state['translatedDataURL'] = None
-
-            # 加载 Clean Image Data
-            if img_meta.get('hasCleanData'):
-                clean_b64 = _load_image_data(session_folder, idx, 'clean')
-                if clean_b64 is not None:
-                    loaded_img_state['cleanImageData'] = clean_b64 # 这个已经是纯 Base64
+                    continue
+                b64 = base64.b64encode(data).decode('ascii')
+                if image_type == 'clean':
+                    loaded_img_state['cleanImageData'] = b64 # 干净背景使用纯 Base64
                 else:
-                    logger.warning(f"会话 '{session_name}', 图像 {idx}: 标记有干净背景数据但文件加载失败。")
-                    loaded_img_state['cleanImageData'] = None
-                    all_images_loaded = False
-            else:
-                loaded_img_state['cleanImageData'] = None
-
-            # 移除辅助标记
-            loaded_img_state.pop('hasOriginalData', None)
-            loaded_img_state.pop('hasTranslatedData', None)
-            loaded_img_state.pop('hasCleanData', None)
+                    loaded_img_state[f'{image_type}DataURL'] = f"data:{ref.get('mime', 'image/png')};base64,{b64}"
 
+            if not lazy:
+                loaded_img_state.pop('imageRefs', None)
             session_data_to_return["images"].append(loaded_img_state)
 
         if not all_images_loaded:
@@ -378,7 +547,8 @@ def list_sessions():
                             "name": meta_data.get("metadata", {}).get("name", item_name), # 优先用元数据里的名字
                             "saved_at": meta_data.get("metadata", {}).get("saved_at", "未知时间"),
                             "image_count": len(meta_data.get("images_meta", [])),
-                            "version": meta_data.get("metadata", {}).get("translator_version", "未知版本")
+                            "version": meta_data.get("metadata", {}).get("translator_version", "未知版本"),
+                            "format_version": _get_format_version(meta_data)
                         }
                         sessions_list.append(session_info)
                     except (json.JSONDecodeError, IOError) as e:
@@ -559,12 +729,9 @@ if __name__ == '__main__':
         session_path = _get_session_path(test_session_name)
         print(f"  - 文件夹: {session_path}")
         print(f"  - 元数据文件: {os.path.join(session_path, METADATA_FILENAME)}")
-        print(f"  - 图像文件 (示例):")
-        print(f"    - {os.path.join(session_path, 'image_0_original' + IMAGE_DATA_EXTENSION)}")
-        print(f"    - {os.path.join(session_path, 'image_0_translated' + IMAGE_DATA_EXTENSION)}")
-        print(f"    - {os.path.join(session_path, 'image_0_clean' + IMAGE_DATA_EXTENSION)}")
-        print(f"    - {os.path.join(session_path, 'image_1_original' + IMAGE_DATA_EXTENSION)}")
-        # ... 应该没有 image_1_translated 和 image_1_clean
+        print(f"  - 图像目录: {_get_image_dir(session_path)}")
+        for filename in sorted(os.listdir(_get_image_dir(session_path))):
+            print(f"    - {filename}")
     else:
         print("保存失败。")
 
@@ -10,6 +10,11 @@ from src.shared import constants # 导入常量
 from src.interfaces.baidu_translate_interface import baidu_translate, BaiduTranslateInterface # 导入百度翻译接口
 from src.interfaces.youdao_translate_interface import YoudaoTranslateInterface # 导入有道翻译接口
 import re # 增加re模块导入
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from src.shared.rate_limiter import acquire_rate_limit
+from src.core.translation_memory import translate_with_memory
 
 # 添加项目根目录到 Python 路径以解决导入问题
 root_dir = str(Path(__file__).resolve().parent.parent.parent)
@@ -43,55 +48,39 @@ youdao_translate = YoudaoTranslateInterface()
 logger = logging.getLogger("CoreTranslation")
 # logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
-# --- rpm Limiting Globals for Translation ---
-_translation_rpm_last_reset_time_container = [0]
-_translation_rpm_request_count_container = [0]
+# --- 连接池: 按 (服务商, base_url, api_key) 复用客户端 ---
+_openai_clients = {}
+_http_sessions = {}
+_client_pool_lock = threading.Lock()
 # ------------------------------------------
 
-def _enforce_rpm_limit(rpm_limit: int, service_name: str, last_reset_time_ref: list, request_count_ref: list):
+def _get_openai_client(model_provider, base_url, api_key):
     """
-    执行rpm（每分钟请求数）限制检查和等待。
-    使用列表作为引用类型来修改外部的 last_reset_time 和 request_count。
-
-    Args:
-        rpm_limit (int): 每分钟最大请求数。如果为0或负数，则不限制。
-        service_name (str): 服务名称，用于日志记录。
-        last_reset_time_ref (list): 包含上次重置时间的列表 (e.g., [timestamp])。
-        request_count_ref (list): 包含当前请求计数的列表 (e.g., [count])。
+    获取 (或创建) 共享的 OpenAI 兼容客户端。
+    OpenAI 客户端内部持有 httpx 连接池且线程安全，复用它可以避免每次请求重新建立 TLS 连接。
     """
-    if rpm_limit <= 0:
-        return # 无限制
-
-    current_time = time.time()
-
-    # 检查是否需要重置窗口
-    if current_time - last_reset_time_ref[0] >= 60:
-        logger.info(f"rpm: {service_name} - 1分钟窗口已过，重置计数器和时间。")
-        last_reset_time_ref[0] = current_time
-        request_count_ref[0] = 0
-
-    # 检查是否达到rpm限制
-    if request_count_ref[0] >= rpm_limit:
-        time_to_wait = 60 - (current_time - last_reset_time_ref[0])
-        if time_to_wait > 0:
-            logger.info(f"rpm: {service_name} - 已达到每分钟 {rpm_limit} 次请求上限。将等待 {time_to_wait:.2f} 秒...")
-            time.sleep(time_to_wait)
-            # 等待结束后，这是一个新的窗口
-            last_reset_time_ref[0] = time.time() # 更新为当前时间
-            request_count_ref[0] = 0
-        else:
-            # 理论上不应该到这里，因为上面的窗口重置逻辑会处理
-            logger.info(f"rpm: {service_name} - 窗口已过但计数未重置，立即重置。")
-            last_reset_time_ref[0] = current_time
-            request_count_ref[0] = 0
-    
-    # 如果是窗口内的第一次请求，设置窗口开始时间
-    if request_count_ref[0] == 0 and last_reset_time_ref[0] == 0: # 或者 last_reset_time_ref[0] 远早于 current_time - 60
-        last_reset_time_ref[0] = current_time
-        logger.info(f"rpm: {service_name} - 启动新的1分钟请求窗口。")
+    key = (model_provider, base_url, api_key)
+    with _client_pool_lock:
+        client = _openai_clients.get(key)
+        if client is None:
+            client = OpenAI(api_key=api_key, base_url=base_url)
+            _openai_clients[key] = client
+            logger.debug(f"创建新的 OpenAI 兼容客户端: {model_provider} ({base_url})")
+        return client
+
+def _get_http_session(model_provider, base_url):
+    """获取 (或创建) 共享的 requests.Session，用于非 OpenAI 兼容的 HTTP 服务 (keep-alive 连接复用)。"""
+    key = (model_provider, base_url)
+    with _client_pool_lock:
+        session = _http_sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, constants.DEFAULT_TRANSLATION_MAX_WORKERS))
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _http_sessions[key] = session
+        return session
 
-    request_count_ref[0] += 1
-    logger.debug(f"rpm: {service_name} - 当前窗口请求计数: {request_count_ref[0]}/{rpm_limit if rpm_limit > 0 else '无限制'}")
 
 # 添加安全JSON解析函数
 def _safely_extract_from_json(json_str, field_name):
@@ -192,12 +181,11 @@ def translate_single_text(text, target_language, model_provider,
     translated_text = "翻译失败: 未知错误"
 
     # --- rpm Enforcement ---
-    # 使用容器来传递引用
-    _enforce_rpm_limit(
+    # 同一服务商/地址/密钥的所有请求共享一个令牌桶
+    acquire_rate_limit(
+        ('translation', model_provider, custom_base_url, api_key),
         rpm_limit_translation,
-        f"Translation ({model_provider})",
-        _translation_rpm_last_reset_time_container,
-        _translation_rpm_request_count_container
+        f"Translation ({model_provider})"
     )
     # ---------------------
 
@@ -207,7 +195,7 @@ def translate_single_text(text, target_language, model_provider,
                 # SiliconFlow (硅基流动) 使用 OpenAI 兼容 API
                 if not api_key:
                     raise ValueError("SiliconFlow需要API Key")
-                client = OpenAI(api_key=api_key, base_url="https://api.siliconflow.cn/v1")
+                client = _get_openai_client(model_provider, "https://api.siliconflow.cn/v1", api_key)
                 response = client.chat.completions.create(
                     model=model_name,
                     messages=[
@@ -221,7 +209,7 @@ def translate_single_text(text, target_language, model_provider,
                 # DeepSeek 也使用 OpenAI 兼容 API
                 if not api_key:
                     raise ValueError("DeepSeek需要API Key")
-                client = OpenAI(api_key=api_key, base_url="https://api.deepseek.com/v1")
+                client = _get_openai_client(model_provider, "https://api.deepseek.com/v1", api_key)
                 response = client.chat.completions.create(
                     model=model_name,
                     messages=[
@@ -234,7 +222,7 @@ def translate_single_text(text, target_language, model_provider,
             elif model_provider == 'volcano':
                 # 火山引擎，也使用 OpenAI 兼容 API
                 if not api_key: raise ValueError("火山引擎需要 API Key")
-                client = OpenAI(api_key=api_key, base_url="https://ark.cn-beijing.volces.com/api/v3")
+                client = _get_openai_client(model_provider, "https://ark.cn-beijing.volces.com/api/v3", api_key)
                 response = client.chat.completions.create(
                     model=model_name,
                     messages=[
@@ -271,7 +259,7 @@ def translate_single_text(text, target_language, model_provider,
                     "media": "text"
                 }
                 
-                response = requests.post(url, headers=headers, json=payload)
+                response = _get_http_session(model_provider, url).post(url, headers=headers, json=payload)
                 response.raise_for_status()
                 result = response.json()
                 if "target" in result and len(result["target"]) > 0:
@@ -290,7 +278,7 @@ def translate_single_text(text, target_language, model_provider,
                         {"role": "user", "content": f"将下面的日文文本翻译成中文：{text}"}
                     ]
                 }
-                response = requests.post(url, headers=headers, json=payload)
+                response = _get_http_session(model_provider, url).post(url, headers=headers, json=payload)
                 response.raise_for_status()
                 result = response.json()
                 translated_text = result['choices'][0]['message']['content'].strip()
@@ -305,7 +293,7 @@ def translate_single_text(text, target_language, model_provider,
                     ],
                     "stream": False
                 }
-                response = requests.post(url, json=payload)
+                response = _get_http_session(model_provider, url).post(url, json=payload)
                 response.raise_for_status()
                 result = response.json()
                 if "message" in result and "content" in result["message"]:
@@ -353,9 +341,10 @@ def translate_single_text(text, target_language, model_provider,
                 if not model_name:
                     raise ValueError("Gemini 需要模型名称 (例如 gemini-1.5-flash-latest)")
 
-                client = OpenAI(
-                    api_key=api_key,
-                    base_url="https://generativelanguage.googleapis.com/v1beta/openai/" # 根据教程
+                client = _get_openai_client(
+                    model_provider,
+                    "https://generativelanguage.googleapis.com/v1beta/openai/", # 根据教程
+                    api_key
                 )
                 
                 gemini_messages = []
@@ -384,7 +373,7 @@ def translate_single_text(text, target_language, model_provider,
                     raise ValueError("自定义 OpenAI 兼容服务需要 Base URL")
 
                 logger.info(f"使用自定义 OpenAI 兼容服务: Base URL='{custom_base_url}', Model='{model_name}'")
-                client = OpenAI(api_key=api_key, base_url=custom_base_url) # 使用 custom_base_url
+                client = _get_openai_client(model_provider, custom_base_url, api_key) # 使用 custom_base_url
                 response = client.chat.completions.create(
                     model=model_name,
                     messages=[
@@ -433,6 +422,251 @@ def translate_single_text(text, target_language, model_provider,
     return translated_text
 
 
+def translate_single_text_with_memory(text, target_language, model_provider,
+                                      api_key=None, model_name=None, prompt_content=None,
+                                      use_json_format=False, custom_base_url=None,
+                                      rpm_limit_translation: int = constants.DEFAULT_rpm_TRANSLATION):
+    """
+    带翻译记忆的 translate_single_text：命中缓存时直接返回，否则翻译并写入缓存。
+    参数与返回值同 translate_single_text。
+    """
+    return translate_with_memory(
+        [text],
+        lambda pending_texts: [translate_single_text(
+            pending_texts[0], target_language, model_provider,
+            api_key=api_key, model_name=model_name, prompt_content=prompt_content,
+            use_json_format=use_json_format, custom_base_url=custom_base_url,
+            rpm_limit_translation=rpm_limit_translation
+        )],
+        target_language, model_provider, model_name, prompt_content, use_json_format, custom_base_url
+    )[0]
+
+# --- 整页批量翻译 (一次请求翻译一页的所有气泡) ---
+# 支持批量模式的 OpenAI 兼容服务商及其 Base URL (自定义服务商使用用户提供的 Base URL)
+_BATCH_PROVIDER_BASE_URLS = {
+    'siliconflow': "https://api.siliconflow.cn/v1",
+    'deepseek': "https://api.deepseek.com/v1",
+    'volcano': "https://ark.cn-beijing.volces.com/api/v3",
+    'gemini': "https://generativelanguage.googleapis.com/v1beta/openai/",
+}
+
+def supports_batch_translation(model_provider, custom_base_url=None):
+    """判断服务商是否支持整页批量翻译模式。"""
+    if model_provider == constants.CUSTOM_OPENAI_PROVIDER_ID:
+        return bool(custom_base_url)
+    return model_provider in _BATCH_PROVIDER_BASE_URLS
+
+def _strip_code_fence(content):
+    """去掉模型可能包裹在输出外层的 ```json ... ``` 代码块标记。"""
+    content = content.strip()
+    match = re.match(r'^```[a-zA-Z]*\s*(.*?)\s*```$', content, re.DOTALL)
+    return match.group(1) if match else content
+
+def _parse_batch_translation_response(content, expected_ids):
+    """
+    解析整页批量翻译的响应。
+
+    优先按 JSON 解析 ({"translations": [{"id": 1, "translated_text": "..."}]} 或直接的数组)，
+    失败时逐项使用 _safely_extract_from_json 的同款正则兜底，最后尝试 "1. 译文" 形式的编号行。
+
+    Args:
+        content (str): 模型返回的原始文本。
+        expected_ids (list): 本次请求中发送的编号列表。
+
+    Returns:
+        dict: {编号: 译文}，只包含成功解析且编号在 expected_ids 中的项。
+    """
+    expected = set(expected_ids)
+    results = {}
+    content = _strip_code_fence(content or "")
+
+    def _collect(items):
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            try:
+                item_id = int(item.get('id'))
+            except (TypeError, ValueError):
+                continue
+            text = item.get('translated_text')
+            if item_id in expected and isinstance(text, str):
+                results[item_id] = text.strip()
+
+    # 1. 标准 JSON
+    try:
+        data = json.loads(content)
+        if isinstance(data, dict):
+            data = data.get('translations', [])
+        if isinstance(data, list):
+            if data and all(isinstance(x, str) for x in data) and len(data) == len(expected_ids):
+                # 模型只返回了字符串数组，按发送顺序对应
+                for item_id, text in zip(expected_ids, data):
+                    results[item_id] = text.strip()
+            else:
+                _collect(data)
+        if results:
+            return results
+    except (json.JSONDecodeError, TypeError, AttributeError):
+        pass
+
+    # 2. JSON 不完整 (例如被截断)，逐个对象提取
+    for obj_str in re.findall(r'\{[^{}]*\}', content, re.DOTALL):
+        id_match = re.search(r'"id"\s*:\s*"?(\d+)"?', obj_str)
+        if not id_match:
+            continue
+        item_id = int(id_match.group(1))
+        if item_id in expected and '"translated_text"' in obj_str:
+            results[item_id] = _safely_extract_from_json(obj_str, "translated_text").strip()
+    if results:
+        return results
+
+    # 3. 编号行: "1. 译文" / "1: 译文" / "[1] 译文"
+    for line in content.splitlines():
+        line_match = re.match(r'^\s*\[?(\d+)[\].:：、)]\s*(.*)$', line)
+        if line_match:
+            item_id = int(line_match.group(1))
+            if item_id in expected:
+                results[item_id] = line_match.group(2).strip()
+    return results
+
+def _is_config_error(error):
+    """凭证或配置错误 (401/403/404，或错误信息提到 API Key、认证、Base URL)，重试和逐条请求都不会成功。"""
+    if getattr(error, 'status_code', None) in (401, 403, 404):
+        return True
+    error_message = str(error)
+    return ("API key" in error_message or "authentication" in error_message.lower()
+            or "Base URL" in error_message)
+
+def _request_batch_translation(items, target_language, model_provider, api_key, model_name,
+                               system_prompt, custom_base_url, rpm_limit_translation):
+    """
+    发送一次整页批量翻译请求。
+
+    Args:
+        items (list): [(编号, 原文), ...]
+
+    Returns:
+        dict: {编号: 译文}
+    """
+    base_url = custom_base_url if model_provider == constants.CUSTOM_OPENAI_PROVIDER_ID else _BATCH_PROVIDER_BASE_URLS[model_provider]
+    user_content = json.dumps([{"id": item_id, "text": text} for item_id, text in items], ensure_ascii=False)
+
+    acquire_rate_limit(
+        ('translation', model_provider, custom_base_url, api_key),
+        rpm_limit_translation,
+        f"Translation ({model_provider})"
+    )
+    client = _get_openai_client(model_provider, base_url, api_key)
+    response = client.chat.completions.create(
+        model=model_name,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_content},
+        ]
+    )
+    content = response.choices[0].message.content or ""
+    logger.debug(f"整页批量翻译原始响应 (前200字符): {content[:200]}")
+    return _parse_batch_translation_response(content, [item_id for item_id, _ in items])
+
+def translate_text_list_batch(texts, target_language, model_provider,
+                              api_key=None, model_name=None, prompt_content=None,
+                              use_json_format=False, custom_base_url=None,
+                              rpm_limit_translation: int = constants.DEFAULT_rpm_TRANSLATION,
+                              use_translation_memory: bool = True):
+    """
+    整页批量翻译：把一页所有气泡的原文以编号 JSON 数组的形式放进一次请求，
+    再把返回的结果按编号拆回每个气泡。模型能看到上下文，且每页只消耗一次请求配额。
+
+    返回的条目缺失时，只针对缺失的编号重新请求；多次重试后仍缺失的条目逐条调用
+    translate_single_text 兜底。启用翻译记忆时只有未命中的气泡会进入批量请求。
+    参数与 translate_text_list 相同。
+
+    Returns:
+        list: 与输入顺序一致的译文列表。
+    """
+    if not supports_batch_translation(model_provider, custom_base_url):
+        logger.info(f"服务商 {model_provider} 不支持整页批量翻译，回退到逐条翻译")
+        return translate_text_list(texts, target_language, model_provider, api_key, model_name, prompt_content,
+                                   use_json_format=use_json_format, custom_base_url=custom_base_url,
+                                   rpm_limit_translation=rpm_limit_translation,
+                                   use_translation_memory=use_translation_memory)
+    if not api_key:
+        raise ValueError(f"{model_provider} 需要 API Key")
+    if not model_name:
+        raise ValueError(f"{model_provider} 需要模型名称")
+
+    if use_translation_memory:
+        return translate_with_memory(
+            texts,
+            lambda pending_texts: translate_text_list_batch(
+                pending_texts, target_language, model_provider, api_key, model_name, prompt_content,
+                use_json_format=use_json_format, custom_base_url=custom_base_url,
+                rpm_limit_translation=rpm_limit_translation, use_translation_memory=False
+            ),
+            target_language, model_provider, model_name, prompt_content, use_json_format, custom_base_url
+        )
+
+    translated_texts = [""] * len(texts)
+    # 编号从 1 开始，对模型更自然；空文本不发送
+    pending = {i + 1: text for i, text in enumerate(texts) if text and text.strip()}
+    if not pending:
+        return translated_texts
+
+    # 组合提示词：用户提示词 (翻译风格) + 批量输出格式要求
+    # 单条 JSON 提示词要求输出单个对象，与批量格式冲突，因此 JSON 模式下改用普通默认提示词
+    base_prompt = prompt_content
+    if not base_prompt or (use_json_format and '"translated_text"' in base_prompt and '"translations"' not in base_prompt):
+        base_prompt = constants.DEFAULT_PROMPT
+    base_prompt = base_prompt.replace('{target_language}', str(target_language)).replace('{text}', '')
+    system_prompt = f"{base_prompt}\n\n{constants.DEFAULT_BATCH_TRANSLATE_JSON_PROMPT}"
+
+    logger.info(f"开始整页批量翻译 {len(pending)} 个文本片段 (使用 {model_provider})")
+    max_rounds = constants.BATCH_TRANSLATION_MAX_ROUNDS
+    request_error = None # 最后一轮请求本身失败的错误信息 (而不是返回内容缺失或格式错误)
+    for round_index in range(max_rounds):
+        items = sorted(pending.items())
+        try:
+            results = _request_batch_translation(
+                items, target_language, model_provider, api_key, model_name,
+                system_prompt, custom_base_url, rpm_limit_translation
+            )
+        except Exception as e:
+            request_error = str(e)
+            logger.error(f"整页批量翻译请求失败 (第 {round_index + 1}/{max_rounds} 轮): {request_error}", exc_info=True)
+            if _is_config_error(e):
+                break # 凭证或配置错误，不重试
+            if round_index + 1 < max_rounds:
+                time.sleep(1)
+            continue
+
+        request_error = None
+        for item_id, text in results.items():
+            translated_texts[item_id - 1] = text
+            pending.pop(item_id, None)
+        if not pending:
+            break
+        logger.warning(f"整页批量翻译返回条目缺失 {len(pending)} 个，编号: {sorted(pending)}，将只重新请求缺失部分")
+
+    if pending and request_error is not None:
+        # 请求本身失败 (凭证、配置或服务不可用)，逐条请求也会以同样的原因失败，直接返回错误
+        logger.error(f"整页批量翻译失败，{len(pending)} 个条目不再逐条重试: {request_error}")
+        for item_id in pending:
+            translated_texts[item_id - 1] = f"翻译失败: {request_error}"
+        return translated_texts
+
+    # 多轮后仍缺失 (解析不到或格式错误) 的条目，逐条翻译兜底
+    for item_id, text in sorted(pending.items()):
+        logger.warning(f"编号 {item_id} 批量翻译失败，改为单条翻译")
+        translated_texts[item_id - 1] = translate_single_text(
+            text, target_language, model_provider,
+            api_key=api_key, model_name=model_name, prompt_content=prompt_content,
+            use_json_format=use_json_format, custom_base_url=custom_base_url,
+            rpm_limit_translation=rpm_limit_translation
+        )
+
+    logger.info("整页批量翻译完成。")
+    return translated_texts
+
 # 添加测试用的 Mock 翻译提供商
 def translate_with_mock(text, target_language, api_key=None, model_name=None, prompt_content=None):
     """只用于测试的模拟翻译提供商"""
@@ -456,7 +690,9 @@ def translate_with_mock(text, target_language, api_key=None, model_name=None, pr
 def translate_text_list(texts, target_language, model_provider, 
                         api_key=None, model_name=None, prompt_content=None, 
                         use_json_format=False, custom_base_url=None,
-                        rpm_limit_translation: int = constants.DEFAULT_rpm_TRANSLATION): # <--- 新增rpm参数
+                        rpm_limit_translation: int = constants.DEFAULT_rpm_TRANSLATION, # <--- 新增rpm参数
+                        max_workers: int = constants.DEFAULT_TRANSLATION_MAX_WORKERS,
+                        use_translation_memory: bool = True):
     """
     翻译文本列表中的每一项。
 
@@ -470,6 +706,9 @@ def translate_text_list(texts, target_language, model_provider,
         use_json_format (bool): 是否期望并解析JSON格式的响应。
         custom_base_url (str, optional): 用户自定义的 OpenAI 兼容 API 的 Base URL。
         rpm_limit_translation (int): 翻译服务的每分钟请求数限制。
+        max_workers (int): 并发翻译的最大线程数；1 表示逐条串行翻译。
+                           rpm 限制由共享令牌桶保证，与并发数无关。
+        use_translation_memory (bool): 是否先查询翻译记忆缓存，只翻译未命中的文本。
     Returns:
         list: 包含翻译后文本的列表，顺序与输入列表一致。失败的项包含错误信息。
     """
@@ -491,21 +730,44 @@ def translate_text_list(texts, target_language, model_provider,
                 prompt_content=prompt_content
             )
             translated_texts.append(translated)
-    else:    
-        # 正常翻译流程
-        for i, text in enumerate(texts):
-            translated = translate_single_text(
-                text,
-                target_language,
-                model_provider,
-                api_key=api_key,
-                model_name=model_name,
-                prompt_content=prompt_content,
-                use_json_format=use_json_format,
-                custom_base_url=custom_base_url,
-                rpm_limit_translation=rpm_limit_translation # <--- 传递参数
-            )
-            translated_texts.append(translated)
+        logger.info("批量翻译完成。")
+        return translated_texts
+
+    def _translate(text):
+        return translate_single_text(
+            text,
+            target_language,
+            model_provider,
+            api_key=api_key,
+            model_name=model_name,
+            prompt_content=prompt_content,
+            use_json_format=use_json_format,
+            custom_base_url=custom_base_url,
+            rpm_limit_translation=rpm_limit_translation # <--- 传递参数
+        )
+
+    def _translate_all(pending_texts):
+        # 只有非空文本需要请求服务
+        pending_count = sum(1 for text in pending_texts if text and text.strip())
+        worker_count = min(max(1, int(max_workers or 1)), pending_count)
+        if model_provider in constants.SERIAL_TRANSLATION_PROVIDERS:
+            worker_count = 1 # 这些服务的 QPS 限制很低或接口对象有共享状态，保持串行
+
+        if worker_count <= 1:
+            # 串行翻译流程
+            return [_translate(text) for text in pending_texts]
+        # 并发翻译流程：map 保证结果顺序与输入一致
+        logger.info(f"使用 {worker_count} 个线程并发翻译")
+        with ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix="Translate") as executor:
+            return list(executor.map(_translate, pending_texts))
+
+    if use_translation_memory:
+        translated_texts = translate_with_memory(
+            texts, _translate_all, target_language, model_provider, model_name,
+            prompt_content, use_json_format, custom_base_url
+        )
+    else:
+        translated_texts = _translate_all(texts)
     
     logger.info("批量翻译完成。")
     return translated_texts
@@ -0,0 +1,318 @@
+"""
+翻译记忆 (Translation Memory) 缓存。
+
+以 "规范化原文 + 目标语言 + 服务商 + 模型 + 提示词哈希" 为键，把成功的译文持久化到 SQLite。
+重新处理同一章节 (例如只修改了字体或修复方式) 或遇到 "え？"、"！！" 这类高频短句时，
+直接命中缓存，不再重复请求翻译服务。超出条目上限时按最近使用时间 (LRU) 淘汰。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from src.shared import constants
+from src.shared.path_helpers import resource_path
+
+logger = logging.getLogger("CoreTranslationMemory")
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_source_text(text):
+    """
+    规范化原文，使仅在全半角、首尾空白或换行方式上不同的文本共享同一条缓存。
+
+    Returns:
+        str: NFKC 规范化、合并连续空白并去除首尾空白后的文本。
+    """
+    if not text:
+        return ""
+    text = unicodedata.normalize('NFKC', text)
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+
+def build_cache_key(text, target_language, model_provider, model_name=None,
+                    prompt_content=None, use_json_format=False, custom_base_url=None):
+    """
+    生成缓存键。提示词和模型名只参与哈希，不会以明文存入数据库。
+
+    Returns:
+        str: SHA-256 十六进制摘要。
+    """
+    prompt_hash = hashlib.sha256((prompt_content or '').encode('utf-8')).hexdigest()
+    payload = json.dumps([
+        normalize_source_text(text),
+        target_language or '',
+        model_provider or '',
+        model_name or '',
+        custom_base_url or '',
+        prompt_hash,
+        bool(use_json_format),
+    ], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def hash_model_name(model_name):
+    """
+    模型名的摘要。百度/有道翻译的 "模型名" 字段实际是 appkey / AppSecret，不能明文存入数据库。
+
+    Returns:
+        str or None: SHA-256 十六进制摘要，未提供模型名时为 None。
+    """
+    if not model_name:
+        return None
+    return hashlib.sha256(str(model_name).encode('utf-8')).hexdigest()
+
+
+def is_cacheable_translation(translated_text, source_text=None, model_provider=None):
+    """
+    只缓存成功的译文：失败时 translate_single_text 返回以 "翻译失败" 开头的文本，不缓存。
+    有道翻译出错时原样返回原文，因此这类服务的译文与原文相同时也不缓存；
+    其他服务 (如大模型) 的译文可以与原文相同 ("！！"、"……" 等)，照常缓存。
+    """
+    if not translated_text or not translated_text.strip() or translated_text.startswith("翻译失败"):
+        return False
+    if (source_text is not None and model_provider in constants.TRANSLATION_MEMORY_ECHO_ON_ERROR_PROVIDERS
+            and normalize_source_text(translated_text) == normalize_source_text(source_text)):
+        return False
+    return True
+
+
+class TranslationMemory:
+    """
+    基于 SQLite 的线程安全翻译记忆。
+
+    所有线程共享同一个连接，由锁串行化访问；读写都是单条主键操作，开销远小于一次网络翻译请求。
+    """
+    def __init__(self, db_path, max_entries=constants.TRANSLATION_MEMORY_MAX_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max(1, int(max_entries))
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS translation_memory (
+                cache_key TEXT PRIMARY KEY,
+                source_text TEXT NOT NULL,
+                translated_text TEXT NOT NULL,
+                target_language TEXT,
+                model_provider TEXT,
+                model_name TEXT,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                use_count INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tm_last_used ON translation_memory (last_used)")
+        # 旧版本以明文保存了模型名 (百度/有道为密钥)，打开时替换为摘要
+        self._conn.create_function('tm_hash_model_name', 1, hash_model_name)
+        self._conn.execute(
+            "UPDATE translation_memory SET model_name = tm_hash_model_name(model_name) "
+            "WHERE model_name IS NOT NULL AND (length(model_name) != 64 OR model_name GLOB '*[^0-9a-f]*')"
+        )
+        logger.info(f"翻译记忆已加载: {db_path} (上限 {self.max_entries} 条)")
+
+    def get_many(self, keys):
+        """
+        批量查询缓存。
+
+        Args:
+            keys (list): 缓存键列表 (可包含重复键)。
+
+        Returns:
+            dict: {缓存键: 译文}，只包含命中的键。
+        """
+        unique_keys = list(dict.fromkeys(keys))
+        if not unique_keys:
+            return {}
+        found = {}
+        now = time.time()
+        with self._lock:
+            # SQLite 默认最多 999 个绑定参数，分块查询
+            for start in range(0, len(unique_keys), 500):
+                chunk = unique_keys[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT cache_key, translated_text FROM translation_memory WHERE cache_key IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                found.update(rows)
+            if found:
+                self._conn.executemany(
+                    "UPDATE translation_memory SET last_used = ?, use_count = use_count + 1 WHERE cache_key = ?",
+                    [(now, key) for key in found]
+                )
+            hit_count = sum(1 for key in keys if key in found)
+            self.hits += hit_count
+            self.misses += len(keys) - hit_count
+        return found
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def put_many(self, entries):
+        """
+        批量写入缓存。
+
+        Args:
+            entries (list): [(缓存键, 原文, 译文, 目标语言, 服务商, 模型名), ...]，
+                模型名写入前会替换为摘要 (见 hash_model_name)。
+        """
+        if not entries:
+            return
+        now = time.time()
+        entries = [entry[:5] + (hash_model_name(entry[5]),) for entry in entries]
+        with self._lock:
+            self._conn.executemany(
+                """INSERT INTO translation_memory
+                       (cache_key, source_text, translated_text, target_language, model_provider, model_name, created_at, last_used)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(cache_key) DO UPDATE SET translated_text = excluded.translated_text, last_used = excluded.last_used""",
+                [entry + (now, now) for entry in entries]
+            )
+            self._writes_since_evict += len(entries)
+            # 每积累一定写入量才检查一次条目数，避免每次写入都 COUNT(*)
+            if self._writes_since_evict >= constants.TRANSLATION_MEMORY_EVICT_INTERVAL:
+                self._writes_since_evict = 0
+                self._evict_locked()
+
+    def _evict_locked(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM translation_memory").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM translation_memory WHERE cache_key IN "
+                "(SELECT cache_key FROM translation_memory ORDER BY last_used ASC LIMIT ?)",
+                (overflow,)
+            )
+            logger.info(f"翻译记忆超出上限，已淘汰 {overflow} 条最久未使用的记录")
+
+    def clear(self):
+        """清空所有缓存条目并重置计数。"""
+        with self._lock:
+            self._conn.execute("DELETE FROM translation_memory")
+            self._conn.execute("VACUUM")
+            self.hits = 0
+            self.misses = 0
+            self._writes_since_evict = 0
+        logger.info("翻译记忆已清空")
+
+    def get_stats(self):
+        """返回命中统计 (可直接序列化为 JSON)。"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM translation_memory").fetchone()[0]
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / total, 4) if total else 0.0,
+            'db_path': self.db_path,
+        }
+
+
+def translate_with_memory(texts, translate_func, target_language, model_provider, model_name=None,
+                          prompt_content=None, use_json_format=False, custom_base_url=None):
+    """
+    在翻译函数前加一层翻译记忆。
+
+    先查询缓存，只把未命中的文本 (去重后) 交给 translate_func，成功的译文写回缓存。
+    翻译记忆被禁用或不可用时直接调用 translate_func。
+
+    Args:
+        texts (list): 待翻译文本列表。
+        translate_func (callable): 接收文本列表、返回等长译文列表的函数。
+        其余参数用于生成缓存键，与 translate_single_text 的同名参数一致。
+
+    Returns:
+        list: 与输入顺序一致的译文列表。
+    """
+    memory = get_translation_memory()
+    if memory is None:
+        return translate_func(texts)
+
+    translated_texts = [""] * len(texts)
+    keys = {}
+    for i, text in enumerate(texts):
+        if text and text.strip():
+            keys[i] = build_cache_key(text, target_language, model_provider, model_name,
+                                      prompt_content, use_json_format, custom_base_url)
+    if not keys:
+        return translated_texts
+
+    try:
+        cached = memory.get_many(list(keys.values()))
+    except Exception as e:
+        logger.error(f"查询翻译记忆失败，直接翻译: {e}", exc_info=True)
+        return translate_func(texts)
+
+    # 未命中的文本按缓存键去重，同一页中重复出现的短句只翻译一次
+    miss_indices_by_key = {}
+    for i, key in keys.items():
+        if key in cached:
+            translated_texts[i] = cached[key]
+        else:
+            miss_indices_by_key.setdefault(key, []).append(i)
+
+    if cached:
+        logger.info(f"翻译记忆命中 {len(keys) - sum(len(v) for v in miss_indices_by_key.values())}/{len(keys)} 条")
+    if not miss_indices_by_key:
+        return translated_texts
+
+    miss_keys = list(miss_indices_by_key)
+    miss_texts = [texts[miss_indices_by_key[key][0]] for key in miss_keys]
+    miss_results = translate_func(miss_texts)
+
+    new_entries = []
+    for key, source_text, result in zip(miss_keys, miss_texts, miss_results):
+        for i in miss_indices_by_key[key]:
+            translated_texts[i] = result
+        if is_cacheable_translation(result, source_text, model_provider):
+            new_entries.append((key, source_text, result, target_language, model_provider, model_name))
+    try:
+        memory.put_many(new_entries)
+    except Exception as e:
+        logger.error(f"写入翻译记忆失败: {e}", exc_info=True)
+    return translated_texts
+
+
+# --- 单例 ---
+translation_memory_instance = None
+_memory_instance_lock = threading.Lock()
+_memory_init_failed = False
+
+def get_translation_memory():
+    """
+    获取翻译记忆的单例实例。
+
+    Returns:
+        TranslationMemory or None: 被禁用或数据库无法打开时返回 None。
+    """
+    global translation_memory_instance, _memory_init_failed
+    if not constants.TRANSLATION_MEMORY_ENABLED or _memory_init_failed:
+        return None
+    with _memory_instance_lock:
+        if translation_memory_instance is None and not _memory_init_failed:
+            try:
+                db_path = resource_path(os.path.join('data', constants.TRANSLATION_MEMORY_FILE))
+                translation_memory_instance = TranslationMemory(db_path)
+            except Exception as e:
+                _memory_init_failed = True
+                logger.error(f"无法打开翻译记忆数据库，翻译记忆已禁用: {e}", exc_info=True)
+        return translation_memory_instance
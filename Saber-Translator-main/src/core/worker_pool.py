@@ -0,0 +1,76 @@
+"""
+常驻的 CPU 工作进程池。
+
+批量重渲染、PDF 提取等纯 CPU 的工作在线程中只能部分释放 GIL，因此提交到这里的进程池并行执行。
+进程池在第一次使用时创建，之后所有请求复用同一组子进程 (子进程的启动和模块导入只发生一次)。
+提交的函数必须是模块级函数，参数和返回值必须可以序列化。
+"""
+
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from src.shared import constants
+
+logger = logging.getLogger("CoreWorkerPool")
+
+
+def get_worker_count():
+    """进程数：constants.WORKER_POOL_PROCESSES 为 0 时按 CPU 核数自动选择 (保留一个核给主进程，最多 4 个)。"""
+    return constants.WORKER_POOL_PROCESSES or max(1, min(4, (os.cpu_count() or 2) - 1))
+
+
+def _init_worker():
+    """子进程初始化：降低日志级别，避免每个子进程都输出一遍模块加载日志。"""
+    logging.getLogger().setLevel(logging.WARNING)
+
+
+# --- 单例 ---
+_worker_pool = None
+_worker_pool_failed = False
+_pool_lock = threading.Lock()
+
+def get_worker_pool():
+    """
+    获取进程池单例。
+
+    Returns:
+        ProcessPoolExecutor or None: 进程池无法创建或已经崩溃过时返回 None，调用方应退回到主进程中执行。
+    """
+    global _worker_pool, _worker_pool_failed
+    with _pool_lock:
+        if _worker_pool is None and not _worker_pool_failed:
+            try:
+                # 统一使用 spawn：fork 一个已加载 torch 且有多个线程的进程容易死锁，Windows 也只支持 spawn
+                _worker_pool = ProcessPoolExecutor(
+                    max_workers=get_worker_count(),
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker
+                )
+                atexit.register(shutdown_worker_pool)
+                logger.info(f"工作进程池已创建 ({get_worker_count()} 个进程)")
+            except Exception as e:
+                logger.warning(f"无法创建工作进程池，改为在主进程中执行: {e}")
+                _worker_pool_failed = True
+        return _worker_pool
+
+
+def discard_worker_pool(pool):
+    """进程池中有子进程崩溃 (BrokenProcessPool) 后丢弃它，之后的任务都在主进程中执行。"""
+    global _worker_pool, _worker_pool_failed
+    with _pool_lock:
+        if _worker_pool is pool:
+            _worker_pool = None
+            _worker_pool_failed = True
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_worker_pool():
+    global _worker_pool
+    with _pool_lock:
+        pool, _worker_pool = _worker_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
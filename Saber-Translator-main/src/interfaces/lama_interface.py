@@ -1,18 +1,27 @@
 import os
 import sys
+import importlib.util
 import logging
+import threading
 import numpy as np
+import cv2
 from PIL import Image, ImageDraw # 确保 ImageDraw 已导入，测试代码需要
 
 # 导入路径助手，确保能找到 sd-webui-cleaner 和模型
 from src.shared.path_helpers import resource_path, get_debug_dir
+from src.shared.debug_sink import save_debug_artifact
+from src.shared import constants
 
 logger = logging.getLogger("LAMAInterface")
 # logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
-# --- LAMA 可用性检查和导入 ---
+# --- LAMA 可用性检查 ---
+# 启动时只检查 litelama 和 torch 是否可以导入 (不真正导入)，模型类在首次使用时才导入和定义，
+# 避免应用启动时就加载 torch
 LAMA_AVAILABLE = False
-LiteLama = None # 初始化为 None
+LiteLama = None # 初始化为 None，首次加载模型时赋值
+LiteLama2 = None
+torch = None
 
 # 设置并检查 sd-webui-cleaner 路径
 cleaner_path = resource_path("sd-webui-cleaner")
@@ -22,83 +31,139 @@ if os.path.exists(cleaner_path):
         sys.path.insert(0, cleaner_path)
         logger.info(f"已将 LAMA 清理器路径添加到 sys.path: {cleaner_path}")
 
+    missing = [name for name in ('litelama', 'torch') if importlib.util.find_spec(name) is None]
+    if missing:
+        logger.warning(f"LAMA 功能不可用 (无法导入 {', '.join(missing)})")
+        logger.warning("请确保已安装 litelama 和 torch，并将 sd-webui-cleaner 放在正确位置。")
+    else:
+        LAMA_AVAILABLE = True
+else:
+    LAMA_AVAILABLE = False
+    logger.warning(f"未找到 sd-webui-cleaner 目录: {cleaner_path}，LAMA 功能不可用。")
+
+
+def _load_lama_class():
+    """
+    首次使用时导入 litelama 和 torch 并定义 LiteLama2。导入失败时把 LAMA 标记为不可用。
+
+    Returns:
+        type or None: LiteLama2 类。
+    """
+    global LAMA_AVAILABLE, LiteLama, LiteLama2, torch
+    if LiteLama2 is not None or not LAMA_AVAILABLE:
+        return LiteLama2
     try:
         # 现在尝试导入 litelama
         from litelama import LiteLama as OriginalLiteLama
-        import torch # litelama 需要 torch
+        import torch as torch_module # litelama 需要 torch
+    except ImportError as e:
+        LAMA_AVAILABLE = False
+        logger.warning(f"LAMA 功能初始化失败 (无法导入 litelama 或 torch): {e}")
+        return None
 
-        LiteLama = OriginalLiteLama # 赋值给全局变量
+    torch = torch_module
+    LiteLama = OriginalLiteLama # 赋值给全局变量
 
-        # 定义我们自己的 LiteLama2 类，直接模仿重构前的代码
-        class LiteLama2(OriginalLiteLama):
-            _instance = None
+    # 定义我们自己的 LiteLama2 类，直接模仿重构前的代码
+    class _LiteLama2(OriginalLiteLama):
+        _instance = None
+        
+        def __new__(cls, *args, **kw):
+            if cls._instance is None:
+                cls._instance = object.__new__(cls)
+            return cls._instance
             
-            def __new__(cls, *args, **kw):
-                if cls._instance is None:
-                    cls._instance = object.__new__(cls)
-                return cls._instance
-                
-            def __init__(self, checkpoint_path=None, config_path=None):
-                self._checkpoint_path = checkpoint_path
-                self._config_path = config_path
-                self._model = None
-                
-                # 配置模型路径
-                if self._checkpoint_path is None:
-                    model_path = resource_path("sd-webui-cleaner/models")
-                    checkpoint_path = os.path.join(model_path, "big-lama.safetensors")
-                    
-                    if os.path.exists(checkpoint_path) and os.path.isfile(checkpoint_path):
-                        logger.info(f"使用已下载的LAMA模型: {checkpoint_path}")
-                    else:
-                        logger.error(f"LAMA模型文件不存在: {checkpoint_path}")
-                        logger.error("请手动下载模型文件到models目录: https://huggingface.co/anyisalin/big-lama/resolve/main/big-lama.safetensors")
-                        
-                    self._checkpoint_path = checkpoint_path
+        def __init__(self, checkpoint_path=None, config_path=None):
+            # __new__ 总是返回同一个实例，但 Python 仍会每次调用 __init__；
+            # 已初始化时直接返回，避免每页都重新加载权重
+            if getattr(self, '_initialized', False):
+                return
+            self._checkpoint_path = checkpoint_path
+            self._config_path = config_path
+            self._model = None
+            
+            # 配置模型路径
+            if self._checkpoint_path is None:
+                model_path = resource_path("sd-webui-cleaner/models")
+                checkpoint_path = os.path.join(model_path, "big-lama.safetensors")
                 
-                # 配置配置文件路径
-                if self._config_path is None:
-                    # 首先尝试在当前目录寻找config.yaml
-                    local_config = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.yaml")
+                if os.path.exists(checkpoint_path) and os.path.isfile(checkpoint_path):
+                    logger.info(f"使用已下载的LAMA模型: {checkpoint_path}")
+                else:
+                    logger.error(f"LAMA模型文件不存在: {checkpoint_path}")
+                    logger.error("请手动下载模型文件到models目录: https://huggingface.co/anyisalin/big-lama/resolve/main/big-lama.safetensors")
                     
-                    if os.path.exists(local_config):
-                        self._config_path = local_config
-                        logger.info(f"使用本地配置文件: {local_config}")
-                    else:
-                        # 尝试在打包环境中的根目录寻找
-                        try:
-                            packed_config = resource_path("config.yaml")
-                            if os.path.exists(packed_config):
-                                self._config_path = packed_config
-                                logger.info(f"使用打包环境中的配置文件: {packed_config}")
-                            else:
-                                # 如果以上路径都不存在，使用默认配置
-                                logger.info("未找到配置文件，将使用默认的内置配置")
-                        except Exception as e:
-                            logger.error(f"查找配置文件时出错: {e}")
+                self._checkpoint_path = checkpoint_path
+            
+            # 配置配置文件路径
+            if self._config_path is None:
+                # 首先尝试在当前目录寻找config.yaml
+                local_config = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.yaml")
                 
-                # 调用父类初始化
-                super().__init__(self._checkpoint_path, self._config_path)
-        
-        # 使用我们的LiteLama2替代原来的LamaSingleton
-        LAMA_AVAILABLE = True
-        logger.info("LAMA 功能已成功初始化。")
+                if os.path.exists(local_config):
+                    self._config_path = local_config
+                    logger.info(f"使用本地配置文件: {local_config}")
+                else:
+                    # 尝试在打包环境中的根目录寻找
+                    try:
+                        packed_config = resource_path("config.yaml")
+                        if os.path.exists(packed_config):
+                            self._config_path = packed_config
+                            logger.info(f"使用打包环境中的配置文件: {packed_config}")
+                        else:
+                            # 如果以上路径都不存在，使用默认配置
+                            logger.info("未找到配置文件，将使用默认的内置配置")
+                    except Exception as e:
+                        logger.error(f"查找配置文件时出错: {e}")
+            
+            # 调用父类初始化
+            super().__init__(self._checkpoint_path, self._config_path)
+            self._initialized = True
+    
+    LiteLama2 = _LiteLama2
+    logger.info("LAMA 功能已成功初始化。")
+    return LiteLama2
 
-    except ImportError as e:
-        LAMA_AVAILABLE = False
-        logger.warning(f"LAMA 功能初始化失败 (无法导入 litelama 或 torch): {e}")
-        logger.warning("请确保已安装 litelama 和 torch，并将 sd-webui-cleaner 放在正确位置。")
-    except FileNotFoundError as e:
-        LAMA_AVAILABLE = False
-        logger.error(f"LAMA 功能初始化失败 (模型文件未找到): {e}")
-    except Exception as e:
-        LAMA_AVAILABLE = False
-        logger.error(f"LAMA 功能初始化时发生未知错误: {e}", exc_info=True)
 
-else:
-    LAMA_AVAILABLE = False
-    logger.warning(f"未找到 sd-webui-cleaner 目录: {cleaner_path}，LAMA 功能不可用。")
+# --- 常驻模型 ---
+# LAMA 模型只加载一次并常驻在推理设备上；推理串行执行 (同一模型实例不保证线程安全)
+_lama_lock = threading.Lock()
+_lama_device = None # 模型当前所在的设备
 
+def _get_device():
+    return "cuda:0" if torch.cuda.is_available() else "cpu"
+
+def get_lama_model():
+    """
+    获取常驻的 LAMA 模型实例，首次调用时加载权重并移动到推理设备。
+
+    Returns:
+        LiteLama2 or None: 模型实例，不可用时返回 None。
+    """
+    with _lama_lock:
+        lama_class = _load_lama_class()
+        if lama_class is None:
+            return None
+        lama = lama_class()
+        _ensure_device_locked(lama)
+        return lama
+
+def _ensure_device_locked(lama):
+    """把模型移动到推理设备 (已在该设备上时不做任何事)。调用方需持有 _lama_lock。"""
+    global _lama_device
+    device = _get_device()
+    if _lama_device != device:
+        logger.info(f"LAMA使用设备: {device}")
+        lama.to(device)
+        _lama_device = device
+
+def _offload_locked(lama):
+    """按配置把模型移回 CPU 以释放显存 (会增加下次推理的搬运开销)。调用方需持有 _lama_lock。"""
+    global _lama_device
+    if constants.LAMA_OFFLOAD_TO_CPU and _lama_device != "cpu":
+        lama.to("cpu")
+        _lama_device = "cpu"
+        torch.cuda.empty_cache()
 
 def lama_clean_object(image, mask):
     """
@@ -112,34 +177,139 @@ def lama_clean_object(image, mask):
         PIL.Image: 清理后的图像或空列表如果失败
     """
     try:
-        Lama = LiteLama2()
-        
+        Lama = get_lama_model()
+        if Lama is None:
+            return None
+
         init_image = image.convert("RGB")
         mask_image = mask.convert("RGB")
-        
-        # 检查是否有可用GPU
-        device = "cuda:0" if torch.cuda.is_available() else "cpu"
-        logger.info(f"LAMA使用设备: {device}")
-        
+
         result = None
         try:
-            Lama.to(device)
-            result = Lama.predict(init_image, mask_image)
+            with _lama_lock:
+                _ensure_device_locked(Lama)
+                try:
+                    result = Lama.predict(init_image, mask_image)
+                finally:
+                    _offload_locked(Lama)
             logger.info("LAMA预测成功")
         except Exception as e:
             logger.error(f"LAMA预测过程中出错: {e}")
-        finally:
-            # 将模型移回CPU以释放GPU内存
-            Lama.to("cpu")
-            if torch.cuda.is_available():
-                torch.cuda.empty_cache()
-        
+
         return result
     except Exception as e:
         logger.error(f"LAMA清理过程中出错: {e}")
         return None
 
 
+def compute_mask_rois(mask_np, padding=constants.LAMA_ROI_PADDING, align=8):
+    """
+    根据掩码计算需要修复的矩形区域 (ROI)。
+
+    每个连通的掩码区域向外扩展 padding 像素 (给 LAMA 提供周围的上下文)，
+    相互重叠的区域合并为一个，最后把边长对齐到 align 的倍数 (LAMA 的下采样要求)。
+
+    Args:
+        mask_np (numpy.ndarray): 二维掩码数组，非零像素为需要修复的区域。
+        padding (int): 每个区域向外扩展的像素数。
+        align (int): ROI 边长的对齐倍数。
+
+    Returns:
+        list: ROI 列表 [(x1, y1, x2, y2), ...]，坐标为左闭右开。
+    """
+    h, w = mask_np.shape[:2]
+    num_labels, _, stats, _ = cv2.connectedComponentsWithStats((mask_np > 0).astype(np.uint8), connectivity=8)
+    boxes = []
+    for label in range(1, num_labels): # 0 是背景
+        x, y, bw, bh, _ = stats[label]
+        boxes.append([max(0, x - padding), max(0, y - padding),
+                      min(w, x + bw + padding), min(h, y + bh + padding)])
+
+    # 合并重叠的区域，直到不再有重叠
+    merged = True
+    while merged and len(boxes) > 1:
+        merged = False
+        result = []
+        while boxes:
+            box = boxes.pop()
+            i = 0
+            while i < len(boxes):
+                other = boxes[i]
+                if box[0] < other[2] and other[0] < box[2] and box[1] < other[3] and other[1] < box[3]:
+                    box = [min(box[0], other[0]), min(box[1], other[1]), max(box[2], other[2]), max(box[3], other[3])]
+                    boxes.pop(i)
+                    merged = True
+                else:
+                    i += 1
+            result.append(box)
+        boxes = result
+
+    # 对齐到 align 的倍数 (向外扩展，超出边界时向内收)
+    rois = []
+    for x1, y1, x2, y2 in boxes:
+        rw = -(-(x2 - x1) // align) * align
+        rh = -(-(y2 - y1) // align) * align
+        x2, y2 = min(w, x1 + rw), min(h, y1 + rh)
+        x1, y1 = max(0, x2 - rw), max(0, y2 - rh)
+        rois.append((int(x1), int(y1), int(x2), int(y2)))
+    return rois
+
+def lama_clean_rois(image, mask):
+    """
+    只对掩码覆盖的区域进行 LAMA 修复：裁剪出各个 ROI 分别推理，再贴回原图。
+
+    典型漫画页的掩码只占全图很小的比例，CPU 上的推理时间随像素数近似线性增长，
+    因此比整页推理快数倍。ROI 总面积超过 LAMA_ROI_MAX_AREA_RATIO 时直接整页推理。
+    贴回时只替换掩码内的像素，掩码外的像素与原图完全一致。
+
+    参数:
+        image (PIL.Image): 原始图像
+        mask (PIL.Image): 遮罩图像，白色区域为需要清除的部分
+
+    返回:
+        PIL.Image: 清理后的图像，失败时返回 None
+    """
+    init_image = image.convert("RGB")
+    mask_l = mask.convert("L")
+    mask_np = np.asarray(mask_l)
+    if not mask_np.any():
+        logger.info("LAMA掩码为空，无需修复")
+        return init_image.copy()
+
+    rois = compute_mask_rois(mask_np)
+    page_area = mask_np.shape[0] * mask_np.shape[1]
+    roi_area = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in rois)
+    if roi_area > page_area * constants.LAMA_ROI_MAX_AREA_RATIO:
+        logger.info(f"ROI 占整页 {roi_area / page_area:.0%}，改为整页推理")
+        return lama_clean_object(init_image, mask_l)
+
+    Lama = get_lama_model()
+    if Lama is None:
+        return None
+    logger.info(f"LAMA ROI 推理: {len(rois)} 个区域，占整页 {roi_area / page_area:.1%}")
+
+    result = init_image.copy()
+    try:
+        with _lama_lock:
+            _ensure_device_locked(Lama)
+            try:
+                for box in rois:
+                    tile_mask = mask_l.crop(box)
+                    tile_result = Lama.predict(init_image.crop(box), tile_mask.convert("RGB"))
+                    if tile_result is None:
+                        raise RuntimeError(f"区域 {box} 推理未返回结果")
+                    if tile_result.size != tile_mask.size:
+                        tile_result = tile_result.crop((0, 0) + tile_mask.size)
+                    # 只替换掩码内的像素
+                    result.paste(tile_result.convert("RGB"), box[:2], tile_mask.point(lambda v: 255 if v > 0 else 0))
+            finally:
+                _offload_locked(Lama)
+    except Exception as e:
+        logger.error(f"LAMA ROI 推理出错: {e}", exc_info=True)
+        return None
+    return result
+
+
 def clean_image_with_lama(image, mask, use_gpu=True):
     """
     使用 LAMA 模型清除图像中的文本。
@@ -170,13 +340,14 @@ def clean_image_with_lama(image, mask, use_gpu=True):
         mask_np = 255 - mask_np  # 反转掩码，255变为0，0变为255
         inverted_mask = Image.fromarray(mask_np)
         
-        # 保存反转后的掩码用于调试
-        debug_dir = get_debug_dir()
-        inverted_mask.save(os.path.join(debug_dir, "inverted_mask_for_lama.png"))
-        logger.info("已保存反转后的LAMA掩码，白色区域将被修复")
+        # 保存反转后的掩码用于调试 (后台异步写入)
+        save_debug_artifact(None, "inverted_mask_for_lama.png", inverted_mask)
         
-        # 调用LAMA清理函数，使用反转后的掩码
-        result = lama_clean_object(image, inverted_mask)
+        # 调用LAMA清理函数，使用反转后的掩码 (默认只推理掩码覆盖的区域)
+        if constants.LAMA_ROI_INFERENCE:
+            result = lama_clean_rois(image, inverted_mask)
+        else:
+            result = lama_clean_object(image, inverted_mask)
         
         if result:
             logger.info("LAMA修复成功")
@@ -1,9 +1,9 @@
-import manga_ocr
 import os
 import sys
 import logging
-import torch
+import threading
 from PIL import Image
+# manga_ocr 和 torch 在首次加载模型时才导入，避免应用启动时就加载 torch/transformers
 
 # 添加缓存目录设置，帮助加速模型加载
 # 设置环境变量指定模型缓存目录
@@ -11,7 +11,6 @@ from PIL import Image
 # 设置缓存目录路径
 model_cache_dir = os.path.join(os.path.abspath(os.path.dirname(__file__)), '..', '..', 'manga_ocr_model')
 
-torch.hub.set_dir(model_cache_dir)
 os.environ['TRANSFORMERS_CACHE'] = model_cache_dir
 os.environ['TORCH_HOME'] = model_cache_dir
 # 强制使用离线模式，优先使用本地模型
@@ -28,6 +27,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../.
 
 # 现在可以导入src模块了
 from src.shared.path_helpers import resource_path # 导入路径助手
+from src.shared import constants
 
 logger = logging.getLogger("MangaOCRInterface")
 
@@ -43,6 +43,7 @@ _manga_ocr_instance = None
 
 # 标记开始预加载过程
 _preloading_started = False
+_instance_lock = threading.Lock() # 后台预加载与首个请求同时加载时，只加载一次
 
 def get_manga_ocr_instance():
     """
@@ -51,7 +52,7 @@ def get_manga_ocr_instance():
     Returns:
         manga_ocr.MangaOcr or None: OCR 实例或 None (如果失败)。
     """
-    global _manga_ocr_instance, _preloading_started
+    global _preloading_started
     
     # 标记正在尝试加载，防止重复加载进程
     _preloading_started = True
@@ -60,6 +61,15 @@ def get_manga_ocr_instance():
         # logger.debug("MangaOCR 实例已存在，直接返回。")
         return _manga_ocr_instance
 
+    with _instance_lock:
+        if _manga_ocr_instance is not None:
+            return _manga_ocr_instance
+        return _load_manga_ocr_instance()
+
+def _load_manga_ocr_instance():
+    """加载 MangaOCR 模型 (调用方需持有 _instance_lock)。"""
+    global _manga_ocr_instance
+
     try:
         # 现代版本的MangaOCR会自动处理模型下载和路径
         logger.info("开始初始化 MangaOCR 实例，如果首次使用可能会自动下载模型文件。")
@@ -67,6 +77,8 @@ def get_manga_ocr_instance():
         start_time = time.time()
         # 检测GPU并设置使用
         import torch
+        import manga_ocr
+        torch.hub.set_dir(model_cache_dir)
         force_cpu = not torch.cuda.is_available()
         if not force_cpu:
             logger.info(f"检测到GPU: {torch.cuda.get_device_name(0)}，将使用GPU加速")
@@ -139,6 +151,7 @@ def preload_manga_ocr():
     def _preload_task():
         logger.info("在后台线程中预加载 MangaOCR 模型...")
         try:
+            import torch
             # 调整torch内存管理，加速加载
             torch.set_grad_enabled(False)  # 禁用梯度计算
             # 设置更高的内存效率
@@ -204,6 +217,66 @@ def recognize_japanese_text(image_pil):
         logger.error(f"MangaOCR 识别失败: {e}", exc_info=True)
         return ""
 
+def _post_process_text(text):
+    """使用 MangaOCR 自带的后处理 (去空白、统一省略号等)，与单张识别的输出保持一致。"""
+    try:
+        from manga_ocr.ocr import post_process
+        return post_process(text)
+    except Exception:
+        return text.strip()
+
+def recognize_japanese_text_batch(images_pil, batch_size=constants.MANGA_OCR_BATCH_SIZE):
+    """
+    批量识别多张 PIL 图像中的日文文本 (一页或多页的所有气泡裁剪图)。
+
+    所有图像统一预处理为同尺寸张量后堆叠成一个批次，编码器和解码器每批只运行一次，
+    避免逐个气泡 batch=1 推理的开销。批量推理失败时自动回退到逐张识别。
+
+    Args:
+        images_pil (list): PIL 图像列表，可以包含 None (对应位置返回空字符串)。
+        batch_size (int): 每次推理的图像数量。
+
+    Returns:
+        list: 与输入顺序一致的识别文本列表，失败的项为空字符串。
+    """
+    results = [""] * len(images_pil)
+    valid = [(i, img) for i, img in enumerate(images_pil) if img is not None]
+    if not valid:
+        return results
+
+    ocr_instance = get_manga_ocr_instance()
+    if ocr_instance is None:
+        return results
+
+    # 旧版本的 MangaOcr 不一定暴露这些属性，此时只能逐张识别
+    if not all(hasattr(ocr_instance, attr) for attr in ('processor', 'tokenizer', 'model')):
+        logger.warning("当前 MangaOCR 版本不支持批量推理，改为逐张识别")
+        for i, img in valid:
+            results[i] = recognize_japanese_text(img)
+        return results
+
+    import torch # 模型已加载，torch 已在 sys.modules 中
+    batch_size = max(1, int(batch_size))
+    for start in range(0, len(valid), batch_size):
+        chunk = valid[start:start + batch_size]
+        try:
+            # 与 MangaOcr.__call__ 相同的预处理：先转灰度再转回 RGB
+            prepared = [img.convert('L').convert('RGB') for _, img in chunk]
+            pixel_values = ocr_instance.processor(prepared, return_tensors="pt").pixel_values
+            with torch.inference_mode():
+                generated = ocr_instance.model.generate(
+                    pixel_values.to(ocr_instance.model.device),
+                    max_length=constants.MANGA_OCR_MAX_LENGTH
+                )
+            texts = ocr_instance.tokenizer.batch_decode(generated.cpu(), skip_special_tokens=True)
+            for (i, _), text in zip(chunk, texts):
+                results[i] = _post_process_text(text) if text else ""
+        except Exception as e:
+            logger.error(f"MangaOCR 批量识别失败，改为逐张识别: {e}", exc_info=True)
+            for i, img in chunk:
+                results[i] = recognize_japanese_text(img)
+    return results
+
 # --- 测试代码 ---
 if __name__ == '__main__':
     print("--- 测试 MangaOCR 接口 ---")
@@ -15,7 +15,8 @@ import shutil
 from PIL import Image
 import time
 
-from src.shared.path_helpers import resource_path, get_debug_dir
+from src.shared.path_helpers import resource_path
+from src.shared.debug_sink import save_debug_artifact
 from src.shared import constants
 
 # 设置OpenMP线程数为1，避免PaddlePaddle性能警告
@@ -283,13 +284,8 @@ class PaddleOCRHandler:
                     x1, y1, x2, y2 = coords
                     bubble_img = img_np[y1:y2, x1:x2]
                     
-                    # 保存调试图像
-                    try:
-                        debug_dir = get_debug_dir("paddle_ocr")
-                        os.makedirs(debug_dir, exist_ok=True)
-                        cv2.imwrite(os.path.join(debug_dir, f"bubble_{i}.png"), bubble_img)
-                    except Exception as e:
-                        logger.warning(f"保存调试图像失败: {e}")
+                    # 保存调试图像 (后台异步写入)
+                    save_debug_artifact("paddle_ocr", f"bubble_{i}.png", bubble_img)
                     
                     # 使用PaddleOCR识别文本
                     start_time = time.time()
@@ -0,0 +1,192 @@
+"""
+把 YOLOv12 的 PyTorch 权重导出为 ONNX/OpenVINO 并缓存，供 CPU 推理使用。
+
+- 导出结果存放在 data/model_cache/yolov12-<权重哈希前 16 位>-<格式>[-int8]/，权重文件变化后自动重新导出；
+- 导出使用 yolov12-main 中的 ultralytics 导出器 (dynamic=True，批量推理和 letterbox 方式与 PyTorch 一致)；
+- ONNX 可选再做 INT8 动态量化 (onnxruntime.quantization)；
+- 首次导出后与 PyTorch 模型的输出做一致性检查，结果写入 meta.json，未通过的导出不会被使用，也不会反复重试。
+"""
+
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+from src.shared import constants
+from src.shared.path_helpers import resource_path
+
+logger = logging.getLogger("YOLOv12Export")
+
+# 格式 -> 导出所需的 Python 包 (缺少时跳过导出，避免 ultralytics 在运行时自动 pip 安装)
+_EXPORT_REQUIREMENTS = {
+    'onnx': ('onnx', 'onnxruntime'),
+    'openvino': ('openvino',),
+}
+_META_FILE = 'meta.json'
+_export_lock = threading.Lock()
+
+
+def weights_hash(weights_path):
+    """权重文件的 SHA-256 (分块读取)。"""
+    digest = hashlib.sha256()
+    with open(weights_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_cache_dir(weights_sha256, export_format, int8=False):
+    name = f"yolov12-{weights_sha256[:16]}-{export_format}" + ("-int8" if int8 else "")
+    return resource_path(os.path.join('data', constants.DETECTOR_CACHE_DIR_NAME, name))
+
+
+def load_cache_meta(cache_dir):
+    """读取缓存目录中的 meta.json，不存在或损坏时返回 None。"""
+    try:
+        with open(os.path.join(cache_dir, _META_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_cache_meta(cache_dir, meta):
+    tmp_path = os.path.join(cache_dir, _META_FILE + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, os.path.join(cache_dir, _META_FILE))
+
+
+def missing_requirements(export_format):
+    """返回导出该格式缺少的 Python 包列表。"""
+    return [pkg for pkg in _EXPORT_REQUIREMENTS.get(export_format, ()) if importlib.util.find_spec(pkg) is None]
+
+
+def _quantize_onnx_int8(onnx_path):
+    """ONNX INT8 动态量化 (权重量化为 INT8，无需校准数据)，返回量化后的模型路径。"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    int8_path = onnx_path.replace('.onnx', '_int8.onnx')
+    quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QUInt8)
+    return int8_path
+
+
+def export_weights(weights_path, export_format='onnx', int8=False):
+    """
+    导出权重并放入缓存目录 (已导出过则直接返回缓存)。
+
+    Returns:
+        tuple: (导出模型路径, 缓存目录, meta 字典)；meta 中 'parity' 为 None 表示刚导出、尚未做一致性检查。
+               无法导出时返回 (None, 缓存目录 或 None, meta 或 None)。
+    """
+    if export_format not in _EXPORT_REQUIREMENTS:
+        logger.error(f"不支持的导出格式: {export_format}")
+        return None, None, None
+    if export_format == 'openvino' and int8:
+        # OpenVINO 的 INT8 导出需要校准数据集 (nncf)，这里只导出 FP32
+        logger.warning("OpenVINO INT8 导出需要校准数据集，改为导出 FP32 模型")
+        int8 = False
+
+    sha256 = weights_hash(weights_path)
+    cache_dir = get_cache_dir(sha256, export_format, int8)
+
+    with _export_lock:
+        meta = load_cache_meta(cache_dir)
+        if meta is not None:
+            model_path = os.path.join(cache_dir, meta.get('model', ''))
+            if meta.get('parity') is False:
+                reason = '一致性检查结果不确定' if meta.get('parity_report', {}).get('inconclusive') else '未通过一致性检查'
+                logger.info(f"已缓存的 {export_format} 模型{reason}，不再使用 (删除该目录可重新检查): {cache_dir}")
+                return None, cache_dir, meta
+            if os.path.exists(model_path):
+                return model_path, cache_dir, meta
+
+        missing = missing_requirements(export_format)
+        if missing:
+            logger.info(f"未安装 {', '.join(missing)}，跳过 {export_format} 导出")
+            return None, cache_dir, None
+
+        # 在临时目录中导出 (导出器把结果写在权重文件旁边)，完成后整体改名为缓存目录
+        tmp_dir = f"{cache_dir}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        try:
+            from ultralytics import YOLO
+            tmp_weights = os.path.join(tmp_dir, os.path.basename(weights_path))
+            shutil.copyfile(weights_path, tmp_weights)
+            start = time.time()
+            logger.info(f"开始把 {weights_path} 导出为 {export_format}{' (INT8)' if int8 else ''}，仅首次需要...")
+            exported = YOLO(tmp_weights).export(format=export_format, dynamic=True, simplify=False,
+                                                half=False, device='cpu')
+            if not exported:
+                raise RuntimeError("导出器没有返回模型路径")
+            exported = str(exported)
+            if int8:
+                exported = _quantize_onnx_int8(exported)
+            os.remove(tmp_weights)
+
+            meta = {
+                'weights_sha256': sha256,
+                'format': export_format,
+                'int8': int8,
+                'model': os.path.relpath(exported, tmp_dir),
+                'export_seconds': round(time.time() - start, 1),
+                'parity': None,
+            }
+            save_cache_meta(tmp_dir, meta)
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            os.replace(tmp_dir, cache_dir)
+            logger.info(f"{export_format} 导出完成，用时 {meta['export_seconds']}s: {cache_dir}")
+            return os.path.join(cache_dir, meta['model']), cache_dir, meta
+        except Exception as e:
+            logger.error(f"导出 {export_format} 模型失败: {e}", exc_info=True)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return None, cache_dir, None
+
+
+def compare_detections(reference, candidate, int8=False):
+    """
+    比较两组检测结果 [(boxes, scores, class_ids), ...] 是否一致：每个参考框都能在候选结果中找到
+    同类别、IoU 不低于阈值且置信度差不超过容差的框，且两边框数相同。INT8 模型的阈值适当放宽。
+
+    两边都没有检测到任何框时无法说明一致，结果为 inconclusive (ok 为 False)。
+
+    Returns:
+        dict: {'ok', 'inconclusive', 'min_iou', 'max_score_diff', 'boxes'}。
+    """
+    import numpy as np
+    min_iou_required = constants.DETECTOR_PARITY_MIN_IOU - (0.1 if int8 else 0.0)
+    score_tolerance = constants.DETECTOR_PARITY_SCORE_TOLERANCE * (2 if int8 else 1)
+    ok, min_iou, max_score_diff, total = True, 1.0, 0.0, 0
+    for (ref_boxes, ref_scores, ref_classes), (boxes, scores, classes) in zip(reference, candidate):
+        total += len(ref_boxes)
+        if len(ref_boxes) != len(boxes):
+            ok = False
+        unmatched = list(range(len(boxes)))
+        for box, score, class_id in zip(ref_boxes, ref_scores, ref_classes):
+            best, best_iou = None, 0.0
+            for k in unmatched:
+                if classes[k] != class_id:
+                    continue
+                other = boxes[k]
+                inter = max(0.0, min(box[2], other[2]) - max(box[0], other[0])) * \
+                        max(0.0, min(box[3], other[3]) - max(box[1], other[1]))
+                union = (box[2] - box[0]) * (box[3] - box[1]) + (other[2] - other[0]) * (other[3] - other[1]) - inter
+                iou = inter / union if union > 0 else 0.0
+                if iou > best_iou:
+                    best, best_iou = k, iou
+            if best is None:
+                ok, min_iou = False, 0.0
+                continue
+            unmatched.remove(best)
+            min_iou = min(min_iou, best_iou)
+            max_score_diff = max(max_score_diff, float(np.abs(score - scores[best])))
+    if min_iou < min_iou_required or max_score_diff > score_tolerance:
+        ok = False
+    inconclusive = total == 0 and sum(len(c[0]) for c in candidate) == 0
+    if inconclusive:
+        ok = False
+    return {'ok': ok, 'inconclusive': inconclusive, 'min_iou': round(float(min_iou), 4),
+            'max_score_diff': round(max_score_diff, 4), 'boxes': total}
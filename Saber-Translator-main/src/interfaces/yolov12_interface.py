@@ -1,19 +1,122 @@
 import sys
 import os
 import logging
+import threading
+import time
 
 # 让本地 yolov12-main 目录优先
 yolov12_main_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../yolov12-main'))
 if yolov12_main_path not in sys.path:
     sys.path.insert(0, yolov12_main_path)
 
-from ultralytics import YOLO
-
 logger = logging.getLogger("YOLOv12Interface")
 
+
+def _import_yolo():
+    """首次加载模型时才导入 ultralytics (会连带导入 torch)，避免拖慢应用启动。"""
+    from ultralytics import YOLO
+    return YOLO
+
 # --- 全局变量存储加载的模型 ---
 _yolov12_model = None
+_yolov12_backend = None  # 实际使用的推理后端: 'pytorch' / 'onnx' / 'openvino'
 _model_conf = 0.5  # 默认置信度阈值
+_model_lock = threading.Lock()
+
+
+def _configured_backend():
+    """推理后端配置，环境变量 SABER_DETECTOR_BACKEND 优先于 constants.DETECTOR_BACKEND。"""
+    from src.shared import constants
+    return os.environ.get('SABER_DETECTOR_BACKEND', constants.DETECTOR_BACKEND).strip().lower()
+
+
+def _resolve_backend():
+    """把配置解析为实际尝试的后端：'auto' 在有 CUDA 时使用 PyTorch (GPU)，只在 CPU 上优先 ONNX。"""
+    backend = _configured_backend()
+    if backend == 'auto':
+        try:
+            import torch
+            if torch.cuda.is_available():
+                return 'pytorch'
+        except ImportError:
+            pass
+        return 'onnx'
+    return backend
+
+
+def _parity_samples():
+    """
+    一致性检查使用的图像：constants.DETECTOR_PARITY_DIR 中的固定样例页面；目录缺失时生成一张合成页面。
+    """
+    import glob
+    import cv2
+    import numpy as np
+    from src.shared import constants
+    from src.shared.path_helpers import resource_path
+    paths = sorted(glob.glob(os.path.join(resource_path(constants.DETECTOR_PARITY_DIR), '*')))
+    samples = [img for img in (cv2.imread(path) for path in paths) if img is not None]
+    if not samples:
+        rng = np.random.default_rng(0)
+        img = rng.integers(150, 230, (1200, 850, 3), dtype=np.uint8)
+        for _ in range(6):
+            center = (int(rng.integers(120, 730)), int(rng.integers(120, 1080)))
+            axes = (int(rng.integers(60, 120)), int(rng.integers(80, 160)))
+            cv2.ellipse(img, center, axes, 0, 0, 360, (255, 255, 255), -1)
+            cv2.ellipse(img, center, axes, 0, 0, 360, (0, 0, 0), 3)
+            cv2.putText(img, "ABC", (center[0] - 40, center[1]), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
+        samples.append(img)
+    return samples
+
+
+def _timed_predictions(model, samples, conf):
+    """返回 (每张样本的检测结果, 平均每张耗时毫秒)，先预热一次再计时。"""
+    model.predict(source=samples[0], conf=conf, verbose=False)
+    start = time.perf_counter()
+    outputs = [_merge_results(model.predict(source=img, conf=conf, verbose=False)) for img in samples]
+    return outputs, (time.perf_counter() - start) * 1000 / len(samples)
+
+
+def _load_exported_model(weights_path, backend):
+    """
+    加载 (必要时先导出) ONNX/OpenVINO 模型。首次导出后与 PyTorch 模型比较检测结果，
+    未通过一致性检查或无法导出时返回 None，由调用方退回 PyTorch。
+    """
+    from src.shared import constants
+    from src.interfaces.yolov12_export import export_weights, compare_detections, save_cache_meta
+
+    YOLO = _import_yolo()
+    export_format = 'openvino' if backend == 'openvino' else 'onnx'
+    int8 = os.environ.get('SABER_DETECTOR_INT8', '1' if constants.DETECTOR_EXPORT_INT8 else '0') == '1'
+    model_path, cache_dir, meta = export_weights(weights_path, export_format, int8)
+    if model_path is None:
+        return None
+
+    exported_model = YOLO(model_path, task='detect')
+    if meta.get('parity') is None:
+        samples = _parity_samples()
+        conf = constants.DETECTOR_PARITY_CONF
+        reference, reference_ms = _timed_predictions(YOLO(weights_path), samples, conf)
+        candidate, candidate_ms = _timed_predictions(exported_model, samples, conf)
+        report = compare_detections(reference, candidate, int8=meta['int8'])
+        report.update(pytorch_ms=round(reference_ms, 1), exported_ms=round(candidate_ms, 1))
+        meta['parity_report'] = report
+        # 结果不确定 (样例中没有检测到任何框) 时同样记为未通过，避免每次启动都重新检查；
+        # 删除缓存目录即可重新导出并检查
+        meta['parity'] = report['ok']
+        save_cache_meta(cache_dir, meta)
+        if report['inconclusive']:
+            logger.warning(f"{export_format} 一致性检查的样例中没有检测到气泡，结果不确定，继续使用 PyTorch: {report}")
+            return None
+        if not report['ok']:
+            logger.error(f"{export_format} 模型与 PyTorch 输出不一致，继续使用 PyTorch: {report}")
+            return None
+        logger.info(f"{export_format} 模型通过一致性检查: {report}")
+    return exported_model
+
+
+def get_detector_backend():
+    """当前实际使用的检测推理后端，模型尚未加载时返回 None。"""
+    return _yolov12_backend
 
 
 def load_yolov12_model(weights_name='best.pt', conf_threshold=0.6):
@@ -27,27 +130,46 @@ def load_yolov12_model(weights_name='best.pt', conf_threshold=0.6):
     Returns:
         ultralytics.YOLO: 加载的模型或 None (如果失败).
     """
-    global _yolov12_model, _model_conf
+    global _yolov12_model, _yolov12_backend, _model_conf
 
     if _yolov12_model is not None:
         # ultralytics YOLOv12 的置信度阈值在 predict 时传递，不在模型对象上设置
         return _yolov12_model
 
-    try:
-        # 你原有的 resource_path 逻辑不变
-        from src.shared.path_helpers import resource_path
-        weights_path = resource_path(os.path.join('weights', weights_name))
-        if not os.path.exists(weights_path):
-            logger.error(f"YOLOv12 权重文件未找到: {weights_path}")
+    with _model_lock:
+        if _yolov12_model is not None:
+            return _yolov12_model
+        try:
+            # 你原有的 resource_path 逻辑不变
+            from src.shared.path_helpers import resource_path
+            weights_path = resource_path(os.path.join('weights', weights_name))
+            if not os.path.exists(weights_path):
+                logger.error(f"YOLOv12 权重文件未找到: {weights_path}")
+                return None
+
+            # 没有 CUDA 时优先使用导出的 CPU 推理后端 (ONNX/OpenVINO)，不可用时退回 PyTorch
+            backend = _resolve_backend()
+            if backend != 'pytorch':
+                try:
+                    exported_model = _load_exported_model(weights_path, backend)
+                except Exception as e:
+                    logger.error(f"加载 {backend} 检测模型失败，改用 PyTorch: {e}", exc_info=True)
+                    exported_model = None
+                if exported_model is not None:
+                    _yolov12_model = exported_model
+                    _yolov12_backend = 'openvino' if backend == 'openvino' else 'onnx'
+                    logger.info(f"YOLOv12 模型加载成功 (后端: {_yolov12_backend})")
+                    return _yolov12_model
+
+            logger.info(f"开始加载 YOLOv12 本地模型: {weights_path}")
+            _yolov12_model = _import_yolo()(weights_path)
+            _yolov12_backend = 'pytorch'
+            logger.info(f"YOLOv12 本地模型加载成功")
+            return _yolov12_model
+        except Exception as e:
+            logger.error(f"加载 YOLOv12 本地模型失败: {e}", exc_info=True)
+            _yolov12_model = None
             return None
-        logger.info(f"开始加载 YOLOv12 本地模型: {weights_path}")
-        _yolov12_model = YOLO(weights_path)
-        logger.info(f"YOLOv12 本地模型加载成功")
-        return _yolov12_model
-    except Exception as e:
-        logger.error(f"加载 YOLOv12 本地模型失败: {e}", exc_info=True)
-        _yolov12_model = None
-        return None
 
 
 def detect_bubbles_v12(image_cv, conf_threshold=0.6):
@@ -71,29 +193,78 @@ def detect_bubbles_v12(image_cv, conf_threshold=0.6):
 
     try:
         results = model.predict(source=image_cv, conf=conf_threshold, verbose=False)
-        boxes, scores, class_ids = [], [], []
-        for r in results:
-            if hasattr(r, 'boxes') and r.boxes is not None:
-                b = r.boxes.xyxy.cpu().numpy() if hasattr(r.boxes, 'xyxy') else np.array([])
-                s = r.boxes.conf.cpu().numpy() if hasattr(r.boxes, 'conf') else np.array([])
-                c = r.boxes.cls.cpu().numpy() if hasattr(r.boxes, 'cls') else np.array([])
-                boxes.append(b)
-                scores.append(s)
-                class_ids.append(c)
-        if boxes:
-            boxes = np.concatenate(boxes, axis=0)
-            scores = np.concatenate(scores, axis=0)
-            class_ids = np.concatenate(class_ids, axis=0)
-        else:
-            boxes = np.array([])
-            scores = np.array([])
-            class_ids = np.array([])
+        boxes, scores, class_ids = _merge_results(results)
         logger.info(f"YOLOv12 检测到 {len(boxes)} 个候选框 (阈值: {conf_threshold})")
         return boxes, scores, class_ids
     except Exception as e:
         logger.error(f"YOLOv12 推理失败: {e}", exc_info=True)
         return np.array([]), np.array([]), np.array([])
 
+
+def _merge_results(results):
+    """把 ultralytics 的 Results 列表合并为 (boxes, scores, class_ids) 三个 numpy 数组。"""
+    import numpy as np
+    boxes, scores, class_ids = [], [], []
+    for r in results:
+        if hasattr(r, 'boxes') and r.boxes is not None:
+            b = r.boxes.xyxy.cpu().numpy() if hasattr(r.boxes, 'xyxy') else np.array([])
+            s = r.boxes.conf.cpu().numpy() if hasattr(r.boxes, 'conf') else np.array([])
+            c = r.boxes.cls.cpu().numpy() if hasattr(r.boxes, 'cls') else np.array([])
+            boxes.append(b)
+            scores.append(s)
+            class_ids.append(c)
+    if boxes:
+        return np.concatenate(boxes, axis=0), np.concatenate(scores, axis=0), np.concatenate(class_ids, axis=0)
+    return np.array([]), np.array([]), np.array([])
+
+
+def detect_bubbles_batch(images_cv, conf_threshold=0.6, batch_size=4):
+    """
+    批量检测多张图像中的气泡，每 batch_size 张图像只做一次前向推理。
+
+    ultralytics 对尺寸不同的一批图像统一 letterbox 为正方形输入，而逐张检测使用按比例的矩形输入，
+    两者的检测框和置信度会有细微差别。因此先按图像尺寸分组，只把尺寸相同的图像放进同一批次
+    (此时批量推理与逐张检测使用相同的矩形 letterbox)，检测框映射回每张原图的坐标系后与逐张检测等价。
+
+    Args:
+        images_cv (list): OpenCV BGR 格式图像 (numpy.ndarray) 的列表。
+        conf_threshold (float): 本次检测使用的置信度阈值。
+        batch_size (int): 每次前向推理的图像数量。
+
+    Returns:
+        list: 与 images_cv 等长的列表，每项为 (boxes, scores, class_ids) 元组，格式同 detect_bubbles_v12。
+    """
+    import numpy as np
+    empty = (np.array([]), np.array([]), np.array([]))
+    if not images_cv:
+        return []
+    model = load_yolov12_model(conf_threshold=conf_threshold)
+    if model is None:
+        return [empty for _ in images_cv]
+
+    batch_size = max(1, int(batch_size))
+    # 按尺寸分组 (保持组内原有顺序)，结果再按原始下标放回
+    groups = {}
+    for index, img in enumerate(images_cv):
+        groups.setdefault(img.shape[:2], []).append(index)
+    outputs = [None] * len(images_cv)
+    for indices in groups.values():
+        for start in range(0, len(indices), batch_size):
+            chunk = indices[start:start + batch_size]
+            try:
+                results = model.predict(source=[images_cv[i] for i in chunk], conf=conf_threshold, verbose=False)
+                if len(results) != len(chunk):
+                    raise RuntimeError(f"批量推理返回 {len(results)} 个结果，期望 {len(chunk)} 个")
+                for i, r in zip(chunk, results):
+                    outputs[i] = _merge_results([r])
+            except Exception as e:
+                # 批量推理失败 (例如显存不足) 时退回逐张检测，保证每页都有结果
+                logger.error(f"YOLOv12 批量推理失败，改为逐张检测: {e}", exc_info=True)
+                for i in chunk:
+                    outputs[i] = detect_bubbles_v12(images_cv[i], conf_threshold=conf_threshold)
+    logger.info(f"YOLOv12 批量检测完成: {len(images_cv)} 张图像，批大小 {batch_size} (阈值: {conf_threshold})")
+    return outputs
+
 # --- 测试代码 ---
 if __name__ == '__main__':
     print("--- 测试 YOLOv12 本地接口 ---")
@@ -187,6 +187,18 @@ DEFAULT_TRANSLATE_JSON_PROMPT = """你是一个专业的翻译引擎。请将用
   "translated_text": "[翻译后的文本放在这里]"
 }"""
 
+# 整页批量翻译：附加在翻译提示词之后，要求模型按编号逐条返回
+DEFAULT_BATCH_TRANSLATE_JSON_PROMPT = """用户会发送一个 JSON 数组，每一项是漫画中一个气泡的文本，格式为 {"id": 编号, "text": "原文"}。
+这些气泡来自同一页漫画，请结合上下文理解，但每个气泡必须单独翻译，不要合并或拆分气泡，也不要遗漏任何编号。
+
+请严格按照以下 JSON 格式返回结果，不要添加任何额外的解释或对话:
+{
+  "translations": [
+    {"id": 1, "translated_text": "[编号 1 的译文]"},
+    {"id": 2, "translated_text": "[编号 2 的译文]"}
+  ]
+}"""
+
 DEFAULT_AI_VISION_OCR_JSON_PROMPT = """你是一个OCR助手。请将我发送给你的图片中的所有文字提取出来。
 
 当文本中包含特殊字符（如大括号{}、引号""、反斜杠\等）时，请在输出中保留它们但不要将它们视为JSON语法的一部分。如果需要，你可以使用转义字符\\来表示这些特殊字符。
@@ -200,8 +212,93 @@ DEFAULT_AI_VISION_OCR_JSON_PROMPT = """你是一个OCR助手。请将我发送
 DEFAULT_rpm_TRANSLATION = 0  # 0 表示无限制
 DEFAULT_rpm_AI_VISION_OCR = 0 # 0 表示无限制
 
+# --- 翻译并发 ---
+DEFAULT_TRANSLATION_MAX_WORKERS = 8 # translate_text_list 并发翻译的最大线程数
+# 这些服务保持逐条串行调用 (免费 QPS 很低，且接口对象保存了共享的认证状态)
+SERIAL_TRANSLATION_PROVIDERS = {BAIDU_TRANSLATE_ENGINE_ID, YOUDAO_TRANSLATE_ENGINE_ID}
+# 整页批量翻译最多请求的轮数 (后续轮次只请求缺失的编号)，仍缺失的条目逐条翻译
+BATCH_TRANSLATION_MAX_ROUNDS = 3
+
+# --- 翻译记忆 (持久化翻译缓存) ---
+TRANSLATION_MEMORY_ENABLED = True
+TRANSLATION_MEMORY_FILE = 'translation_memory.sqlite3' # 位于 data/ 目录下
+TRANSLATION_MEMORY_MAX_ENTRIES = 100000 # 超出后按最近使用时间淘汰
+TRANSLATION_MEMORY_EVICT_INTERVAL = 200 # 每写入多少条检查一次是否超出上限
+# 出错时原样返回原文的服务 (有道)，其译文与原文相同时不写入翻译记忆；百度出错时返回空文本或抛出异常，无需特殊处理
+TRANSLATION_MEMORY_ECHO_ON_ERROR_PROVIDERS = {YOUDAO_TRANSLATE_ENGINE_ID}
+
 # --- 文本描边默认值 ---
 DEFAULT_TEXT_STROKE_ENABLED = False
 DEFAULT_TEXT_STROKE_COLOR = '#FFFFFF' # 默认白色描边
 DEFAULT_TEXT_STROKE_WIDTH = 1         # 默认1像素宽度
-# ------------------------
\ No newline at end of file
+# ------------------------
+# --- 章节任务引擎 (多页流水线) ---
+# 每个阶段的工作线程数量；检测/OCR/修复为本地模型推理，翻译主要等待网络
+CHAPTER_JOB_STAGE_WORKERS = {
+    'detection': 1,
+    'ocr': 1,
+    'translation': 4,
+    'inpainting': 1,
+    'rendering': 2,
+}
+CHAPTER_JOB_QUEUE_SIZE = 4       # 每个阶段输入队列的最大长度 (背压，限制内存中的页面数)
+CHAPTER_JOB_MAX_FINISHED = 20    # 最多保留多少个已结束任务的结果
+CHAPTER_JOB_MAX_WAIT = 30        # 查询结果时 ?wait= 最多等待的秒数 (等待期间占用一个请求线程)
+DETECTION_BATCH_SIZE = 4        # 检测阶段每次前向推理最多合并的页数
+# 分块检测 (条漫长图、超大图)：整页 letterbox 缩放到模型输入尺寸后气泡只剩几个像素，改为切成重叠的图块分别检测
+DETECTION_TILE_ASPECT_RATIO = 3.0   # 长边/短边超过该比例时分块
+DETECTION_TILE_MAX_SIDE = 6000      # 长边超过该像素数时也分块
+DETECTION_TILE_SIZE = 1280          # 图块最大边长 (不超过图像短边)
+DETECTION_TILE_OVERLAP = 0.25       # 相邻图块的重叠比例
+DETECTION_TILE_NMS_IOU = 0.5        # 合并各图块结果时的 NMS 阈值
+DETECTION_TILE_EDGE_MARGIN = 4      # 检测框距图块内部边缘不超过该像素数时视为被接缝切开
+
+# --- 模型预热 ---
+# 应用启动后在后台线程中并行加载的模型 (detector / manga_ocr / lama)，可用环境变量 SABER_WARMUP_MODELS 覆盖 (逗号分隔，留空表示不预热)
+MODEL_WARMUP = ['detector', 'manga_ocr', 'lama']
+
+# --- 气泡检测推理后端 ---
+# 'onnx': 首次加载时把 weights/best.pt 导出为 ONNX 并缓存 (按权重哈希)，通过一致性检查后使用，否则退回 PyTorch
+# 'auto': 有 CUDA 时使用 PyTorch (GPU)，否则同 'onnx'；'openvino': 同 'onnx'，导出为 OpenVINO；
+# 'pytorch': 始终使用 PyTorch 权重。可用环境变量 SABER_DETECTOR_BACKEND 覆盖
+DETECTOR_BACKEND = 'auto'
+DETECTOR_EXPORT_INT8 = False          # ONNX 导出后再做 INT8 动态量化，可用环境变量 SABER_DETECTOR_INT8=1 开启
+DETECTOR_CACHE_DIR_NAME = 'model_cache'  # 导出模型的缓存目录 (data/model_cache/)
+DETECTOR_PARITY_DIR = 'data/detector_parity'  # 一致性检查使用的固定样例页面 (随程序发布，不依赖调试输出)
+DETECTOR_PARITY_CONF = 0.1            # 一致性检查使用较低的置信度阈值，以便比较更多的框
+DETECTOR_PARITY_MIN_IOU = 0.9         # 对应框的最小 IoU (INT8 模型放宽 0.1)
+DETECTOR_PARITY_SCORE_TOLERANCE = 0.05  # 对应框的置信度最大差值 (INT8 模型放宽一倍)
+MANGA_OCR_BATCH_SIZE = 16       # MangaOCR 每次批量推理的气泡裁剪图数量
+MANGA_OCR_MAX_LENGTH = 300       # MangaOCR 解码的最大长度 (与 MangaOcr.__call__ 一致)
+
+# --- 调试产物 (data/debug/) ---
+DEBUG_ARTIFACTS_ENABLED = False      # 默认不保存调试图像，可用环境变量 SABER_DEBUG_ARTIFACTS=1 开启
+DEBUG_ARTIFACTS_SAMPLE_RATE = 0.25   # 开启后的采样率，可用环境变量 SABER_DEBUG_SAMPLE_RATE 覆盖
+DEBUG_ARTIFACTS_QUEUE_SIZE = 64      # 后台写入队列长度，满时丢弃新的调试产物
+DEBUG_ARTIFACTS_MAX_DIR_MB = 200     # 调试目录大小上限，超出后删除最早的文件
+
+# --- LAMA 修复 ---
+LAMA_ROI_INFERENCE = True        # 只对掩码覆盖的区域推理，而不是整页
+LAMA_ROI_PADDING = 32            # 每个区域向外扩展的上下文像素
+LAMA_ROI_MAX_AREA_RATIO = 0.6    # ROI 总面积超过整页的该比例时直接整页推理
+LAMA_OFFLOAD_TO_CPU = False      # 每次推理后把模型移回 CPU (节省显存，但每页都要搬运权重)
+
+# --- 增量重渲染 (编辑器) ---
+INCREMENTAL_RENDER_MAX_PAGES = 6     # 服务端最多缓存多少页的干净背景和渲染结果 (4K 页面每页约 50MB)
+INCREMENTAL_RENDER_MAX_BBOX_RETRIES = 3 # 气泡文字超出测量区域时扩大区域重新测量的次数
+INCREMENTAL_RENDER_CANVAS_PADDING = 32 # 重绘画布在脏区域外额外保留的像素 (字形贴着画布边缘绘制时边缘像素会不同)
+
+# --- 页面存储 (data/page_store/) ---
+PAGE_STORE_DIR_NAME = 'page_store'
+PAGE_STORE_MAX_MB = 2048             # 磁盘占用上限，超出后按最近使用时间淘汰
+PAGE_STORE_ENCODE_CACHE_SIZE = 1024  # 记住多少张图像的像素指纹，内容未变化时复用已有编码
+
+# --- 工作进程池 (批量重渲染、PDF 提取) ---
+WORKER_POOL_PROCESSES = 0            # 进程数，0 表示按 CPU 核数自动选择 (最多 4 个)
+
+# --- PDF 导入 ---
+PDF_EXTRACT_CHUNK_PAGES = 8          # 每个提取任务处理的连续页数
+
+# --- 批量导出 ---
+EXPORT_PDF_JPEG_QUALITY = 75         # 导出 PDF 时非 JPEG 页面的编码质量 (75 与之前 Pillow 保存 PDF 的默认值一致)
+# ------------------------
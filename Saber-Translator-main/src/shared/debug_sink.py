@@ -0,0 +1,209 @@
+"""
+调试产物 (OCR 裁剪图、修复掩码、修复结果等) 的集中写入模块。
+
+- 默认关闭，开启后按采样率抽样保存；
+- 图像编码和写盘在后台线程中完成，请求线程只做一次内存拷贝后入队；
+- 队列有界，写盘跟不上时直接丢弃新的调试产物，不会阻塞处理流程；
+- 调试目录 (data/debug/) 的总大小有上限，超出后删除最早写入的文件。
+"""
+
+import logging
+import os
+import queue
+import random
+import threading
+
+from src.shared import constants
+from src.shared.path_helpers import get_debug_dir
+
+logger = logging.getLogger("DebugSink")
+
+
+def _env_flag(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+class DebugArtifactSink:
+    """
+    后台调试产物写入器。
+    """
+    def __init__(self, enabled=False, sample_rate=1.0,
+                 queue_size=constants.DEBUG_ARTIFACTS_QUEUE_SIZE,
+                 max_dir_bytes=constants.DEBUG_ARTIFACTS_MAX_DIR_MB * 1024 * 1024):
+        """
+        Args:
+            enabled (bool): 是否保存调试产物。
+            sample_rate (float): 采样率 (0~1)，1 表示全部保存。
+            queue_size (int): 待写入队列的最大长度，队列满时丢弃新的调试产物。
+            max_dir_bytes (int): 调试目录的总大小上限 (字节)。
+        """
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.max_dir_bytes = max_dir_bytes
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._dir_bytes = None # 首次写入时统计，之后增量维护
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def configure(self, enabled=None, sample_rate=None):
+        """运行时修改开关和采样率。"""
+        if enabled is not None:
+            self.enabled = bool(enabled)
+        if sample_rate is not None:
+            self.sample_rate = min(1.0, max(0.0, float(sample_rate)))
+        logger.info(f"调试产物保存: {'开启' if self.enabled else '关闭'}，采样率: {self.sample_rate}")
+
+    def should_save(self):
+        """本次调试产物是否需要保存 (已关闭或未被采样时返回 False)。"""
+        if not self.enabled:
+            return False
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def save(self, subdirectory, filename, image):
+        """
+        异步保存一个调试图像。
+
+        Args:
+            subdirectory (str or None): data/debug/ 下的子目录名，None 表示直接保存在 data/debug/。
+            filename (str): 文件名 (扩展名决定编码格式)。
+            image: PIL 图像或 numpy 数组 (OpenCV BGR/灰度格式)。
+
+        Returns:
+            bool: 是否已加入写入队列。
+        """
+        if image is None or not self.should_save():
+            return False
+        self._ensure_started()
+        try:
+            # 调用方之后可能继续修改图像 (例如在修复结果上渲染文字)，因此先拷贝一份
+            self._queue.put_nowait((subdirectory, filename, image.copy()))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                logger.warning(f"调试产物写入队列已满，已丢弃 {self.dropped} 个调试产物")
+            return False
+
+    def flush(self, timeout=None):
+        """等待队列中的调试产物全部写入 (主要用于测试)。"""
+        if self._thread is None:
+            return
+        if timeout is None:
+            self._queue.join()
+            return
+        done = threading.Event()
+        threading.Thread(target=lambda: (self._queue.join(), done.set()), daemon=True).start()
+        done.wait(timeout)
+
+    def reset_dir_usage(self):
+        """调试目录被外部清理后调用，下次写入时重新统计目录大小。"""
+        self._dir_bytes = None
+
+    def get_stats(self):
+        return {
+            'enabled': self.enabled,
+            'sample_rate': self.sample_rate,
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'dropped': self.dropped,
+            'dir_bytes': self._dir_bytes or 0,
+            'max_dir_bytes': self.max_dir_bytes,
+        }
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._writer_loop, name="DebugArtifactWriter", daemon=True)
+                self._thread.start()
+
+    def _writer_loop(self):
+        while True:
+            subdirectory, filename, image = self._queue.get()
+            try:
+                path = os.path.join(get_debug_dir(subdirectory), filename)
+                old_size = os.path.getsize(path) if os.path.exists(path) else 0
+                if hasattr(image, 'save'):
+                    image.save(path)
+                else:
+                    import cv2
+                    cv2.imwrite(path, image)
+                self.written += 1
+                self._account(os.path.getsize(path) - old_size)
+            except Exception as e:
+                logger.warning(f"保存调试产物 {subdirectory or ''}/{filename} 失败: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _account(self, delta):
+        """维护调试目录的总大小，超出上限时从最早的文件开始删除，直到降到上限的 80%。"""
+        if self._dir_bytes is None:
+            self._dir_bytes = sum(size for _, size, _ in self._list_files())
+        else:
+            self._dir_bytes += delta
+        if self._dir_bytes <= self.max_dir_bytes:
+            return
+
+        files = sorted(self._list_files(), key=lambda item: item[2]) # 按修改时间排序
+        self._dir_bytes = sum(size for _, size, _ in files)
+        target = int(self.max_dir_bytes * 0.8)
+        removed = 0
+        for path, size, _ in files:
+            if self._dir_bytes <= target:
+                break
+            try:
+                os.remove(path)
+                self._dir_bytes -= size
+                removed += 1
+            except OSError:
+                pass
+        logger.info(f"调试目录超出 {self.max_dir_bytes / (1024 * 1024):.0f}MB 上限，已删除 {removed} 个最早的调试文件")
+
+    @staticmethod
+    def _list_files():
+        result = []
+        for root, _, files in os.walk(get_debug_dir()):
+            for f in files:
+                path = os.path.join(root, f)
+                try:
+                    st = os.stat(path)
+                    result.append((path, st.st_size, st.st_mtime))
+                except OSError:
+                    pass
+        return result
+
+
+# --- 单例 ---
+debug_sink_instance = None
+_sink_instance_lock = threading.Lock()
+
+def get_debug_sink():
+    """获取调试产物写入器的单例 (初始开关和采样率可通过环境变量覆盖)。"""
+    global debug_sink_instance
+    if debug_sink_instance is None:
+        with _sink_instance_lock:
+            if debug_sink_instance is None:
+                sample_rate = constants.DEBUG_ARTIFACTS_SAMPLE_RATE
+                try:
+                    sample_rate = float(os.environ.get('SABER_DEBUG_SAMPLE_RATE', sample_rate))
+                except ValueError:
+                    pass
+                debug_sink_instance = DebugArtifactSink(
+                    enabled=_env_flag('SABER_DEBUG_ARTIFACTS', constants.DEBUG_ARTIFACTS_ENABLED),
+                    sample_rate=sample_rate
+                )
+    return debug_sink_instance
+
+def save_debug_artifact(subdirectory, filename, image):
+    """便捷函数：通过单例异步保存一个调试图像，详见 DebugArtifactSink.save。"""
+    return get_debug_sink().save(subdirectory, filename, image)
+
+def debug_artifacts_enabled():
+    """调试产物保存是否开启 (可用于跳过仅为调试而做的准备工作)。"""
+    return get_debug_sink().enabled
@@ -0,0 +1,113 @@
+"""
+线程安全的令牌桶限流器，用于限制对外部服务的每分钟请求数 (rpm)。
+同一服务的所有请求 (跨 HTTP 请求、跨工作线程) 共享同一个令牌桶。
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger("RateLimiter")
+
+
+class TokenBucket:
+    """
+    令牌桶：容量为 capacity，每秒补充 rate_per_minute / 60 个令牌。
+    获取不到令牌的线程只会等待到下一个令牌可用为止，不会像固定窗口那样整分钟阻塞。
+
+    容量默认为 1 (不允许突发)：请求按 60 / rate_per_minute 秒的间隔放行，任意一分钟内最多
+    rate_per_minute + 1 次。容量等于 rate_per_minute 时，第一分钟内满桶突发加上补充的令牌
+    会接近 2 倍配额，服务商按分钟统计时会超限。
+    """
+    def __init__(self, rate_per_minute, capacity=None):
+        self._lock = threading.Lock()
+        self.rate_per_minute = 0
+        self.capacity = 0
+        self.set_rate(rate_per_minute, capacity)
+        self._tokens = float(self.capacity)
+        self._last_refill = time.monotonic()
+
+    def set_rate(self, rate_per_minute, capacity=None):
+        """更新速率 (例如用户修改了 rpm 设置)，已有的令牌数不会超过新容量。"""
+        with self._lock:
+            self.rate_per_minute = max(1, int(rate_per_minute))
+            self.capacity = max(1, int(capacity if capacity is not None else 1))
+            if hasattr(self, '_tokens'):
+                self._tokens = min(self._tokens, float(self.capacity))
+
+    def _refill(self, now):
+        elapsed = now - self._last_refill
+        if elapsed > 0:
+            self._tokens = min(float(self.capacity), self._tokens + elapsed * self.rate_per_minute / 60.0)
+            self._last_refill = now
+
+    def acquire(self, tokens=1, timeout=None):
+        """
+        获取令牌，必要时阻塞等待。
+
+        Args:
+            tokens (int): 需要的令牌数。
+            timeout (float, optional): 最长等待秒数，None 表示一直等待。
+
+        Returns:
+            bool: 是否成功获取令牌 (仅在超时时返回 False)。
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait_time = (tokens - self._tokens) * 60.0 / self.rate_per_minute
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait_time = min(wait_time, remaining)
+            time.sleep(wait_time)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+def get_token_bucket(key, rate_per_minute):
+    """
+    获取 (或创建) 指定键的共享令牌桶。
+
+    Args:
+        key: 令牌桶标识，例如 ('translation', provider, base_url, api_key)。
+        rate_per_minute (int): 每分钟请求数上限；0 或负数表示不限制。
+
+    Returns:
+        TokenBucket or None: 不限制时返回 None。
+    """
+    if not rate_per_minute or rate_per_minute <= 0:
+        return None
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(rate_per_minute)
+            _buckets[key] = bucket
+        elif bucket.rate_per_minute != int(rate_per_minute):
+            bucket.set_rate(rate_per_minute)
+        return bucket
+
+def acquire_rate_limit(key, rate_per_minute, service_name=None):
+    """
+    按 rpm 限制获取一次请求许可；不限制时立即返回。
+
+    Args:
+        key: 令牌桶标识。
+        rate_per_minute (int): 每分钟请求数上限。
+        service_name (str, optional): 服务名称，用于日志记录。
+    """
+    bucket = get_token_bucket(key, rate_per_minute)
+    if bucket is None:
+        return
+    start_time = time.monotonic()
+    bucket.acquire()
+    waited = time.monotonic() - start_time
+    if waited > 0.05:
+        logger.info(f"rpm: {service_name or key} - 达到每分钟 {rate_per_minute} 次请求限制，等待了 {waited:.2f} 秒")
@@ -0,0 +1,97 @@
+"""
+增量重渲染与整页渲染的一致性测试。
+"""
+
+import os
+import unittest
+
+import numpy as np
+from PIL import Image
+
+from src.core import incremental_render
+from src.core.rendering import build_default_bubble_styles, render_all_bubbles
+
+FONT_PATH = os.path.join('src', 'app', 'static', 'fonts', 'STXINWEI.TTF')
+
+
+class IncrementalRenderTests(unittest.TestCase):
+    def setUp(self):
+        incremental_render.get_incremental_render_cache().clear()
+        # 随机噪声背景：任何一个像素不同都能被检测到
+        rng = np.random.default_rng(0)
+        self.clean = Image.fromarray(rng.integers(0, 255, (900, 800, 3)).astype(np.uint8))
+        self.coords = [(250, 300, 500, 600), (50, 50, 200, 250)]
+        self.texts = ['这是一段竖排测试文字，用来检查增量渲染', '另一个气泡']
+
+    def tearDown(self):
+        incremental_render.get_incremental_render_cache().clear()
+
+    def _styles(self, font_size):
+        styles = build_default_bubble_styles(len(self.coords), 28, FONT_PATH, 'vertical', '#000000', 0)
+        styles['0']['fontSize'] = font_size
+        return styles
+
+    def test_vertical_font_size_change_matches_full_render(self):
+        for old_size, new_size in [(28, 32), (28, 24), (24, 40)]:
+            with self.subTest(old_size=old_size, new_size=new_size):
+                incremental_render.get_incremental_render_cache().clear()
+                incremental_render.render_page('page', self.texts, self.coords, self._styles(old_size),
+                                               clean_image=self.clean.copy(), clean_hash='clean')
+                result = incremental_render.render_page('page', self.texts, self.coords, self._styles(new_size))
+                self.assertTrue(result['incremental'])
+
+                full = self.clean.copy()
+                render_all_bubbles(full, self.texts, self.coords, self._styles(new_size))
+                diff = (np.asarray(result['page']) != np.asarray(full)).any(axis=2)
+                ys, xs = np.nonzero(diff)
+                self.assertEqual(len(xs), 0, f"与整页渲染不同的像素: {list(zip(xs[:10], ys[:10]))}")
+
+    def test_random_edits_match_full_render(self):
+        """随机的旋转、横排/竖排、描边和相互重叠的气泡，改动其中一部分后与整页渲染逐像素比较。"""
+        rng = np.random.default_rng(1)
+        words = '这是一段用来检查增量渲染的测试文字ABCabc123！？'
+        for trial in range(20):
+            with self.subTest(trial=trial):
+                incremental_render.get_incremental_render_cache().clear()
+                coords = []
+                for _ in range(4):
+                    x1, y1 = int(rng.integers(0, 600)), int(rng.integers(0, 700))
+                    coords.append((x1, y1, x1 + int(rng.integers(60, 200)), y1 + int(rng.integers(60, 200))))
+                # 保证至少有一对气泡重叠
+                x1, y1, x2, y2 = coords[0]
+                coords[1] = (x1 + 20, y1 + 20, x2 + 40, y2 + 40)
+                texts = [''.join(rng.choice(list(words), int(rng.integers(2, 14)))) for _ in coords]
+                styles = build_default_bubble_styles(len(coords), 24, FONT_PATH, 'vertical', '#000000', 0)
+                for style in styles.values():
+                    self._randomize_style(rng, style)
+                incremental_render.render_page('page', texts, coords, styles,
+                                               clean_image=self.clean.copy(), clean_hash='clean')
+
+                # 随机改动部分气泡的文本或样式
+                for i in rng.choice(len(coords), int(rng.integers(1, 3)), replace=False):
+                    if rng.random() < 0.3:
+                        texts[i] = ''.join(rng.choice(list(words), int(rng.integers(2, 14))))
+                    else:
+                        self._randomize_style(rng, styles[str(i)])
+                result = incremental_render.render_page('page', texts, coords, styles)
+                self.assertTrue(result['incremental'])
+
+                full = self.clean.copy()
+                render_all_bubbles(full, texts, coords, styles)
+                diff = (np.asarray(result['page']) != np.asarray(full)).any(axis=2)
+                ys, xs = np.nonzero(diff)
+                self.assertEqual(len(xs), 0, f"与整页渲染不同的像素: {list(zip(xs[:10], ys[:10]))}")
+
+    @staticmethod
+    def _randomize_style(rng, style):
+        style['fontSize'] = int(rng.integers(14, 40))
+        style['text_direction'] = 'vertical' if rng.random() < 0.5 else 'horizontal'
+        style['rotation_angle'] = float(rng.choice([0, 0, rng.uniform(-45, 45)]))
+        style['position_offset'] = {'x': int(rng.integers(-15, 16)), 'y': int(rng.integers(-15, 16))}
+        style['enableStroke'] = bool(rng.random() < 0.5)
+        style['strokeColor'] = '#FFFFFF'
+        style['strokeWidth'] = int(rng.integers(1, 4)) if style['enableStroke'] else 0
+
+
+if __name__ == '__main__':
+    unittest.main()
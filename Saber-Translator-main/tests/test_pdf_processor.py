@@ -0,0 +1,95 @@
+"""
+流式 PDF 导入的测试：用真实的 PDF 文件检查页码顺序、JPEG 原样透传和 PNG 转换。
+"""
+
+import io
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from PIL import Image
+
+from src.core import pdf_processor, worker_pool
+from src.core.archive_export import ArchiveExporter
+from src.shared import constants
+
+
+def _encode(img, fmt, **kwargs):
+    buffered = io.BytesIO()
+    img.save(buffered, format=fmt, **kwargs)
+    return buffered.getvalue()
+
+
+class PdfProcessorTests(unittest.TestCase):
+    def setUp(self):
+        self._saved = (constants.PDF_EXTRACT_CHUNK_PAGES, constants.WORKER_POOL_PROCESSES)
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        constants.PDF_EXTRACT_CHUNK_PAGES, constants.WORKER_POOL_PROCESSES = self._saved
+        worker_pool.shutdown_worker_pool()
+        self.temp_dir.cleanup()
+
+    def _write(self, name, data):
+        path = os.path.join(self.temp_dir.name, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def _export_pdf(self, pages):
+        exporter = ArchiveExporter('pdf')
+        return self._write('export.pdf', b''.join(exporter.iter_chunks(enumerate(pages))))
+
+    def test_exported_pdf_keeps_page_order_and_jpeg_bytes(self):
+        # 每页尺寸不同，便于核对页码顺序
+        rng = np.random.default_rng(0)
+        pages = []
+        for i in range(5):
+            img = Image.fromarray(rng.integers(0, 255, (60 + i * 10, 40 + i * 10, 3)).astype(np.uint8))
+            if i == 2:
+                pages.append(_encode(img, 'PNG')) # PNG 页面导出时编码为 JPEG
+            elif i == 3:
+                pages.append(_encode(img.convert('L'), 'JPEG', quality=90))
+            else:
+                pages.append(_encode(img, 'JPEG', quality=90))
+        pdf_path = self._export_pdf(pages)
+
+        # 每段 2 页，5 页分为 3 段，在工作进程池中提取
+        constants.PDF_EXTRACT_CHUNK_PAGES = 2
+        constants.WORKER_POOL_PROCESSES = 2
+        results = list(pdf_processor.iter_pdf_images(pdf_path))
+        self.assertIsNotNone(worker_pool._worker_pool, "应使用工作进程池提取")
+
+        self.assertEqual([(page_num, image_index) for page_num, image_index, _, _ in results],
+                         [(i, 0) for i in range(5)])
+        for i, (_, _, data, mime) in enumerate(results):
+            source = Image.open(io.BytesIO(pages[i]))
+            self.assertEqual(mime, 'image/jpeg')
+            self.assertEqual(Image.open(io.BytesIO(data)).size, source.size)
+            if source.format == 'JPEG':
+                self.assertEqual(data, pages[i], f"第 {i + 1} 页的 JPEG 应原样透传")
+
+    def test_non_browser_images_are_converted_to_png(self):
+        # CMYK JPEG (DCTDecode) 和 JPEG 2000 (JPXDecode) 浏览器无法正确显示，应转换为 RGB PNG
+        cmyk = Image.new('CMYK', (48, 32), (10, 200, 30, 40))
+        rng = np.random.default_rng(0)
+        rgb = rng.integers(0, 255, (32, 48, 3)).astype(np.uint8)
+        jpx = Image.fromarray(rgb).convert('RGBA') # Pillow 以 JPXDecode 保存 RGBA 图像
+        buffered = io.BytesIO()
+        cmyk.save(buffered, format='PDF', save_all=True, append_images=[jpx])
+        pdf_path = self._write('converted.pdf', buffered.getvalue())
+
+        results = list(pdf_processor.iter_pdf_images(pdf_path))
+        self.assertEqual([(page_num, mime) for page_num, _, _, mime in results],
+                         [(0, 'image/png'), (1, 'image/png')])
+
+        converted = [Image.open(io.BytesIO(data)) for _, _, data, _ in results]
+        self.assertEqual([(img.mode, img.size) for img in converted], [('RGB', (48, 32)), ('RGB', (48, 32))])
+        expected = np.asarray(cmyk.convert('RGB'), dtype=np.int16)
+        self.assertLessEqual(np.abs(np.asarray(converted[0], dtype=np.int16) - expected).max(), 8)
+        np.testing.assert_array_equal(np.asarray(converted[1]), rgb) # JPEG 2000 默认无损
+
+
+if __name__ == '__main__':
+    unittest.main()